@@ -0,0 +1,495 @@
+"""
+Contains benchmarks for API serialization and rendering.
+
+These use synthetic data shaped like what Solr returns for each
+resource, so they don't require a running Solr instance or database.
+Run them from a Django shell, e.g.:
+
+>>> from api import benchmarks
+>>> benchmarks.print_results(benchmarks.benchmark_renderers())
+>>> benchmarks.print_results(benchmarks.benchmark_uris())
+>>> benchmarks.print_results(benchmarks.benchmark_serializers())
+
+`benchmark_async_views` is different: it measures request throughput
+for a Solr-backed view under ASGI, using a local stand-in for Solr (so
+it still doesn't need a real Solr instance), e.g.:
+
+>>> benchmarks.print_results(benchmarks.benchmark_async_views())
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import asyncio
+import json
+import multiprocessing
+import random
+import re
+import time
+import timeit
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytz
+import ujson
+from rest_framework.test import APIRequestFactory
+from rest_framework.utils import encoders
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.test.utils import override_settings
+from django.urls import re_path
+
+from api import renderers, serializers as s, views
+from api.simpleviews import AsyncSimpleGetMixin, AsyncSimpleView
+from api.uris import APIUris
+from utils.lookupcache import LOOKUP_CACHE
+from utils import solr
+
+
+def make_fake_value(field, rand):
+    """
+    Generate a random source value for the given serializer field,
+    based on the field's type.
+    """
+    if isinstance(field, s.SimpleJSONField):
+        return json.dumps([
+            {'i': rand.randint(1000000, 9999999), 'b': 'A{}'.format(n),
+             'c': 'QA76.{} .A{}'.format(rand.randint(1, 999), n)}
+            for n in range(rand.randint(1, 4))
+        ])
+    if isinstance(field, s.SimpleDateTimeField):
+        date = datetime(2000, 1, 1, tzinfo=pytz.utc)
+        return date + timedelta(seconds=rand.randint(0, 700000000))
+    if isinstance(field, s.SimpleBoolField):
+        return rand.choice((True, False))
+    if isinstance(field, s.SimpleIntField):
+        return rand.randint(0, 100000)
+    words = ['{}{}'.format(rand.choice('abcdefgh/é'), rand.randint(0, 999))
+             for _ in range(rand.randint(2, 8))]
+    if field.name.endswith(('_display', '_facet', '_numbers', 's')):
+        return [' '.join(words[:n + 1]) for n in range(rand.randint(1, 3))]
+    return ' '.join(words)
+
+
+def make_fake_solr_docs(serializer_class, id_prefix, num_docs=500, seed=0):
+    """
+    Generate `num_docs` fake solr.Result objects for the given
+    serializer class, populating every source field the serializer
+    uses. Record IDs start with `id_prefix` (e.g. 'b' for bibs).
+    """
+    rand = random.Random(seed)
+    docs = []
+    for num in range(num_docs):
+        doc = solr.Result()
+        for field in serializer_class.fields:
+            source = field.sources['main']
+            if source is not None:
+                doc[source] = make_fake_value(field, rand)
+        doc['id'] = '{}{}'.format(id_prefix, 1000000 + num)
+        docs.append(doc)
+    return docs
+
+
+def make_context(view_class, path):
+    """
+    Make a serializer context (request and view) for the given view
+    class and request path, so that serializers generate links.
+    """
+    request = APIRequestFactory().get(path, HTTP_HOST='localhost')
+    return {'request': request, 'view': view_class()}
+
+
+def make_bibs_page(num_bibs=500, seed=0):
+    """
+    Make the data structure for one page of a `bibs` list response,
+    containing `num_bibs` fake bibs.
+    """
+    docs = make_fake_solr_docs(s.BibSerializer, 'b', num_bibs, seed)
+    context = make_context(views.BibList, '/api/v1/bibs/')
+    bibs = s.BibSerializer(instance=docs, context=context).data
+    return OrderedDict([
+        ('_links', OrderedDict([
+            ('self', {'href': 'http://localhost/api/v1/bibs/'}),
+            ('next', {'href': 'http://localhost/api/v1/bibs/?offset=500'}),
+        ])),
+        ('totalCount', 1000000),
+        ('startRow', 0),
+        ('endRow', num_bibs - 1),
+        ('_embedded', {'bibs': bibs}),
+    ])
+
+
+def time_function(func, *args, repeat=5, number=1):
+    """
+    Run `func(*args)` `number` times in a row, `repeat` times, and
+    return the fastest time per call, in seconds.
+    """
+    timer = timeit.Timer(lambda: func(*args))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def stdlib_json_render(data, accepted_media_type=None, context=None):
+    """
+    Render `data` the way FullJSONRenderer did before it used ujson
+    for every unindented response.
+    """
+    return json.dumps(data, cls=encoders.JSONEncoder,
+                      ensure_ascii=True).encode('utf-8')
+
+
+def benchmark_renderers(num_bibs=500, repeat=5, number=5):
+    """
+    Compare rendering a large `bibs` page with the stdlib json module
+    vs. HALJSONRenderer.
+    """
+    data = make_bibs_page(num_bibs)
+    renderer = renderers.HALJSONRenderer()
+    media_type = renderer.media_type
+    assert renderer.render(data, media_type) == stdlib_json_render(data)
+    return OrderedDict([
+        ('stdlib json (before)', time_function(
+            stdlib_json_render, data, media_type, repeat=repeat,
+            number=number
+        )),
+        ('HALJSONRenderer (after)', time_function(
+            renderer.render, data, media_type, repeat=repeat, number=number
+        )),
+    ])
+
+
+def legacy_get_uri(uris_class, name, req=None, absolute=False,
+                   template=False, **kwargs):
+    """
+    Build a URI the way Uris.get_uri did before patterns were compiled
+    and the base URI was memoized.
+    """
+    if absolute:
+        uri = re.sub(r'(//[^/]*)/.*$', r'\1', req.build_absolute_uri())
+        uri = '{}{}{}'.format(uri, settings.SITE_URL_ROOT, uris_class.root)
+    else:
+        uri = '/{}'.format(uris_class.root)
+    for p in uris_class.named_uripatterns.get(name, None) or []:
+        if isinstance(p, dict):
+            if (template and not list(p.values())[0]):
+                uri = '{}{{{}}}'.format(uri, list(p.keys())[0])
+            else:
+                uri = '{}{}'.format(uri, kwargs.get(list(p.keys())[0],
+                                                    list(p.values())[0]))
+        else:
+            uri = '{}{}'.format(uri, p)
+    return uri
+
+
+def make_item_links(get_uri, num_items, path='/api/v1/items/'):
+    """
+    Build the `_links` URIs for one page of `num_items` items (five
+    per item), using the given `get_uri` function.
+    """
+    req = make_context(views.ItemList, path)['request']
+    links = []
+    for num in range(num_items):
+        links.extend([
+            get_uri('items-detail', req=req, absolute=True, v=1,
+                    id='i{}'.format(num)),
+            get_uri('bibs-detail', req=req, absolute=True, v=1,
+                    id='b{}'.format(num)),
+            get_uri('locations-detail', req=req, absolute=True, v=1,
+                    code='w3'),
+            get_uri('itemtypes-detail', req=req, absolute=True, v=1,
+                    code='1'),
+            get_uri('itemstatuses-detail', req=req, absolute=True, v=1,
+                    code='-'),
+        ])
+    return links
+
+
+def benchmark_uris(num_items=500, repeat=5, number=5):
+    """
+    Compare generating links for a page of `num_items` items using the
+    old Uris.get_uri implementation vs. the current one.
+    """
+    def legacy(name, **kwargs):
+        return legacy_get_uri(APIUris, name, **kwargs)
+
+    assert (make_item_links(legacy, num_items)
+            == make_item_links(APIUris.get_uri, num_items))
+    return OrderedDict([
+        ('Uris.get_uri (before)', time_function(
+            make_item_links, legacy, num_items, repeat=repeat, number=number
+        )),
+        ('Uris.get_uri (after)', time_function(
+            make_item_links, APIUris.get_uri, num_items, repeat=repeat,
+            number=number
+        )),
+    ])
+
+
+def legacy_serialize(serializer, obj):
+    """
+    Serialize `obj` the way SimpleSerializer.to_representation did
+    before it used compiled serialization plans.
+    """
+    if serializer.obj_interface.obj_is_many(obj):
+        return [legacy_serialize(serializer, o) for o in obj]
+    data = OrderedDict()
+    if obj is not None:
+        obj_data = serializer.obj_interface.get_obj_data(obj)
+        obj_data = serializer.prepare_for_serialization(obj_data)
+        for f in serializer.active_fields:
+            data[f.public_name] = f.present(obj_data)
+    return data
+
+
+def make_item_docs(num_items=500, seed=0):
+    """
+    Generate fake item docs, with lookup values for each item's
+    location, status, and itype codes in the lookup cache.
+    """
+    docs = make_fake_solr_docs(s.ItemSerializer, 'i', num_items, seed)
+    lookups = {'location': {}, 'status': {}, 'item_type': {}}
+    for doc in docs:
+        lookups['location'][doc['location_code']] = 'Location'
+        lookups['status'][doc['status_code']] = 'AVAILABLE'
+        lookups['item_type'][doc['item_type_code']] = 'Book'
+    for name, lookup in lookups.items():
+        LOOKUP_CACHE[name] = lookup
+    return docs
+
+
+def benchmark_serializers(num_objs=500, repeat=5, number=5):
+    """
+    Compare serializing a page of `num_objs` items and `num_objs` bibs
+    using the old SimpleSerializer.to_representation implementation
+    vs. the current one.
+    """
+    tests = (
+        ('ItemSerializer', s.ItemSerializer, make_item_docs(num_objs),
+         make_context(views.ItemList, '/api/v1/items/')),
+        ('BibSerializer', s.BibSerializer,
+         make_fake_solr_docs(s.BibSerializer, 'b', num_objs),
+         make_context(views.BibList, '/api/v1/bibs/')),
+    )
+    results = OrderedDict()
+    for label, serializer_class, docs, context in tests:
+        serializer = serializer_class(instance=docs, context=context)
+        if hasattr(serializer, 'cache_all'):
+            serializer.cache_all()
+        assert (legacy_serialize(serializer, docs)
+                == serializer.to_representation(docs))
+        results['{} (before)'.format(label)] = time_function(
+            legacy_serialize, serializer, docs, repeat=repeat, number=number
+        )
+        results['{} (after)'.format(label)] = time_function(
+            serializer.to_representation, docs, repeat=repeat,
+            number=number
+        )
+    return results
+
+
+class StandInSolrHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for StandInSolr. Answers every search (GET or
+    POST) with the server's canned response after the server's
+    `delay`, and answers replication handler requests (for the index
+    version) immediately.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        # Long queries are POSTed; the body isn't needed, but it has to
+        # be read before the response is sent.
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def do_GET(self):
+        if self.path.split('?')[0].endswith('/replication'):
+            body = ujson.dumps({'indexversion': 1500000000000,
+                                'generation': 1}).encode('utf-8')
+        else:
+            time.sleep(self.server.delay)
+            body = self.server.search_body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInSolrServer(ThreadingHTTPServer):
+    """
+    The HTTP server for StandInSolr, with a listen backlog big enough
+    for many concurrent clients.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class StandInSolr(object):
+    """
+    A local HTTP server that stands in for a Solr core, for load
+    benchmarks. Every search returns the given `docs`, after `delay`
+    seconds (to simulate the time Solr spends on a query). Use it as a
+    context manager; while it's running, `url` is the core's URL.
+
+    The server runs in a forked child process, so that its work doesn't
+    compete with the process being benchmarked for the GIL. (So this
+    only works on platforms that support forking.)
+    """
+
+    def __init__(self, docs, delay=0.02):
+        self.server = StandInSolrServer(('127.0.0.1', 0), StandInSolrHandler)
+        self.server.delay = delay
+        self.server.search_body = ujson.dumps({
+            'responseHeader': {'status': 0, 'QTime': int(delay * 1000)},
+            'response': {'numFound': 1000000, 'start': 0, 'docs': docs}
+        }).encode('utf-8')
+        self.url = 'http://127.0.0.1:{}/solr/bench'.format(
+            self.server.server_port
+        )
+
+    def __enter__(self):
+        context = multiprocessing.get_context('fork')
+        self.process = context.Process(target=self.server.serve_forever,
+                                       daemon=True)
+        self.process.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.join()
+        self.server.server_close()
+
+
+class BenchBibList(views.BibList):
+    """
+    The `bibs` list view, searching the Solr core at `solr_url`, with
+    no authentication, permission checks, or throttling.
+    """
+    authentication_classes = ()
+    permission_classes = ()
+    throttle_classes = ()
+    solr_url = None
+
+    def get_queryset(self):
+        return solr.Queryset(url=self.solr_url)
+
+
+class AsyncBenchBibList(AsyncSimpleGetMixin, AsyncSimpleView,
+                        BenchBibList):
+    """
+    The async version of BenchBibList.
+    """
+    pass
+
+
+def make_bench_urlconf(solr_url):
+    """
+    Make a URLconf with routes for BenchBibList (`/sync/bibs/`) and
+    AsyncBenchBibList (`/async/bibs/`), using the given Solr URL.
+    """
+    return type('BenchURLConf', (object,), {'urlpatterns': [
+        re_path(r'^sync/bibs/$', BenchBibList.as_view(solr_url=solr_url)),
+        re_path(r'^async/bibs/$',
+                AsyncBenchBibList.as_view(solr_url=solr_url)),
+    ]})
+
+
+async def asgi_get(application, path, query_string=''):
+    """
+    Send a GET request for `path` to the given ASGI `application` and
+    return the response status code.
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path,
+        'raw_path': path.encode('utf-8'),
+        'query_string': query_string.encode('utf-8'), 'root_path': '',
+        'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await application(scope, receive, send)
+    return sent[0]['status']
+
+
+async def run_load(application, path, num_requests, concurrency, limit):
+    """
+    Make `num_requests` requests for pages of `path`, `concurrency` at
+    a time, and return the total elapsed time in seconds. Each request
+    is for a different page, so no two are identical.
+    """
+    offsets = iter(range(0, num_requests * limit, limit))
+    statuses = []
+
+    async def client():
+        for offset in offsets:
+            query_string = 'limit={}&offset={}'.format(limit, offset)
+            statuses.append(await asgi_get(application, path, query_string))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    assert statuses == [200] * num_requests
+    return elapsed
+
+
+def benchmark_async_views(num_requests=200, concurrency=20, solr_delay=0.05,
+                          limit=20):
+    """
+    Compare the throughput of one process serving the `bibs` list view
+    under ASGI, as a normal SimpleView vs. an AsyncSimpleView, with
+    `concurrency` clients making `num_requests` requests in total.
+
+    Solr is a local stand-in (see StandInSolr) that takes `solr_delay`
+    seconds to answer each search and returns `limit` fake bibs. Times
+    are per request (i.e., total elapsed time / `num_requests`), so the
+    throughput in requests per second is 1 / time. Django runs sync
+    views under ASGI one at a time, in one thread, so the sync view's
+    throughput is capped at about 1 / (`solr_delay` + overhead).
+    """
+    docs = [
+        {k: solr.format_datetime_for_solr(v) if isinstance(v, datetime)
+         else v for k, v in doc.items()}
+        for doc in make_fake_solr_docs(s.BibSerializer, 'b', limit)
+    ]
+    with StandInSolr(docs, solr_delay) as stand_in:
+        urlconf = make_bench_urlconf(stand_in.url)
+        with override_settings(ROOT_URLCONF=urlconf,
+                               ALLOWED_HOSTS=['localhost']):
+            application = ASGIHandler()
+
+            async def run_all():
+                results = OrderedDict()
+                for label, path in (('sync view (before)', '/sync/bibs/'),
+                                    ('async view (after)', '/async/bibs/')):
+                    elapsed = await run_load(application, path, num_requests,
+                                             concurrency, limit)
+                    results[label] = elapsed / num_requests
+                return results
+
+            return asyncio.run(run_all())
+
+
+def print_results(results):
+    """
+    Print results from one of the `benchmark_` functions, with each
+    time relative to the most recent "(before)" time.
+    """
+    baseline = None
+    for label, secs in results.items():
+        if baseline is None or label.endswith('(before)'):
+            baseline = secs
+        print('{:<40} {:>10.2f} ms {:>8.2f}x'.format(label, secs * 1000,
+                                                     baseline / secs))
@@ -34,3 +34,9 @@ class ReadOnlyEdit(exceptions.APIException):
     status_code = 400
     default_detail = ('The requested resource could not be updated because '
                       'the request attempted to update read-only content.')
+
+
+class UpdateConflict(exceptions.APIException):
+    status_code = 409
+    default_detail = ('The requested resource could not be updated because '
+                      'it was changed by another request. Please try again.')
@@ -24,11 +24,14 @@ class SimpleQSetFilterBackend(BaseFilterBackend):
     """
     paginate_by_param = settings.REST_FRAMEWORK['PAGINATE_BY_PARAM']
     paginate_param = settings.REST_FRAMEWORK['PAGINATE_PARAM']
+    cursor_param = settings.REST_FRAMEWORK['CURSOR_PARAM']
     order_by_param = settings.REST_FRAMEWORK['ORDER_BY_PARAM']
     search_param = settings.REST_FRAMEWORK['SEARCH_PARAM']
     searchtype_param = settings.REST_FRAMEWORK['SEARCHTYPE_PARAM']
-    reserved_params = [paginate_by_param, paginate_param, order_by_param,
-                       search_param, searchtype_param, 'format']
+    fields_param = settings.REST_FRAMEWORK['FIELDS_PARAM']
+    reserved_params = [paginate_by_param, paginate_param, cursor_param,
+                       order_by_param, search_param, searchtype_param,
+                       fields_param, 'format']
     valid_operators = ['exact', 'contains', 'in', 'gt', 'gte', 'lt', 'lte',
                        'startswith', 'endswith', 'range', 'matches', 'isnull',
                        'keywords']
@@ -14,6 +14,8 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models, transaction, IntegrityError
 
+from utils.lookupcache import LookupCache
+
 
 class APIUserException(Exception):
     pass
@@ -216,6 +218,8 @@ class APIUser(models.Model):
     secret = models.CharField(max_length=128)
     permissions = models.TextField(default='{}')
     permission_defaults = get_permission_defaults_from_apps()
+    credential_cache = LookupCache(ttl=settings.API_CREDENTIAL_CACHE_TTL,
+                                   redis_key='api_credential_cache:versions')
     objects = APIUserManager()
 
     def __init__(self, *args, **kwargs):
@@ -259,6 +263,43 @@ class APIUser(models.Model):
         if msg:
             raise APIUserException(msg)
         super(APIUser, self).save(*args, **kwargs)
+        # Invalidate now and again after the transaction commits, so
+        # no other process can re-cache the old values in between.
+        self.invalidate_cached_credentials()
+        transaction.on_commit(self.invalidate_cached_credentials)
+
+    def delete(self, *args, **kwargs):
+        username = self.user.username
+        result = super(APIUser, self).delete(*args, **kwargs)
+        type(self).credential_cache.invalidate(username)
+        return result
+
+    def invalidate_cached_credentials(self):
+        """
+        Drop this APIUser's credentials from the credential cache (see
+        `get_cached`), in this and every other process.
+        """
+        type(self).credential_cache.invalidate(self.user.username)
+
+    @classmethod
+    def get_cached(cls, username):
+        """
+        Get the APIUser (with its related User) for the given username,
+        using the credential cache if possible, to avoid querying the
+        database on every authenticated request. Raises
+        APIUser.DoesNotExist if there's no such APIUser. Cached
+        APIUsers expire after settings.API_CREDENTIAL_CACHE_TTL seconds
+        and are invalidated whenever an APIUser is saved or deleted.
+        """
+        cache = cls.credential_cache
+        cache.sync()
+        api_user = cache.get(username)
+        if api_user is None:
+            api_user = cls.objects.select_related('user').get(
+                user__username=username
+            )
+            cache.set(username, api_user)
+        return api_user
 
     @transaction.atomic
     def update_and_save(self, secret_text=None, permissions_dict=None,
@@ -2,12 +2,17 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import json
+import re
 
 import ujson
 from django.http.multipartparser import parse_header
 from rest_framework.renderers import BaseRenderer
 from rest_framework.utils import encoders
-from six import text_type
+
+
+# ujson renders floats with one-digit negative exponents differently
+# than the stdlib json module does (e.g. 1e-7 vs. 1e-07).
+SHORT_NEGATIVE_EXPONENT = re.compile(rb'\de-\d(?!\d)')
 
 
 class FullJSONRenderer(BaseRenderer):
@@ -17,23 +22,16 @@ class FullJSONRenderer(BaseRenderer):
     ensure_ascii = True
     charset = None
 
-    def render(self, data, accepted_media_type=None, renderer_context=None):
+    def get_indent(self, accepted_media_type, renderer_context):
         '''
-        Render `data` into JSON, using the faster ujson library for
-        serialization unless indentation is requested (ujson does not
-        support indentation).
+        Return the indentation level requested via the media type
+        (e.g. 'application/json; indent=4') or the renderer context, or
+        None if output should not be indented.
         '''
-        if data is None:
-            return bytes()
-
         # If 'indent' is provided in the context, then pretty print the result.
         # E.g. If we're being called by the BrowsableAPIRenderer.
-        renderer_context = renderer_context or {}
-        indent = renderer_context.get('indent', None)
-
+        indent = (renderer_context or {}).get('indent', None)
         if accepted_media_type:
-            # If the media type looks like 'application/json; indent=4',
-            # then pretty print the result.
             base_media_type, params = parse_header(
                 accepted_media_type.encode('ascii'))
             indent = params.get('indent', indent)
@@ -41,18 +39,53 @@ class FullJSONRenderer(BaseRenderer):
                 indent = max(min(int(indent), 8), 0)
             except (ValueError, TypeError):
                 indent = None
+        return indent
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        '''
+        Render `data` into JSON, using the faster ujson library for
+        serialization unless indentation is requested (ujson does not
+        support indentation).
 
-            ret = json.dumps(data, cls=self.encoder_class,
-                             indent=indent, ensure_ascii=self.ensure_ascii)
-        else:
-            ret = ujson.dumps(data, ensure_ascii=self.ensure_ascii)
-
-        # On python 2.x json.dumps() returns bytestrings if ensure_ascii=True,
-        # but if ensure_ascii=False, the return type is underspecified,
-        # and may (or may not) be unicode.
-        # On python 3.x json.dumps() returns unicode strings.
-        if isinstance(ret, text_type):
-            return bytes(ret.encode('utf-8'))
+        Output is identical either way: ujson is configured to use the
+        same separators and escaping as the stdlib json module, values
+        ujson can't encode natively (datetimes, etc.) are coerced using
+        `encoder_class`, and the few outputs where the two libraries
+        still differ are detected and re-rendered using the stdlib.
+        '''
+        if data is None:
+            return bytes()
+
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent is None:
+            ret = self.fast_render(data)
+            if ret is not None:
+                return ret
+
+        ret = json.dumps(data, cls=self.encoder_class, indent=indent,
+                         ensure_ascii=self.ensure_ascii)
+        return ret.encode('utf-8')
+
+    def fast_render(self, data):
+        '''
+        Render `data` using ujson. Returns None if the output might not
+        match the stdlib json module's output byte-for-byte, or if
+        ujson can't render it.
+        '''
+        try:
+            ret = ujson.dumps(data, ensure_ascii=self.ensure_ascii,
+                              escape_forward_slashes=False,
+                              separators=(', ', ': '),
+                              default=self.encoder_class().default)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        ret = ret.encode('utf-8')
+        if b'e-' in ret and SHORT_NEGATIVE_EXPONENT.search(ret):
+            return None
+        # The stdlib escapes DEL (0x7f) when ensure_ascii is on; ujson
+        # doesn't.
+        if self.ensure_ascii and b'\x7f' in ret:
+            return None
         return ret
 
 
@@ -62,3 +95,26 @@ class UnicodeFullJSONRenderer(FullJSONRenderer):
 
 class HALJSONRenderer(FullJSONRenderer):
     media_type = 'application/hal+json'
+
+
+class NDJSONRenderer(FullJSONRenderer):
+    '''
+    Renders newline-delimited JSON (NDJSON). Each object in a list is
+    rendered as JSON on its own line; any other data is rendered as a
+    single line.
+    '''
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        if not isinstance(data, (list, tuple)):
+            data = [data]
+        return b''.join([self.render_line(obj) for obj in data])
+
+    def render_line(self, obj):
+        '''
+        Render one object as one line of JSON, with a trailing newline.
+        '''
+        return super().render(obj) + b'\n'
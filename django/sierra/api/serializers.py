@@ -118,6 +118,7 @@ class APIUserSerializer(SimpleSerializer):
 
 class ItemSerializer(SimpleSerializerWithLookups):
     _lookup_conn = settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ItemStatuses']
+    cached_lookups = ('location', 'status', 'item_type')
 
     class LinksField(SimpleField):
         def present(self, obj_data):
@@ -161,7 +162,9 @@ class ItemSerializer(SimpleSerializerWithLookups):
 
     obj_interface = SimpleObjectInterface(solr.Result)
     fields = [
-        LinksField('_links', derived=True),
+        LinksField('_links', derived=True,
+                   depends_on=['id', 'parent_bib_id', 'location_code',
+                               'item_type_code', 'status_code']),
         SimpleStrField('id', orderable=True, filterable=True),
         SimpleStrField('record_number', source='id', orderable=True,
                        filterable=True),
@@ -189,7 +192,7 @@ class ItemSerializer(SimpleSerializerWithLookups):
         SimpleIntField('local_code1', filterable=True),
         SimpleIntField('number_of_renewals', filterable=True),
         SimpleStrField('item_type_code', filterable=True),
-        SimpleStrField('item_type'),
+        SimpleStrField('item_type', depends_on=['item_type_code']),
         SimpleStrField('price', filterable=True),
         SimpleIntField('internal_use_count', filterable=True),
         SimpleIntField('copy_use_count'),
@@ -199,9 +202,9 @@ class ItemSerializer(SimpleSerializerWithLookups):
         SimpleIntField('year_to_date_checkout_count', filterable=True),
         SimpleIntField('last_year_to_date_checkout_count', filterable=True),
         SimpleStrField('location_code', filterable=True),
-        SimpleStrField('location'),
+        SimpleStrField('location', depends_on=['location_code']),
         SimpleStrField('status_code', filterable=True),
-        SimpleStrField('status'),
+        SimpleStrField('status', depends_on=['status_code', 'due_date']),
         SimpleDateTimeField('due_date', filterable=True),
         SimpleDateTimeField('checkout_date', orderable=True, filterable=True),
         SimpleDateTimeField('last_checkin_date', filterable=True),
@@ -277,7 +280,8 @@ class BibSerializer(SimpleSerializer):
 
     obj_interface = SimpleObjectInterface(solr.Result)
     fields = [
-        LinksField('_links', derived=True),
+        LinksField('_links', derived=True,
+                   depends_on=['id', 'items_json', 'more_items_json']),
         SimpleStrField('id', orderable=True, filterable=True),
         SimpleStrField('record_number', source='id', orderable=True,
                        filterable=True),
@@ -404,7 +408,7 @@ class EResourceSerializer(SimpleSerializerWithLookups):
 
     obj_interface = SimpleObjectInterface(solr.Result)
     fields = [
-        LinksField('_links', derived=True),
+        LinksField('_links', derived=True, depends_on=['id']),
         SimpleStrField('id', orderable=True, filterable=True),
         SimpleStrField('record_number', source='id',
                        orderable=True, filterable=True),
@@ -455,7 +459,7 @@ class ItemCodeSerializer(SimpleSerializer):
     foreign_key_field_name = None
     detail_uri_str = ''
     fields = [
-        LinksField('_links', derived=True),
+        LinksField('_links', derived=True, depends_on=['code']),
         SimpleStrField('code', orderable=True, filterable=True),
         SimpleStrField('label', orderable=True, filterable=True)
     ]
@@ -6,7 +6,8 @@ from collections.abc import Sequence
 
 import django.db.models.query
 from django.conf import settings
-from utils import camel_case, helpers
+from utils import camel_case, helpers, servertiming
+from utils.lookupcache import LOOKUP_CACHE
 
 # set up logger, for debugging
 logger = logging.getLogger('sierra.custom')
@@ -62,7 +63,8 @@ class SimpleField(object):
 
     def __init__(self, name, derived=False, source=None, order_source=None,
                  filter_source=None, keyword_source=None, writeable=False,
-                 orderable=False, filterable=False, present_direct_value=None):
+                 orderable=False, filterable=False, present_direct_value=None,
+                 depends_on=None):
         """
         Initialize a field instance.
 
@@ -112,6 +114,14 @@ class SimpleField(object):
         provided, `order_source` defaults to `source`. `filter_source`
         behaves like `order_source`, but `keyword_source` defaults to
         `filter_source`, if not provided.
+
+        `depends_on` is a list of the source obj fields needed in order
+        to present this field. Views use this to figure out the minimal
+        set of fields to request from the source (such as the `fl`
+        parameter for Solr), so derived fields, or fields whose values
+        are calculated from other fields (such as lookups), should
+        declare what they need. If not provided, it defaults to the
+        main `source` field, if there is one.
         """
         self.name = name
         self.camelcase_name = self.name_to_camelcase(name)
@@ -126,6 +136,9 @@ class SimpleField(object):
             'filter': filter_source,
             'keyword': keyword_source
         }
+        if depends_on is None:
+            depends_on = [] if source is None else [source]
+        self.depends_on = tuple(depends_on)
         self.writeable = writeable
         self.orderable = orderable
         self.filterable = filterable
@@ -207,6 +220,56 @@ class SimpleField(object):
         """
         return source_obj_data.get(self.sources.get('main'))
 
+    def compile_presenter(self):
+        """
+        Compile a function that does what `present` does for this
+        field: take the source obj data and return the presented value.
+
+        Serializers call this once per field (see
+        `SimpleSerializer.get_serialization_plan`) so that per-object
+        serialization doesn't have to go through `present`,
+        `get_from_source`, and `cast_to_python` for each value. If a
+        subclass overrides `present` or `get_from_source`, the bound
+        method is returned as-is; likewise, an overridden
+        `cast_to_python` is used as-is. Otherwise the source field name
+        and `cast_one_to_python` are bound in advance.
+
+        Returns None if the presented value is just the value of the
+        `sources['main']` field, as-is, so that callers can skip the
+        function call.
+        """
+        cls = type(self)
+        if (cls.present is not SimpleField.present
+                or cls.get_from_source is not SimpleField.get_from_source):
+            return self.present
+
+        source = self.sources.get('main')
+        if self.present_direct_value:
+            return None
+
+        cast = self.cast_to_python
+        default_cast = SimpleField.cast_to_python.__func__
+        if getattr(cast, '__func__', None) is not default_cast:
+            def present(obj_data):
+                value = obj_data.get(source)
+                return value if value is None else cast(value)
+            return present
+
+        cast_one = self.cast_one_to_python
+
+        def present(obj_data):
+            value = obj_data.get(source)
+            if value is None:
+                return value
+            try:
+                if isinstance(value, (list, tuple)):
+                    return [cast_one(v) for v in value]
+                return cast_one(value)
+            except ValueError:
+                # Let cast_to_python raise the appropriate error.
+                return cast(value)
+        return present
+
     def parse_from_client(self, client_data):
         """
         Parse (and clean/validate) data for this field from the client.
@@ -346,18 +409,34 @@ class SimpleSerializer(object):
 
     Override `prepare_for_serialization` if you need to implement any
     pre-serialization code to prep object data before it's serialized.
+    If that code needs source fields that none of your serializer
+    fields depend on, list them in the `required_source_fields` class
+    attribute so they're always fetched (see `get_source_fields`).
+
+    To serialize only a subset of fields (i.e., a sparse fieldset),
+    pass a list of field names via the `only` kwarg when instantiating
+    the serializer. HAL-style fields whose names begin with an
+    underscore, such as `_links`, are always included.
+
+    If `instance` has already been serialized (e.g., along with other
+    objects, as one list), pass its serialized data via the
+    `instance_data` kwarg so that the serializer can use it, such as
+    for validating client data, without serializing it again.
     """
     fields = []
+    required_source_fields = ()
     camelcase_fieldnames = settings.REST_FRAMEWORK['CAMELCASE_FIELDNAMES']
     obj_interface = SimpleObjectInterface()
 
-    def __init__(self, instance=None, data=None, context=None):
+    def __init__(self, instance=None, data=None, context=None, only=None,
+                 instance_data=None):
         self.object = instance
         self.raw_client_data = data
         self.context = context or {}
-        self._data = None
+        self._data = instance_data
         self.errors = []
         self.set_up_field_lookup()
+        self.active_fields = self.select_fields(only)
 
     @classmethod
     def set_up_field_lookup(cls):
@@ -368,6 +447,39 @@ class SimpleSerializer(object):
                     f.public_name = f.camelcase_name
                     cls.field_lookup[f.camelcase_name] = f
 
+    @classmethod
+    def select_fields(cls, fieldnames=None):
+        """
+        Return the list of field objects matching `fieldnames`.
+
+        `fieldnames` may contain either the public or internal name of
+        each field. Fields are returned in serializer order, along with
+        any fields whose names begin with an underscore. If
+        `fieldnames` is None, all fields are returned.
+        """
+        if fieldnames is None:
+            return cls.fields
+        wanted = set(cls.field_lookup[fn].name for fn in fieldnames)
+        return [f for f in cls.fields
+                if f.name in wanted or f.name.startswith('_')]
+
+    @classmethod
+    def get_source_fields(cls, fieldnames=None):
+        """
+        Return a list of source obj fields needed for serialization.
+
+        This compiles the `depends_on` source fields for each field
+        that would be serialized, given `fieldnames` (see
+        `select_fields`), plus the `required_source_fields`. Use it to
+        avoid fetching data from the source that the serializer will
+        never use.
+        """
+        cls.set_up_field_lookup()
+        sources = list(cls.required_source_fields)
+        for f in cls.select_fields(fieldnames):
+            sources.extend(s for s in f.depends_on if s not in sources)
+        return sources
+
     def try_field_data_from_client(self, f, client_data):
         old_ser_data = self.data or {}
         old_val = f.parse_from_client(old_ser_data)
@@ -388,24 +500,66 @@ class SimpleSerializer(object):
         """
         return obj_data
 
+    @classmethod
+    def get_serialization_plan(cls, fields):
+        """
+        Return the serialization plan for the given list of fields: a
+        tuple of (public_name, source, presenter) triples, where each
+        presenter is the field's compiled `present` function, or None
+        if the value comes directly from the `source` field (see
+        `SimpleField.compile_presenter`).
+
+        Plans are compiled the first time they're needed for a given
+        set of fields and then cached on the serializer class.
+        """
+        plans = cls.__dict__.get('_serialization_plans')
+        if plans is None:
+            plans = {}
+            cls._serialization_plans = plans
+        key = tuple(f.name for f in fields)
+        try:
+            return plans[key]
+        except KeyError:
+            pass
+        plans[key] = tuple((f.public_name, f.sources.get('main'),
+                            f.compile_presenter()) for f in fields)
+        return plans[key]
+
     def to_representation(self, obj):
         """
         Serializes an object (or sequence of objects) based on field
         specifications.
-        """
-        if self.obj_interface.obj_is_many(obj):
-            data = []
-            for o in obj:
-                data.append(self.to_representation(o))
-            return data
 
-        data = OrderedDict()
-        if obj is not None:
-            obj_data = self.obj_interface.get_obj_data(obj)
-            obj_data = self.prepare_for_serialization(obj_data)
-            for f in self.fields:
-                data[f.public_name] = f.present(obj_data)
-        return data
+        Every object is serialized using the same plan (see
+        `get_serialization_plan`), so a sequence of objects is handled
+        in one loop. `prepare_for_serialization` is only called if a
+        subclass overrides it.
+        """
+        is_many = self.obj_interface.obj_is_many
+        many = is_many(obj)
+        plan = self.get_serialization_plan(self.active_fields)
+        get_obj_data = self.obj_interface.get_obj_data
+        prepare = self.prepare_for_serialization
+        if prepare.__func__ is SimpleSerializer.prepare_for_serialization:
+            prepare = None
+
+        data = []
+        for o in (obj if many else (obj,)):
+            if o is None:
+                data.append(OrderedDict())
+            elif many and is_many(o):
+                data.append(self.to_representation(o))
+            else:
+                obj_data = get_obj_data(o)
+                if prepare is not None:
+                    obj_data = prepare(obj_data)
+                get = obj_data.get
+                data.append(OrderedDict([
+                    (name, get(source) if present is None
+                     else present(obj_data))
+                    for name, source, present in plan
+                ]))
+        return data if many else data[0]
 
     def prevalidate_client_data(self, client_data):
         errors = []
@@ -463,6 +617,23 @@ class SimpleSerializer(object):
         self.raw_client_data = data
         self.errors = []
 
+    @classmethod
+    def get_related_versions(cls, obj=None):
+        """
+        Get the current state of any data this serializer adds to its
+        output from somewhere other than the objects themselves (e.g.,
+        lookup tables or Redis), for views to fold into their HTTP
+        validators. Pass `obj` for a single-object view, or leave it
+        as None for a list view.
+
+        Returns a list of (version, last_modified) tuples, where
+        `version` is a string and `last_modified` is a Unix timestamp,
+        or None if the time of the last change is not known. If the
+        state of some source can't be determined right now, use None
+        in place of its tuple. By default, this returns an empty list.
+        """
+        return []
+
 
 class SimpleSerializerWithLookups(SimpleSerializer):
     """
@@ -474,18 +645,48 @@ class SimpleSerializerWithLookups(SimpleSerializer):
     To use, your child class should override the cache_all_lookups
     and cache_all_db_objects methods to specify how lookup values are
     derived. (Note that both are optional.)
+
+    Lookup values are stored in `utils.lookupcache.LOOKUP_CACHE`,
+    which all serializers in the process share and which expires and
+    is invalidated independently of any one request. List in
+    `cached_lookups` the names of the lookups that cache_all_lookups
+    loads; cache_all_lookups then only runs when one of those is
+    missing from the cache, so in the steady state, serializing a page
+    of objects does not require any lookup queries.
     """
-    _lookup_cache = {}
+    _lookup_cache = LOOKUP_CACHE
     _db_cache = {}
+    cached_lookups = tuple()
 
     def cache_all(self):
-        self.cache_all_lookups()
-        self.cache_all_db_objects()
+        with servertiming.timing('lookups'):
+            self._lookup_cache.sync()
+            for fname in self.cached_lookups:
+                if fname not in self._lookup_cache:
+                    self.cache_all_lookups()
+                    break
+            self.cache_all_db_objects()
+
+    @classmethod
+    def get_related_versions(cls, obj=None):
+        """
+        Include the state of the `cached_lookups` tables, which change
+        (e.g., when an item status label is edited) independently of
+        the objects that use them.
+        """
+        versions = super(SimpleSerializerWithLookups,
+                         cls).get_related_versions(obj)
+        if cls.cached_lookups:
+            versions.append(
+                cls._lookup_cache.get_versions(cls.cached_lookups)
+            )
+        return versions
 
     def cache_all_lookups(self):
         """
         Child classes should implement this method to load all lookup
-        fields using self.cache_lookup
+        fields using self.cache_lookup. Unlike cache_all, this should
+        always (re)load lookups from the source.
         """
         pass
 
@@ -524,14 +725,20 @@ class SimpleSerializerWithLookups(SimpleSerializer):
         When `refresh` is True, it tries to find a `refresh_{fname}`
         method, where "fname" is the name of the lookup field. If not
         found, then it calls `cache_all_lookups`. Subclasses should
-        implement these methods as necessary.
+        implement these methods as necessary. If the code still isn't
+        found after a refresh, it's cached as None so that we don't
+        refresh again for the same code until the lookup is next
+        invalidated or expires.
         """
-        val = self._lookup_cache.get(fname, {}).get(lookup_code)
+        lookup = self._lookup_cache.get(fname, {})
+        val = lookup.get(lookup_code)
         if val is None and refresh:
-            if lookup_code is None:
+            if lookup_code is None or lookup_code in lookup:
                 return None
             getattr(self, f'refresh_{fname}', self.cache_all_lookups)()
-            val = self._lookup_cache.get(fname, {}).get(lookup_code)
+            lookup = self._lookup_cache.get(fname)
+            if lookup is not None:
+                val = lookup.setdefault(lookup_code, None)
         return val
 
     def cache_field(self, fname, pk, value):
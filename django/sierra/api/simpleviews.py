@@ -1,20 +1,32 @@
 from __future__ import absolute_import
 
+import asyncio
+import functools
+import hashlib
 import logging
+import re
 from collections import OrderedDict
 
 import jsonpatch
 import jsonpointer
+import pysolr
 import six.moves.urllib.error
 import six.moves.urllib.parse
 import six.moves.urllib.request
 from api import exceptions
+from api.renderers import NDJSONRenderer
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.text import compress_sequence
+from rest_framework import permissions
 from rest_framework import status
 from rest_framework import views
 from rest_framework.response import Response
 from rest_framework.templatetags.rest_framework import replace_query_param
-from utils import load_class
+from utils import asyncsolr, load_class, servertiming, solr
 from utils.camel_case import render
 
 # set up logger, for debugging
@@ -37,7 +49,56 @@ class SimpleView(views.APIView):
     resource_name = 'resources'
     multi = True
 
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Dispatch the request, timing each phase of it.
+
+        If settings.SERVER_TIMING_ENABLED is True, this collects
+        timings while the request is handled (see utils.servertiming),
+        renders the response so that rendering can be timed as well,
+        then reports the timings in a `Server-Timing` header and adds
+        them to this view's latency histograms.
+        """
+        if not settings.SERVER_TIMING_ENABLED:
+            return super(SimpleView, self).dispatch(request, *args, **kwargs)
+        timings = servertiming.start_request()
+        try:
+            response = super(SimpleView, self).dispatch(request, *args,
+                                                        **kwargs)
+            if callable(getattr(response, 'render', None)):
+                with timings.timing('render'):
+                    response.render()
+        finally:
+            servertiming.end_request()
+        return self.report_timings(response, timings)
+
+    def report_timings(self, response, timings):
+        """
+        Set the `Server-Timing` header on the given response, based on
+        the given RequestTimings object, add the timings to this view's
+        latency histograms, and return the response.
+        """
+        total = timings.elapsed()
+        response['Server-Timing'] = timings.get_header_value(total)
+        metrics = dict(timings.metrics, total=total)
+        servertiming.LATENCY_HISTOGRAMS.observe(self.get_timing_name(),
+                                                metrics)
+        return response
+
+    def get_timing_name(self):
+        """
+        Get the name this view's timings are aggregated under.
+        """
+        return '{}.{}'.format(type(self).__module__, type(self).__name__)
+
     def get_queryset(self):
+        # Read-only requests share Solr round trips with identical
+        # searches in flight (see utils.solr.coalesced_search). Writes
+        # don't, so that they read what's in Solr now.
+        request = getattr(self, 'request', None)
+        if (isinstance(self.queryset, solr.Queryset) and request is not None
+                and request.method in permissions.SAFE_METHODS):
+            return self.queryset.coalesced()
         return self.queryset
 
     def get_serializer(self, **kwargs):
@@ -79,12 +140,157 @@ class SimpleView(views.APIView):
         return Response(content, status=status.HTTP_200_OK)
 
 
+class AsyncSimpleView(SimpleView):
+    """
+    Base for SimpleViews whose handlers can be coroutines, to run under
+    ASGI (see sierra.asgi).
+
+    The view function that `as_view` returns is a coroutine function,
+    so Django awaits it instead of tying up a thread for the whole
+    request. Handlers (`get`, etc.) that are coroutines are awaited,
+    and handlers that aren't are run in a thread. DRF's request setup
+    (authentication, permission checks, throttling, and content
+    negotiation) may query the database or Redis, so it runs in a
+    thread as well. Use with AsyncSimpleGetMixin for Solr-backed GET
+    views. An existing SimpleView subclass can be made async without
+    changing anything else, e.g.:
+
+    class AsyncItemList(AsyncSimpleGetMixin, AsyncSimpleView, ItemList):
+        pass
+
+    (Under WSGI, Django runs async views in an event loop of their own,
+    which works but gains nothing.) The URLconfs route to the async
+    views in api.views and shelflist.views instead of their sync
+    counterparts when settings.ASYNC_API_VIEWS is True; see
+    `select_view`.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super(AsyncSimpleView, cls).as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        return functools.wraps(view)(async_view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        Dispatch the request, awaiting the handler. Times each phase of
+        the request, like `SimpleView.dispatch`.
+        """
+        if not settings.SERVER_TIMING_ENABLED:
+            return await self.adispatch(request, *args, **kwargs)
+        timings = servertiming.start_request()
+        try:
+            response = await self.adispatch(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                with timings.timing('render'):
+                    response.render()
+        finally:
+            servertiming.end_request()
+        return self.report_timings(response, timings)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        Coroutine version of `APIView.dispatch`.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            method = request.method.lower()
+            handler = self.http_method_not_allowed
+            if method in self.http_method_names:
+                handler = getattr(self, method, handler)
+            if not asyncio.iscoroutinefunction(handler):
+                handler = sync_to_async(handler)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args,
+                                               **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """
+        Coroutine version of `APIView.initial`.
+
+        Authentication and permission checks may query the database,
+        so they run in a thread with `thread_sensitive=True`. Django
+        needs that for ORM calls: it runs all of them in one thread
+        per request, which is also the thread whose connections get
+        cleaned up when the request finishes. A call in any other
+        thread would open a connection that's never closed.
+        Throttling only talks to Redis, and by then the user is
+        already loaded, so it runs with `thread_sensitive=False` and
+        doesn't have to wait for that thread. Content negotiation and
+        versioning don't block, so they run in the event loop.
+        """
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+        await sync_to_async(self.check_access)(request)
+        await sync_to_async(self.check_throttles,
+                            thread_sensitive=False)(request)
+
+    def check_access(self, request):
+        """
+        Authenticate the request and make sure it is permitted.
+        """
+        self.perform_authentication(request)
+        self.check_permissions(request)
+
+
+def select_view(module, name):
+    """
+    Get the view class named `name` from `module`. If
+    settings.ASYNC_API_VIEWS is True and `module` has an async variant
+    of that view, named 'Async' + `name`, get that instead. Use this
+    in a URLconf to serve views asynchronously under ASGI.
+    """
+    if settings.ASYNC_API_VIEWS:
+        return getattr(module, 'Async{}'.format(name), getattr(module, name))
+    return getattr(module, name)
+
+
 class SimpleGetMixin(object):
     """
     Simple mixin for a get view that paginates data. Instead of using a
     special serializer and Django Pagination objects, this uses the
     more standard offset/limit parameters.
+
+    Responses get ETag and Last-Modified validators, and conditional
+    GETs get 304 responses, based on the state of the underlying data
+    (see `get_validators`). Set `conditional_get` to False for views
+    whose output can change in ways the validators don't capture.
     """
+    throttle_cost_rows = 100
+    throttle_cost_offset = 10000
+    conditional_get = True
+
+    def get_throttle_cost(self, request):
+        """
+        Get the number of tokens the given request costs (see
+        api.throttles). List requests cost 1 token, plus 1 for every
+        `throttle_cost_rows` rows requested (the `limit`) and 1 for
+        every `throttle_cost_offset` rows skipped (the `offset`), since
+        bigger pages and deeper offsets mean more work for Solr. Paging
+        with a cursor instead of an offset avoids the offset cost.
+        """
+        if not self.multi:
+            return 1
+        try:
+            offset, limit = self.get_offset_limit_from_request(request)
+        except ValueError:
+            return 1
+        return (1 + max(limit, 0) // self.throttle_cost_rows
+                + max(offset, 0) // self.throttle_cost_offset)
 
     def get_default_paging_params(self):
         """
@@ -95,6 +301,8 @@ class SimpleGetMixin(object):
                                                     'limit'),
             'offset_qp': settings.REST_FRAMEWORK.get('PAGINATE_PARAM',
                                                      'offset'),
+            'cursor_qp': settings.REST_FRAMEWORK.get('CURSOR_PARAM',
+                                                     'cursor'),
             'max_limit': settings.REST_FRAMEWORK.get('MAX_PAGINATE_BY', 500),
             'default_limit': settings.REST_FRAMEWORK.get('PAGINATE_BY', 10)
         }
@@ -110,21 +318,75 @@ class SimpleGetMixin(object):
         than the total), limit used in calculating results for this
         page, the row number of the last valid result on this page
         (`end_row`), and a list of this page's results (`results`).
+
+        If the client opted into cursor-based paging by providing a
+        `cursor` parameter, then the page is fetched using a Solr
+        cursor instead of an offset. In that case, `offset` and
+        `end_row` are None, and the dict also contains the `cursor`
+        used to fetch this page and the `next_cursor`.
         """
         if getattr(self, '_cached_page', None) is None:
             offset, limit = self.get_offset_limit_from_request(request)
-            results = queryset[offset:offset + limit]
-            total = queryset.count()
-            end_row = self.get_page_end_row(total, offset, limit)
-            offset = None if end_row is None else offset
-            self._cached_page = {
+            cursor = self.get_cursor_from_request(request, queryset)
+            if cursor is None:
+                results = queryset[offset:offset + limit]
+                self._cached_page = self.make_page(
+                    results, queryset.count(), offset, limit
+                )
+            else:
+                results, next_cursor = queryset.get_cursor_page(cursor, limit)
+                self._cached_page = self.make_page(
+                    results, queryset.count(), None, limit, cursor,
+                    next_cursor
+                )
+        return self._cached_page
+
+    def make_page(self, results, total, offset, limit, cursor=None,
+                  next_cursor=None):
+        """
+        Make the page dict that `paginate_queryset` returns, given one
+        page of `results` and the parameters used to fetch it. Pass an
+        `offset` of None for cursor-based pages.
+        """
+        if cursor is not None:
+            return {
                 'total': total,
-                'offset': offset,
+                'offset': None,
                 'limit': limit,
-                'end_row': end_row,
-                'results': results
+                'end_row': None,
+                'results': results,
+                'cursor': cursor,
+                'next_cursor': next_cursor
             }
-        return self._cached_page
+        end_row = self.get_page_end_row(total, offset, limit)
+        return {
+            'total': total,
+            'offset': None if end_row is None else offset,
+            'limit': limit,
+            'end_row': end_row,
+            'results': results
+        }
+
+    def get_cursor_from_request(self, request, queryset):
+        """
+        Get the `cursor` value from the given request, or None if the
+        client did not opt into cursor-based paging. A cursor value of
+        `*` requests the first page. Raises a BadQuery exception if the
+        client tries to use a cursor along with an offset or if the
+        given queryset does not support cursors.
+        """
+        params = self.get_default_paging_params()
+        cursor = request.query_params.get(params['cursor_qp'])
+        if cursor is not None:
+            if params['offset_qp'] in request.query_params:
+                msg = ("The '{}' and '{}' parameters cannot be used together."
+                       "".format(params['cursor_qp'], params['offset_qp']))
+                raise exceptions.BadQuery(detail=msg)
+            if not isinstance(queryset, solr.Queryset):
+                msg = ("The '{}' parameter is not supported for this resource."
+                       "".format(params['cursor_qp']))
+                raise exceptions.BadQuery(detail=msg)
+        return cursor
 
     def get_offset_limit_from_request(self, request):
         """
@@ -173,8 +435,18 @@ class SimpleGetMixin(object):
         the current `page` and base `url`. (Where `page` is the output
         from the `paginate_queryset` method.) Returns None if this is
         the last page.
+
+        For cursor-based pages, the next page URL carries the next
+        cursor. (Cursor values may contain characters that must stay
+        URL-encoded, so this URL is not unquoted.)
         """
         params = self.get_default_paging_params()
+        if page.get('cursor') is not None:
+            next_cursor = page['next_cursor']
+            if (next_cursor in (None, page['cursor'])
+                    or len(page['results']) < page['limit']):
+                return None
+            return replace_query_param(url, params['cursor_qp'], next_cursor)
         if page['offset'] is None or page['end_row'] == page['total'] - 1:
             next_offset = None
         else:
@@ -185,6 +457,46 @@ class SimpleGetMixin(object):
         return unquote(replace_query_param(url, params['offset_qp'],
                                            next_offset))
 
+    def get_requested_fields(self, request):
+        """
+        Get the list of fields requested via the `fields` parameter.
+
+        This lets clients ask for a sparse fieldset. Field names may be
+        provided as a comma-delimited list, by repeating the parameter,
+        or both. Returns None if the client did not request specific
+        fields. Raises a BadQuery exception if any of the requested
+        fields are not valid for this resource.
+        """
+        fields_qp = settings.REST_FRAMEWORK.get('FIELDS_PARAM', 'fields')
+        pvals = request.query_params.getlist(fields_qp)
+        fnames = [fn.strip() for pval in pvals for fn in pval.split(',')
+                  if fn.strip()]
+        if not fnames:
+            return None
+        field_lookup = self.get_serializer().field_lookup
+        invalid = [fn for fn in fnames if fn not in field_lookup]
+        if invalid:
+            msg = ("The '{}' parameter contains fields that are not valid for "
+                   "this resource: {}.".format(fields_qp, ', '.join(invalid)))
+            raise exceptions.BadQuery(detail=msg)
+        return fnames
+
+    def project_queryset(self, queryset, fieldnames=None):
+        """
+        Limit the fields the given queryset fetches from Solr.
+
+        Uses the serializer to determine which source fields are needed
+        to serialize the given `fieldnames` (all fields, if None), so
+        that Solr doesn't return stored fields we'll never use. Only
+        Solr querysets are projected, and a queryset that already sets
+        its own field list (`fl`) is left as-is.
+        """
+        if isinstance(queryset, solr.Queryset):
+            if not queryset._search_params.get('fl'):
+                sources = self.serializer_class.get_source_fields(fieldnames)
+                return queryset.only(*sources)
+        return queryset
+
     def get_page_data(self, queryset, request):
         """
         Return data for an API page based on the given queryset and
@@ -210,10 +522,12 @@ class SimpleGetMixin(object):
             page_data['_links']['next'] = {'href': next_page}
 
         resource_name = render.underscoreToCamel(self.resource_name)
-        resource_list = self.get_serializer(instance=page['results'],
-                                            force_refresh=True,
-                                            context={'request': request,
-                                                     'view': self}).data
+        resource_list = self.get_serializer(
+            instance=page['results'],
+            force_refresh=True,
+            context={'request': request, 'view': self},
+            only=self.get_requested_fields(request)
+        ).data
         if resource_list:
             page_data['_embedded'] = {resource_name: resource_list}
         return page_data
@@ -223,19 +537,382 @@ class SimpleGetMixin(object):
         HTTP `get` method for this view. Given the `request`, `args`,
         and `kwargs`, return an appropriately paginated Response obj.
         """
+        fieldnames = self.get_requested_fields(request)
         if self.multi:
-            queryset = self.get_queryset()
-            queryset = self.filter_class().filter_queryset(request, queryset,
-                                                           self)
-            data = self.get_page_data(queryset, request)
+            queryset = self.project_queryset(self.get_queryset(), fieldnames)
+            validators = self.get_validators(
+                request, self.get_list_version(queryset),
+                self.get_related_versions()
+            )
+            not_modified = self.get_not_modified_response(request,
+                                                          validators)
+            if not_modified is not None:
+                return not_modified
+            with servertiming.timing('filter'):
+                queryset = self.filter_class().filter_queryset(request,
+                                                               queryset, self)
+            with servertiming.timing('serialize'):
+                data = self.get_page_data(queryset, request)
         else:
             obj = self.get_object()
-            data = self.get_serializer(
-                instance=obj,
-                force_refresh=True,
-                context={'request': request, 'view': self}
-            ).data
-        return Response(data)
+            validators = self.get_validators(
+                request, self.get_object_version(obj),
+                self.get_related_versions(obj)
+            )
+            not_modified = self.get_not_modified_response(request,
+                                                          validators)
+            if not_modified is not None:
+                return not_modified
+            with servertiming.timing('serialize'):
+                data = self.get_object_data(obj, request, fieldnames)
+        return self.set_validator_headers(Response(data), validators)
+
+    def get_object_data(self, obj, request, fieldnames=None):
+        """
+        Return data for a single-object API response, serializing the
+        given `fieldnames` (all fields, if None) of `obj`.
+        """
+        return self.get_serializer(
+            instance=obj,
+            force_refresh=True,
+            context={'request': request, 'view': self},
+            only=fieldnames
+        ).data
+
+    def get_list_version(self, queryset):
+        """
+        Get a (version, last_modified) tuple representing the current
+        state of the data behind a list view, or None if there isn't
+        one.
+
+        For Solr querysets, the version is the index version and
+        generation, which change with every commit, and `last_modified`
+        is the time of the last commit (a Unix timestamp). The index
+        version is cached for `INDEX_VERSION_MAX_AGE` seconds (see the
+        REST_FRAMEWORK settings), so responses may be validated against
+        a slightly stale version for up to that long after a commit.
+        """
+        if not isinstance(queryset, solr.Queryset):
+            return None
+        max_age = settings.REST_FRAMEWORK.get('INDEX_VERSION_MAX_AGE', 0)
+        try:
+            version, generation = queryset.get_index_version(max_age)
+        except (pysolr.SolrError, KeyError, ValueError) as e:
+            logger.warning('Could not get the index version for a '
+                           'conditional response: {}'.format(e))
+            return None
+        return '{}.{}'.format(version, generation), version / 1000.0
+
+    def get_object_version(self, obj):
+        """
+        Get a (version, last_modified) tuple representing the current
+        state of a single object, or None if there isn't one.
+
+        For Solr results, this uses the `_version_` field, which Solr
+        updates whenever the document changes. The high bits of a
+        `_version_` value are the time of the update, in milliseconds,
+        which we use for `last_modified` (a Unix timestamp).
+        """
+        version = getattr(obj, 'get', lambda key: None)('_version_')
+        if not isinstance(version, int):
+            return None
+        return str(version), (version >> 20) / 1000.0
+
+    def get_related_versions(self, obj=None):
+        """
+        Get a list of (version, last_modified) tuples representing the
+        current state of data the serializer adds from sources other
+        than `obj` (or, if `obj` is None, other than the list's
+        queryset)--see `SimpleSerializer.get_related_versions`.
+        """
+        if not self.conditional_get:
+            return []
+        get_versions = getattr(self.serializer_class,
+                               'get_related_versions', None)
+        return [] if get_versions is None else get_versions(obj)
+
+    def get_validators(self, request, version, related=()):
+        """
+        Get the `etag` and `last_modified` validators for the response
+        to the given request, based on the given `version` tuple (from
+        `get_list_version` or `get_object_version`) and the `related`
+        version tuples (from `get_related_versions`). Returns a dict,
+        or None if `conditional_get` is False or if `version` or any
+        of the `related` versions is None.
+
+        The ETag combines the versions with everything else in the
+        request that changes the representation: the host and path,
+        the query parameters (sorted, so that equivalent queries get
+        the same ETag), and the negotiated media type. `last_modified`
+        is the latest of the versions' timestamps, or None if any of
+        them has no timestamp, since then we can't tell when the
+        response last changed.
+        """
+        if not self.conditional_get or version is None or None in related:
+            return None
+        version, last_modified = version
+        for rel_version, rel_last_modified in related:
+            version = '{}+{}'.format(version, rel_version)
+            if last_modified is not None:
+                if rel_last_modified is None:
+                    last_modified = None
+                else:
+                    last_modified = max(last_modified, rel_last_modified)
+        query = sorted(request.query_params.lists())
+        key = '|'.join([
+            version,
+            request.get_host(),
+            request.path,
+            six.moves.urllib.parse.urlencode(query, doseq=True),
+            getattr(request, 'accepted_media_type', None) or ''
+        ])
+        etag = '"{}"'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+        if last_modified is not None:
+            last_modified = int(last_modified)
+        return {'etag': etag, 'last_modified': last_modified}
+
+    def get_not_modified_response(self, request, validators):
+        """
+        Evaluate the request's conditional headers (`If-None-Match`,
+        `If-Modified-Since`) against the given validators. Returns a
+        304 Not Modified response (with the validator headers set) if
+        the client's copy is still current, or None if it isn't or if
+        there are no validators.
+        """
+        if validators is None:
+            return None
+        response = get_conditional_response(request, **validators)
+        if response is not None:
+            return self.set_validator_headers(response, validators)
+        return None
+
+    def set_validator_headers(self, response, validators):
+        """
+        Set the ETag and Last-Modified headers on the given response,
+        based on the given validators, and return the response.
+        """
+        if validators is not None:
+            response['ETag'] = validators['etag']
+            if validators['last_modified'] is not None:
+                response['Last-Modified'] = http_date(
+                    validators['last_modified']
+                )
+        return response
+
+
+class AsyncSimpleGetMixin(SimpleGetMixin):
+    """
+    Async version of SimpleGetMixin, for use with AsyncSimpleView.
+
+    Solr querysets are converted to utils.asyncsolr.AsyncQueryset
+    objects, so the event loop can serve other requests while this one
+    waits on Solr. Paging, filtering, conditional GETs, and the
+    response format are the same as SimpleGetMixin's. Serializers may
+    do blocking lookups (e.g. in Redis or the database), so they run
+    in a thread--the request's thread-sensitive one, since that's
+    where Django needs database queries to run (see
+    `AsyncSimpleView.ainitial`). The serializer's
+    `get_related_versions` runs with `thread_sensitive=False`, so it
+    should only use Redis or Solr, as the existing ones do.
+    """
+
+    def get_queryset(self):
+        queryset = super(AsyncSimpleGetMixin, self).get_queryset()
+        if (isinstance(queryset, solr.Queryset)
+                and not isinstance(queryset, asyncsolr.AsyncQueryset)):
+            return asyncsolr.AsyncQueryset.from_queryset(queryset)
+        return queryset
+
+    def paginate_queryset(self, queryset, request):
+        """
+        Return the page fetched by `apaginate_queryset`.
+
+        The filter backend calls this (synchronously) to make sure Solr
+        accepts the filtered queryset. Here, that check happens when
+        `apaginate_queryset` fetches the page, so until then this does
+        nothing and returns None.
+        """
+        return getattr(self, '_cached_page', None)
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        Coroutine version of `SimpleGetMixin.paginate_queryset`. Raises
+        a BadQuery exception if Solr rejects the query.
+        """
+        if not isinstance(queryset, asyncsolr.AsyncQueryset):
+            paginate = functools.partial(SimpleGetMixin.paginate_queryset,
+                                         self)
+            self._cached_page = await sync_to_async(paginate)(queryset,
+                                                              request)
+            return self._cached_page
+        offset, limit = self.get_offset_limit_from_request(request)
+        cursor = self.get_cursor_from_request(request, queryset)
+        try:
+            if cursor is None:
+                results = await queryset.aslice(offset, offset + limit)
+                page = self.make_page(results, await queryset.acount(),
+                                      offset, limit)
+            else:
+                results, next_cursor = await queryset.aget_cursor_page(
+                    cursor, limit
+                )
+                page = self.make_page(results, await queryset.acount(),
+                                      None, limit, cursor, next_cursor)
+        except pysolr.SolrError as e:
+            msg = ('Query raised Solr error. {}'.format(e))
+            raise exceptions.BadQuery(detail=msg)
+        self._cached_page = page
+        return page
+
+    async def aget_object(self):
+        """
+        Get the object for a single-object view. By default, this runs
+        `get_object` in a thread; override it to fetch the object
+        natively, e.g.:
+
+        return await self.get_queryset().filter(
+            id=self.kwargs['id']
+        ).aget_item(0)
+
+        (AsyncQueryset.aget_item raises an IndexError if there is no
+        such object, and this converts that to a 404.)
+        """
+        return await sync_to_async(self.get_object)()
+
+    async def get(self, request, *args, **kwargs):
+        """
+        HTTP `get` method for this view. Given the `request`, `args`,
+        and `kwargs`, return an appropriately paginated Response obj.
+        """
+        fieldnames = self.get_requested_fields(request)
+        if self.multi:
+            queryset = self.project_queryset(self.get_queryset(), fieldnames)
+            validators = self.get_validators(
+                request, await self.aget_list_version(queryset),
+                await sync_to_async(self.get_related_versions,
+                                    thread_sensitive=False)()
+            )
+            not_modified = self.get_not_modified_response(request,
+                                                          validators)
+            if not_modified is not None:
+                return not_modified
+            with servertiming.timing('filter'):
+                self._cached_page = None
+                queryset = self.filter_class().filter_queryset(request,
+                                                               queryset, self)
+                await self.apaginate_queryset(queryset, request)
+            with servertiming.timing('serialize'):
+                data = await sync_to_async(self.get_page_data)(queryset,
+                                                               request)
+        else:
+            try:
+                obj = await self.aget_object()
+            except IndexError:
+                raise Http404
+            validators = self.get_validators(
+                request, self.get_object_version(obj),
+                await sync_to_async(self.get_related_versions,
+                                    thread_sensitive=False)(obj)
+            )
+            not_modified = self.get_not_modified_response(request,
+                                                          validators)
+            if not_modified is not None:
+                return not_modified
+            with servertiming.timing('serialize'):
+                data = await sync_to_async(self.get_object_data)(
+                    obj, request, fieldnames
+                )
+        return self.set_validator_headers(Response(data), validators)
+
+    async def aget_list_version(self, queryset):
+        """
+        Coroutine version of `SimpleGetMixin.get_list_version`.
+        """
+        if not isinstance(queryset, asyncsolr.AsyncQueryset):
+            return await sync_to_async(self.get_list_version)(queryset)
+        max_age = settings.REST_FRAMEWORK.get('INDEX_VERSION_MAX_AGE', 0)
+        try:
+            version, generation = await queryset.aget_index_version(max_age)
+        except (pysolr.SolrError, KeyError, ValueError) as e:
+            logger.warning('Could not get the index version for a '
+                           'conditional response: {}'.format(e))
+            return None
+        return '{}.{}'.format(version, generation), version / 1000.0
+
+
+class SimpleDumpMixin(object):
+    """
+    Mixin for a view that streams a full resource listing as NDJSON.
+
+    Add this to a Solr-backed list view (i.e., one that uses
+    SimpleGetMixin) to replace the paginated `get` with one that
+    returns every object matching the request, serialized using the
+    view's serializer, one JSON object per line. The same filter,
+    search, ordering, and `fields` parameters that work on the list
+    view work here. Results are fetched from Solr `dump_page_size` at a
+    time using a cursor and written to a streaming response as they're
+    serialized, so memory use stays constant regardless of how many
+    objects there are. If the client accepts gzip encoding, the stream
+    is gzip-compressed.
+    """
+    dump_page_size = 1000
+    dump_throttle_cost = 100
+    renderer_classes = (NDJSONRenderer,)
+
+    def get_throttle_cost(self, request):
+        """
+        Get the number of tokens the given request costs (see
+        api.throttles). Each dump request costs a flat
+        `dump_throttle_cost` tokens.
+        """
+        return self.dump_throttle_cost
+
+    def paginate_queryset(self, queryset, request):
+        """
+        Get the total number of results, without fetching any.
+
+        The filter backend calls this to make sure Solr accepts the
+        filtered queryset, so that query errors are reported before we
+        start streaming.
+        """
+        if getattr(self, '_cached_page', None) is None:
+            self._cached_page = {'total': queryset.count()}
+        return self._cached_page
+
+    def iter_dump_chunks(self, queryset, request, fieldnames=None):
+        """
+        Generate NDJSON output for the given queryset, one chunk (i.e.
+        one page of Solr results) at a time.
+        """
+        renderer = self.renderer_classes[0]()
+        context = {'request': request, 'view': self}
+        for results in queryset.iter_cursor_pages(self.dump_page_size):
+            data = self.get_serializer(instance=results, force_refresh=True,
+                                       context=context, only=fieldnames).data
+            yield renderer.render(data)
+
+    def client_accepts_gzip(self, request):
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        return bool(re.search(r'\bgzip\b', accept_encoding))
+
+    def get(self, request, *args, **kwargs):
+        """
+        HTTP `get` method for this view. Returns a streaming response.
+        """
+        fieldnames = self.get_requested_fields(request)
+        queryset = self.project_queryset(self.get_queryset(), fieldnames)
+        queryset = self.filter_class().filter_queryset(request, queryset,
+                                                       self)
+        self._cached_page = None
+        chunks = self.iter_dump_chunks(queryset, request, fieldnames)
+        if self.client_accepts_gzip(request):
+            response = StreamingHttpResponse(compress_sequence(chunks))
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = StreamingHttpResponse(chunks)
+        response['Content-Type'] = NDJSONRenderer.media_type
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
 
 
 class SimplePutMixin(object):
@@ -271,3 +948,209 @@ class SimplePatchMixin(object):
         ret_val = self.update_object(request, new_data)
         return ret_val
 
+
+class SimpleBatchPatchMixin(object):
+    """
+    Simple mixin to provide a PATCH method for a SimpleView-based list
+    view, which updates many objects in one request. The request body
+    must be a JSON object mapping the ID of each object to update to a
+    json-patch document (see IETF RFC 6902) for that object, e.g.:
+
+        {"i1000001": [{"op": "replace", "path": "/shelfStatus",
+                       "value": "onShelf"}],
+         "i1000002": [{"op": "remove", "path": "/inventoryNotes"}]}
+
+    Each patch is applied and validated through the view's serializer,
+    the same way SimplePatchMixin does it for a single object. But,
+    instead of saving each object separately, all of the changes are
+    passed to `save_batch` together, which a view using this mixin must
+    implement. Views should use the `commitWithin` query parameter, if
+    provided, as the number of milliseconds the backend may wait before
+    committing the changes.
+
+    The response contains a result for each object in the request: a
+    `status` of 200 if the object was updated or needed no changes, 400
+    if its patch could not be applied or did not validate, 404 if the
+    object isn't in the view's queryset, or whatever status
+    `save_batch` reports for an object it couldn't save (e.g., 409 if
+    it was changed by another request in the meantime). Objects that
+    fail don't stop the others from being saved.
+    """
+    max_batch_size = 1000
+    throttle_cost_batch = 100
+    commit_within_qp = 'commitWithin'
+
+    def get_throttle_cost(self, request):
+        """
+        Get the number of tokens the given request costs (see
+        api.throttles). Batch updates cost 1 token, plus 1 for every
+        `throttle_cost_batch` objects in the batch.
+        """
+        if request.method != 'PATCH':
+            get_cost = getattr(super(SimpleBatchPatchMixin, self),
+                               'get_throttle_cost', None)
+            return 1 if get_cost is None else get_cost(request)
+        data = request.data
+        num_objects = len(data) if isinstance(data, dict) else 0
+        return 1 + num_objects // self.throttle_cost_batch
+
+    def get_batch_patches(self, data):
+        """
+        Validate the given request data. Returns an OrderedDict mapping
+        each object ID to its json-patch document (a list of
+        operations), or raises a BadUpdate exception.
+        """
+        if not isinstance(data, dict) or not data:
+            msg = ('Batch updates require a JSON object that maps each ID to '
+                   'a json-patch document.')
+            raise exceptions.BadUpdate(detail=msg)
+        if len(data) > self.max_batch_size:
+            msg = ('Batch updates are limited to {} resources per request; '
+                   'received {}.'.format(self.max_batch_size, len(data)))
+            raise exceptions.BadUpdate(detail=msg)
+        patches = OrderedDict()
+        for obj_id, patch in data.items():
+            if not isinstance(patch, list):
+                msg = ('The json-patch doc for {} should be an array type--'
+                       'received {}.'.format(obj_id, type(patch)))
+                raise exceptions.BadUpdate(detail=msg)
+            patches[obj_id] = patch
+        return patches
+
+    def get_commit_within_from_request(self, request):
+        """
+        Get the `commitWithin` value (milliseconds) from the given
+        request, or None if there isn't one. Raises a BadQuery
+        exception if it isn't a non-negative integer.
+        """
+        value = request.query_params.get(self.commit_within_qp)
+        if value is None:
+            return None
+        try:
+            commit_within = int(value)
+        except ValueError:
+            commit_within = -1
+        if commit_within < 0:
+            msg = ("The '{}' parameter must be a number of milliseconds."
+                   "".format(self.commit_within_qp))
+            raise exceptions.BadQuery(detail=msg)
+        return commit_within
+
+    def get_batch_objects(self, obj_ids):
+        """
+        Get a dict mapping each of the given IDs to the matching object
+        from this view's queryset. IDs that don't match anything are
+        left out. This works for solr.Queryset querysets; override it
+        if you need something else.
+
+        The objects are found with a search, but their contents come
+        from a real-time get (see `solr.Queryset.get_current`), so
+        their `_version_` values include updates that Solr hasn't
+        committed yet (e.g., from an earlier batch's `commitWithin`).
+        Otherwise, an object changed by such an update would always
+        look stale to a version-checked `save_batch`.
+        """
+        queryset = self.get_queryset().filter(id__in=obj_ids)
+        objects = queryset[0:len(obj_ids)]
+        if isinstance(queryset, solr.Queryset):
+            objects = queryset.get_current(objects)
+        return {self.get_object_id(obj): obj for obj in objects}
+
+    def save_batch(self, changes, commit_within=None):
+        """
+        Save all changes from a batch update. `changes` is a list of
+        (object, changed_data) tuples, where `changed_data` is a dict
+        of only the source fields that changed, mapped to their new
+        values. `commit_within` is from `get_commit_within_from_request`.
+
+        If some objects' changes can't be saved, return a dict mapping
+        each of their IDs to a (status code, details) tuple, which
+        replaces the result for that object; save (and commit) the
+        rest anyway. Raise a BadUpdate exception if nothing can be
+        saved because of a problem with the batch as a whole.
+        """
+        raise NotImplementedError
+
+    def make_batch_result(self, obj_id, status_code, details, data=None):
+        result = OrderedDict([('id', obj_id), ('status', status_code),
+                              ('details', details)])
+        self_link = ((data or {}).get('_links') or {}).get('self')
+        if self_link is not None:
+            result['links'] = {'self': {'href': self_link['href'],
+                                        'id': obj_id}}
+        return result
+
+    def patch_batch_object(self, obj, old_data, patch, context):
+        """
+        Apply one json-patch document (`patch`) to `obj`, whose
+        serialized data is `old_data`. Returns a tuple: (status code,
+        details, changes), where `changes` is a dict of the source
+        fields that changed, or None if the patch failed.
+        """
+        try:
+            new_data = jsonpatch.JsonPatch(patch).apply(old_data)
+        except (jsonpatch.JsonPatchException,
+                jsonpointer.JsonPointerException) as e:
+            msg = 'Could not apply json-patch to object: {}'.format(e)
+            return 400, msg, None
+
+        # The object was already serialized with the rest of the batch,
+        # so the serializer doesn't need to do it again to validate.
+        serializer = self.serializer_class(instance=obj, data=new_data,
+                                           context=context,
+                                           instance_data=old_data)
+        if not serializer.is_valid():
+            msg = ('Attempting to save the object produced the following '
+                   'errors. {}'.format(' '.join(serializer.errors)))
+            return 400, msg, None
+
+        get_obj_data = serializer.obj_interface.get_obj_data
+        old_obj_data = get_obj_data(obj)
+        changes = {k: v for k, v in get_obj_data(serializer.object).items()
+                   if k not in old_obj_data or old_obj_data[k] != v}
+        if changes:
+            return 200, 'The resource was updated.', changes
+        return 200, 'The resource needed no changes.', changes
+
+    def patch(self, request, *args, **kwargs):
+        patches = self.get_batch_patches(request.data)
+        commit_within = self.get_commit_within_from_request(request)
+        objects = self.get_batch_objects(list(patches))
+        context = {'request': request, 'view': self}
+        serializer = self.get_serializer(force_refresh=True,
+                                         instance=list(objects.values()),
+                                         context=context)
+        old_data = dict(zip(objects, serializer.data))
+
+        results, changes = [], []
+        for obj_id, patch in patches.items():
+            if obj_id not in objects:
+                results.append(self.make_batch_result(
+                    obj_id, 404, 'No such resource was found.'
+                ))
+                continue
+            status_code, details, obj_changes = self.patch_batch_object(
+                objects[obj_id], old_data[obj_id], patch, context
+            )
+            if obj_changes:
+                changes.append((objects[obj_id], obj_changes))
+            results.append(self.make_batch_result(
+                obj_id, status_code, details, old_data[obj_id]
+            ))
+
+        failed = self.save_batch(changes, commit_within) if changes else None
+        for result in results:
+            if result['id'] in (failed or {}):
+                result['status'], result['details'] = failed[result['id']]
+
+        num_ok = len([r for r in results if r['status'] == 200])
+        content = {
+            'status': 200,
+            'details': '{} of the {} resources in the request were updated or '
+                       'needed no changes. See `results` for details.'
+                       ''.format(num_ok, len(results)),
+            'commitWithin': commit_within,
+            'results': results
+        }
+        return Response(content, status=status.HTTP_200_OK)
+
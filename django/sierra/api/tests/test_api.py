@@ -6,6 +6,8 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 from datetime import datetime
+import gzip
+import json
 
 import pytest
 from django.contrib.auth.models import User
@@ -1992,6 +1994,49 @@ def test_apiusers_repeated_requests_fail(api_client,
     assert resp_two.status_code == 403
 
 
+@pytest.mark.django_db
+def test_apiusers_credentials_are_cached(api_client,
+                                         apiuser_with_custom_defaults,
+                                         simple_sig_auth_credentials,
+                                         mocker):
+    """
+    Authenticating repeated requests from the same APIUser should only
+    fetch the APIUser from the database once.
+    """
+    test_cls = apiuser_with_custom_defaults()
+    api_user = test_cls.objects.create_user('test', 'secret', password='pw',
+                                            email='test@test.com',
+                                            first_name='F', last_name='Last')
+    spy = mocker.spy(test_cls.objects, 'select_related')
+    for _ in range(3):
+        api_client.credentials(**simple_sig_auth_credentials(api_user))
+        resp = api_client.get('{}apiusers/'.format(API_ROOT))
+        assert resp.status_code == 200
+    assert spy.call_count == 1
+
+
+@pytest.mark.django_db
+def test_apiusers_update_invalidates_cached_credentials(
+        api_client, apiuser_with_custom_defaults, simple_sig_auth_credentials):
+    """
+    Updating an APIUser's secret should take effect for the very next
+    request, even though the APIUser's credentials are cached.
+    """
+    test_cls = apiuser_with_custom_defaults()
+    api_user = test_cls.objects.create_user('test', 'secret', password='pw',
+                                            email='test@test.com',
+                                            first_name='F', last_name='Last')
+    old_user = test_cls.objects.get(pk=api_user.pk)
+    api_client.credentials(**simple_sig_auth_credentials(api_user))
+    assert api_client.get('{}apiusers/'.format(API_ROOT)).status_code == 200
+
+    api_user.update_and_save(secret_text='new secret')
+    api_client.credentials(**simple_sig_auth_credentials(old_user))
+    assert api_client.get('{}apiusers/'.format(API_ROOT)).status_code == 403
+    api_client.credentials(**simple_sig_auth_credentials(api_user))
+    assert api_client.get('{}apiusers/'.format(API_ROOT)).status_code == 200
+
+
 @pytest.mark.parametrize('resource', list(RESOURCE_METADATA.keys()))
 def test_standard_resource(resource, api_settings, api_solr_env, api_client,
                            pick_reference_object_having_link,
@@ -2015,6 +2060,38 @@ def test_standard_resource(resource, api_settings, api_solr_env, api_client,
     assert_data_is_from_serializer(detail_obj, serializer)
 
 
+@pytest.mark.parametrize('resource, fields, exp_fields', [
+    ('bibs', 'id', ['_links', 'id']),
+    ('bibs', 'id,titleDisplay', ['_links', 'id', 'titleDisplay']),
+    ('items', 'callNumber,id', ['_links', 'id', 'callNumber']),
+    ('items', 'location', ['_links', 'location']),
+    ('eresources', 'id&fields=title', ['_links', 'id', 'title']),
+    ('locations', 'label', ['_links', 'label']),
+])
+def test_sparse_fieldsets(resource, fields, exp_fields, api_settings,
+                          api_solr_env, api_client):
+    """
+    Using the `fields` parameter on a list view or a detail view
+    should limit the fields on each serialized object to the ones
+    requested, plus `_links`, in serializer order. Objects in the list
+    view and detail view should otherwise match what you get without
+    the `fields` parameter.
+    """
+    list_url = '{}{}/'.format(API_ROOT, resource)
+    full_objs = api_client.get(list_url).data['_embedded'][resource]
+    sparse_objs = api_client.get('{}?fields={}'.format(list_url, fields)
+                                 ).data['_embedded'][resource]
+    detail_url = sparse_objs[0]['_links']['self']['href']
+    sparse_detail = api_client.get('{}?fields={}'.format(detail_url, fields))
+
+    assert len(full_objs) == len(sparse_objs)
+    assert list(sparse_detail.data.keys()) == exp_fields
+    assert sparse_detail.data == sparse_objs[0]
+    for full, sparse in zip(full_objs, sparse_objs):
+        assert list(sparse.keys()) == exp_fields
+        assert all([sparse[fname] == full[fname] for fname in exp_fields])
+
+
 @pytest.mark.parametrize('resource, links',
                          compile_resource_links(RESOURCE_METADATA))
 def test_standard_resource_links(resource, links, api_settings, api_solr_env,
@@ -2053,6 +2130,9 @@ def test_standard_resource_links(resource, links, api_settings, api_solr_env,
     ('items/?copyNumber[range]=[1, t]', "Could not convert value ' t'"),
     ('items/?copyNumber[range]=1, t', "Could not convert value ' t'"),
     ('items/?copyNumber[startswith]=1', "prefix queries on numeric fields"),
+    ('items/?fields=id,nonExistent', 'not valid for this resource'),
+    ('items/?cursor=*&offset=20', 'cannot be used together'),
+    ('items/?cursor=invalid', 'Solr error'),
 ])
 def test_request_error_badquery(url, err_text, api_solr_env, api_client,
                                 api_settings):
@@ -2149,6 +2229,156 @@ def test_list_view_pagination(resource, default_limit, max_limit, limit,
         assert 'offset={}'.format(exp_prev_offset) in prev_link
 
 
+@pytest.mark.parametrize('resource, limit, orderby', [
+    ('bibs', 7, None),
+    ('items', 7, None),
+    ('items', 13, '-id'),
+    ('eresources', 50, 'id'),
+    ('locations', 5, 'code'),
+])
+def test_list_view_cursor_pagination(resource, limit, orderby, api_settings,
+                                     api_solr_env, api_client):
+    """
+    Requesting the given resource using the `cursor` parameter instead
+    of `offset` should return pages of results, each with a `next` link
+    containing the cursor for the following page. Following `next`
+    links until there are none should return every record exactly once,
+    in the same order you'd get using offsets.
+    """
+    api_settings.REST_FRAMEWORK['MAX_PAGINATE_BY'] = 500
+    api_id_field = RESOURCE_METADATA[resource]['api_id_field']
+    profile = RESOURCE_METADATA[resource]['profile']
+    exp_total = len(api_solr_env.records[profile])
+    base_url = '{}{}/?limit={}'.format(API_ROOT, resource, limit)
+    if orderby:
+        base_url = '{}&orderBy={}'.format(base_url, orderby)
+    all_at_once = api_client.get('{}&limit=500'.format(base_url)).data
+    exp_ids = [r[api_id_field] for r in all_at_once['_embedded'][resource]]
+
+    found_ids = []
+    next_url = '{}&cursor=*'.format(base_url)
+    while next_url:
+        response = api_client.get(next_url)
+        data = response.data
+        assert response.status_code == 200
+        assert data['totalCount'] == exp_total
+        assert 'startRow' not in data
+        assert 'previous' not in data['_links']
+        records = data.get('_embedded', {resource: []})[resource]
+        assert len(records) <= limit
+        found_ids.extend([r[api_id_field] for r in records])
+        next_url = data['_links'].get('next', {'href': None})['href']
+
+    assert len(found_ids) == exp_total
+    assert len(set(found_ids)) == exp_total
+    if orderby:
+        assert found_ids == exp_ids
+    else:
+        assert set(found_ids) == set(exp_ids)
+
+
+@pytest.mark.parametrize('resource, query, gzipped', [
+    ('bibs', '', False),
+    ('items', '?orderBy=-id', False),
+    ('items', '?orderBy=id&fields=id,barcode', True),
+    ('eresources', '', True),
+    ('locations', '?code[startswith]=w', False),
+])
+def test_dump_view(resource, query, gzipped, api_settings, api_solr_env,
+                   api_client):
+    """
+    Requesting a resource's `dump` view should stream every record
+    matching the request as newline-delimited JSON, where each line is
+    the same object the list view returns for that record. If the
+    client accepts gzip, the stream should be gzip-compressed.
+    """
+    api_settings.REST_FRAMEWORK['MAX_PAGINATE_BY'] = 500
+    api_id_field = RESOURCE_METADATA[resource]['api_id_field']
+    list_url = '{}{}/{}'.format(API_ROOT, resource, query)
+    sep = '&' if query else '?'
+    list_resp = api_client.get('{}{}limit=500'.format(list_url, sep))
+    list_data = json.loads(list_resp.content)
+    exp_records = list_data.get('_embedded', {resource: []})[resource]
+    dump_url = '{}{}/dump/{}'.format(API_ROOT, resource, query)
+    encoding = 'gzip, deflate' if gzipped else 'identity'
+    response = api_client.get(dump_url, HTTP_ACCEPT_ENCODING=encoding)
+    body = b''.join(response.streaming_content)
+    if gzipped:
+        assert response['Content-Encoding'] == 'gzip'
+        body = gzip.decompress(body)
+    else:
+        assert not response.has_header('Content-Encoding')
+    records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert len(records) == list_data['totalCount']
+    if 'orderBy' in query:
+        assert records == exp_records
+    else:
+        exp_by_id = {r[api_id_field]: r for r in exp_records}
+        found_by_id = {r[api_id_field]: r for r in records}
+        assert found_by_id == exp_by_id
+
+
+@pytest.mark.parametrize('resource, query', [
+    ('bibs', ''),
+    ('items', '?orderBy=-id&limit=5'),
+    ('locations', '?fields=code,label'),
+])
+def test_conditional_get(resource, query, api_settings, api_solr_env,
+                         api_client, mocker):
+    """
+    List and detail views should return ETag and Last-Modified
+    headers. Repeating a request with a matching `If-None-Match` or a
+    current `If-Modified-Since` header should get a 304 response
+    without serializing anything, and a different query should get a
+    different ETag.
+    """
+    api_settings.REST_FRAMEWORK['INDEX_VERSION_MAX_AGE'] = 0
+    list_url = '{}{}/{}'.format(API_ROOT, resource, query)
+    list_resp = api_client.get(list_url)
+    objects = list_resp.data['_embedded'][resource]
+    detail_url = objects[0]['_links']['self']['href']
+    detail_resp = api_client.get(detail_url)
+    other_resp = api_client.get('{}{}/?limit=1'.format(API_ROOT, resource))
+
+    view_class = type(list_resp.renderer_context['view'])
+    spy = mocker.spy(view_class, 'get_page_data')
+    for url, resp in ((list_url, list_resp), (detail_url, detail_resp)):
+        assert resp.status_code == 200
+        etag, last_modified = resp['ETag'], resp['Last-Modified']
+        by_etag = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        by_date = api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        stale = api_client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        assert by_etag.status_code == 304
+        assert by_etag['ETag'] == etag
+        assert by_etag.content == b''
+        assert by_date.status_code == 304
+        assert stale.status_code == 200
+        assert stale['ETag'] == etag
+    assert spy.call_count == 1
+    assert other_resp['ETag'] != list_resp['ETag']
+
+
+@pytest.mark.parametrize('resource, exp_metrics', [
+    ('bibs', ['filter', 'solr', 'solr-qtime', 'serialize', 'render',
+              'total']),
+    ('items', ['filter', 'solr', 'solr-qtime', 'lookups', 'serialize',
+               'render', 'total']),
+])
+def test_server_timing_header(resource, exp_metrics, api_settings,
+                              api_solr_env, api_client):
+    """
+    List views should report the time spent in each phase of the
+    request in a Server-Timing header.
+    """
+    api_settings.SERVER_TIMING_ENABLED = True
+    resp = api_client.get('{}{}/'.format(API_ROOT, resource))
+    metrics = [m.split(';')[0] for m in resp['Server-Timing'].split(', ')]
+    assert sorted(metrics) == sorted(exp_metrics)
+
+
 @pytest.mark.parametrize('resource, test_data, search, expected',
                          compile_params(PARAMETERS__FILTER_TESTS__INTENDED) +
                          compile_params(PARAMETERS__FILTER_TESTS__STRANGE),
@@ -0,0 +1,90 @@
+"""
+Tests API renderers.
+"""
+
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+import pytz
+from rest_framework.utils import encoders
+
+from api import renderers
+
+
+# FIXTURES AND TEST DATA
+
+TEST_DATA = OrderedDict([
+    ('str', 'Hello / world, "quoted" \\ <b>&</b>\t\n'),
+    ('unicode', 'café   \U0001f600 \x1f \x7f'),
+    ('ints', [0, -5, 2 ** 63, 2 ** 70]),
+    ('floats', [0.0, -0.0, 1.5, 0.1, 1e16, 1e-4, 1e-5, 1.1e-7, 3e-10]),
+    ('decimals', [Decimal('1.10'), Decimal('1E-7'), Decimal('12.345')]),
+    ('datetimes', [datetime(2020, 1, 2, 3, 4, 5, 678901),
+                   datetime(2020, 1, 2, 3, 4, 5, tzinfo=pytz.utc)]),
+    ('timedelta', timedelta(seconds=90)),
+    ('nested', OrderedDict([('list', [OrderedDict(), [], None, True]),
+                            ('none', None), ('false', False)])),
+])
+
+
+# TESTS
+
+@pytest.mark.parametrize('renderer_class', [
+    renderers.FullJSONRenderer,
+    renderers.UnicodeFullJSONRenderer,
+    renderers.HALJSONRenderer,
+])
+@pytest.mark.parametrize('key', list(TEST_DATA.keys()) + [None])
+@pytest.mark.parametrize('accepted_media_type', [
+    None,
+    'application/json',
+    'application/hal+json',
+])
+def test_fulljsonrenderer_matches_stdlib_json(renderer_class, key,
+                                              accepted_media_type):
+    """
+    FullJSONRenderer (and subclasses) should render data exactly the
+    same way that the stdlib json module (using the DRF JSON encoder)
+    does, byte for byte, regardless of which encoder it uses internally.
+    """
+    data = TEST_DATA if key is None else {key: TEST_DATA[key]}
+    renderer = renderer_class()
+    expected = json.dumps(data, cls=encoders.JSONEncoder,
+                          ensure_ascii=renderer.ensure_ascii).encode('utf-8')
+    assert renderer.render(data, accepted_media_type) == expected
+
+
+@pytest.mark.parametrize('accepted_media_type, context, exp_indent', [
+    ('application/json; indent=4', None, 4),
+    ('application/json; indent=20', None, 8),
+    ('application/json; indent=0', None, 0),
+    ('application/json', {'indent': 2}, 2),
+    (None, {'indent': 2}, 2),
+])
+def test_fulljsonrenderer_indentation(accepted_media_type, context,
+                                      exp_indent):
+    """
+    FullJSONRenderer should indent output if indentation is requested
+    via the media type or the renderer context.
+    """
+    data = TEST_DATA
+    expected = json.dumps(data, cls=encoders.JSONEncoder,
+                          indent=exp_indent).encode('utf-8')
+    result = renderers.FullJSONRenderer().render(data, accepted_media_type,
+                                                 context)
+    assert result == expected
+
+
+def test_fulljsonrenderer_uses_ujson_when_not_indenting(mocker):
+    """
+    FullJSONRenderer should render with ujson whenever output is not
+    indented and ujson's output is safe to use.
+    """
+    dumps = mocker.patch.object(renderers.json, 'dumps')
+    data = {'a': [1, 'b', datetime(2020, 1, 2, 3, 4, 5)]}
+    result = renderers.HALJSONRenderer().render(data, 'application/hal+json')
+    assert result == b'{"a": [1, "b", "2020-01-02T03:04:05"]}'
+    dumps.assert_not_called()
@@ -0,0 +1,140 @@
+"""
+Tests the api.simpleserializers module.
+"""
+
+from collections import OrderedDict
+
+import pytest
+
+from api import simpleserializers as ss
+from api import serializers as s
+
+
+# FIXTURES AND TEST DATA
+
+class UpperStrField(s.SimpleStrField):
+    def present(self, obj_data):
+        value = super().present(obj_data)
+        return None if value is None else value.upper()
+
+
+class FirstValueField(s.SimpleStrField):
+    def get_from_source(self, obj_data):
+        value = obj_data.get(self.sources['main'])
+        return value[0] if isinstance(value, list) else value
+
+
+class StrictIntField(s.SimpleIntField):
+    @classmethod
+    def cast_to_python(cls, value):
+        if isinstance(value, bool):
+            raise cls.ValidationError('Booleans are not integers.')
+        return super().cast_to_python(value)
+
+
+class CastStrField(s.SimpleStrField):
+    present_direct_value = False
+
+
+class ExampleSerializer(ss.SimpleSerializer):
+    fields = [
+        s.SimpleStrField('id'),
+        s.SimpleStrField('title', source='title_display'),
+        s.SimpleIntField('count', present_direct_value=False),
+        s.SimpleBoolField('suppressed'),
+        s.SimpleJSONField('data'),
+        CastStrField('code'),
+        UpperStrField('label'),
+        FirstValueField('first', source='values'),
+        StrictIntField('strict', present_direct_value=False),
+        s.SimpleStrField('prepped', derived=True),
+    ]
+
+    def prepare_for_serialization(self, obj_data):
+        obj_data['prepped'] = 'prepped {}'.format(obj_data.get('id'))
+        return obj_data
+
+
+TEST_OBJS = [
+    {'id': 'a1', 'title_display': 'A title', 'count': '5',
+     'suppressed': 'false', 'data': '{"x": [1, 2]}', 'code': 5,
+     'label': 'a label', 'values': ['one', 'two'], 'strict': 3},
+    {'id': 'a2', 'count': ['1', 2.0], 'suppressed': ['t', 'f'],
+     'code': ['a', 1], 'values': 'only', 'strict': [1, '2']},
+    {},
+]
+
+
+def serialize_field_by_field(serializer, obj):
+    """
+    Serialize `obj` one field at a time, using each field's `present`
+    method.
+    """
+    if serializer.obj_interface.obj_is_many(obj):
+        return [serialize_field_by_field(serializer, o) for o in obj]
+    data = OrderedDict()
+    if obj is not None:
+        obj_data = serializer.obj_interface.get_obj_data(obj)
+        obj_data = serializer.prepare_for_serialization(obj_data)
+        for f in serializer.active_fields:
+            data[f.public_name] = f.present(obj_data)
+    return data
+
+
+# TESTS
+
+@pytest.mark.parametrize('obj, only', [
+    (TEST_OBJS, None),
+    (TEST_OBJS, ['id', 'label', 'count']),
+    (TEST_OBJS[0], None),
+    (TEST_OBJS[1], ['first', 'strict']),
+    ([TEST_OBJS[0], None, [TEST_OBJS[1]]], None),
+    ([], None),
+    (None, None),
+])
+def test_simpleserializer_output_matches_field_by_field(obj, only):
+    """
+    SimpleSerializer.to_representation, which uses a compiled plan to
+    serialize objects, should return exactly what calling `present` on
+    each field for each object would return.
+    """
+    serializer = ExampleSerializer(instance=obj, only=only)
+    expected = serialize_field_by_field(serializer, obj)
+    result = serializer.to_representation(obj)
+    assert result == expected
+    assert type(result) == type(expected)
+
+
+@pytest.mark.parametrize('obj', [
+    {'id': 'a1', 'count': 'not a number'},
+    {'id': 'a1', 'count': ['1', 'not a number']},
+    {'id': 'a1', 'strict': True},
+])
+def test_simpleserializer_raises_cast_errors(obj):
+    """
+    SimpleSerializer.to_representation should raise the same
+    ValidationErrors for uncastable values that the field's
+    `cast_to_python` method does.
+    """
+    serializer = ExampleSerializer(instance=[obj])
+    with pytest.raises(ss.SimpleField.ValidationError) as expected:
+        serialize_field_by_field(serializer, [obj])
+    with pytest.raises(ss.SimpleField.ValidationError) as result:
+        serializer.to_representation([obj])
+    assert str(result.value) == str(expected.value)
+
+
+def test_simpleserializer_compiles_plan_once_per_fieldset(mocker):
+    """
+    SimpleSerializer should compile each field's presenter only once
+    for a given serializer class and set of fields.
+    """
+    class PlanExampleSerializer(ExampleSerializer):
+        pass
+
+    spy = mocker.spy(ss.SimpleField, 'compile_presenter')
+    for _ in range(3):
+        PlanExampleSerializer(instance=TEST_OBJS).data
+    assert spy.call_count == len(PlanExampleSerializer.fields)
+    PlanExampleSerializer(instance=TEST_OBJS, only=['id']).data
+    assert spy.call_count == len(PlanExampleSerializer.fields) + 1
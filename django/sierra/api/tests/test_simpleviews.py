@@ -0,0 +1,346 @@
+"""
+Tests the AsyncSimpleView, SimpleBatchPatchMixin, and SimpleGetMixin
+classes in api.simpleviews.
+"""
+
+import asyncio
+import types
+
+import pysolr
+import pytest
+import ujson
+from asgiref.sync import async_to_sync
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import BaseThrottle
+
+from api import exceptions
+from api import serializers as s
+from api import simpleserializers as ss
+from api.simpleviews import AsyncSimpleView, SimpleBatchPatchMixin, \
+                            SimpleGetMixin, SimpleView, select_view
+from utils import solr
+
+
+# FIXTURES AND TEST DATA
+
+class ExampleAsyncView(AsyncSimpleView):
+    authentication_classes = ()
+    permission_classes = ()
+    throttle_classes = ()
+
+    async def get(self, request, *args, **kwargs):
+        await asyncio.sleep(0)
+        if 'bad' in request.query_params:
+            raise exceptions.BadQuery(detail='bad')
+        return Response({'async': True})
+
+    def post(self, request, *args, **kwargs):
+        return Response({'async': False})
+
+
+class DenyAllThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        return False
+
+
+class ExampleThrottledAsyncView(ExampleAsyncView):
+    throttle_classes = (DenyAllThrottle,)
+
+
+class ExampleBatchSerializer(ss.SimpleSerializer):
+    fields = [
+        s.SimpleStrField('id'),
+        s.SimpleIntField('copy_number'),
+        s.SimpleStrField('shelf_status', writeable=True),
+    ]
+
+
+class ExampleBatchView(SimpleBatchPatchMixin, SimpleView):
+    authentication_classes = ()
+    permission_classes = ()
+    throttle_classes = ()
+    serializer_class = ExampleBatchSerializer
+    max_batch_size = 4
+    objects = {
+        'i1': {'id': 'i1', 'copy_number': 1, 'shelf_status': None},
+        'i2': {'id': 'i2', 'copy_number': 2, 'shelf_status': 'onShelf'},
+        'i3': {'id': 'i3', 'copy_number': 3, 'shelf_status': None},
+    }
+    saved = []
+    conflicts = set()
+
+    def get_batch_objects(self, obj_ids):
+        return {i: self.objects[i] for i in obj_ids if i in self.objects}
+
+    def save_batch(self, changes, commit_within=None):
+        self.saved.append((changes, commit_within))
+        return {obj['id']: (409, 'conflict') for obj, _ in changes
+                if obj['id'] in self.conflicts}
+
+
+class ExampleDetailSerializer(ExampleBatchSerializer):
+    related_versions = []
+
+    @classmethod
+    def get_related_versions(cls, obj=None):
+        return list(cls.related_versions)
+
+
+class ExampleDetailView(SimpleGetMixin, SimpleView):
+    authentication_classes = ()
+    permission_classes = ()
+    throttle_classes = ()
+    serializer_class = ExampleDetailSerializer
+    multi = False
+
+    def get_object(self):
+        return {'id': 'i1', 'copy_number': 1, 'shelf_status': None,
+                '_version_': 1000 << 20}
+
+
+@pytest.fixture
+def call_detail_view():
+    ExampleDetailSerializer.related_versions = []
+
+    def _call_detail_view(**headers):
+        request = APIRequestFactory().get('/things/i1', **headers)
+        return ExampleDetailView.as_view()(request)
+    return _call_detail_view
+
+
+@pytest.fixture
+def call_batch_view():
+    ExampleBatchView.saved = []
+    ExampleBatchView.conflicts = set()
+
+    def _call_batch_view(body, path='/things/'):
+        request = APIRequestFactory().patch(path, ujson.dumps(body),
+                                            content_type='application/json')
+        return ExampleBatchView.as_view()(request)
+    return _call_batch_view
+
+
+@pytest.fixture
+def call_view():
+    def _call_view(method='get', path='/things/', view_class=ExampleAsyncView):
+        request = getattr(APIRequestFactory(), method)(path)
+        view = view_class.as_view()
+        return async_to_sync(view)(request)
+    return _call_view
+
+
+# TESTS
+
+def test_asyncsimpleview_as_view_returns_coroutine_function():
+    """
+    AsyncSimpleView.as_view should return a coroutine function, so
+    that Django awaits it under ASGI.
+    """
+    assert asyncio.iscoroutinefunction(ExampleAsyncView.as_view())
+
+
+@pytest.mark.parametrize('method, path, exp_status, exp_data', [
+    ('get', '/things/', 200, {'async': True}),
+    ('post', '/things/', 200, {'async': False}),
+    ('get', '/things/?bad=1', 400, None),
+    ('delete', '/things/', 405, None),
+])
+def test_asyncsimpleview_dispatches_handlers(method, path, exp_status,
+                                             exp_data, call_view, settings):
+    """
+    AsyncSimpleView should await coroutine handlers, run other handlers
+    in a thread, and turn exceptions into error responses, like a
+    normal view. Responses should come back rendered, with a
+    Server-Timing header.
+    """
+    settings.SERVER_TIMING_ENABLED = True
+    response = call_view(method, path)
+    assert response.status_code == exp_status
+    assert response.is_rendered
+    assert 'total;desc="Total"' in response['Server-Timing']
+    if exp_data is not None:
+        assert response.data == exp_data
+
+
+@pytest.mark.parametrize('method', ['get', 'post'])
+def test_asyncsimpleview_checks_throttles(method, call_view):
+    """
+    AsyncSimpleView should run the view's throttle checks before
+    calling the handler, as a normal view does.
+    """
+    response = call_view(method, view_class=ExampleThrottledAsyncView)
+    assert response.status_code == 429
+
+
+@pytest.mark.parametrize('method, exp_coalesce', [
+    ('get', True),
+    ('head', True),
+    ('patch', False),
+])
+def test_simpleview_get_queryset_coalesces_only_reads(method, exp_coalesce):
+    """
+    SimpleView.get_queryset should return a coalesced copy of a Solr
+    queryset for read-only requests, and the queryset as-is for others.
+    """
+    view = SimpleView()
+    view.queryset = solr.Queryset(conn=pysolr.Solr('http://solr/core'))
+    view.request = Request(getattr(APIRequestFactory(), method)('/things/'))
+    assert view.get_queryset().coalesce == exp_coalesce
+    assert not view.queryset.coalesce
+
+
+@pytest.mark.parametrize('async_views, name, exp_name', [
+    (True, 'ThingList', 'AsyncThingList'),
+    (True, 'OtherList', 'OtherList'),
+    (False, 'ThingList', 'ThingList'),
+])
+def test_select_view(async_views, name, exp_name, settings):
+    """
+    `select_view` should return a view's async variant only if
+    settings.ASYNC_API_VIEWS is True and the variant exists.
+    """
+    settings.ASYNC_API_VIEWS = async_views
+    module = types.SimpleNamespace(ThingList='ThingList',
+                                   AsyncThingList='AsyncThingList',
+                                   OtherList='OtherList')
+    assert select_view(module, name) == exp_name
+
+
+def test_simplebatchpatchmixin_saves_all_changes_together(call_batch_view):
+    """
+    SimpleBatchPatchMixin.patch should apply each object's json-patch
+    via the serializer and pass only the changed source fields for
+    every updated object to one `save_batch` call. Each object should
+    get its own result, and objects that fail shouldn't stop the rest.
+    """
+    response = call_batch_view({
+        'i1': [{'op': 'replace', 'path': '/shelfStatus', 'value': 'missing'}],
+        'i2': [{'op': 'replace', 'path': '/shelfStatus',
+                'value': 'onShelf'}],
+        'i3': [{'op': 'replace', 'path': '/copyNumber', 'value': 9}],
+        'i4': [{'op': 'replace', 'path': '/shelfStatus', 'value': 'x'}],
+    }, path='/things/?commitWithin=5000')
+    objs = ExampleBatchView.objects
+
+    assert response.status_code == 200
+    assert ExampleBatchView.saved == [
+        ([(objs['i1'], {'shelf_status': 'missing'})], 5000)
+    ]
+    assert response.data['commitWithin'] == 5000
+    assert [(r['id'], r['status']) for r in response.data['results']] == [
+        ('i1', 200), ('i2', 200), ('i3', 400), ('i4', 404)
+    ]
+    assert 'copyNumber is not a writeable field' in \
+        response.data['results'][2]['details']
+    assert objs['i1']['shelf_status'] is None
+
+
+def test_simplebatchpatchmixin_reports_objects_save_batch_failed(
+        call_batch_view):
+    """
+    SimpleBatchPatchMixin.patch should still return a 200 response with
+    a result for every object when `save_batch` can't save some of
+    them, using the status and details `save_batch` reports for those.
+    """
+    ExampleBatchView.conflicts = {'i1'}
+    response = call_batch_view({
+        'i1': [{'op': 'replace', 'path': '/shelfStatus', 'value': 'missing'}],
+        'i3': [{'op': 'replace', 'path': '/shelfStatus', 'value': 'missing'}],
+    })
+
+    assert response.status_code == 200
+    assert len(ExampleBatchView.saved[0][0]) == 2
+    assert [(r['id'], r['status'], r['details'])
+            for r in response.data['results']] == [
+        ('i1', 409, 'conflict'), ('i3', 200, 'The resource was updated.')
+    ]
+    assert response.data['details'].startswith('1 of the 2 resources')
+
+
+@pytest.mark.parametrize('body, path, exp_status', [
+    ([{'op': 'replace', 'path': '/shelfStatus', 'value': 'x'}], '/things/',
+     400),
+    ({}, '/things/', 400),
+    ({'i1': {'op': 'replace', 'path': '/shelfStatus', 'value': 'x'}},
+     '/things/', 400),
+    ({'i{}'.format(n): [] for n in range(5)}, '/things/', 400),
+    ({'i1': []}, '/things/?commitWithin=soon', 400),
+    ({'i1': [{'op': 'bad', 'path': '/shelfStatus'}]}, '/things/', 200),
+    ({'i1': [{'op': 'remove', 'path': '/nope'}]}, '/things/', 200),
+])
+def test_simplebatchpatchmixin_invalid_requests(body, path, exp_status,
+                                                call_batch_view):
+    """
+    SimpleBatchPatchMixin.patch should reject a request body that
+    isn't an object mapping IDs to json-patch arrays, a batch over
+    `max_batch_size`, or a bad `commitWithin` value, without saving
+    anything. A patch that can't be applied only fails that object.
+    """
+    response = call_batch_view(body, path=path)
+    assert response.status_code == exp_status
+    if exp_status == 200:
+        assert response.data['results'][0]['status'] == 400
+    assert ExampleBatchView.saved == []
+
+
+@pytest.mark.parametrize('related, exp_last_modified', [
+    ([], 1),
+    ([('status=3', 0)], 1),
+    ([('status=3', 2000.5)], 2000),
+    ([('status=3', 2000.5), ('row=5', None)], None),
+])
+def test_simplegetmixin_get_validators_folds_in_related_versions(
+        related, exp_last_modified):
+    """
+    SimpleGetMixin.get_validators should give a different ETag for
+    each combination of the object's version and the related versions,
+    and use the latest timestamp among them for `last_modified`--or
+    None, if any of them has no timestamp.
+    """
+    request = Request(APIRequestFactory().get('/things/i1'))
+    view = ExampleDetailView()
+    plain = view.get_validators(request, ('v1', 1.5))
+    validators = view.get_validators(request, ('v1', 1.5), related)
+    assert validators['last_modified'] == exp_last_modified
+    assert (validators['etag'] == plain['etag']) == (related == [])
+
+
+@pytest.mark.parametrize('related, conditional_get', [
+    ([None], True),
+    ([('status=3', 0), None], True),
+    ([], False),
+])
+def test_simplegetmixin_get_validators_none_if_unknown_or_disabled(
+        related, conditional_get):
+    """
+    SimpleGetMixin.get_validators should return None if the state of
+    any related data is unknown or if the view sets `conditional_get`
+    to False.
+    """
+    request = Request(APIRequestFactory().get('/things/i1'))
+    view = ExampleDetailView()
+    view.conditional_get = conditional_get
+    assert view.get_validators(request, ('v1', 1.5), related) is None
+
+
+def test_simplegetmixin_detail_revalidates_on_related_change(
+        call_detail_view):
+    """
+    A detail view's ETag should change when the serializer's related
+    versions change, even though the object's `_version_` doesn't, so
+    a client revalidating with the old ETag gets the new data rather
+    than a 304.
+    """
+    first = call_detail_view()
+    etag = first['ETag']
+    assert first.status_code == 200
+    assert 'Last-Modified' in first
+    assert call_detail_view(HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    ExampleDetailSerializer.related_versions = [('row=2', None)]
+    second = call_detail_view(HTTP_IF_NONE_MATCH=etag)
+    assert second.status_code == 200
+    assert second['ETag'] != etag
+    assert 'Last-Modified' not in second
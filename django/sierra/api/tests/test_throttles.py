@@ -0,0 +1,136 @@
+"""
+Tests the api.throttles module.
+"""
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import throttles
+from api.simpleviews import SimpleGetMixin, SimpleView
+
+
+# FIXTURES AND TEST DATA
+
+class ExampleListView(SimpleGetMixin, SimpleView):
+    throttle_classes = (throttles.APIUserThrottle, throttles.IPThrottle,
+                        throttles.ViewThrottle)
+
+    def get(self, request, *args, **kwargs):
+        return Response({'ok': True})
+
+
+class ExampleDetailView(ExampleListView):
+    multi = False
+
+
+@pytest.fixture
+def throttle_rates(settings):
+    def _throttle_rates(**rates):
+        settings.REST_FRAMEWORK = dict(settings.REST_FRAMEWORK,
+                                       DEFAULT_THROTTLE_RATES=rates)
+    return _throttle_rates
+
+
+@pytest.fixture
+def make_request():
+    def _make_request(path='/things/', user=None, ip='10.0.0.1'):
+        request = APIRequestFactory().get(path, REMOTE_ADDR=ip)
+        if user is not None:
+            force_authenticate(request, user=user)
+        return request
+    return _make_request
+
+
+# TESTS
+
+@pytest.mark.parametrize('view_class, query, exp_cost', [
+    (ExampleListView, '', 1),
+    (ExampleListView, '?limit=50', 1),
+    (ExampleListView, '?limit=100', 2),
+    (ExampleListView, '?limit=500&offset=20000', 8),
+    (ExampleListView, '?offset=1000000', 101),
+    (ExampleListView, '?offset=bad', 1),
+    (ExampleDetailView, '?offset=1000000', 1),
+])
+def test_simplegetmixin_throttle_cost(view_class, query, exp_cost,
+                                      make_request, settings):
+    """
+    SimpleGetMixin.get_throttle_cost should charge list requests more
+    for large pages and deep offsets.
+    """
+    settings.REST_FRAMEWORK = dict(settings.REST_FRAMEWORK, PAGINATE_BY=20,
+                                   MAX_PAGINATE_BY=500)
+    view = view_class()
+    request = view.initialize_request(make_request('/things/{}'.format(query)))
+    assert view.get_throttle_cost(request) == exp_cost
+
+
+def test_ip_throttle_limits_anonymous_requests(throttle_rates, make_request):
+    """
+    Unauthenticated requests should be limited per IP address. Once a
+    client is over its limit, it should get a 429 response with a
+    Retry-After header.
+    """
+    throttle_rates(ip='3/min')
+    view = ExampleListView.as_view()
+    statuses = [view(make_request()).status_code for _ in range(3)]
+    over_limit = view(make_request())
+    other_ip = view(make_request(ip='10.0.0.2'))
+    assert statuses == [200, 200, 200]
+    assert over_limit.status_code == 429
+    assert 0 < int(over_limit['Retry-After']) <= 20
+    assert other_ip.status_code == 200
+
+
+def test_user_throttle_limits_authenticated_requests(throttle_rates,
+                                                     make_request):
+    """
+    Authenticated requests should be limited per user, not per IP
+    address.
+    """
+    throttle_rates(user='2/min', ip='1/min')
+    view = ExampleListView.as_view()
+    user_a, user_b = User(username='a'), User(username='b')
+    statuses = [view(make_request(user=user_a)).status_code,
+                view(make_request(user=user_a)).status_code,
+                view(make_request(user=user_a)).status_code,
+                view(make_request(user=user_b)).status_code,
+                view(make_request()).status_code]
+    assert statuses == [200, 200, 429, 200, 200]
+
+
+def test_throttles_weight_requests_by_cost(throttle_rates, make_request):
+    """
+    Each request should use up as many tokens as it costs, and
+    requests that cost more than the bucket holds should be allowed
+    only when the bucket is full.
+    """
+    throttle_rates(ip='10/min')
+    view = ExampleListView.as_view()
+    deep = view(make_request('/things/?offset=80000'))
+    shallow = view(make_request('/things/'))
+    too_deep = view(make_request('/things/?offset=1000000'))
+    other_ip_too_deep = view(make_request('/things/?offset=1000000',
+                                          ip='10.0.0.2'))
+    assert deep.status_code == 200
+    assert shallow.status_code == 200
+    assert too_deep.status_code == 429
+    assert other_ip_too_deep.status_code == 200
+
+
+def test_view_throttle_rates(throttle_rates, make_request):
+    """
+    The view throttle should limit all requests to a view, regardless
+    of the client, and views should be able to override rates via a
+    `throttle_rates` attribute.
+    """
+    class LimitedView(ExampleListView):
+        throttle_rates = {'view': '2/min', 'ip': None}
+
+    throttle_rates(ip='1/min')
+    view = LimitedView.as_view()
+    statuses = [view(make_request(ip='10.0.0.{}'.format(i))).status_code
+                for i in range(3)]
+    assert statuses == [200, 200, 429]
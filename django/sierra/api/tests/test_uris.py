@@ -0,0 +1,81 @@
+"""
+Tests the api.uris module.
+"""
+
+import pytest
+from rest_framework.test import APIRequestFactory
+
+from api.uris import Uris
+
+
+# FIXTURES AND TEST DATA
+
+class FakeUris(Uris):
+    root = r'test/'
+    named_uripatterns = {
+        'things-list': [r'v', {'v': r'1'}, r'/things/'],
+        'things-detail': [r'v', {'v': r'1'}, r'/things/', {'id': ''}],
+        'parts-list': [r'v', {'v': r'1'}, r'/things/', {'id': ''},
+                       r'/parts/{x}/'],
+    }
+
+
+@pytest.fixture
+def make_request(settings):
+    settings.ALLOWED_HOSTS = ['example.com', 'example.org']
+
+    def _make_request(path='/test/v1/things/?limit=5', host='example.com'):
+        return APIRequestFactory().get(path, HTTP_HOST=host)
+    return _make_request
+
+
+# TESTS
+
+@pytest.mark.parametrize('name, absolute, template, kwargs, expected', [
+    ('things-list', False, False, {}, '/test/v1/things/'),
+    ('things-list', False, False, {'v': 2}, '/test/v2/things/'),
+    ('things-list', True, False, {}, 'http://example.com/test/v1/things/'),
+    ('things-detail', False, False, {'id': 'a1'}, '/test/v1/things/a1'),
+    ('things-detail', False, False, {}, '/test/v1/things/'),
+    ('things-detail', False, True, {}, '/test/v1/things/{id}'),
+    ('things-detail', False, True, {'id': 'a1'}, '/test/v1/things/{id}'),
+    ('things-detail', True, True, {'v': 2},
+     'http://example.com/test/v2/things/{id}'),
+    ('parts-list', False, False, {'id': 'a1'},
+     '/test/v1/things/a1/parts/{x}/'),
+    ('parts-list', False, True, {}, '/test/v1/things/{id}/parts/{x}/'),
+    ('no-such-pattern', False, False, {}, '/test/'),
+    ('no-such-pattern', True, False, {}, 'http://example.com/test/'),
+])
+def test_uris_geturi(name, absolute, template, kwargs, expected,
+                     make_request, settings):
+    """
+    Uris.get_uri should build the correct URI for the given pattern
+    name and arguments.
+    """
+    settings.SITE_URL_ROOT = '/'
+    req = make_request() if absolute else None
+    uri = FakeUris.get_uri(name, req=req, absolute=absolute,
+                           template=template, **kwargs)
+    assert uri == expected
+
+
+def test_uris_geturi_memoizes_base_uri_per_request(make_request, settings,
+                                                   mocker):
+    """
+    When building absolute URIs, Uris.get_uri should only derive the
+    base URI from the request object once per request.
+    """
+    settings.SITE_URL_ROOT = '/'
+    req1, req2 = make_request(), make_request(host='example.org')
+    mocker.spy(req1, 'build_absolute_uri')
+    mocker.spy(req2, 'build_absolute_uri')
+    for i in range(3):
+        uri1 = FakeUris.get_uri('things-detail', req=req1, absolute=True,
+                                id=i)
+        uri2 = FakeUris.get_uri('things-detail', req=req2, absolute=True,
+                                id=i)
+        assert uri1 == 'http://example.com/test/v1/things/{}'.format(i)
+        assert uri2 == 'http://example.org/test/v1/things/{}'.format(i)
+    assert req1.build_absolute_uri.call_count == 1
+    assert req2.build_absolute_uri.call_count == 1
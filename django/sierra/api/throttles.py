@@ -0,0 +1,184 @@
+"""
+Implements rate limiting (throttling) for the API.
+
+Each throttle keeps token buckets in Redis. A bucket holds up to
+`capacity` tokens and refills at a steady rate; each request removes
+tokens according to its cost, and a request that would overdraw the
+bucket is rejected with a 429 response and a `Retry-After` header
+telling the client how long to wait. Checking and updating a bucket
+happens in one atomic Lua script, so buckets are shared correctly by
+every web server process.
+
+Rates are given like DRF rates, as '<tokens>/<period>' strings (e.g.
+'600/min'), where <tokens> is both the bucket capacity (the maximum
+burst) and how many tokens are refilled over one <period>. Defaults
+come from the `DEFAULT_THROTTLE_RATES` dict in the REST_FRAMEWORK
+settings, keyed by each throttle's `rate_name`; views can override them
+with a `throttle_rates` dict, using the same keys. A rate of None
+disables that throttle.
+
+Request cost comes from the view's `get_throttle_cost` method, if it
+has one, so that expensive requests (e.g. large pages or deep offsets
+in Solr-backed list views) use up a client's allowance faster.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import math
+
+import redis
+from django.conf import settings
+from rest_framework import throttling
+from utils import redisobjs as ro
+
+# set up logger, for debugging
+logger = logging.getLogger('sierra.custom')
+
+
+# TAKE_TOKENS is a Lua script that refills a token bucket based on the
+# time elapsed since it was last used, then tries to take tokens from
+# it. KEYS[1] is the bucket's key (a hash storing the current number of
+# `tokens` and the timestamp, `ts`, of the last update). ARGV[1] is the
+# bucket capacity, ARGV[2] is the refill rate (tokens per second), and
+# ARGV[3] is the number of tokens to take. Uses the Redis server clock,
+# so all web servers agree on the time. Returns a list: [1 if the
+# tokens were taken or 0 if not, seconds until enough tokens would be
+# available, tokens remaining].
+TAKE_TOKENS = ro.REDIS_CONNECTION.register_script('''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts',
+           tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(wait), tostring(tokens)}
+''')
+
+
+class TokenBucketThrottle(throttling.BaseThrottle):
+    """
+    Base class for token-bucket throttles. Subclasses must set a
+    `rate_name` and implement `get_bucket_id`.
+    """
+    redis_key = 'throttle'
+    rate_name = None
+    periods = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+    def __init__(self):
+        self.wait_time = None
+
+    def parse_rate(self, rate):
+        """
+        Parse a '<tokens>/<period>' rate string. Returns a tuple:
+        (capacity, tokens refilled per second), or None if `rate` is
+        None or blank.
+        """
+        if not rate:
+            return None
+        num, period = rate.split('/')
+        capacity = int(num)
+        return capacity, capacity / float(self.periods[period[0]])
+
+    def get_rate(self, view):
+        rates = getattr(view, 'throttle_rates', None) or {}
+        if self.rate_name in rates:
+            return rates[self.rate_name]
+        defaults = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+        return defaults.get(self.rate_name)
+
+    def get_cost(self, request, view):
+        get_throttle_cost = getattr(view, 'get_throttle_cost', None)
+        return 1 if get_throttle_cost is None else get_throttle_cost(request)
+
+    def get_bucket_id(self, request, view):
+        """
+        Return the ID of the bucket to use for this request, or None if
+        this throttle does not apply to the request.
+        """
+        raise NotImplementedError
+
+    def get_bucket_key(self, bucket_id):
+        return '{}:{}:{}'.format(self.redis_key, self.rate_name, bucket_id)
+
+    def allow_request(self, request, view):
+        rate = self.parse_rate(self.get_rate(view))
+        bucket_id = None if rate is None else self.get_bucket_id(request,
+                                                                 view)
+        if bucket_id is None:
+            return True
+        capacity, refill_rate = rate
+        # A request costing more than a full bucket is allowed when the
+        # bucket is full, rather than never.
+        cost = min(self.get_cost(request, view), capacity)
+        try:
+            allowed, wait, _ = TAKE_TOKENS(
+                keys=[self.get_bucket_key(bucket_id)],
+                args=[capacity, refill_rate, cost]
+            )
+        except redis.RedisError as e:
+            logger.warning('Could not check throttle {} for {}: {}'
+                           ''.format(self.rate_name, bucket_id, e))
+            return True
+        if allowed:
+            return True
+        self.wait_time = float(wait)
+        return False
+
+    def wait(self):
+        if self.wait_time is None:
+            return None
+        return math.ceil(self.wait_time)
+
+
+class APIUserThrottle(TokenBucketThrottle):
+    """
+    Throttles authenticated requests, with one bucket per user.
+    """
+    rate_name = 'user'
+
+    def get_bucket_id(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.username
+        return None
+
+
+class IPThrottle(TokenBucketThrottle):
+    """
+    Throttles unauthenticated requests, with one bucket per client IP
+    address. (If the API is behind proxies, set NUM_PROXIES in the
+    REST_FRAMEWORK settings so the address is taken from the
+    X-Forwarded-For header.)
+    """
+    rate_name = 'ip'
+
+    def get_bucket_id(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class ViewThrottle(TokenBucketThrottle):
+    """
+    Throttles all requests to a view, with one bucket per view class,
+    shared by every client. Use this to shed load before a backend
+    (e.g. Solr) is saturated, no matter how many clients there are.
+    """
+    rate_name = 'view'
+
+    def get_bucket_id(self, request, view):
+        return '{}.{}'.format(type(view).__module__, type(view).__name__)
@@ -37,24 +37,62 @@ class Uris(object):
         req should contain the current request object.
         '''
         if absolute:
-            uri = re.sub(r'(//[^/]*)/.*$', r'\1', req.build_absolute_uri())
-            uri = '{}{}{}'.format(uri, settings.SITE_URL_ROOT, self.root)
+            uri = '{}{}{}'.format(self.get_base_uri(req),
+                                  settings.SITE_URL_ROOT, self.root)
         else:
             uri = '/{}'.format(self.root)
-        pattern = self.named_uripatterns.get(name, None)
+        fmt, params = self.get_compiled_pattern(name, template)
+        return uri + fmt.format(*[kwargs.get(p, d) for p, d in params])
 
-        if pattern is not None:
-            for p in pattern:
-                if isinstance(p, dict):
-                    if (template and not list(p.values())[0]):
-                        uri = '{}{{{}}}'.format(uri, list(p.keys())[0])
-                    else:
-                        uri = '{}{}'.format(uri, kwargs.get(list(p.keys())[0],
-                                                            list(p.values())[0]))
+    @classmethod
+    def get_compiled_pattern(self, name, template=False):
+        '''
+        Get the named pattern compiled into a format string and a tuple
+        of (parameter name, default value) pairs, one for each `{}` in
+        the format string. Patterns are compiled the first time they're
+        requested and then cached on the class, so building a URI is
+        just a string format. If template is True, parameters that
+        have no default are left in the URI as `{name}` placeholders.
+        '''
+        compiled = self.__dict__.get('_compiled_patterns')
+        if compiled is None:
+            compiled = {}
+            self._compiled_patterns = compiled
+        try:
+            return compiled[(name, template)]
+        except KeyError:
+            pass
+
+        fmt, params = '', []
+        for p in self.named_uripatterns.get(name, None) or []:
+            if isinstance(p, dict):
+                param, default = list(p.items())[0]
+                if template and not default:
+                    fmt = '{}{{{{{}}}}}'.format(fmt, param)
                 else:
-                    uri = '{}{}'.format(uri, p)
+                    fmt = '{}{{}}'.format(fmt)
+                    params.append((param, default))
+            else:
+                literal = p.replace('{', '{{').replace('}', '}}')
+                fmt = '{}{}'.format(fmt, literal)
+        compiled[(name, template)] = (fmt, tuple(params))
+        return compiled[(name, template)]
 
-        return uri
+    @staticmethod
+    def get_base_uri(req):
+        '''
+        Get the scheme and host portion of the absolute URI for the
+        given request (e.g. 'https://example.com'). This is memoized on
+        the request object, since serializers build many absolute URIs
+        for the same request.
+        '''
+        try:
+            return req._uris_base_uri
+        except AttributeError:
+            base_uri = re.sub(r'(//[^/]*)/.*$', r'\1',
+                              req.build_absolute_uri())
+            req._uris_base_uri = base_uri
+            return base_uri
 
     @classmethod
     def get_urlpattern(self, name, **kwargs):
@@ -88,21 +126,28 @@ class APIUris(Uris):
         'apiusers-list': [r'v', {'v': r'1'}, r'/apiusers/'],
         'apiusers-detail': [r'v', {'v': r'1'}, r'/apiusers/', {'id': ''}],
         'items-list': [r'v', {'v': r'1'}, r'/items/'],
+        'items-dump': [r'v', {'v': r'1'}, r'/items/dump/'],
         'items-detail': [r'v', {'v': r'1'}, r'/items/', {'id': ''}],
         'bibs-list': [r'v', {'v': r'1'}, r'/bibs/'],
+        'bibs-dump': [r'v', {'v': r'1'}, r'/bibs/dump/'],
         'bibs-detail': [r'v', {'v': r'1'}, r'/bibs/', {'id': ''}],
         'marc-list': [r'v', {'v': r'1'}, r'/marc/'],
         'marc-detail': [r'v', {'v': r'1'}, r'/marc/', {'id': ''}],
         'locations-list': [r'v', {'v': r'1'}, r'/locations/'],
+        'locations-dump': [r'v', {'v': r'1'}, r'/locations/dump/'],
         'locations-detail': [r'v', {'v': r'1'}, r'/locations/', {'code': ''}],
         'itemtypes-list': [r'v', {'v': r'1'}, r'/itemtypes/'],
+        'itemtypes-dump': [r'v', {'v': r'1'}, r'/itemtypes/dump/'],
         'itemtypes-detail': [r'v', {'v': r'1'}, r'/itemtypes/', {'code': ''}],
         'itemstatuses-list': [r'v', {'v': r'1'}, r'/itemstatuses/'],
+        'itemstatuses-dump': [r'v', {'v': r'1'}, r'/itemstatuses/dump/'],
         'itemstatuses-detail': [r'v', {'v': r'1'}, r'/itemstatuses/',
                                 {'code': ''}],
         'callnumbermatches-list': [r'v', {'v': r'1'}, r'/callnumbermatches/'],
         'firstitemperlocation-list': [r'v', {'v': r'1'},
                                       r'/firstitemperlocation/'],
         'eresources-list': [r'v', {'v': r'1'}, r'/eresources/'],
+        'eresources-dump': [r'v', {'v': r'1'}, r'/eresources/dump/'],
         'eresources-detail': [r'v', {'v': r'1'}, r'/eresources/', {'id': ''}],
+        'timings-list': [r'v', {'v': r'1'}, r'/timings/'],
     }
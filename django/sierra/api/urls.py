@@ -6,6 +6,7 @@ from django.views.generic import RedirectView
 from rest_framework.urlpatterns import format_suffix_patterns
 
 from . import views
+from .simpleviews import select_view
 from .uris import APIUris
 
 urlpatterns = [
@@ -19,42 +20,64 @@ urlpatterns = [
                                    id=r'(?P<id>[^?/]+)'),
             views.APIUserDetail.as_view(), name='apiusers-detail'),
     re_path(APIUris.get_urlpattern('items-list', v=r'1'),
-            views.ItemList.as_view(), name='items-list'),
+            select_view(views, 'ItemList').as_view(), name='items-list'),
+    re_path(APIUris.get_urlpattern('items-dump', v=r'1'),
+            views.ItemDump.as_view(), name='items-dump'),
     re_path(APIUris.get_urlpattern('items-detail', v=r'1',
                                    id=r'(?P<id>i[0-9]+)'),
-            views.ItemDetail.as_view(), name='items-detail'),
+            select_view(views, 'ItemDetail').as_view(), name='items-detail'),
     re_path(APIUris.get_urlpattern('bibs-list', v=r'1'),
-            views.BibList.as_view(),
+            select_view(views, 'BibList').as_view(),
             name='bibs-list'),
+    re_path(APIUris.get_urlpattern('bibs-dump', v=r'1'),
+            views.BibDump.as_view(), name='bibs-dump'),
     re_path(APIUris.get_urlpattern('bibs-detail', v=r'1',
                                    id=r'(?P<id>b[0-9]+)'),
-            views.BibDetail.as_view(), name='bibs-detail'),
+            select_view(views, 'BibDetail').as_view(), name='bibs-detail'),
     re_path(APIUris.get_urlpattern('eresources-list', v=r'1'),
-            views.EResourceList.as_view(), name='eresources-list'),
+            select_view(views, 'EResourceList').as_view(),
+            name='eresources-list'),
+    re_path(APIUris.get_urlpattern('eresources-dump', v=r'1'),
+            views.EResourceDump.as_view(), name='eresources-dump'),
     re_path(APIUris.get_urlpattern('eresources-detail', v=r'1',
                                    id=r'(?P<id>e[0-9]+)'),
-            views.EResourceDetail.as_view(), name='eresources-list'),
+            select_view(views, 'EResourceDetail').as_view(),
+            name='eresources-list'),
     re_path(APIUris.get_urlpattern('locations-list', v=r'1'),
-            views.LocationList.as_view(), name='locations-list'),
+            select_view(views, 'LocationList').as_view(),
+            name='locations-list'),
+    re_path(APIUris.get_urlpattern('locations-dump', v=r'1'),
+            views.LocationDump.as_view(), name='locations-dump'),
     re_path(APIUris.get_urlpattern('locations-detail', v=r'1',
                                    code=r'(?P<code>[a-z0-9]+)'),
-            views.LocationDetail.as_view(), name='locations-detail'),
+            select_view(views, 'LocationDetail').as_view(),
+            name='locations-detail'),
     re_path(APIUris.get_urlpattern('itemtypes-list', v=r'1'),
-            views.ItemTypesList.as_view(), name='itemtypes-list'),
+            select_view(views, 'ItemTypesList').as_view(),
+            name='itemtypes-list'),
+    re_path(APIUris.get_urlpattern('itemtypes-dump', v=r'1'),
+            views.ItemTypesDump.as_view(), name='itemtypes-dump'),
     re_path(APIUris.get_urlpattern('itemtypes-detail', v=r'1',
                                    code=r'(?P<code>[a-z0-9]+)'),
-            views.ItemTypesDetail.as_view(), name='itemtypes-detail'),
+            select_view(views, 'ItemTypesDetail').as_view(),
+            name='itemtypes-detail'),
     re_path(APIUris.get_urlpattern('itemstatuses-list', v=r'1'),
-            views.ItemStatusesList.as_view(), name='itemstatuses-list'),
+            select_view(views, 'ItemStatusesList').as_view(),
+            name='itemstatuses-list'),
+    re_path(APIUris.get_urlpattern('itemstatuses-dump', v=r'1'),
+            views.ItemStatusesDump.as_view(), name='itemstatuses-dump'),
     re_path(APIUris.get_urlpattern('itemstatuses-detail', v=r'1',
                                    code=r'(?P<code>[a-z0-9]+)'),
-            views.ItemStatusesDetail.as_view(), name='itemstatuses-detail'),
+            select_view(views, 'ItemStatusesDetail').as_view(),
+            name='itemstatuses-detail'),
     re_path(APIUris.get_urlpattern('callnumbermatches-list', v=r'1'),
             views.CallnumbermatchesList.as_view(),
             name='callnumbermatches-list'),
     re_path(APIUris.get_urlpattern('firstitemperlocation-list', v=r'1'),
             views.FirstItemPerLocationList.as_view(),
             name='firstitemperlocation-list'),
+    re_path(APIUris.get_urlpattern('timings-list', v=r'1'),
+            views.Timings.as_view(), name='timings-list'),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns, allowed=['json', 'html'])
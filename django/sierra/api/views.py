@@ -8,14 +8,16 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.http import Http404
 from django.utils import timezone as tz
-from rest_framework import permissions
+from rest_framework import authentication, permissions, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from utils import solr
+from rest_framework.settings import api_settings
+from utils import servertiming, solr
 
 from . import filters
 from . import serializers
-from .simpleviews import SimpleView, SimpleGetMixin
+from .simpleviews import SimpleView, SimpleGetMixin, SimpleDumpMixin, \
+                         AsyncSimpleView, AsyncSimpleGetMixin
 from .uris import APIUris
 
 # set up logger, for debugging
@@ -345,22 +347,42 @@ class CallnumbermatchesList(SimpleGetMixin, SimpleView):
     serializer_class = serializers.ItemSerializer
     resource_name = 'callnumber_matches'
     filter_fields = ['call_number', 'location_code', 'call_number_type']
+    group_field = 'call_number'
+
+    def paginate_queryset(self, queryset, request):
+        """
+        Fetch up to `limit` distinct call numbers using one Solr query.
+
+        The (filtered and sorted) queryset is grouped on the call
+        number field, with one document per group. Solr orders groups
+        based on the top document in each, so call numbers come back in
+        the same order they'd appear in the full sorted result set. One
+        extra group is requested in case the null group (items without
+        a call number) is among them. The return value is a dict with
+        the list of call numbers (`results`), cached so that the
+        filter backend and `get_page_data` share the same response.
+        """
+        if getattr(self, '_cached_page', None) is None:
+            _, limit = self.get_offset_limit_from_request(request)
+            gf = self.group_field
+            grouped_qs = queryset.set_raw_params({
+                'group': 'true',
+                'group.field': gf,
+                'group.limit': 1,
+                'start': 0,
+                'rows': limit + 1
+            })
+            groups = grouped_qs.full_response.grouped[gf]['groups']
+            results = [g['groupValue'] for g in groups
+                       if g['groupValue'] is not None]
+            self._cached_page = {'results': results[:limit]}
+        return self._cached_page
 
     def get_page_data(self, queryset, request):
         # for paging, we only use the 'limit'
-        limit_p = settings.REST_FRAMEWORK.get('PAGINATE_BY_PARAM', 'limit')
-        max_limit = settings.REST_FRAMEWORK.get('MAX_PAGINATE_BY', 500)
-        default_limit = settings.REST_FRAMEWORK.get('PAGINATE_BY', 10)
-        limit = int(request.query_params.get(limit_p, default_limit))
-        limit = max_limit if limit > max_limit else limit
-        data, i, count = [], 0, queryset.count()
-        while len(data) < limit and i < count:
-            call_number = queryset[i].get('call_number', None)
-            if call_number is not None and call_number not in data:
-                data.append(call_number)
-            i += 1
-
-        return data
+        page = self.paginate_queryset(queryset, request)
+        self._cached_page = None
+        return page['results']
 
 
 class FirstItemPerLocationList(SimpleGetMixin, SimpleView):
@@ -368,47 +390,263 @@ class FirstItemPerLocationList(SimpleGetMixin, SimpleView):
     Returns the first item (by call number) for each location within a
     filtered result set.
     """
-    facet_field = 'location_code'
+    group_field = 'location_code'
+    group_sort = 'call_number_sort asc'
+    max_groups = 1000
+    item_fields = ['id', 'parent_bib_title', 'parent_bib_record_number',
+                   'call_number', 'barcode', 'record_number',
+                   'call_number_type', 'location_code']
     queryset = solr.Queryset(
         using=settings.REST_VIEWS_HAYSTACK_CONNECTIONS['Items']
-    ).filter(type='Item').search(
-        '*:*', params={'facet': 'true', 'facet.field': facet_field,
-                       'facet.sort': 'index', 'facet.mincount': 1}
-    )
+    ).filter(type='Item')
     serializer_class = serializers.ItemSerializer
     resource_name = 'firstitemperlocation'
 
+    def paginate_queryset(self, queryset, request):
+        """
+        Fetch the first item for each location using one Solr query.
+
+        Instead of paging, this groups the (filtered) queryset on the
+        `group_field`, asking Solr for only the top item in each group
+        based on `group_sort`. Groups come back in `group_field` order,
+        and items that have no value for the `group_field` are skipped.
+        The return value is a dict containing the total number of
+        groups (`total`) and the list of first items (`results`); like
+        the default paginator, it's cached so the filter backend and
+        `get_page_data` can share the same Solr response.
+        """
+        if getattr(self, '_cached_page', None) is None:
+            gf = self.group_field
+            grouped_qs = queryset.set_raw_params({
+                'group': 'true',
+                'group.field': gf,
+                'group.sort': self.group_sort,
+                'group.limit': 1,
+                'sort': '{} asc'.format(gf),
+                'start': 0,
+                'rows': self.max_groups,
+                'fl': self.item_fields
+            })
+            groups = grouped_qs.full_response.grouped[gf]['groups']
+            results = [solr.Result(g['doclist']['docs'][0]) for g in groups
+                       if g['groupValue'] is not None
+                       and g['doclist']['docs']]
+            self._cached_page = {'total': len(results), 'results': results}
+        return self._cached_page
+
     def get_page_data(self, queryset, request):
-        ff = self.facet_field
-        facets = queryset.full_response.facets['facet_fields'][ff]
-        fields = ['id', 'parent_bib_title', 'parent_bib_record_number',
-                  'call_number', 'barcode', 'record_number', 'call_number_type']
-        total_count = int(len(facets) / 2)
+        page = self.paginate_queryset(queryset, request)
+        self._cached_page = None
         items = []
 
-        for key in facets[0:len(facets):2]:
-            facet_qs = solr.Queryset(conn=queryset._conn)
-            facet_qs._search_params['fq'] = queryset._search_params['fq']
-            facet_qs = facet_qs.filter(**{ff: key})
-            facet_qs = facet_qs.order_by('call_number_sort').only(*fields)
-            item_uri = APIUris.get_uri('items-detail', id=facet_qs[0]['id'],
+        for item in page['results']:
+            item_uri = APIUris.get_uri('items-detail', id=item['id'],
                                        req=request, absolute=True)
             items.append({
                 '_links': {'self': {'href': item_uri}},
-                'id': facet_qs[0].get('id'),
-                'parentBibRecordNumber':
-                    facet_qs[0].get('parent_bib_record_number'),
-                'parentBibTitle': facet_qs[0].get('parent_bib_title'),
-                'recordNumber': facet_qs[0].get('id'),
-                'callNumber': facet_qs[0].get('call_number'),
-                'callNumberType': facet_qs[0].get('call_number_type'),
-                'barcode': facet_qs[0].get('barcode'),
-                'locationCode': key,
+                'id': item.get('id'),
+                'parentBibRecordNumber': item.get('parent_bib_record_number'),
+                'parentBibTitle': item.get('parent_bib_title'),
+                'recordNumber': item.get('id'),
+                'callNumber': item.get('call_number'),
+                'callNumberType': item.get('call_number_type'),
+                'barcode': item.get('barcode'),
+                'locationCode': item.get(self.group_field),
             })
 
         data = OrderedDict()
-        data['totalCount'] = total_count
+        data['totalCount'] = page['total']
         data['_links'] = {'self': request.build_absolute_uri()}
         data['_embedded'] = {'items': items}
 
         return data
+
+
+# Async versions of the Solr-backed list and detail views. The URLconf
+# routes to these instead when settings.ASYNC_API_VIEWS is True, so
+# that, under ASGI, requests waiting on Solr don't each hold a thread.
+# (See api.simpleviews.AsyncSimpleView.)
+
+class AsyncItemList(AsyncSimpleGetMixin, AsyncSimpleView, ItemList):
+    """
+    Async version of ItemList.
+    """
+
+
+class AsyncItemDetail(AsyncSimpleGetMixin, AsyncSimpleView, ItemDetail):
+    """
+    Async version of ItemDetail.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            id=self.kwargs['id']
+        ).aget_item(0)
+
+
+class AsyncBibList(AsyncSimpleGetMixin, AsyncSimpleView, BibList):
+    """
+    Async version of BibList.
+    """
+
+
+class AsyncBibDetail(AsyncSimpleGetMixin, AsyncSimpleView, BibDetail):
+    """
+    Async version of BibDetail.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            id=self.kwargs['id']
+        ).aget_item(0)
+
+
+class AsyncEResourceList(AsyncSimpleGetMixin, AsyncSimpleView, EResourceList):
+    """
+    Async version of EResourceList.
+    """
+
+
+class AsyncEResourceDetail(AsyncSimpleGetMixin, AsyncSimpleView,
+                           EResourceDetail):
+    """
+    Async version of EResourceDetail.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            id=self.kwargs['id']
+        ).aget_item(0)
+
+
+class AsyncLocationList(AsyncSimpleGetMixin, AsyncSimpleView, LocationList):
+    """
+    Async version of LocationList.
+    """
+
+
+class AsyncLocationDetail(AsyncSimpleGetMixin, AsyncSimpleView,
+                          LocationDetail):
+    """
+    Async version of LocationDetail.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            code=self.kwargs['code']
+        ).aget_item(0)
+
+
+class AsyncItemTypesList(AsyncSimpleGetMixin, AsyncSimpleView, ItemTypesList):
+    """
+    Async version of ItemTypesList.
+    """
+
+
+class AsyncItemTypesDetail(AsyncSimpleGetMixin, AsyncSimpleView,
+                           ItemTypesDetail):
+    """
+    Async version of ItemTypesDetail.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            code=self.kwargs['code']
+        ).aget_item(0)
+
+
+class AsyncItemStatusesList(AsyncSimpleGetMixin, AsyncSimpleView,
+                            ItemStatusesList):
+    """
+    Async version of ItemStatusesList.
+    """
+
+
+class AsyncItemStatusesDetail(AsyncSimpleGetMixin, AsyncSimpleView,
+                              ItemStatusesDetail):
+    """
+    Async version of ItemStatusesDetail.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            code=self.kwargs['code']
+        ).aget_item(0)
+
+
+class ItemDump(SimpleDumpMixin, ItemList):
+    """
+    Streams all items matching the request filters as
+    newline-delimited JSON.
+    """
+
+
+class BibDump(SimpleDumpMixin, BibList):
+    """
+    Streams all bibs matching the request filters as
+    newline-delimited JSON.
+    """
+
+
+class EResourceDump(SimpleDumpMixin, EResourceList):
+    """
+    Streams all eresources matching the request filters as
+    newline-delimited JSON.
+    """
+
+
+class LocationDump(SimpleDumpMixin, LocationList):
+    """
+    Streams all locations matching the request filters as
+    newline-delimited JSON.
+    """
+
+
+class ItemTypesDump(SimpleDumpMixin, ItemTypesList):
+    """
+    Streams all item types matching the request filters as
+    newline-delimited JSON.
+    """
+
+
+class ItemStatusesDump(SimpleDumpMixin, ItemStatusesList):
+    """
+    Streams all item statuses matching the request filters as
+    newline-delimited JSON.
+    """
+
+
+class Timings(SimpleView):
+    """
+    Latency histograms for each API view, aggregated across all server
+    processes, in milliseconds. For each view and each timed phase of
+    a request (filtering, Solr round trips, Solr QTime, lookups,
+    serialization, rendering, and the total), this shows the number of
+    requests, mean and estimated percentile latencies, and counts of
+    requests per latency bucket, keyed by each bucket's upper bound.
+    Only staff users can view these. Send a DELETE request to reset
+    them.
+    """
+    resource_name = 'timings'
+    authentication_classes = (
+        tuple(api_settings.DEFAULT_AUTHENTICATION_CLASSES) +
+        (authentication.SessionAuthentication,)
+    )
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        histograms = servertiming.LATENCY_HISTOGRAMS
+        return Response(OrderedDict([
+            ('_links', {
+                'self': {
+                    'href': APIUris.get_uri('timings-list', req=request,
+                                            absolute=True)
+                }
+            }),
+            ('bucketsMs', histograms.bucket_labels),
+            ('views', histograms.get_histograms()),
+        ]))
+
+    def delete(self, request, *args, **kwargs):
+        servertiming.LATENCY_HISTOGRAMS.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
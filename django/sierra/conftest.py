@@ -26,6 +26,7 @@ from rest_framework import test as drftest
 from api.models import APIUser
 from base import models as bm
 from export import models as em
+from utils.lookupcache import LOOKUP_CACHE
 from utils.redisobjs import RedisObject
 from utils.test_helpers import (fixture_factories as ff,
                                 solr_test_profiles as tp)
@@ -38,9 +39,14 @@ def pytest_runtest_teardown(item, nextitem):
     Flush the Redis appdata store after every single test. We can get
     away with this for Redis because it's fast. (There is no
     discernable difference in test run time with and without this.)
+    The in-process lookup and APIUser credential caches are cleared
+    along with it, since tests load different lookup data into Solr and
+    create different APIUsers.
     """
     conn = redis.StrictRedis(**settings.REDIS_CONNECTION)
     conn.flushdb()
+    LOOKUP_CACHE.clear()
+    APIUser.credential_cache.clear()
 
 
 # General utility fixtures
@@ -10,12 +10,14 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import logging
+from collections import OrderedDict
 
 from base import models as sierra_models
 from base import search_indexes as indexes
 from django.conf import settings
 from export.exporter import (Exporter, ToSolrExporter, MetadataToSolrExporter,
                              CompoundMixin, AttachedRecordExporter)
+from redis.exceptions import WatchError
 from six import iteritems
 from utils import helpers, redisobjs, solr
 
@@ -26,6 +28,130 @@ logger = logging.getLogger('sierra.custom')
 SOLR_CONNS = settings.EXPORTER_HAYSTACK_CONNECTIONS
 
 
+# REMOVE_IF_EQUAL is a Lua script that deletes each hash field in
+# ARGV[2..n] from hash KEYS[1], but only where the field's current
+# value is ARGV[1]. (It's how we unmap holdings from one eresource
+# without clobbering a holding that another eresource has claimed in
+# the meantime.) Returns the number of fields deleted.
+REMOVE_IF_EQUAL = redisobjs.REDIS_CONNECTION.register_script('''
+local deleted = 0
+for i = 2, #ARGV do
+  if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[1] then
+    deleted = deleted + redis.call('HDEL', KEYS[1], ARGV[i])
+  end
+end
+return deleted
+''')
+
+
+class ReverseHoldingsList(object):
+    """
+    Maps holdings record numbers to the record numbers of the
+    eresources they're attached to.
+
+    The mapping has an entry for every holdings record we've ever
+    exported, so it's stored as a Redis hash, and exporters work with
+    it a field at a time: `get` (HMGET), `set` (HSET), and `remove`
+    (HDEL). What one export chunk costs depends on how many holdings
+    are in the chunk, not on how many there are in total.
+
+    Older versions stored the mapping as one encoded object, read and
+    rewritten whole for every chunk. `migrate` converts that to a hash
+    in place; it runs automatically the first time an instance is
+    used, and it's a no-op (one TYPE call) once the data is converted.
+    """
+    entity = 'reverse_holdings_list'
+    obj_id = '0'
+
+    def __init__(self):
+        self.obj = redisobjs.RedisObject(self.entity, self.obj_id)
+        self.migrated = False
+
+    @property
+    def conn(self):
+        return self.obj.conn
+
+    @property
+    def key(self):
+        return self.obj.key
+
+    def migrate(self):
+        """
+        Convert a legacy encoded-object mapping to a hash, atomically
+        (via WATCH) so that concurrent export tasks can't convert it
+        twice or interleave writes with the conversion. Returns True
+        if anything was converted.
+        """
+        with self.conn.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.key)
+                    if pipe.type(self.key) != 'string':
+                        return False
+                    raw = pipe.get(self.key)
+                    if raw.startswith(redisobjs.STR_OBJ_PREFIX):
+                        raw = raw[len(redisobjs.STR_OBJ_PREFIX):]
+                    mapping = redisobjs.decode_member(raw) or {}
+                    pipe.multi()
+                    pipe.delete(self.key)
+                    if mapping:
+                        pipe.hset(self.key, mapping={
+                            h: redisobjs.encode_member(er, self.obj.codec)
+                            for h, er in mapping.items()
+                        })
+                    pipe.execute()
+                except WatchError:
+                    continue
+                logger.info('Converted {} ({} holdings) to a Redis hash.'
+                            ''.format(self.key, len(mapping)))
+                return True
+
+    def _ensure_migrated(self):
+        if not self.migrated:
+            if self.migrate():
+                self.obj = redisobjs.RedisObject(self.entity, self.obj_id)
+            self.migrated = True
+
+    def get(self, h_rec_nums):
+        """
+        Return a dict mapping each of the given holdings record
+        numbers to its eresource record number, or None if it isn't
+        mapped, in one HMGET.
+        """
+        h_rec_nums = list(h_rec_nums)
+        if not h_rec_nums:
+            return {}
+        self._ensure_migrated()
+        er_rec_nums = self.obj.get(h_rec_nums, 'fields')
+        er_rec_nums = er_rec_nums or [None] * len(h_rec_nums)
+        return dict(zip(h_rec_nums, er_rec_nums))
+
+    def set(self, mapping):
+        """
+        Map holdings record numbers to eresource record numbers, per
+        the given dict, with one HSET.
+        """
+        if mapping:
+            self._ensure_migrated()
+            self.obj.set(mapping, update=True)
+
+    def remove(self, h_rec_nums, er_rec_num=None):
+        """
+        Unmap the given holdings record numbers with one HDEL. Pass
+        `er_rec_num` to unmap only holdings that still point to that
+        eresource.
+        """
+        h_rec_nums = list(h_rec_nums)
+        if not h_rec_nums:
+            return
+        self._ensure_migrated()
+        if er_rec_num is None:
+            self.conn.hdel(self.key, *h_rec_nums)
+        else:
+            value = redisobjs.encode_member(er_rec_num, self.obj.codec)
+            REMOVE_IF_EQUAL(keys=[self.key], args=[value] + h_rec_nums)
+
+
 class LocationsToSolr(MetadataToSolrExporter):
     """
     Defines process to load Locations into Solr.
@@ -35,6 +161,7 @@ class LocationsToSolr(MetadataToSolrExporter):
         Index('Locations', indexes.LocationIndex,
               SOLR_CONNS['LocationsToSolr']),
     )
+    lookup_cache_names = ('location',)
     model = sierra_models.Location
 
 
@@ -46,6 +173,7 @@ class ItypesToSolr(MetadataToSolrExporter):
     index_config = (
         Index('Itypes', indexes.ItypeIndex, SOLR_CONNS['ItypesToSolr']),
     )
+    lookup_cache_names = ('item_type',)
     model = sierra_models.ItypeProperty
 
 
@@ -58,6 +186,7 @@ class ItemStatusesToSolr(MetadataToSolrExporter):
         Index('ItemStatuses', indexes.ItemStatusIndex,
               SOLR_CONNS['ItemStatusesToSolr']),
     )
+    lookup_cache_names = ('status',)
     model = sierra_models.ItemStatusProperty
 
 
@@ -142,28 +271,23 @@ class EResourcesToSolr(ToSolrExporter):
 
     def commit_to_redis(self, vals):
         self.log('Info', 'Committing EResource updates to Redis...')
-        rhl_obj = redisobjs.RedisObject('reverse_holdings_list', '0')
-        reverse_holdings = rhl_obj.get() or {}
+        reverse_holdings = ReverseHoldingsList()
 
         # Update holdings for updated eresources
+        updated = {}
         for ernum, h_list in vals.get('h_lists', {}).items():
             redisobjs.RedisObject('eresource_holdings_list', ernum).set(h_list)
             for hrnum in h_list:
-                reverse_holdings[hrnum] = ernum
+                updated[hrnum] = ernum
+        reverse_holdings.set(updated)
 
-        # Delete holdings for deleted eresources
-        deletions = vals.get('deletions', [])
-        for ernum in deletions:
+        # Delete holdings for deleted eresources. Each eresource's own
+        # holdings list tells us which reverse mappings to remove.
+        for ernum in vals.get('deletions', []):
             ehl_obj = redisobjs.RedisObject('eresource_holdings_list', ernum)
+            reverse_holdings.remove(ehl_obj.get() or [], ernum)
             ehl_obj.conn.delete(ehl_obj.key)
 
-        if deletions:
-            for hrnum, ernum in list(reverse_holdings.items()):
-                if ernum in deletions:
-                    del(reverse_holdings[hrnum])
-
-        rhl_obj.set(reverse_holdings)
-
     def final_callback(self, vals=None, status='success'):
         vals = vals or {}
         self.commit_to_redis(vals)
@@ -205,6 +329,8 @@ class HoldingUpdate(CompoundMixin, Exporter):
         'resourcerecord_set__holding_records'
     ]
 
+    holdings_lock_timeout = 300
+
     def __init__(self, *args, **kwargs):
         super(HoldingUpdate, self).__init__(*args, **kwargs)
         self.max_rec_chunk = self.children['EResourcesToSolr'].max_rec_chunk
@@ -214,11 +340,11 @@ class HoldingUpdate(CompoundMixin, Exporter):
         # First we loop through the holding records and determine which
         # eresources need to be updated. er_mapping maps eresource rec
         # nums to lists of holdings rec nums to update.
-        rev_handler = redisobjs.RedisObject('reverse_holdings_list', '0')
-        reverse_holdings_list = rev_handler.get() or {}
-        for h in records:
-            h_rec_num = h.record_metadata.get_iii_recnum(True)
-            old_er_rec_num = reverse_holdings_list.get(h_rec_num, None)
+        h_rec_nums = [h.record_metadata.get_iii_recnum(True)
+                      for h in records]
+        reverse_holdings = ReverseHoldingsList().get(h_rec_nums)
+        for h, h_rec_num in zip(records, h_rec_nums):
+            old_er_rec_num = reverse_holdings.get(h_rec_num, None)
             try:
                 er_record = h.resourcerecord_set.all()[0]
             except IndexError:
@@ -265,49 +391,29 @@ class HoldingUpdate(CompoundMixin, Exporter):
                 }
 
         h_vals = {}
-        #self.log('Info', er_mapping)
+        conn = self.children['EResourcesToSolr'].indexes['EResources'].conn
+        unique_key = solr.get_unique_key(solr.connect(using=conn))
         for er_rec_num, entry in iteritems(er_mapping):
             er_record, holdings = entry['er_record'], entry['holdings']
             # if we've already indexed the eresource this holding is
-            # attached to, then we want to pull the record from Solr
-            # and make whatever changes to it rather than reindex the
-            # whole record and all attached holdings from scratch.
-            # Since export jobs get broken up and run in parallel, we
-            # want to hold off on actually committing to Solr and
-            # updating Redis until the callback runs.
-            conn = self.children['EResourcesToSolr'].indexes['EResources'].conn
+            # attached to, then we want to make whatever changes to it
+            # in Solr directly rather than reindex the whole record and
+            # all attached holdings from scratch. Since export jobs get
+            # broken up and run in parallel, we want to hold off on
+            # committing to Solr and on deleting holdings until the
+            # callback runs.
             s = solr.Queryset(using=conn).filter(record_number=er_rec_num)
-            if s.count() > 0:
+            found = s.only(unique_key)[0:1]
+            if found:
+                with self.get_holdings_lock(er_rec_num):
+                    appended, deleted = self.update_holdings(
+                        conn, found[0][unique_key], er_rec_num, holdings
+                    )
                 rec_queue = h_vals.get(er_rec_num, {})
-                rec_append_list = rec_queue.get('append', [])
-                rec_delete_list = rec_queue.get('delete', [])
-
-                record = s[0]
-                red = redisobjs.RedisObject('eresource_holdings_list',
-                                            er_rec_num)
-                red_h_list = red.get()
-                for data in holdings:
-                    try:
-                        red_h_index = red_h_list.index(data.get('rec_num'))
-                    except AttributeError:
-                        self.log('Info', '{}'.format(data.get('rec_num')))
-                    except ValueError:
-                        record.holdings.append(data.get('title'))
-                        rec_append_list.append(data.get('rec_num'))
-                    else:
-                        if data.get('delete'):
-                            # we wait until the final callback to
-                            # delete anything from Solr, because that
-                            # will mess up our holdings index number
-                            rec_delete_list.append(data.get('rec_num'))
-                        else:
-                            record.holdings[red_h_index] = data.get('title')
-
-                record.save(commit=False)
-                rec_queue['append'] = rec_append_list
-                rec_queue['delete'] = rec_delete_list
+                rec_queue['append'] = rec_queue.get('append', []) + appended
+                rec_queue['delete'] = rec_queue.get('delete', []) + deleted
                 h_vals[er_rec_num] = rec_queue
-            else:
+            elif er_record is not None:
                 # if we haven't indexed the record already, we'll add
                 # it using the Haystack indexer.
                 eresources.add(er_record)
@@ -321,31 +427,148 @@ class HoldingUpdate(CompoundMixin, Exporter):
     def commit_to_redis(self, vals):
         self.log('Info', 'Committing Holdings updates to Redis...')
         h_vals = vals.get('holdings', {})
-        er_vals = vals.get('eresources', {})
-        rev_handler = redisobjs.RedisObject('reverse_holdings_list', '0')
-        reverse_h_list = rev_handler.get()
+        reverse_holdings = ReverseHoldingsList()
+        appended, deleted_any = {}, False
         sconn = self.children['EResourcesToSolr'].indexes['EResources'].conn
         for er_rec_num, lists in (h_vals or {}).items():
-            s = solr.Queryset(using=sconn).filter(record_number=er_rec_num)
-            try:
-                record = s[0]
-            except IndexError:
-                record = None
-
-            er_handler = redisobjs.RedisObject('eresource_holdings_list',
-                                               er_rec_num)
-            h_list = er_handler.get()
-            for h_rec_num in lists.get('delete', []):
-                h_index = h_list.index(h_rec_num)
-                del(h_list[h_index])
-                del(reverse_h_list[h_rec_num])
-                del(record.holdings[h_index])
+            deletes = lists.get('delete', [])
+            if deletes:
+                with self.get_holdings_lock(er_rec_num):
+                    self.delete_holdings(sconn, er_rec_num, deletes)
+                reverse_holdings.remove(deletes, er_rec_num)
+                deleted_any = True
             for h_rec_num in lists.get('append', []):
-                h_list.append(h_rec_num)
-                reverse_h_list[h_rec_num] = er_rec_num
-            record.save()
-            er_handler.set(h_list)
-        rev_handler.set(reverse_h_list)
+                appended[h_rec_num] = er_rec_num
+        reverse_holdings.set(appended)
+        if deleted_any:
+            solr.commit(solr.connect(using=sconn), sconn)
+
+    def get_holdings_lock(self, er_rec_num):
+        """
+        Get a Redis lock for changing the holdings on the eresource
+        with the given record number.
+
+        An eresource's `holdings` field in Solr lists holding titles in
+        the same order as its `eresource_holdings_list` in Redis lists
+        holding record numbers; that's how we find a holding's title.
+        Export tasks hold this lock while they change both, so that
+        tasks running in parallel can't interleave their changes and
+        get the two out of step.
+        """
+        key = redisobjs.RedisObject('eresource_holdings_list', er_rec_num).key
+        return redisobjs.REDIS_CONNECTION.lock(
+            '{}:lock'.format(key), timeout=self.holdings_lock_timeout
+        )
+
+    def get_holdings_positions(self, er_rec_num, h_rec_nums):
+        """
+        Get the position of each of the given holdings record numbers
+        in the eresource's `eresource_holdings_list`, in one round
+        trip. A position is None if the holding isn't in the list.
+        Returns None if the eresource has no list.
+        """
+        red = redisobjs.RedisObject('eresource_holdings_list', er_rec_num)
+        if not h_rec_nums:
+            return []
+        return red.get(list(h_rec_nums), 'values')
+
+    def update_holdings(self, using, er_id, er_rec_num, holdings):
+        """
+        Add and retitle holdings on an eresource that's already in
+        Solr (`er_id` is its uniqueKey value), and append the added
+        ones to its `eresource_holdings_list`. `holdings` is the list
+        of dicts `export_records` builds. Deletions are left for the
+        final callback. Hold the eresource's holdings lock while this
+        runs (see `get_holdings_lock`).
+
+        Returns a tuple: (the record numbers of the holdings added,
+        the record numbers of the holdings to delete).
+        """
+        rec_nums = [data['rec_num'] for data in holdings]
+        positions = self.get_holdings_positions(er_rec_num, rec_nums)
+        if positions is None:
+            self.log('Info', 'No holdings list for {}; skipping holdings '
+                             '{}'.format(er_rec_num, rec_nums))
+            return [], []
+        appends, edits, deletes = OrderedDict(), {}, []
+        for data, pos in zip(holdings, positions):
+            if pos is None:
+                if not data['delete']:
+                    appends[data['rec_num']] = data['title']
+            elif data['delete']:
+                # we wait until the final callback to delete anything,
+                # because that will mess up our holdings index numbers
+                deletes.append(data['rec_num'])
+            else:
+                edits[pos] = data['title']
+
+        if edits:
+            # Retitling a holding means changing a value at a position,
+            # which an atomic update can't do (titles aren't unique),
+            # so we set the whole holdings field--but not the rest of
+            # the document.
+            def change(current):
+                for pos, title in edits.items():
+                    current[pos] = title
+                return current + list(appends.values())
+            self.set_holdings(using, er_id, change)
+        elif appends:
+            unique_key = solr.get_unique_key(solr.connect(using=using))
+            solr.Result({unique_key: er_id}).update_fields(
+                add={'holdings': list(appends.values())}, using=using,
+                commit=False
+            )
+        if appends:
+            red = redisobjs.RedisObject('eresource_holdings_list', er_rec_num)
+            red.append_values(*appends.keys())
+        return list(appends.keys()), deletes
+
+    def delete_holdings(self, using, er_rec_num, h_rec_nums):
+        """
+        Delete the given holdings from an eresource, both from its
+        `holdings` field in Solr (without committing) and from its
+        `eresource_holdings_list` in Redis. Hold the eresource's
+        holdings lock while this runs (see `get_holdings_lock`).
+        """
+        positions = self.get_holdings_positions(er_rec_num, h_rec_nums)
+        positions = set(p for p in positions or [] if p is not None)
+        if positions:
+            s = solr.Queryset(using=using).filter(record_number=er_rec_num)
+            unique_key = solr.get_unique_key(solr.connect(using=using))
+            found = s.only(unique_key)[0:1]
+            if found:
+                def change(current):
+                    return [t for i, t in enumerate(current)
+                            if i not in positions]
+                self.set_holdings(using, found[0][unique_key], change)
+        red = redisobjs.RedisObject('eresource_holdings_list', er_rec_num)
+        red.remove_values(*h_rec_nums)
+
+    def set_holdings(self, using, er_id, change):
+        """
+        Replace the `holdings` field of the eresource with the given
+        uniqueKey value (`er_id`) with `change(current_holdings)`,
+        without committing. Only the `holdings` field is sent. It's
+        read with a real-time get and updated with a version check, and
+        if something else changes the document in between, it's read
+        and changed again.
+        """
+        conn = solr.connect(using=using)
+        unique_key = solr.get_unique_key(conn)
+        while True:
+            docs = solr.realtime_get(conn, [er_id],
+                                     fl=[unique_key, 'holdings', '_version_'])
+            if not docs:
+                return
+            record = docs[0]
+            holdings = change(list(record.get('holdings') or []))
+            try:
+                record.update_fields(set={'holdings': holdings or None},
+                                     using=using, check_version=True,
+                                     commit=False)
+            except solr.VersionConflict:
+                continue
+            return
 
     def final_callback(self, vals=None, status='success'):
         vals = vals or {}
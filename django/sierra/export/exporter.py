@@ -20,6 +20,7 @@ from django.conf import settings
 from django.db.models import F
 from utils import dict_merge
 from utils import helpers
+from utils.lookupcache import LOOKUP_CACHE
 
 from .models import ExportInstance, ExportType, Status
 from .tasks import SierraExplicitKeyBundler
@@ -465,6 +466,11 @@ class MetadataToSolrExporter(ToSolrExporter):
     """
     Base class for creating exporters to export simple Sierra
     "metadata" to Solr: Locations, Itypes, Ptypes, Material Types, etc.
+
+    API serializers cache labels for some of these values (see
+    `utils.lookupcache`). Use the `lookup_cache_names` class attribute
+    to list the names of the lookups that your exporter's data feeds;
+    they're invalidated once the export commits.
     """
     class Index(ToSolrExporter.Index):
 
@@ -473,6 +479,7 @@ class MetadataToSolrExporter(ToSolrExporter):
                 instance.reindex(commit=False, queryset=records)
 
     index_config = tuple()
+    lookup_cache_names = tuple()
 
     def get_records(self, prefetch=False):
         return self.model.objects.all()
@@ -480,6 +487,11 @@ class MetadataToSolrExporter(ToSolrExporter):
     def get_deletions(self):
         return None
 
+    def final_callback(self, vals=None, status='success'):
+        super(MetadataToSolrExporter, self).final_callback(vals, status)
+        if self.lookup_cache_names:
+            LOOKUP_CACHE.invalidate(*self.lookup_cache_names)
+
 
 class CompoundMixin(object):
     """
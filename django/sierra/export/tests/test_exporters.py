@@ -1228,3 +1228,33 @@ def test_ertosolr_delete_callback_commits_to_redis(basic_exporter_class,
     for key in redis_obj.conn.keys():
         assert key in expected
         assert redis_obj(key).get() == expected[key]
+
+
+@pytest.mark.parametrize('legacy', [True, False])
+def test_reverseholdingslist_field_operations(legacy, redis_obj):
+    """
+    ReverseHoldingsList should get, set, and remove individual
+    holdings in the `reverse_holdings_list:0` hash. If the mapping is
+    still stored as a legacy encoded object, it should be converted
+    to a hash, without losing anything, the first time it's used.
+    """
+    from export.basic_exporters import ReverseHoldingsList
+    from utils import redisobjs
+
+    existing = {'c1': 'e1', 'c2': 'e1', 'c3': 'e2'}
+    key = 'reverse_holdings_list:0'
+    if legacy:
+        redis_obj.conn.set(key, ''.join([redisobjs.STR_OBJ_PREFIX,
+                                         redisobjs.encode_member(existing)]))
+    else:
+        redis_obj(key).set(existing)
+
+    rhl = ReverseHoldingsList()
+    assert rhl.get(['c3', 'c1', 'c9']) == {'c3': 'e2', 'c1': 'e1',
+                                           'c9': None}
+    assert redis_obj.conn.type(key) == 'hash'
+    rhl.set({'c2': 'e3', 'c4': 'e3'})
+    rhl.remove(['c1', 'c2'], 'e1')
+    rhl.remove(['c3'])
+    assert redis_obj(key).get() == {'c2': 'e3', 'c4': 'e3'}
+    assert rhl.migrate() is False
@@ -3,8 +3,8 @@ Exporters for the Shelflist app are defined here. See export.exporter
 for the base Exporter classes and export.basic_exporters for some
 implementations. This overrides the export.basic_exporters.ItemsToSolr
 exporter to support features needed for the shelflistitems API
-resource: a new index object (ShelflistItemIndex) and creation/storage
-of shelflistitem manifests.
+resource: a new index object (ShelflistItemIndex) and maintenance of
+shelflistitem manifests (see shelflist.manifests).
 """
 
 from __future__ import absolute_import
@@ -13,8 +13,8 @@ from __future__ import unicode_literals
 import logging
 
 from export import basic_exporters as exporters
+from shelflist import manifests
 from shelflist.search_indexes import ShelflistItemIndex
-from utils import redisobjs
 
 # set up logger, for debugging
 logger = logging.getLogger('sierra.custom')
@@ -29,15 +29,25 @@ class ItemsToSolr(exporters.ItemsToSolr):
     )
     max_rec_chunk = 500
     app_name = 'shelflist'
-    redis_shelflist_prefix = 'shelflistitem_manifest'
 
     def export_records(self, records):
+        """
+        Index the given records and reposition them in the shelflist
+        item manifests for their locations. Only these records are
+        touched in Redis, so the cost doesn't depend on the size of
+        the locations.
+        """
         super(ItemsToSolr, self).export_records(records)
+        manifests.update_items(self.indexes['Items'].manifest_docs)
         return {'seen_lcodes': self.indexes['Items'].location_set}
 
     def delete_records(self, records):
         seen_lcodes = self.indexes['Items'].get_location_set_from_recs(records)
         super(ItemsToSolr, self).delete_records(records)
+        manifests.remove_items([
+            getattr(r, 'record_metadata', r).get_iii_recnum(False)
+            for r in records
+        ])
         return {'seen_lcodes': seen_lcodes}
 
     def compile_vals(self, results):
@@ -49,17 +59,21 @@ class ItemsToSolr(exporters.ItemsToSolr):
             return vals
 
     def final_callback(self, vals=None, status='success'):
+        """
+        Build the shelflist item manifest for any location in
+        vals['seen_lcodes'] that hasn't been fully built yet, such as a
+        new location. Manifests that have been built are already up to
+        date, since `export_records` and `delete_records` maintain
+        them.
+        """
         vals = vals or {}
         super(ItemsToSolr, self).final_callback(vals, status)
-        lcodes = list(vals.get('seen_lcodes', []))
-        total = len(lcodes)
-        msg = ('Building shelflist item manifest for {} location(s): {}'
-               ''.format(total, ', '.join(lcodes)))
-        self.log('Info', msg)
-        for i, lcode in enumerate(lcodes):
-            manifest = self.indexes['Items'].get_location_manifest(lcode)
-            r = redisobjs.RedisObject(
-                self.redis_shelflist_prefix, lcode, batch_size=50000,
-                transaction_size=5
-            )
-            r.set(manifest)
+        lcodes = [lcode for lcode in vals.get('seen_lcodes', [])
+                  if not manifests.ShelflistManifest(lcode).is_built()]
+        if lcodes:
+            msg = ('Building shelflist item manifest for {} new location(s): '
+                   '{}'.format(len(lcodes), ', '.join(lcodes)))
+            self.log('Info', msg)
+        for lcode in lcodes:
+            docs = self.indexes['Items'].get_location_manifest_docs(lcode)
+            manifests.ShelflistManifest(lcode).rebuild(docs)
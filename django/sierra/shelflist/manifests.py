@@ -0,0 +1,403 @@
+"""
+Contains tools for maintaining shelflist item manifests in Redis.
+
+A shelflist item manifest lists the IDs of all items at one location,
+in shelflist order. It's what gives each item in the `shelflistitems`
+API resource its `rowNumber`.
+
+Manifests are kept up to date incrementally: each time items are
+indexed or deleted, only those items are repositioned. Every manifest
+is a Redis sorted set (`shelflistitem_order:<location code>`) where
+all members have the same score (0), so Redis orders the members
+lexicographically. Each member is the item's shelflist sort key (its
+`SORT_FIELDS` values, encoded so that byte order matches Solr's sort
+order) followed by its ID; see `make_member`. An item's row number is
+its rank, and adding, moving, or removing an item is a ZADD or ZREM,
+all O(log n) regardless of how many items the location has.
+
+A global manifest (`shelflistitem_browse`) holds the same members for
+items at all locations, so that it lists every item in call number
+order regardless of location. Together with the location manifests,
+it's the shelf-browse index: `browse` finds the items just before and
+after a given call number or item with ZRANGEBYLEX / ZREVRANGEBYLEX.
+
+Two Redis hashes map each item ID to the location code of the manifest
+it's in (`shelflistitem_locations`) and to its current member in that
+manifest (`shelflistitem_sortkeys`), so that items can be found by ID
+alone--e.g., when an item is deleted or moves to another location.
+A Redis set (`shelflistitem_manifests_built`) lists the locations
+whose manifests have been fully built; until a location's manifest is
+built, incremental updates only cover the items that have changed.
+
+Use `ShelflistManifest` to read a location's manifest or to rebuild it
+from Solr data, and `update_items` / `remove_items` to reposition
+individual items. A full rebuild is only needed to verify or repair a
+manifest; see `utils.inventory.generate_shelflistitem_manifests`.
+"""
+
+from __future__ import absolute_import
+
+import logging
+
+from utils import helpers
+from utils.redisobjs import REDIS_CONNECTION
+
+# set up logger, for debugging
+logger = logging.getLogger('sierra.custom')
+
+SORT_FIELDS = ('call_number_type', 'call_number_sort', 'volume_sort',
+               'copy_number')
+ORDER_PREFIX = 'shelflistitem_order'
+LOCATIONS_KEY = 'shelflistitem_locations'
+SORTKEYS_KEY = 'shelflistitem_sortkeys'
+BUILT_KEY = 'shelflistitem_manifests_built'
+BROWSE_KEY = 'shelflistitem_browse'
+BATCH_SIZE = 1000
+MAX_ATTEMPTS = 5
+
+
+# PLACE_ITEMS is a Lua script that moves items into, between, or out
+# of manifests atomically. KEYS[1] and KEYS[2] are the locations and
+# sortkeys hashes, and KEYS[3] is the global manifest, which gets the
+# same changes as the location manifests. ARGV holds four values per
+# item: the item ID, the
+# location code the caller expects the item to be in now ('' for
+# none), the location code it should be in ('' to remove it), and its
+# new member. Each item also has two KEYS: the manifests it moves from
+# and to. If an item is no longer where the caller expected (i.e. it
+# was moved concurrently), it's left alone and its ID is returned so
+# the caller can try again.
+PLACE_ITEMS = REDIS_CONNECTION.register_script('''
+local conflicts = {}
+for i = 1, #ARGV, 4 do
+    local k = (i - 1) / 2 + 4
+    local id, old_loc = ARGV[i], ARGV[i + 1]
+    local new_loc, member = ARGV[i + 2], ARGV[i + 3]
+    local current = redis.call('HGET', KEYS[1], id) or ''
+    local old_member = redis.call('HGET', KEYS[2], id)
+    if current ~= old_loc then
+        table.insert(conflicts, id)
+    elseif current ~= new_loc or old_member ~= member then
+        if old_member then
+            redis.call('ZREM', KEYS[k], old_member)
+            redis.call('ZREM', KEYS[3], old_member)
+        end
+        if new_loc == '' then
+            redis.call('HDEL', KEYS[1], id)
+            redis.call('HDEL', KEYS[2], id)
+        else
+            redis.call('ZADD', KEYS[k + 1], 0, member)
+            redis.call('ZADD', KEYS[3], 0, member)
+            redis.call('HSET', KEYS[1], id, new_loc)
+            redis.call('HSET', KEYS[2], id, member)
+        end
+    end
+end
+return conflicts
+''')
+
+
+# GET_ROW_NUMBERS is a Lua script that gets the row number of each
+# item ID in ARGV, in the manifest at the corresponding key in KEYS
+# (after KEYS[1], the sortkeys hash). Row numbers are false (None) for
+# items that aren't in that manifest.
+GET_ROW_NUMBERS = REDIS_CONNECTION.register_script('''
+local rows = {}
+for i, id in ipairs(ARGV) do
+    local member = redis.call('HGET', KEYS[1], id)
+    rows[i] = member and redis.call('ZRANK', KEYS[i + 1], member) or false
+end
+return rows
+''')
+
+
+# BROWSE is a Lua script that gets the members just before and just
+# after a position in a manifest (KEYS[1]). ARGV[1] is the position:
+# a member, or a prefix of one. If ARGV[2] is an item ID, the item's
+# member (from the sortkeys hash, KEYS[2]) is the position instead.
+# ARGV[3] and ARGV[4] are how many members to get before and after.
+# Returns the members before, nearest first, and the members at or
+# after the position; or false if the item isn't in any manifest.
+BROWSE = REDIS_CONNECTION.register_script('''
+local position = ARGV[1]
+if ARGV[2] ~= '' then
+    position = redis.call('HGET', KEYS[2], ARGV[2])
+    if not position then
+        return false
+    end
+end
+local before = redis.call('ZREVRANGEBYLEX', KEYS[1], '(' .. position, '-',
+                          'LIMIT', 0, ARGV[3])
+local after = redis.call('ZRANGEBYLEX', KEYS[1], '[' .. position, '+',
+                         'LIMIT', 0, ARGV[4])
+return {before, after}
+''')
+
+
+def get_order_key(location_code):
+    return '{}:{}'.format(ORDER_PREFIX, location_code)
+
+
+def _encode_sort_value(value):
+    # Solr sorts missing values last (sortMissingLast) and pysolr
+    # doesn't send empty strings, so None and '' both sort after any
+    # real value. Integers are offset and zero-padded so that they
+    # sort numerically.
+    if value is None or value == '':
+        return '\x02\x00'
+    if isinstance(value, int):
+        value = '{:020d}'.format(value + 2 ** 63)
+    return '\x01{}\x00'.format(value)
+
+
+def make_member(doc):
+    """
+    Make the manifest member for the item in `doc`, a dict (such as a
+    Solr document) with the item's `id` and its `SORT_FIELDS` values.
+
+    Each sort value is encoded so that comparing two members byte by
+    byte, as Redis does, matches Solr's sort order: values are
+    terminated with a NUL so a shorter value sorts before a longer one
+    it's a prefix of, and missing values sort last. The item ID comes
+    last, to break ties.
+    """
+    sort_key = ''.join(_encode_sort_value(doc.get(f)) for f in SORT_FIELDS)
+    return '{}{}'.format(sort_key, doc['id'])
+
+
+def get_id_from_member(member):
+    return member.rsplit('\x00', 1)[-1]
+
+
+def normalize_call_number(call_number, call_number_type):
+    """
+    Normalize a call number the same way the `call_number_sort` field
+    is normalized when items are indexed, so it can be compared to the
+    members in a manifest.
+    """
+    try:
+        return helpers.NormalizedCallNumber(call_number,
+                                            call_number_type).normalize()
+    except helpers.CallNumberError:
+        return helpers.NormalizedCallNumber(call_number, 'other').normalize()
+
+
+def make_call_number_position(call_number, call_number_type):
+    """
+    Make a manifest position (see `browse`) for the given call number
+    and call number type. It falls just before the first member for an
+    item with that call number (and any volume or copy number), so it
+    also falls just after items with call numbers that sort before it.
+    """
+    cn_sort = normalize_call_number(call_number, call_number_type)
+    return '{}\x01{}'.format(_encode_sort_value(call_number_type), cn_sort)
+
+
+def _place(entries, only_from=None, conn=REDIS_CONNECTION):
+    """
+    Put items where they belong. `entries` is a list of (item id,
+    location code, member) tuples; a location code of None removes
+    that item from whatever manifest it's in. Pass `only_from` to
+    remove items only if they're in that location's manifest. Returns
+    the number of items that couldn't be placed because they kept
+    being moved concurrently.
+    """
+    failed = 0
+    for start in range(0, len(entries), BATCH_SIZE):
+        pending = entries[start:start + BATCH_SIZE]
+        for _ in range(MAX_ATTEMPTS):
+            current = conn.hmget(LOCATIONS_KEY, [e[0] for e in pending])
+            keys, args = [LOCATIONS_KEY, SORTKEYS_KEY, BROWSE_KEY], []
+            for (item_id, lcode, member), old in zip(pending, current):
+                if lcode is None and (old is None or only_from not in
+                                      (None, old)):
+                    continue
+                keys.extend([get_order_key(old or lcode),
+                             get_order_key(lcode or old)])
+                args.extend([item_id, old or '', lcode or '', member or ''])
+            if not args:
+                pending = []
+                break
+            conflicts = set(PLACE_ITEMS(keys=keys, args=args, client=conn))
+            pending = [e for e in pending if e[0] in conflicts]
+            if not pending:
+                break
+        failed += len(pending)
+    if failed:
+        logger.warning('Could not place {} item(s) in shelflist item '
+                       'manifests; they were moved concurrently too many '
+                       'times.'.format(failed))
+    return failed
+
+
+def update_items(docs, conn=REDIS_CONNECTION):
+    """
+    Add the items in `docs` to the manifests for their locations, or
+    move them to their new positions. Each doc is a dict with the
+    item's `id`, `location_code`, and `SORT_FIELDS` values; items
+    without a location code are removed from manifests.
+    """
+    entries = [(doc['id'], doc.get('location_code') or None,
+                make_member(doc)) for doc in docs]
+    return _place(entries, conn=conn)
+
+
+def remove_items(item_ids, conn=REDIS_CONNECTION):
+    """
+    Remove the items with the given IDs from their manifests.
+    """
+    return _place([(item_id, None, None) for item_id in item_ids],
+                  conn=conn)
+
+
+def get_row_numbers(pairs, conn=REDIS_CONNECTION):
+    """
+    Get row numbers for multiple items, possibly in different
+    locations, with one round trip to Redis. `pairs` is a list of
+    (location code, item id) tuples. Returns a list of row numbers,
+    where the row number for an item that isn't in the manifest for
+    the given location is None.
+    """
+    if not pairs:
+        return []
+    keys = [SORTKEYS_KEY] + [get_order_key(lcode) for lcode, _ in pairs]
+    args = [item_id for _, item_id in pairs]
+    return [None if row is None else int(row) for row in
+            GET_ROW_NUMBERS(keys=keys, args=args, client=conn)]
+
+
+def browse(before=5, after=5, position=None, item_id=None,
+           location_code=None, conn=REDIS_CONNECTION):
+    """
+    Get the IDs of the items nearest a given spot on the shelf, with
+    one round trip to Redis.
+
+    The spot is either the position of an item, given its `item_id`,
+    or a `position` from `make_call_number_position`. Up to `before`
+    items before the spot and up to `after` items at or after it are
+    returned, both in shelflist order, as a tuple of two lists. (So if
+    you browse from an item, it's the first of the `after` items.)
+    Items are from the manifest for `location_code`, or from all
+    locations if no location code is given. Returns None if `item_id`
+    isn't in any manifest.
+    """
+    key = BROWSE_KEY if location_code is None else get_order_key(
+        location_code)
+    result = BROWSE(keys=[key, SORTKEYS_KEY],
+                    args=[position or '', item_id or '', before, after],
+                    client=conn)
+    if result is None:
+        return None
+    before_members, after_members = result
+    return ([get_id_from_member(m) for m in reversed(before_members)],
+            [get_id_from_member(m) for m in after_members])
+
+
+class ShelflistManifest(object):
+    """
+    The shelflist item manifest for one location.
+    """
+
+    def __init__(self, location_code, conn=REDIS_CONNECTION):
+        self.location_code = location_code
+        self.conn = conn
+        self.key = get_order_key(location_code)
+
+    def __len__(self):
+        return self.conn.zcard(self.key)
+
+    def is_built(self):
+        """
+        Return True if this manifest has been fully built (see
+        `rebuild`), rather than just having had items added to it.
+        """
+        return bool(self.conn.sismember(BUILT_KEY, self.location_code))
+
+    def get_ids(self, start=0, stop=-1):
+        """
+        Get the IDs of the items from row `start` through row `stop`
+        (inclusive; negative values count from the end), in order.
+        """
+        members = self.conn.zrange(self.key, start, stop)
+        return [get_id_from_member(m) for m in members]
+
+    def get_row_numbers(self, item_ids):
+        return get_row_numbers([(self.location_code, i) for i in item_ids],
+                               self.conn)
+
+    def get_row_number(self, item_id):
+        return self.get_row_numbers([item_id])[0]
+
+    def get_members(self):
+        """
+        Get a dict mapping the ID of each item in this manifest to its
+        member.
+        """
+        return {get_id_from_member(m): m for m in
+                self.conn.zrange(self.key, 0, -1)}
+
+    def get_changes(self, docs, members=None):
+        """
+        Compare this manifest against `docs`, the full list of items
+        that should be in it (as in `update_items`). Returns a list of
+        (item id, location code, member) tuples for the items that need
+        to be added or repositioned, and the items that need to be
+        removed (with a location code of None). An empty list means the
+        manifest is correct. Pass `members` if you already have them
+        (see `get_members`).
+        """
+        expected = {doc['id']: make_member(doc) for doc in docs}
+        members = self.get_members() if members is None else members
+        changes = [(item_id, self.location_code, member)
+                   for item_id, member in expected.items()
+                   if members.get(item_id) != member]
+        changes.extend((item_id, None, None) for item_id in members
+                       if item_id not in expected)
+        return changes
+
+    def remove_orphans(self, members):
+        """
+        Remove members from this manifest that don't match what the
+        sortkeys hash has recorded for their items, e.g. if a write
+        was interrupted. Orphans are removed from `members`, too.
+        Returns the number removed.
+        """
+        item_ids = list(members)
+        orphans = []
+        for start in range(0, len(item_ids), BATCH_SIZE):
+            batch = item_ids[start:start + BATCH_SIZE]
+            recorded = self.conn.hmget(SORTKEYS_KEY, batch)
+            orphans.extend(item_id for item_id, member in zip(batch, recorded)
+                           if member != members[item_id])
+        if orphans:
+            orphan_members = [members.pop(i) for i in orphans]
+            self.conn.zrem(self.key, *orphan_members)
+            self.conn.zrem(BROWSE_KEY, *orphan_members)
+        return len(orphans)
+
+    def add_to_browse(self, members):
+        """
+        Make sure the global manifest has all of the given `members`
+        from this manifest. Adding a member that's already there does
+        nothing, so this is safe to run any time; it fills in the
+        global manifest for items that were placed before it existed.
+        """
+        members = list(members)
+        for start in range(0, len(members), BATCH_SIZE):
+            batch = members[start:start + BATCH_SIZE]
+            self.conn.zadd(BROWSE_KEY, {m: 0 for m in batch})
+
+    def rebuild(self, docs):
+        """
+        Make this manifest match `docs`, the full list of items that
+        should be in it (as in `update_items`), by repositioning only
+        the items that are out of place. Returns the number of items
+        that were added, moved, or removed.
+        """
+        members = self.get_members()
+        num_orphans = self.remove_orphans(members)
+        self.add_to_browse(members.values())
+        changes = self.get_changes(docs, members)
+        _place(changes, only_from=self.location_code, conn=self.conn)
+        self.conn.sadd(BUILT_KEY, self.location_code)
+        return num_orphans + len(changes)
@@ -6,6 +6,7 @@ from __future__ import absolute_import
 
 from base import search_indexes
 from haystack import indexes
+from shelflist import manifests
 from utils import solr
 
 
@@ -27,9 +28,16 @@ class ShelflistItemIndex(search_indexes.ItemIndex):
     unique set of location codes (in Solr) matching records in a Django
     queryset (RecordMetadata or ItemRecord instances), for deletions.
 
-    The `get_location_manifest` method pulls a list of item IDs from
-    Solr, sorted in shelflist order, for a particular location, to help
-    build shelflist item manifests.
+    Shelflist item manifests (see shelflist.manifests) are updated
+    incrementally, so the index also tracks the data needed to place
+    each item it indexes in its location's manifest: the
+    `manifest_docs` property lists the id, location code, and sort
+    fields for every item indexed during an update.
+
+    The `get_location_manifest_docs` method pulls the same data from
+    Solr for all items in a particular location, sorted in shelflist
+    order, to help build or verify shelflist item manifests.
+    `get_location_manifest` returns just the item IDs.
     """
     shelf_status = indexes.FacetCharField(null=True)
     inventory_notes = indexes.MultiValueField(null=True)
@@ -37,15 +45,17 @@ class ShelflistItemIndex(search_indexes.ItemIndex):
     inventory_date = indexes.DateTimeField(null=True)
     user_data_fields = ('shelf_status', 'inventory_notes', 'flags',
                         'inventory_date')
-    solr_shelflist_sort_criteria = ['call_number_type', 'call_number_sort',
-                                    'volume_sort', 'copy_number']
+    solr_shelflist_sort_criteria = list(manifests.SORT_FIELDS) + ['id']
+    manifest_fields = ['id', 'location_code'] + list(manifests.SORT_FIELDS)
 
     def __init__(self, *args, **kwargs):
         super(ShelflistItemIndex, self).__init__(*args, **kwargs)
         self.location_set = set()
+        self.manifest_docs = []
 
     def update(self, using=None, commit=True, queryset=None):
         self.location_set = set()
+        self.manifest_docs = []
         super(ShelflistItemIndex, self).update(using, commit, queryset)
 
     def prepare_location_code(self, obj):
@@ -79,6 +89,10 @@ class ShelflistItemIndex(search_indexes.ItemIndex):
             if item:
                 for field in self.user_data_fields:
                     self.prepared_data[field] = getattr(item, field, None)
+        self.manifest_docs.append({
+            field: self.prepared_data.get(field)
+            for field in self.manifest_fields
+        })
         return self.prepared_data
 
     def get_location_set_from_recs(self, records, using=None):
@@ -101,16 +115,27 @@ class ShelflistItemIndex(search_indexes.ItemIndex):
         except KeyError:
             return set()
 
-    def get_location_manifest(self, location_code, using=None):
+    def get_location_manifest_docs(self, location_code, using=None):
         """
-        Query the underlying Solr index to pull a list of all item ids
-        for a given location code, pre-sorted based on the
-        `solr_shelflist_sort_criteria` class attribute. Returns the
-        list of ids, in order.
+        Query the underlying Solr index to pull the data needed to build
+        the shelflist item manifest for a given location code: a list
+        of docs for all items in that location, containing the fields
+        in the `manifest_fields` class attribute, pre-sorted based on
+        the `solr_shelflist_sort_criteria` class attribute.
         """
         conn = self.get_backend(using=using).conn
         man_qs = solr.Queryset(conn=conn).filter(type=self.type_name,
                                                  location_code=location_code)
-        man_qs = man_qs.order_by(*self.solr_shelflist_sort_criteria).only('id')
+        man_qs = man_qs.order_by(*self.solr_shelflist_sort_criteria)
+        man_qs = man_qs.only(*self.manifest_fields)
         results = man_qs.set_raw_params({'rows': len(man_qs)}).full_response
-        return [i['id'] for i in results]
+        return list(results)
+
+    def get_location_manifest(self, location_code, using=None):
+        """
+        Query the underlying Solr index to pull a list of all item ids
+        for a given location code, in shelflist order. Returns the list
+        of ids, in order.
+        """
+        docs = self.get_location_manifest_docs(location_code, using)
+        return [doc['id'] for doc in docs]
@@ -12,9 +12,10 @@ from api.simpleserializers import SimpleField, SimpleObjectInterface,\
                                   SimpleSerializerWithLookups
 from api.uris import APIUris
 from django.conf import settings
-from utils import solr
-from utils.redisobjs import RedisObject
+from utils import servertiming, solr
 
+from . import manifests
+from .manifests import ShelflistManifest
 from .uris import ShelflistAPIUris
 
 # set up logger, for debugging
@@ -24,6 +25,7 @@ logger = logging.getLogger('sierra.custom')
 class ShelflistItemSerializer(SimpleSerializerWithLookups):
     _save_conn = settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
     _lookup_conn = settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ItemStatuses']
+    cached_lookups = ('status',)
 
     class LinksField(SimpleField):
         def present(self, obj_data):
@@ -56,29 +58,33 @@ class ShelflistItemSerializer(SimpleSerializerWithLookups):
     class RowNumberField(api_serializers.SimpleIntField):
         def present(self, obj_data):
             # Note: We don't have to cast the result to int because
-            # it's coming from the index position in a Redis zset which
+            # it's the item's rank in the shelflist manifest, which
             # already gets returned as an int.
             row_num = obj_data['row_number']
             if row_num is None:
                 location_code = obj_data.get('location_code')
-                r = RedisObject('shelflistitem_manifest', location_code)
-                return r.get_index(obj_data['id'])
+                manifest = ShelflistManifest(location_code)
+                return manifest.get_row_number(obj_data['id'])
             return row_num
 
     obj_interface = SimpleObjectInterface(solr.Result)
+    required_source_fields = ('id',)
     fields = [
-        LinksField('_links', derived=True),
+        LinksField('_links', derived=True,
+                   depends_on=['id', 'location_code']),
         api_serializers.SimpleStrField('id', filterable=True),
         api_serializers.SimpleStrField('record_number', source='id',
                                        filterable=True),
-        RowNumberField('row_number', derived=True),
+        RowNumberField('row_number', derived=True,
+                       depends_on=['id', 'location_code']),
         api_serializers.CallNumberField('call_number', filterable=True,
                                         filter_source='call_number_search'),
         api_serializers.SimpleStrField('call_number_type', filterable=True),
         api_serializers.SimpleStrField('volume', filterable=True),
         api_serializers.SimpleIntField('copy_number', filterable=True),
         api_serializers.SimpleStrField('barcode', filterable=True),
-        api_serializers.SimpleStrField('status'),
+        api_serializers.SimpleStrField('status',
+                                       depends_on=['status_code', 'due_date']),
         api_serializers.SimpleStrField('status_code', filterable=True),
         api_serializers.SimpleDateTimeField('due_date', filterable=True),
         api_serializers.SimpleBoolField('suppressed', filterable=True),
@@ -97,16 +103,43 @@ class ShelflistItemSerializer(SimpleSerializerWithLookups):
     ]
 
     def __init__(self, *args, **kwargs):
-        self.item_ids = []
+        self.items = []
         super().__init__(*args, **kwargs)
+        self.original = self.object
+
+    def cache_all(self):
+        # Row numbers depend on the current state of the shelflist
+        # manifest, so unlike statuses they're refreshed for every
+        # page, regardless of what's in the shared lookup cache.
+        super().cache_all()
+        with servertiming.timing('lookups'):
+            self.refresh_row_numbers()
 
     def cache_all_lookups(self):
         self.refresh_status()
-        self.refresh_row_numbers()
+
+    @classmethod
+    def get_related_versions(cls, obj=None):
+        # An item's row number comes from the shelflist manifest, which
+        # changes when other items at the location are added, removed,
+        # or reordered, without touching this item's document. (For
+        # lists, those changes are also commits to the item index, so
+        # the index version already covers them.)
+        versions = super().get_related_versions(obj)
+        if obj is not None:
+            manifest = ShelflistManifest(obj.get('location_code'))
+            row_num = manifest.get_row_number(obj['id'])
+            versions.append(('row={}'.format(row_num), None))
+        return versions
 
     def to_representation(self, obj):
         if self.obj_interface.obj_is_many(obj):
-            self.item_ids = [item['id'] for item in obj]
+            # Items in a page may be from different locations (e.g.,
+            # when browsing the shelf across all locations).
+            view = self.context.get('view')
+            default = view.kwargs.get('code') if view else None
+            self.items = [(item.get('location_code') or default, item['id'])
+                          for item in obj]
         # The superclass ends up running self.cache_all if this is a
         # page view (self.obj_interface.obj_is_many(obj) == True)
         return super().to_representation(obj)
@@ -128,14 +161,12 @@ class ShelflistItemSerializer(SimpleSerializerWithLookups):
         self.cache_lookup('status', lookup)
 
     def refresh_row_numbers(self):
-        if self.item_ids:
+        if self.items:
             row_numbers = self._lookup_cache.get('row_numbers', {})
-            location_code = self.context['view'].kwargs['code']
-            r = RedisObject('shelflistitem_manifest', location_code)
-            fetched = r.get(self.item_ids, 'values')
-            if fetched is not None:
-                row_numbers.update(dict(zip(self.item_ids, fetched)))
-                self.cache_lookup('row_numbers', row_numbers)
+            fetched = manifests.get_row_numbers(self.items)
+            item_ids = [item_id for _, item_id in self.items]
+            row_numbers.update(dict(zip(item_ids, fetched)))
+            self.cache_lookup('row_numbers', row_numbers)
 
     def prepare_for_serialization(self, obj_data):
         obj_data['__context'] = self.context
@@ -150,8 +181,17 @@ class ShelflistItemSerializer(SimpleSerializerWithLookups):
         return obj_data
 
     def save(self, *args, **kwargs):
-        kwargs['using'] = self._save_conn
-        super().save(*args, **kwargs)
+        # Only the fields that changed are sent to Solr, as an atomic
+        # update, rather than rewriting the whole document; that way an
+        # update can't undo changes made to other fields (e.g., by an
+        # export) since the item was fetched.
+        get_obj_data = self.obj_interface.get_obj_data
+        old_data = get_obj_data(self.original)
+        changes = {k: v for k, v in get_obj_data(self.object).items()
+                   if k not in old_data or old_data[k] != v}
+        if changes:
+            kwargs['using'] = self._save_conn
+            self.object.update_fields(set=changes, **kwargs)
 
 
 class ItemSerializer(api_serializers.ItemSerializer):
@@ -176,7 +216,9 @@ class ItemSerializer(api_serializers.ItemSerializer):
             new_fields = []
             for f in cls.fields:
                 if f.name == '_links':
-                    new_fields.append(cls.LinksField('_links', derived=True))
+                    new_fields.append(cls.LinksField(
+                        '_links', derived=True, depends_on=f.depends_on
+                    ))
                 else:
                     new_fields.append(f)
             cls.fields = new_fields
@@ -204,7 +246,9 @@ class LocationSerializer(api_serializers.LocationSerializer):
             new_fields = []
             for f in cls.fields:
                 if f.name == '_links':
-                    new_fields.append(cls.LinksField('_links', derived=True))
+                    new_fields.append(cls.LinksField(
+                        '_links', derived=True, depends_on=f.depends_on
+                    ))
                 else:
                     new_fields.append(f)
             cls.fields = new_fields
@@ -10,12 +10,12 @@ from datetime import datetime
 import jsonpatch
 import pytest
 import ujson
-from shelflist.exporters import ItemsToSolr
+from shelflist.manifests import ShelflistManifest
 from shelflist.search_indexes import ShelflistItemIndex
 from shelflist.serializers import ShelflistItemSerializer
 from six import text_type
 from six.moves import range
-from utils.redisobjs import RedisObject
+from utils import solr
 
 
 # FIXTURES AND TEST DATA
@@ -26,9 +26,6 @@ from utils.redisobjs import RedisObject
 API_ROOT = '/api/v1/'
 
 
-REDIS_SHELFLIST_PREFIX = ItemsToSolr.redis_shelflist_prefix
-
-
 # PARAMETERS__* constants contain parametrization data for certain
 # tests. Each should be a tuple, where the first tuple member is a
 # header string that describes the parametrization values (such as
@@ -644,7 +641,7 @@ def test_shelflistitem_view_orderby(order_by, api_settings, shelflist_solr_env,
 
 
 def test_shelflistitem_row_order(api_settings, shelflist_solr_env,
-                                 get_shelflist_urls, api_client, redis_obj,
+                                 get_shelflist_urls, api_client,
                                  get_found_ids):
     """
     The `shelflistitems` list view should list items in the same order
@@ -657,8 +654,9 @@ def test_shelflistitem_row_order(api_settings, shelflist_solr_env,
     using = api_settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
     index = ShelflistItemIndex(using=using)
     manifest = index.get_location_manifest(loc)
-    redis_key = '{}:{}'.format(REDIS_SHELFLIST_PREFIX, loc)
-    redis_obj(redis_key).set(manifest)
+    ShelflistManifest(loc).rebuild(
+        index.get_location_manifest_docs(loc)
+    )
     url = get_shelflist_urls(shelflist_solr_env.records['shelflistitem'])[loc]
     response = api_client.get(url)
     total = response.data['totalCount']
@@ -670,7 +668,7 @@ def test_shelflistitem_row_order(api_settings, shelflist_solr_env,
 
 def test_shelflistitem_row_pagination(api_settings, shelflist_solr_env,
                                       get_shelflist_urls, api_client,
-                                      redis_obj, get_found_ids):
+                                      get_found_ids):
     """
     When paginating a `shelflistitems` list view, the `rowNumber`
     values should accurately reflect the requested pagination
@@ -682,8 +680,9 @@ def test_shelflistitem_row_pagination(api_settings, shelflist_solr_env,
     using = api_settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
     index = ShelflistItemIndex(using=using)
     manifest = index.get_location_manifest(loc)
-    redis_key = '{}:{}'.format(REDIS_SHELFLIST_PREFIX, loc)
-    redis_obj(redis_key).set(manifest)
+    ShelflistManifest(loc).rebuild(
+        index.get_location_manifest_docs(loc)
+    )
     total = len(loc_recs)
     offset = int(total / 2)
     limit = int(total / 4)
@@ -702,7 +701,7 @@ def test_shelflistitem_row_pagination(api_settings, shelflist_solr_env,
 
 def test_shelflistitem_row_limit_one(api_settings, shelflist_solr_env,
                                      get_shelflist_urls, api_client,
-                                     redis_obj, get_found_ids):
+                                     get_found_ids):
     """
     When paginating a `shelflistitems` list view, requesting a limit of
     one item should work as expected.
@@ -713,8 +712,9 @@ def test_shelflistitem_row_limit_one(api_settings, shelflist_solr_env,
     using = api_settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
     index = ShelflistItemIndex(using=using)
     manifest = index.get_location_manifest(loc)
-    redis_key = '{}:{}'.format(REDIS_SHELFLIST_PREFIX, loc)
-    redis_obj(redis_key).set(manifest)
+    ShelflistManifest(loc).rebuild(
+        index.get_location_manifest_docs(loc)
+    )
     limit_p = api_settings.REST_FRAMEWORK['PAGINATE_BY_PARAM']
     url = get_shelflist_urls(shelflist_solr_env.records['shelflistitem'])[loc]
     paginated_url = f"{url}?{limit_p}=1"
@@ -728,7 +728,7 @@ def test_shelflistitem_row_limit_one(api_settings, shelflist_solr_env,
 def test_shelflistitem_row_filtering(api_settings, shelflist_solr_env,
                                      get_shelflist_urls, api_client,
                                      assemble_shelflist_test_records,
-                                     redis_obj, get_found_ids):
+                                     get_found_ids):
     """
     When filtering a `shelflistitems` list view, the `rowNumber`
     values should accurately reflect the items included in the filter.
@@ -757,8 +757,9 @@ def test_shelflistitem_row_filtering(api_settings, shelflist_solr_env,
 
     index = ShelflistItemIndex(using=using)
     manifest = index.get_location_manifest(loc)
-    redis_key = '{}:{}'.format(REDIS_SHELFLIST_PREFIX, loc)
-    redis_obj(redis_key).set(manifest)
+    ShelflistManifest(loc).rebuild(
+        index.get_location_manifest_docs(loc)
+    )
 
     url = get_shelflist_urls(shelflist_solr_env.records['shelflistitem'])[loc]
     filtered_url = f"{url}?shelfStatus=SELECT_ME"
@@ -770,8 +771,7 @@ def test_shelflistitem_row_filtering(api_settings, shelflist_solr_env,
 
 
 def test_shelflistitem_detail_view_rows(api_settings, shelflist_solr_env,
-                                        get_shelflist_urls, api_client,
-                                        redis_obj):
+                                        get_shelflist_urls, api_client):
     """
     The `shelflistitems` detail view for individual items should
     reflect the correct `rowNumber` values.
@@ -782,8 +782,9 @@ def test_shelflistitem_detail_view_rows(api_settings, shelflist_solr_env,
     using = api_settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
     index = ShelflistItemIndex(using=using)
     manifest = index.get_location_manifest(loc)
-    redis_key = '{}:{}'.format(REDIS_SHELFLIST_PREFIX, loc)
-    redis_obj(redis_key).set(manifest)
+    ShelflistManifest(loc).rebuild(
+        index.get_location_manifest_docs(loc)
+    )
     total = len(loc_recs)
     url = get_shelflist_urls(shelflist_solr_env.records['shelflistitem'])[loc]
     rows_to_check = (0, 2, len(manifest) - 1)
@@ -793,6 +794,52 @@ def test_shelflistitem_detail_view_rows(api_settings, shelflist_solr_env,
         assert response.data['rowNumber'] == exp_row
 
 
+def test_shelflistitem_browse_from_item(api_settings, shelflist_solr_env,
+                                       get_shelflist_urls, api_client,
+                                       get_found_ids):
+    """
+    The `shelflistitems/browse` view should return the items just
+    before and after the given item, in shelflist order, with the
+    correct `rowNumber` values.
+    """
+    recs = shelflist_solr_env.records['shelflistitem']
+    loc = recs[0]['location_code']
+    using = api_settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
+    index = ShelflistItemIndex(using=using)
+    manifest = index.get_location_manifest(loc)
+    ShelflistManifest(loc).rebuild(
+        index.get_location_manifest_docs(loc)
+    )
+    mid = len(manifest) // 2
+    url = get_shelflist_urls(recs)[loc]
+    response = api_client.get(f"{url}browse/?item={manifest[mid]}"
+                              "&before=2&after=3")
+    exp_ids = manifest[max(mid - 2, 0):mid + 3]
+    assert response.data['beforeCount'] == min(mid, 2)
+    assert get_found_ids('id', response) == exp_ids
+    assert get_found_ids('rowNumber', response) == [
+        manifest.index(item_id) for item_id in exp_ids
+    ]
+
+
+@pytest.mark.parametrize('query', [
+    '',
+    'item=i1&callNumber=AB100&callNumberType=lc',
+    'callNumber=AB100',
+    'item=i1&before=-1',
+    'item=i1&after=1000',
+    'item=i1&after=many',
+])
+def test_shelflistitem_browse_bad_query(query, api_settings, api_client):
+    """
+    The `shelflistitems/browse` view should reject requests that don't
+    give exactly one place to browse from or that ask for an invalid
+    number of items.
+    """
+    response = api_client.get(f"{API_ROOT}shelflistitems/browse/?{query}")
+    assert response.status_code == 400
+
+
 def test_shelflistitem_list_row_caching(api_settings, shelflist_solr_env,
                                         get_shelflist_urls, api_client,
                                         mocker):
@@ -806,8 +853,8 @@ def test_shelflistitem_list_row_caching(api_settings, shelflist_solr_env,
     cache miss.
     """
     mocker.patch.object(
-        RedisObject, 'get', mocker.Mock(
-            side_effect=lambda l, lt: list(range(1000, 1000 + len(l)))
+        ShelflistManifest, 'get_row_numbers', mocker.Mock(
+            side_effect=lambda ids: list(range(1000, 1000 + len(ids)))
         )
     )
     ShelflistItemSerializer._lookup_cache['row_numbers'] = {}
@@ -832,28 +879,28 @@ def test_shelflistitem_list_row_caching(api_settings, shelflist_solr_env,
     # Redis to get the first item, and we extrapolate to get the rest
     # of the items in the list.
     assert len(manifest) > 1
-    call_stack.append(mocker.call(manifest, 'values'))
-    assert RedisObject.get.mock_calls == call_stack
+    call_stack.append(mocker.call(manifest))
+    assert ShelflistManifest.get_row_numbers.mock_calls == call_stack
 
     # Now when we request detail views for individual rows in the list,
     # it should still use the cached row number, if it finds it,
     # instead of querying Redis.
     for ping_row in (0, 2, len(manifest) - 1):
         api_client.get(f"{url}{manifest[ping_row]}")
-    assert RedisObject.get.mock_calls == call_stack
+    assert ShelflistManifest.get_row_numbers.mock_calls == call_stack
 
     # When we hit the list view again it should refresh the cache,
     # resulting in an additional call to Redis.
     api_client.get(url)
-    call_stack.append(mocker.call(manifest, 'values'))
-    assert RedisObject.get.mock_calls == call_stack
+    call_stack.append(mocker.call(manifest))
+    assert ShelflistManifest.get_row_numbers.mock_calls == call_stack
 
     # If we clear the serializer lookup_cache, then hitting the detail
     # view for an individual row requests the rowNumber from Redis.
     ShelflistItemSerializer._lookup_cache['row_numbers'] = {}
     api_client.get(f"{url}{manifest[-1]}")
-    call_stack.append(mocker.call(manifest[-1], 'value'))
-    assert RedisObject.get.mock_calls == call_stack
+    call_stack.append(mocker.call([manifest[-1]]))
+    assert ShelflistManifest.get_row_numbers.mock_calls == call_stack
 
 
 def test_shelflistitem_putpatch_requires_auth(api_settings,
@@ -916,7 +963,7 @@ def test_shelflistitem_update_err_nonwriteable(method, api_settings,
 @pytest.mark.django_db
 @pytest.mark.parametrize('method', ['put', 'patch'])
 def test_shelflistitem_update_items(method, api_settings,
-                                    assemble_custom_shelflist, redis_obj,
+                                    assemble_custom_shelflist,
                                     shelflist_solr_env,
                                     filter_serializer_fields_by_opt,
                                     derive_updated_resource, send_api_data,
@@ -930,9 +977,9 @@ def test_shelflistitem_update_items(method, api_settings,
     _, _, trecs = assemble_custom_shelflist(test_lcode, [(test_id, {})])
     using = api_settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
     index = ShelflistItemIndex(using=using)
-    manifest = index.get_location_manifest(test_lcode)
-    redis_key = '{}:{}'.format(REDIS_SHELFLIST_PREFIX, test_lcode)
-    redis_obj(redis_key).set(manifest)
+    ShelflistManifest(test_lcode).rebuild(
+        index.get_location_manifest_docs(test_lcode)
+    )
     url = '{}{}'.format(get_shelflist_urls(trecs)[test_lcode], test_id)
     before = api_client.get(url)
     serializer = before.renderer_context['view'].get_serializer()
@@ -970,7 +1017,7 @@ def test_shelflistitem_update_items(method, api_settings,
 @pytest.mark.django_db
 @pytest.mark.parametrize('method', ['put', 'patch'])
 def test_shelflistitem_delete_data(method, api_settings,
-                                   assemble_custom_shelflist, redis_obj,
+                                   assemble_custom_shelflist,
                                    shelflist_solr_env,
                                    filter_serializer_fields_by_opt,
                                    derive_updated_resource, send_api_data,
@@ -983,9 +1030,9 @@ def test_shelflistitem_delete_data(method, api_settings,
     _, _, trecs = assemble_custom_shelflist(test_lcode, [(test_id, {})])
     using = api_settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
     index = ShelflistItemIndex(using=using)
-    manifest = index.get_location_manifest(test_lcode)
-    redis_key = '{}:{}'.format(REDIS_SHELFLIST_PREFIX, test_lcode)
-    redis_obj(redis_key).set(manifest)
+    ShelflistManifest(test_lcode).rebuild(
+        index.get_location_manifest_docs(test_lcode)
+    )
     url = '{}{}'.format(get_shelflist_urls(trecs)[test_lcode], test_id)
     before = api_client.get(url)
     serializer = before.renderer_context['view'].get_serializer()
@@ -1070,11 +1117,88 @@ def test_shelflistitem_put_data_missing_fields(fname_solr, fname_api,
         assert after.data[fname_api] is None
 
 
+def test_shelflistitem_batch_patch_requires_auth(api_settings,
+                                                assemble_custom_shelflist,
+                                                get_shelflist_urls,
+                                                api_client):
+    """
+    Batch updates (via patch) to a shelflistitem list should fail
+    without authentication. A 403 status code should be returned, and
+    the items should NOT be updated.
+    """
+    test_lcode, test_id = '1test', 'i99999999'
+    _, _, trecs = assemble_custom_shelflist(test_lcode, [(test_id, {})])
+    url = get_shelflist_urls(trecs)[test_lcode]
+    before = api_client.get(url)
+    patch = [{'op': 'replace', 'path': '/shelfStatus', 'value': 'onShelf'}]
+    resp = api_client.patch(url, {test_id: patch}, format='json')
+    after = api_client.get(url)
+    assert resp.status_code == 403
+    assert before.data == after.data
+
+
+@pytest.mark.django_db
+def test_shelflistitem_batch_patch_updates_items(api_settings,
+                                                 assemble_custom_shelflist,
+                                                 send_api_data,
+                                                 get_shelflist_urls,
+                                                 api_client, mocker):
+    """
+    A batch update (via patch) to a shelflistitem list should apply
+    each item's json-patch, saving all of the valid changes with one
+    commit, and report a result for each item. Items with invalid
+    changes and items not at that location are not updated.
+    """
+    test_lcode = '1test'
+    test_ids = ['i99999997', 'i99999998', 'i99999999']
+    _, _, trecs = assemble_custom_shelflist(test_lcode, [
+        (test_id, {'shelf_status': None, 'barcode': '1'})
+        for test_id in test_ids
+    ])
+    url = get_shelflist_urls(trecs)[test_lcode]
+    before = {tid: api_client.get('{}{}'.format(url, tid)).data
+              for tid in test_ids}
+    commit = mocker.patch('utils.solr.commit', wraps=solr.commit)
+    req_body = ujson.dumps({
+        test_ids[0]: [{'op': 'replace', 'path': '/shelfStatus',
+                       'value': 'onShelf'}],
+        test_ids[1]: [{'op': 'replace', 'path': '/inventoryNotes',
+                       'value': ['checked']},
+                      {'op': 'replace', 'path': '/shelfStatus',
+                       'value': 'missing'}],
+        test_ids[2]: [{'op': 'replace', 'path': '/barcode', 'value': '2'}],
+        'i1': [{'op': 'replace', 'path': '/shelfStatus', 'value': 'x'}],
+    })
+    resp = send_api_data(api_client, url, req_body, 'patch',
+                         content_type='application/json')
+    after = {tid: api_client.get('{}{}'.format(url, tid)).data
+             for tid in test_ids}
+
+    assert resp.status_code == 200
+    assert commit.call_count == 1
+    assert [(r['id'], r['status']) for r in resp.data['results']] == [
+        (test_ids[0], 200), (test_ids[1], 200), (test_ids[2], 400),
+        ('i1', 404)
+    ]
+    assert resp.data['results'][0]['links']['self']['href'].endswith(
+        '{}{}'.format(url, test_ids[0])
+    )
+    assert after[test_ids[0]]['shelfStatus'] == 'onShelf'
+    assert after[test_ids[1]]['shelfStatus'] == 'missing'
+    assert after[test_ids[1]]['inventoryNotes'] == ['checked']
+    assert after[test_ids[2]] == before[test_ids[2]]
+    for tid in test_ids[:2]:
+        changed = ('shelfStatus', 'inventoryNotes')
+        assert ({k: v for k, v in after[tid].items() if k not in changed}
+                == {k: v for k, v in before[tid].items()
+                    if k not in changed})
+
+
 @pytest.mark.parametrize('test_data, search, expected',
                          compile_params(PARAMETERS__FIRSTITEMPERLOCATION),
                          ids=compile_ids(PARAMETERS__FIRSTITEMPERLOCATION))
 def test_shelflist_firstitemperlocation_list(test_data, search, expected,
-                                             api_settings, redis_obj,
+                                             api_settings,
                                              assemble_custom_shelflist,
                                              api_client, get_found_ids,
                                              do_filter_search):
@@ -1100,9 +1224,9 @@ def test_shelflist_firstitemperlocation_list(test_data, search, expected,
     index = ShelflistItemIndex(using=using)
     for test_lcode, data in test_data_by_location.items():
         assemble_custom_shelflist(test_lcode, data)
-        manifest = index.get_location_manifest(test_lcode)
-        redis_key = '{}:{}'.format(REDIS_SHELFLIST_PREFIX, test_lcode)
-        redis_obj(redis_key).set(manifest)
+        ShelflistManifest(test_lcode).rebuild(
+            index.get_location_manifest_docs(test_lcode)
+        )
 
     resource_url = '{}firstitemperlocation/'.format(API_ROOT)
     rsp = do_filter_search(resource_url, search, api_client)
@@ -7,6 +7,7 @@ from __future__ import absolute_import
 import random
 
 import pytest
+from shelflist.manifests import ShelflistManifest
 
 # FIXTURES AND TEST DATA
 # Fixtures used in the below tests can be found in ...
@@ -279,13 +280,13 @@ def test_itemstosolr_compile_vals(results, expected, exporter_class,
 @pytest.mark.shelflist
 @pytest.mark.callback
 def test_itemstosolr_shelflist_manifests(exporter_class, new_exporter,
-                                         shelflist_export_solr_assembler,
-                                         redis_obj):
+                                         shelflist_export_solr_assembler):
     """
     The shelflist app ItemsToSolr `final_callback` method should build
-    or rebuild the shelflist manifest for each location provided in the
-    vals['seen_lcode'] set. Each shelflist manifest should be saved in
-    Redis.
+    the shelflist manifest for each location provided in the
+    vals['seen_lcode'] set that hasn't been built yet. Manifests that
+    have already been built are maintained incrementally as records
+    are exported, so they should be left alone.
     """
     expclass = exporter_class('ItemsToSolr')
     exporter = new_exporter(expclass, 'full_export', 'waiting')
@@ -318,15 +319,24 @@ def test_itemstosolr_shelflist_manifests(exporter_class, new_exporter,
         '4_2_1': ('14', 'i00014', '4', '2', 1),
     }
 
+    def make_docs(lcode, slist):
+        return [{
+            'id': id_,
+            'location_code': lcode,
+            'call_number_sort': cn,
+            'volume_sort': vol,
+            'copy_number': copy,
+            'call_number_type': 'lc'
+        } for django_id, id_, cn, vol, copy in slist]
+
     # Add some pre-existing shelflistitem-manifest data to Redis.
     existing_shelflists = {
         'w3': [items['1_1_1'], items['1_2_1'], items['1_2_2']],
         'w4m': [items['3_1_2'], items['3_2_1'], items['3_2_2']],
         'x': [items['4_1_1'], items['4_2_1']]
     }
-    for lcode, item_data in existing_shelflists.items():
-        key = '{}:{}'.format(expclass.redis_shelflist_prefix, lcode)
-        redis_obj(key).set([i[1] for i in item_data])
+    for lcode, slist in existing_shelflists.items():
+        ShelflistManifest(lcode).rebuild(make_docs(lcode, slist))
 
     # Now simulate data that's been loaded into Solr that's updated one
     # or more existing shelflists.
@@ -337,15 +347,9 @@ def test_itemstosolr_shelflist_manifests(exporter_class, new_exporter,
     }
     solr_data = []
     for lcode, slist in updated_shelflists.items():
-        for django_id, id_, cn, vol, copy in slist:
-            solr_data.append((django_id, {
-                'id': id_,
-                'location_code': lcode,
-                'call_number_sort': cn,
-                'volume_sort': vol,
-                'copy_number': copy,
-                'call_number_type': 'lc'
-            }))
+        for (django_id, _, _, _, _), doc in zip(slist,
+                                                make_docs(lcode, slist)):
+            solr_data.append((django_id, doc))
     shelflist_export_solr_assembler.load_static_test_data(
         'shelflistitem', solr_data, id_field=id_field
     )
@@ -355,16 +359,50 @@ def test_itemstosolr_shelflist_manifests(exporter_class, new_exporter,
     vals = {'seen_lcodes': set(updated_shelflists.keys())}
     exporter.final_callback(vals=vals, status='success')
 
-    # Now check the results. Updated shelflists should be stored in
-    # Redis; any existing ones that weren't in `updated_shelflists`
-    # should still be in Redis.
-    for key in redis_obj.conn.keys():
-        lcode = key.split(':')[1]
-        if lcode in updated_shelflists:
-            expected_shelflist = [i[1] for i in updated_shelflists[lcode]]
-        else:
-            expected_shelflist = [i[1] for i in existing_shelflists[lcode]]
-        assert redis_obj(key).get() == expected_shelflist
+    # Now check the results. The new shelflist should be built from
+    # Solr; the ones that were already built should be unchanged.
+    expected = {'w2': updated_shelflists['w2']}
+    expected.update(existing_shelflists)
+    for lcode, slist in expected.items():
+        manifest = ShelflistManifest(lcode)
+        assert manifest.get_ids() == [i[1] for i in slist]
+        assert manifest.is_built()
+
+
+# NOTE: Do not remove 'solr_conns' from the below test's fixture list.
+# It is not used in the test, but this is what assures that Solr gets
+# cleared out when the test finishes.
+@pytest.mark.shelflist
+@pytest.mark.exports
+def test_itemstosolr_updates_manifests_incrementally(exporter_class,
+                                                     new_exporter,
+                                                     sierra_full_object_set,
+                                                     setattr_model_instance,
+                                                     solr_conns):
+    """
+    The shelflist app ItemsToSolr `export_records` and `delete_records`
+    methods should add, move, and remove the exported items in the
+    shelflist manifests for their locations, without rebuilding the
+    manifests.
+    """
+    items = sierra_full_object_set('ItemRecord').order_by('pk')[0:4]
+    for item in items:
+        setattr_model_instance(item, 'location_id', 'xdoc')
+    expclass = exporter_class('ItemsToSolr')
+    exporter = new_exporter(expclass, 'full_export', 'waiting')
+    exporter.export_records(items)
+    item_ids = [i.record_metadata.get_iii_recnum(False) for i in items]
+    xdoc, xmus = ShelflistManifest('xdoc'), ShelflistManifest('xmus')
+
+    assert sorted(xdoc.get_ids()) == sorted(item_ids)
+    assert not xdoc.is_built()
+
+    setattr_model_instance(items[0], 'location_id', 'xmus')
+    exporter.export_records([items[0]])
+    exporter.delete_records([items[1].record_metadata])
+
+    assert sorted(xdoc.get_ids()) == sorted(item_ids[2:])
+    assert xmus.get_ids() == [item_ids[0]]
 
 
 # NOTE: Do not remove 'solr_conns' from the below test's fixture list.
@@ -0,0 +1,162 @@
+"""
+Tests the shelflist.manifests module.
+"""
+
+from __future__ import absolute_import
+
+import random
+
+import pytest
+from shelflist import manifests
+
+
+# FIXTURES AND TEST DATA
+
+def make_doc(id_, lcode='w3', cn_type='lc', cn=None, vol=None, copy=None):
+    return {'id': id_, 'location_code': lcode, 'call_number_type': cn_type,
+            'call_number_sort': cn, 'volume_sort': vol, 'copy_number': copy}
+
+
+def solr_sort_key(doc):
+    """
+    Emulates how Solr sorts items in shelflist order: by each of the
+    manifest SORT_FIELDS, with missing values last, then by id.
+    """
+    key = []
+    for field in manifests.SORT_FIELDS:
+        value = doc[field]
+        key.append((1, 0) if value in (None, '') else (0, value))
+    return key + [doc['id']]
+
+
+@pytest.fixture
+def random_docs():
+    rand = random.Random(41)
+
+    def _random_docs(num, lcode='w3'):
+        return [make_doc(
+            'i{}'.format(i), lcode, rand.choice(['lc', 'sudoc', None]),
+            rand.choice(['A 1', 'A 10', 'A 2', 'AB', '', None]),
+            rand.choice(['V 1', 'V 10', None]),
+            rand.choice([1, 2, 10, -1, None])
+        ) for i in range(num)]
+    return _random_docs
+
+
+# TESTS
+
+def test_make_member_sorts_like_solr(random_docs):
+    """
+    Manifest members should sort, byte by byte, in the same order that
+    Solr sorts items in shelflist order.
+    """
+    docs = random_docs(300)
+    by_member = sorted(docs, key=lambda d: manifests.make_member(d)
+                       .encode('utf-8'))
+    assert by_member == sorted(docs, key=solr_sort_key)
+    assert [manifests.get_id_from_member(manifests.make_member(d))
+            for d in docs] == [d['id'] for d in docs]
+
+
+def test_rebuild_builds_manifest_in_shelflist_order(random_docs):
+    """
+    ShelflistManifest.rebuild should store the given items in
+    shelflist order, and an item's row number should be its position.
+    A second rebuild with the same items should change nothing.
+    """
+    docs = random_docs(200)
+    manifest = manifests.ShelflistManifest('w3')
+    exp_ids = [d['id'] for d in sorted(docs, key=solr_sort_key)]
+
+    assert not manifest.is_built()
+    assert manifest.rebuild(docs) == 200
+    assert manifest.is_built()
+    assert manifest.get_ids() == exp_ids
+    assert manifest.get_ids(10, 12) == exp_ids[10:13]
+    assert manifest.get_row_numbers(exp_ids[-2:] + ['i999']) == [
+        198, 199, None
+    ]
+    assert manifest.rebuild(docs) == 0
+    assert manifest.get_changes(docs) == []
+
+
+def test_update_items_repositions_items(random_docs):
+    """
+    The update_items and remove_items functions should add, move, and
+    remove individual items, including moving items between locations,
+    without disturbing the order of the others.
+    """
+    docs = random_docs(100)
+    manifests.ShelflistManifest('w3').rebuild(docs)
+    docs[0]['location_code'] = 'w4'
+    docs[1]['call_number_sort'] = 'ZZZ'
+    new_doc = make_doc('i500', 'w3', 'lc', 'A 1')
+    manifests.update_items([docs[0], docs[1], new_doc])
+    manifests.remove_items([docs[2]['id'], 'i999'])
+    exp_w3 = sorted([new_doc] + docs[1:2] + docs[3:], key=solr_sort_key)
+
+    assert manifests.ShelflistManifest('w3').get_ids() == [
+        d['id'] for d in exp_w3
+    ]
+    assert manifests.ShelflistManifest('w4').get_ids() == [docs[0]['id']]
+    assert manifests.get_row_numbers([('w4', docs[0]['id']),
+                                      ('w3', docs[0]['id']),
+                                      ('w3', new_doc['id'])]) == [
+        0, None, exp_w3.index(new_doc)
+    ]
+    assert manifests.ShelflistManifest('w3').get_changes(exp_w3) == []
+
+
+def test_rebuild_repairs_manifest(random_docs):
+    """
+    ShelflistManifest.rebuild should fix items that are missing or out
+    of place, remove items that shouldn't be there, and drop orphaned
+    members, touching only those items.
+    """
+    docs = random_docs(50)
+    manifest = manifests.ShelflistManifest('w3')
+    manifest.rebuild(docs)
+    manifests.remove_items([docs[0]['id']])
+    manifests.update_items([dict(docs[1], call_number_sort='ZZZ')])
+    manifests.update_items([make_doc('i500', 'w3')])
+    manifest.conn.zadd(manifest.key, {'\x01ZZZ\x00i600': 0})
+
+    assert len(manifest.get_changes(docs)) == 4
+    assert manifest.rebuild(docs) == 4
+    assert manifest.get_ids() == [
+        d['id'] for d in sorted(docs, key=solr_sort_key)
+    ]
+
+
+def test_browse_finds_items_near_a_call_number_or_item():
+    """
+    The browse function should get the items just before and after a
+    call number or an item, in one location's manifest or in the
+    global manifest, which follows items as they move.
+    """
+    def make_lc_doc(n, lcode):
+        cn_sort = manifests.normalize_call_number('QA {}'.format(n), 'lc')
+        return make_doc('i{}'.format(n), lcode, 'lc', cn_sort)
+
+    w3 = [make_lc_doc(n, 'w3') for n in range(10, 20)]
+    w4 = [make_lc_doc(n, 'w4') for n in range(20, 25)]
+    manifests.ShelflistManifest('w3').rebuild(w3)
+    manifests.ShelflistManifest('w4').rebuild(w4)
+    pos = manifests.make_call_number_position('QA 15', 'lc')
+
+    assert manifests.browse(2, 3, position=pos, location_code='w3') == (
+        ['i13', 'i14'], ['i15', 'i16', 'i17']
+    )
+    assert manifests.browse(1, 2, item_id='i19') == (['i18'], ['i19', 'i20'])
+    assert manifests.browse(2, 2, item_id='i19', location_code='w3') == (
+        ['i17', 'i18'], ['i19']
+    )
+    assert manifests.browse(0, 1, position=pos, location_code='w4') == (
+        [], ['i20']
+    )
+    assert manifests.browse(item_id='i999') is None
+
+    manifests.remove_items(['i18'])
+    manifests.update_items([dict(w4[0], call_number_sort='A')])
+    assert manifests.browse(2, 1, item_id='i19') == (['i16', 'i17'], ['i19'])
+    assert manifests.browse(0, 2, position='') == ([], ['i20', 'i10'])
@@ -8,6 +8,12 @@ class ShelflistAPIUris(Uris):
     named_uripatterns = {
         'shelflistitems-list': [r'v', {'v': r'1'}, r'/locations/',
                                 {'code': ''}, r'/shelflistitems/'],
+        'shelflistitems-dump': [r'v', {'v': r'1'}, r'/locations/',
+                                {'code': ''}, r'/shelflistitems/dump/'],
         'shelflistitems-detail': [r'v', {'v': r'1'}, r'/locations/',
                                   {'code': ''}, r'/shelflistitems/', {'id': ''}],
+        'shelflistitems-browse': [r'v', {'v': r'1'}, r'/locations/',
+                                  {'code': ''}, r'/shelflistitems/browse/'],
+        'shelflistitems-browse-all': [r'v', {'v': r'1'},
+                                      r'/shelflistitems/browse/'],
     }
@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 
+from api.simpleviews import select_view
 from api.uris import APIUris
 from django.urls import re_path, reverse_lazy
 from django.views.generic import RedirectView
@@ -14,22 +15,40 @@ urlpatterns = [
     re_path(APIUris.get_urlpattern('api-root', v=r'1'), views.api_root,
             name='api-root'),
     re_path(APIUris.get_urlpattern('locations-list', v='1'),
-            views.LocationList.as_view(), name='locations-list'),
+            select_view(views, 'LocationList').as_view(),
+            name='locations-list'),
+    re_path(APIUris.get_urlpattern('locations-dump', v='1'),
+            views.LocationDump.as_view(), name='locations-dump'),
     re_path(APIUris.get_urlpattern('locations-detail', v='1',
                                    code=r'(?P<code>[a-z\d]+)'),
-            views.LocationDetail.as_view(), name='locations-detail'),
+            select_view(views, 'LocationDetail').as_view(),
+            name='locations-detail'),
     re_path(ShelflistAPIUris.get_urlpattern('shelflistitems-list', v='1',
                                             code=r'(?P<code>[a-z\d]+)'),
-            views.ShelflistItemList.as_view(), name='shelflistitems-list'),
+            select_view(views, 'ShelflistItemList').as_view(),
+            name='shelflistitems-list'),
+    re_path(ShelflistAPIUris.get_urlpattern('shelflistitems-dump', v='1',
+                                            code=r'(?P<code>[a-z\d]+)'),
+            views.ShelflistItemDump.as_view(), name='shelflistitems-dump'),
+    re_path(ShelflistAPIUris.get_urlpattern('shelflistitems-browse', v='1',
+                                            code=r'(?P<code>[a-z\d]+)'),
+            views.ShelflistItemBrowse.as_view(), name='shelflistitems-browse'),
+    re_path(ShelflistAPIUris.get_urlpattern('shelflistitems-browse-all',
+                                            v='1'),
+            views.ShelflistItemBrowse.as_view(),
+            name='shelflistitems-browse-all'),
     re_path(ShelflistAPIUris.get_urlpattern('shelflistitems-detail', v=r'1',
                                             code=r'(?P<code>[a-z\d]+)',
                                             id=r'(?P<shelflistitem_id>i\d+)'),
-            views.ShelflistItemDetail.as_view(), name='shelflistitems-detail'),
+            select_view(views, 'ShelflistItemDetail').as_view(),
+            name='shelflistitems-detail'),
     re_path(APIUris.get_urlpattern('items-list', v=r'1'),
-            views.ItemList.as_view(), name='items-list'),
+            select_view(views, 'ItemList').as_view(), name='items-list'),
+    re_path(APIUris.get_urlpattern('items-dump', v=r'1'),
+            views.ItemDump.as_view(), name='items-dump'),
     re_path(APIUris.get_urlpattern('items-detail', v=r'1',
                                    id=r'(?P<id>i\d+)'),
-            views.ItemDetail.as_view(), name='items-detail'),
+            select_view(views, 'ItemDetail').as_view(), name='items-detail'),
     re_path(APIUris.get_urlpattern('firstitemperlocation-list', v=r'1'),
             views.FirstItemPerLocationList.as_view(),
             name='firstitemperlocation-list')
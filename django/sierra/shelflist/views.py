@@ -7,20 +7,24 @@ from __future__ import absolute_import
 import logging
 from collections import OrderedDict
 
+import pysolr
+from api import exceptions
 from api import views as api_views
 from api.simpleviews import SimpleView, SimpleGetMixin, SimplePatchMixin, \
-                            SimplePutMixin
+                            SimplePutMixin, SimpleDumpMixin, \
+                            SimpleBatchPatchMixin, AsyncSimpleView, \
+                            AsyncSimpleGetMixin
 from django.conf import settings
 from django.http import Http404
 from rest_framework import permissions
 from rest_framework.decorators import api_view
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from utils import solr
-from utils.redisobjs import RedisObject
+from utils import servertiming, solr
 
-from . import serializers
+from . import manifests, serializers
 from .parsers import JSONPatchParser
+from .search_indexes import ShelflistItemIndex
 from .uris import ShelflistAPIUris
 
 # set up logger, for debugging
@@ -42,12 +46,20 @@ def api_root(request):
     return Response(resp.data)
 
 
-class ShelflistItemList(SimpleGetMixin, SimpleView):
+class ShelflistItemList(SimpleBatchPatchMixin, SimpleGetMixin, SimpleView):
     """
     Paginated list of items. Use the 'page' query parameter to specify
     the page number.
+
+    PATCH updates many items at this location in one request, using a
+    json-patch document for each item (see SimpleBatchPatchMixin). All
+    of the changes go to Solr as atomic updates in one request, with
+    one commit, instead of one full save and commit per item. An item
+    that another request changed in the meantime isn't saved, and its
+    result has a 409 status; the rest of the batch is still saved.
     """
     serializer_class = serializers.ShelflistItemSerializer
+    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     resource_name = 'shelflistItems'
 
     def get_queryset(self):
@@ -56,12 +68,27 @@ class ShelflistItemList(SimpleGetMixin, SimpleView):
         ).filter(
             type='Item',
             location_code=self.kwargs['code']
-        ).order_by(
-            'call_number_type',
-            'call_number_sort',
-            'volume_sort',
-            'copy_number'
-        )
+        ).order_by(*ShelflistItemIndex.solr_shelflist_sort_criteria)
+
+    def save_batch(self, changes, commit_within=None):
+        # Changes were made to the items as they were when we fetched
+        # them, so an item's update fails if it has changed since then.
+        # The other items are still saved and committed.
+        using = settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
+        updates = [(obj, {'set': obj_changes}) for obj, obj_changes in changes]
+        try:
+            conflicts = solr.bulk_update_fields(
+                updates, using=using, check_version=True,
+                commit_within=commit_within, skip_conflicts=True
+            )
+        except pysolr.SolrError as e:
+            msg = ('The changes in the batch could not be saved: '
+                   '{}'.format(e))
+            raise exceptions.BadUpdate(detail=msg)
+        msg = ('This item was changed by another request while this one '
+               'was being processed, so its changes were not saved. Please '
+               'try again.')
+        return {self.get_object_id(obj): (409, msg) for obj in conflicts}
 
 
 # Add SimplePutMixin, SimplePatchMixin before SimpleGetMixin to enable
@@ -90,6 +117,136 @@ class ShelflistItemDetail(SimplePutMixin, SimplePatchMixin, SimpleGetMixin,
             return obj
 
 
+class ShelflistItemDump(SimpleDumpMixin, ShelflistItemList):
+    """
+    Streams all shelflist items for a location matching the request
+    filters as newline-delimited JSON, in shelflist order.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+
+class ShelflistItemBrowse(SimpleGetMixin, SimpleView):
+    """
+    Browse the shelf: get the items just before and just after a call
+    number or an item, in shelflist order, either at one location or
+    across all locations.
+
+    Use the `callNumber` and `callNumberType` query parameters to start
+    at a call number, or `item` to start at an item (which is then the
+    first of the items after). Use `before` and `after` to say how many
+    items to get on either side. The items are found in the
+    shelf-browse index in Redis (see `manifests.browse`) and fetched
+    from Solr, with one round trip to each.
+    """
+    serializer_class = serializers.ShelflistItemSerializer
+    resource_name = 'shelflistItems'
+    http_method_names = ['get', 'head', 'options']
+    call_number_qp = 'callNumber'
+    call_number_type_qp = 'callNumberType'
+    item_qp = 'item'
+    default_count = 5
+    max_count = 100
+
+    def get_queryset(self):
+        return solr.Queryset(
+            using=settings.REST_VIEWS_HAYSTACK_CONNECTIONS['ShelflistItems']
+        ).filter(type='Item')
+
+    def get_throttle_cost(self, request):
+        """
+        Browse requests cost 1 token, plus 1 for every
+        `throttle_cost_rows` items requested.
+        """
+        try:
+            before, after = self.get_counts_from_request(request)
+        except exceptions.BadQuery:
+            return 1
+        return 1 + (before + after) // self.throttle_cost_rows
+
+    def get_counts_from_request(self, request):
+        """
+        Get the number of items to return before and after the start
+        position, from the `before` and `after` query parameters.
+        Raises a BadQuery exception if either is invalid.
+        """
+        counts = []
+        for param in ('before', 'after'):
+            value = request.query_params.get(param, self.default_count)
+            try:
+                value = int(value)
+            except ValueError:
+                value = -1
+            if not 0 <= value <= self.max_count:
+                msg = ('The \'{}\' parameter must be an integer from 0 to '
+                       '{}.'.format(param, self.max_count))
+                raise exceptions.BadQuery(detail=msg)
+            counts.append(value)
+        return tuple(counts)
+
+    def get_start_from_request(self, request):
+        """
+        Get the position to browse from, as a (position, item id)
+        tuple for `manifests.browse`. Raises a BadQuery exception
+        unless exactly one of a call number or an item is provided.
+        """
+        params = request.query_params
+        call_number = params.get(self.call_number_qp)
+        item_id = params.get(self.item_qp)
+        if bool(call_number) == bool(item_id):
+            msg = ('Please provide either a \'{}\' or an \'{}\' parameter '
+                   'to browse from.'.format(self.call_number_qp,
+                                            self.item_qp))
+            raise exceptions.BadQuery(detail=msg)
+        if item_id:
+            return None, item_id
+        cn_type = params.get(self.call_number_type_qp)
+        if not cn_type:
+            msg = ('A \'{}\' parameter is required with \'{}\'.'
+                   ''.format(self.call_number_type_qp, self.call_number_qp))
+            raise exceptions.BadQuery(detail=msg)
+        return manifests.make_call_number_position(call_number, cn_type), None
+
+    def get_items(self, item_ids, fieldnames=None):
+        """
+        Fetch the items with the given IDs from Solr, in the order
+        given. Items that aren't in Solr are left out.
+        """
+        if not item_ids:
+            return []
+        queryset = self.project_queryset(self.get_queryset(), fieldnames)
+        queryset = queryset.filter(id__in=item_ids)
+        found = {item['id']: item for item in queryset[0:len(item_ids)]}
+        return [found[i] for i in item_ids if i in found]
+
+    def get(self, request, *args, **kwargs):
+        fieldnames = self.get_requested_fields(request)
+        before, after = self.get_counts_from_request(request)
+        position, item_id = self.get_start_from_request(request)
+        with servertiming.timing('browse'):
+            ids = manifests.browse(before, after, position, item_id,
+                                   self.kwargs.get('code'))
+        if ids is None:
+            raise Http404
+        before_ids = set(ids[0])
+        with servertiming.timing('filter'):
+            items = self.get_items(ids[0] + ids[1], fieldnames)
+        with servertiming.timing('serialize'):
+            data = OrderedDict()
+            data['beforeCount'] = len([i for i in items
+                                       if i['id'] in before_ids])
+            data['afterCount'] = len(items) - data['beforeCount']
+            data['_links'] = {'self': {'href': request.build_absolute_uri()}}
+            items = self.get_serializer(
+                instance=items,
+                force_refresh=True,
+                context={'request': request, 'view': self},
+                only=fieldnames
+            ).data
+            if items:
+                data['_embedded'] = {self.resource_name: items}
+        return Response(data)
+
+
 class LocationList(api_views.LocationList):
     serializer_class = serializers.LocationSerializer
 
@@ -106,10 +263,78 @@ class ItemDetail(api_views.ItemDetail):
     serializer_class = serializers.ItemSerializer
 
 
+class AsyncLocationList(AsyncSimpleGetMixin, AsyncSimpleView, LocationList):
+    """
+    Async version of LocationList.
+    """
+
+
+class AsyncLocationDetail(AsyncSimpleGetMixin, AsyncSimpleView,
+                          LocationDetail):
+    """
+    Async version of LocationDetail.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            code=self.kwargs['code']
+        ).aget_item(0)
+
+
+class AsyncItemList(AsyncSimpleGetMixin, AsyncSimpleView, ItemList):
+    """
+    Async version of ItemList.
+    """
+
+
+class AsyncItemDetail(AsyncSimpleGetMixin, AsyncSimpleView, ItemDetail):
+    """
+    Async version of ItemDetail.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            id=self.kwargs['id']
+        ).aget_item(0)
+
+
+class AsyncShelflistItemList(AsyncSimpleGetMixin, AsyncSimpleView,
+                             ShelflistItemList):
+    """
+    Async version of ShelflistItemList. PATCH requests are handled
+    synchronously, in a thread.
+    """
+
+
+class AsyncShelflistItemDetail(AsyncSimpleGetMixin, AsyncSimpleView,
+                               ShelflistItemDetail):
+    """
+    Async version of ShelflistItemDetail. PUT and PATCH requests are
+    handled synchronously, in a thread.
+    """
+
+    async def aget_object(self):
+        return await self.get_queryset().filter(
+            id=self.kwargs['shelflistitem_id']
+        ).aget_item(0)
+
+
+class LocationDump(api_views.LocationDump):
+    serializer_class = serializers.LocationSerializer
+
+
+class ItemDump(api_views.ItemDump):
+    serializer_class = serializers.ItemSerializer
+
+
 class FirstItemPerLocationList(api_views.FirstItemPerLocationList):
     def get_page_data(self, queryset, request):
         data = super().get_page_data(queryset, request)
-        for item in data['_embedded']['items']:
+        items = data['_embedded']['items']
+        # All of the row number lookups go into one call, so we make
+        # one round trip to Redis regardless of how many locations
+        # there are.
+        for item in items:
             l_code = item['locationCode']
             this_id = item['id']
             item['_links']['shelflistItem'] = {
@@ -117,7 +342,9 @@ class FirstItemPerLocationList(api_views.FirstItemPerLocationList):
                     'shelflistitems-detail', req=request, absolute=True,
                     v=self.api_version, code=l_code, id=this_id)
             }
-            r = RedisObject('shelflistitem_manifest', l_code)
-            item['rowNumber'] = r.get_index(this_id)
+        row_numbers = manifests.get_row_numbers(
+            [(item['locationCode'], item['id']) for item in items]
+        )
+        for item, row_number in zip(items, row_numbers):
+            item['rowNumber'] = row_number
         return data
-
@@ -0,0 +1,24 @@
+"""
+ASGI config for the sierra project.
+
+This module contains the ASGI application, as a module-level variable
+named ``application``, for use with any ASGI server (e.g. ``uvicorn
+sierra.asgi:application``). The ``ASGI_APPLICATION`` setting points
+here.
+
+Under ASGI, views based on ``api.simpleviews.AsyncSimpleView`` handle
+requests as coroutines, so one process can serve many requests that
+are waiting on Solr at the same time. Other (synchronous) views still
+work; Django runs them in a thread.
+"""
+from __future__ import absolute_import
+
+import dotenv
+from django.core.asgi import get_asgi_application
+from unipath import Path
+
+# As with WSGI, we defer to a DJANGO_SETTINGS_MODULE already in the
+# environment, or set via a .env settings file.
+dotenv.load_dotenv('{}/settings/.env'.format(Path(__file__).ancestor(1)))
+
+application = get_asgi_application()
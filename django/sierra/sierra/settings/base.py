@@ -189,6 +189,10 @@ TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 # Python dotted path to the WSGI application used by Django's runserver.
 WSGI_APPLICATION = 'sierra.wsgi.application'
 
+# Python dotted path to the ASGI application, for ASGI servers. Views
+# based on api.simpleviews.AsyncSimpleView run as coroutines under ASGI.
+ASGI_APPLICATION = 'sierra.asgi.application'
+
 INSTALLED_APPS = (
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -399,11 +403,14 @@ REST_FRAMEWORK = {
     'PAGINATE_BY': 20,
     'PAGINATE_BY_PARAM': 'limit',
     'PAGINATE_PARAM': 'offset',
+    'CURSOR_PARAM': 'cursor',
     'ORDER_BY_PARAM': 'orderBy',
     'SEARCH_PARAM': 'search',
     'SEARCHTYPE_PARAM': 'searchtype',
+    'FIELDS_PARAM': 'fields',
     'CAMELCASE_FIELDNAMES': True,
     'MAX_PAGINATE_BY': 500,
+    'INDEX_VERSION_MAX_AGE': 1,
     'DEFAULT_FILTER_BACKENDS': ('api.filters.SimpleQSetFilterBackend',),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'api.simpleauth.SimpleSignatureAuthentication',
@@ -413,6 +420,14 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': ('api.renderers.HALJSONRenderer',
                                  'rest_framework.renderers.BrowsableAPIRenderer',),
     'DEFAULT_PARSER_CLASSES': ('rest_framework.parsers.JSONParser',),
+    'DEFAULT_THROTTLE_CLASSES': ('api.throttles.APIUserThrottle',
+                                 'api.throttles.IPThrottle',
+                                 'api.throttles.ViewThrottle'),
+    'DEFAULT_THROTTLE_RATES': {
+        'user': get_env_variable('API_THROTTLE_RATE_USER', '3000/min'),
+        'ip': get_env_variable('API_THROTTLE_RATE_IP', '600/min'),
+        'view': get_env_variable('API_THROTTLE_RATE_VIEW'),
+    },
     'EXCEPTION_HANDLER': 'api.exceptions.sierra_exception_handler'
 }
 
@@ -542,6 +557,49 @@ REDIS_CONNECTION = {
     'password': get_env_variable('REDIS_APPDATA_PASSWORD')
 }
 
+# LOOKUP_CACHE_TTL is the maximum number of seconds that API serializers
+# keep lookup tables (location names, item status labels, etc.) in
+# memory before rebuilding them from Solr. Metadata exports invalidate
+# these tables when they finish, so this only matters if that fails.
+LOOKUP_CACHE_TTL = 3600
+
+# API_CREDENTIAL_CACHE_TTL is the maximum number of seconds that each
+# process keeps an APIUser's credentials in memory for authenticating
+# signed API requests. Saving an APIUser invalidates its cached
+# credentials in every process (within a few seconds), so this only
+# bounds how long changes made some other way can take to apply.
+API_CREDENTIAL_CACHE_TTL = 60
+
+# SOLR_SINGLE_FLIGHT_* settings control coalescing of identical Solr
+# searches that run concurrently, so that they share one round trip to
+# Solr. This only applies to read-only (GET/HEAD/OPTIONS) API requests;
+# other searches, such as exporters', always go to Solr. With
+# SOLR_SINGLE_FLIGHT_LOCAL, searches are coalesced between threads in
+# each process. Setting SOLR_SINGLE_FLIGHT_REDIS as well coalesces
+# searches across processes, using a Redis lock that expires after
+# SOLR_SINGLE_FLIGHT_TIMEOUT seconds; results larger than
+# SOLR_SINGLE_FLIGHT_MAX_BYTES aren't shared this way.
+SOLR_SINGLE_FLIGHT_LOCAL = get_env_variable('SOLR_SINGLE_FLIGHT_LOCAL', True)
+SOLR_SINGLE_FLIGHT_REDIS = get_env_variable('SOLR_SINGLE_FLIGHT_REDIS', False)
+SOLR_SINGLE_FLIGHT_TIMEOUT = 2
+SOLR_SINGLE_FLIGHT_MAX_BYTES = 1048576
+
+# SERVER_TIMING_ENABLED controls whether API views time each phase of
+# every request, report the timings to clients in a `Server-Timing`
+# header, and add them to the per-view latency histograms that staff
+# users can view at /api/v1/timings/. Each process writes its
+# histogram data to Redis at most once every
+# SERVER_TIMING_FLUSH_INTERVAL seconds.
+SERVER_TIMING_ENABLED = get_env_variable('SERVER_TIMING_ENABLED', True)
+SERVER_TIMING_FLUSH_INTERVAL = 10
+
+# ASYNC_API_VIEWS controls whether the URLconfs serve the async
+# versions of the Solr-backed API list and detail views (see
+# api.simpleviews.AsyncSimpleView). Only enable this when running under
+# an ASGI server (see sierra.asgi); under WSGI, async views still work
+# but gain nothing.
+ASYNC_API_VIEWS = get_env_variable('ASYNC_API_VIEWS', False)
+
 # Do we allow access to the admin interface on /admin URL?
 ADMIN_ACCESS = get_env_variable('ADMIN_ACCESS', True)
 
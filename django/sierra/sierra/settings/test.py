@@ -17,6 +17,13 @@ ALLOWED_HOSTS += (
     'testserver',
 )
 
+# Disable API throttling by default; tests for throttling enable it.
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = {
+    'user': None,
+    'ip': None,
+    'view': None,
+}
+
 INSTALLED_APPS += (
     'base.tests.vcftestmodels',
     'sierra.tests.testmodels',
@@ -0,0 +1,304 @@
+"""
+Provides asyncio versions of the Solr tools in utils.solr.
+
+`AsyncSolr` is a pysolr.Solr subclass that adds coroutine versions of
+the methods the API uses for searching (`asearch`). It makes requests
+using httpx instead of requests, so that a coroutine waiting on Solr
+doesn't block the event loop: under ASGI, one process can have many
+Solr requests in flight at once. Connections are pooled in one httpx
+client per event loop (see `get_client`).
+
+`AsyncQueryset` is a utils.solr.Queryset subclass that uses an
+`AsyncSolr` connection. Building querysets works exactly the same way
+(`filter`, `exclude`, `search`, `order_by`, `only`, etc.), and the
+normal, blocking ways of fetching results (slicing, `count`, etc.)
+still work, but each also has a coroutine version (`aslice`,
+`acount`, `aget_item`, `aget_one`, `aget_cursor_page`).
+
+Like utils.solr, identical searches from querysets made with
+`coalesce=True` that run concurrently on the same event loop share one
+Solr round trip if settings.SOLR_SINGLE_FLIGHT_LOCAL is True, and Solr
+round trips are recorded for the Server-Timing header
+(see utils.servertiming).
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import copy
+import time
+import weakref
+
+import httpx
+import pysolr
+import ujson
+from django.conf import settings
+
+from utils import servertiming, solr
+from utils.singleflight import AsyncSingleFlight
+
+
+_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """
+    Get the httpx.AsyncClient for the running event loop.
+
+    Async clients can only be used on the event loop they were created
+    on, so this creates one per loop, which all AsyncSolr objects on
+    that loop share (i.e., they share a connection pool).
+    """
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        client = _CLIENTS[loop] = httpx.AsyncClient()
+    return client
+
+
+def connect(url=None, using='default', **kwargs):
+    """
+    Get an AsyncSolr object for the given `url`, or for the Haystack
+    connection named by `using`. See `utils.solr.connect`.
+    """
+    return solr.connect(url, using, solr_class=AsyncSolr, **kwargs)
+
+
+class UJSONDecoder(object):
+    """
+    Decodes JSON using ujson, for use as a pysolr `decoder`.
+    """
+
+    def decode(self, s):
+        return ujson.loads(s)
+
+
+class AsyncSolr(pysolr.Solr):
+    """
+    A pysolr.Solr object that can also search Solr asynchronously.
+
+    The coroutine methods mirror the pysolr methods they're named
+    after, and they raise pysolr.SolrError in the same situations. Set
+    the `client` attribute to an httpx.AsyncClient to use it instead of
+    the shared client for the running event loop.
+
+    Responses are decoded on the event loop, so the default `decoder`
+    is a UJSONDecoder, which is several times faster than the json
+    module's decoder that pysolr uses by default.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('decoder', UJSONDecoder())
+        super(AsyncSolr, self).__init__(*args, **kwargs)
+        self.client = None
+
+    def get_client(self):
+        return self.client or get_client()
+
+    async def _asend_request(self, method, path='', body=None,
+                             headers=None):
+        url = self._create_full_url(path)
+        try:
+            resp = await self.get_client().request(
+                method.upper(), url, content=body, headers=headers,
+                timeout=self.timeout, auth=self.auth
+            )
+        except httpx.TimeoutException as err:
+            msg = "Connection to server '{}' timed out: {}".format(url, err)
+            raise pysolr.SolrError(msg)
+        except httpx.HTTPError as err:
+            msg = 'Failed to connect to server at {}: {}'.format(url, err)
+            raise pysolr.SolrError(msg)
+        if resp.status_code != 200:
+            msg = 'Solr responded with an error (HTTP {}): {}'.format(
+                resp.status_code, self._extract_error(resp)
+            )
+            raise pysolr.SolrError(msg)
+        return resp.text
+
+    async def _aselect(self, params, handler=None):
+        params['wt'] = 'json'
+        custom_handler = handler or self.search_handler
+        handler = 'select'
+        if custom_handler:
+            if self.use_qt_param:
+                params['qt'] = custom_handler
+            else:
+                handler = custom_handler
+        params_encoded = pysolr.safe_urlencode(params, True)
+        if len(params_encoded) < 1024:
+            path = '{}/?{}'.format(handler, params_encoded)
+            return await self._asend_request('get', path)
+        # Very long queries are sent as a POST, like pysolr does.
+        headers = {
+            'Content-type': 'application/x-www-form-urlencoded; '
+                            'charset=utf-8'
+        }
+        return await self._asend_request(
+            'post', '{}/'.format(handler), body=params_encoded.encode('utf-8'),
+            headers=headers
+        )
+
+    async def asearch(self, q, search_handler=None, **kwargs):
+        """
+        Coroutine version of `search`. Returns a `results_cls` object
+        (pysolr.Results, by default).
+        """
+        params = {'q': q}
+        params.update(kwargs)
+        response = await self._aselect(params, handler=search_handler)
+        return self.results_cls(self.decoder.decode(response))
+
+
+async def aget_unique_key(conn):
+    """
+    Coroutine version of `utils.solr.get_unique_key`, which shares its
+    cache.
+    """
+    if conn.url not in solr._UNIQUE_KEYS:
+        resp = await conn._asend_request('get', 'schema/uniquekey')
+        solr._UNIQUE_KEYS[conn.url] = ujson.loads(resp)['uniqueKey']
+    return solr._UNIQUE_KEYS[conn.url]
+
+
+async def aget_index_version(conn, max_age=0):
+    """
+    Coroutine version of `utils.solr.get_index_version`, which shares
+    its cache.
+    """
+    now = time.monotonic()
+    cached = solr._INDEX_VERSIONS.get(conn.url)
+    if cached is not None and now - cached[0] < max_age:
+        return cached[1]
+    req_path = 'replication?command=indexversion&wt=json'
+    resp = ujson.loads(await conn._asend_request('get', req_path))
+    version = (resp['indexversion'], resp['generation'])
+    solr._INDEX_VERSIONS[conn.url] = (now, version)
+    return version
+
+
+LOCAL_SEARCH_FLIGHTS = AsyncSingleFlight()
+
+
+async def coalesced_search(conn, **kwargs):
+    """
+    Coroutine version of `utils.solr.coalesced_search`, for AsyncSolr
+    connections. Identical searches are coalesced between tasks on the
+    same event loop if settings.SOLR_SINGLE_FLIGHT_LOCAL is True. (The
+    SOLR_SINGLE_FLIGHT_REDIS setting does not apply here.) As with the
+    blocking version, AsyncQuerysets only use this if they're made
+    with `coalesce=True`.
+    """
+    if not settings.SOLR_SINGLE_FLIGHT_LOCAL:
+        return await conn.asearch(**kwargs)
+    key = solr.get_search_key(conn, (), kwargs)
+    results, shared = await LOCAL_SEARCH_FLIGHTS.do(
+        key, lambda: conn.asearch(**kwargs)
+    )
+    return solr.copy_results(results) if shared else results
+
+
+class AsyncQueryset(solr.Queryset):
+    """
+    A utils.solr.Queryset with coroutine methods for fetching results.
+    """
+
+    def __init__(self, url=None, using='default', page_by=100, conn=None,
+                 coalesce=False, **kwargs):
+        conn = conn or connect(url=url, using=using, **kwargs)
+        super(AsyncQueryset, self).__init__(page_by=page_by, conn=conn,
+                                            coalesce=coalesce, **kwargs)
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        """
+        Make an AsyncQueryset that searches the same Solr core with the
+        same parameters as the given utils.solr.Queryset.
+        """
+        conn = queryset._conn
+        if not isinstance(conn, AsyncSolr):
+            conn = AsyncSolr(conn.url, timeout=conn.timeout, auth=conn.auth,
+                             always_commit=conn.always_commit,
+                             results_cls=conn.results_cls)
+        aqs = cls(conn=conn, page_by=queryset.page_by,
+                  coalesce=queryset.coalesce)
+        aqs._search_params = copy.deepcopy(queryset._search_params)
+        return aqs
+
+    async def _asearch(self, **kwargs):
+        kwargs.update(self._search_params)
+        start = time.perf_counter()
+        if self.coalesce:
+            response = await coalesced_search(self._conn, **kwargs)
+        else:
+            response = await self._conn.asearch(**kwargs)
+        servertiming.record('solr', time.perf_counter() - start)
+        if getattr(response, 'qtime', None) is not None:
+            servertiming.record('solr-qtime', response.qtime / 1000.0)
+        self._full_response = response
+        self._hits = response.hits
+        return response
+
+    async def aslice(self, start, stop):
+        """
+        Coroutine version of slicing: `await qs.aslice(10, 20)` gets
+        the same list of Result objects as `qs[10:20]`.
+        """
+        response = await self._asearch(start=start, rows=stop - start)
+        return [solr.Result(i) for i in response]
+
+    async def acount(self):
+        if self._hits is None:
+            await self._asearch(rows=0)
+        return self._hits
+
+    async def aget_item(self, key):
+        """
+        Coroutine version of indexing: `await qs.aget_item(0)` gets the
+        same Result object as `qs[0]`, or raises an IndexError.
+        """
+        if key < 0:
+            key = await self.acount() + key
+        new_key = key - self._result_offset
+        if 0 <= new_key < len(self._result_set):
+            return self._result_set[new_key]
+        if key >= 0 and (self._hits is None or key < self._hits):
+            response = await self._asearch(start=key, rows=self.page_by)
+            self._set_cache(response, offset=key)
+        if key < 0 or key >= self._hits or not self._result_set:
+            raise IndexError('index out of range')
+        return self._result_set[0]
+
+    async def aget_one(self, **kwargs):
+        """
+        Coroutine version of `get_one`.
+        """
+        result = self.filter(**kwargs)
+        try:
+            ret_value = await result.aget_item(0)
+        except IndexError:
+            return None
+        if await result.acount() > 1:
+            msg = ('Multiple objects returned for query {} '
+                   ''.format(result._search_params))
+            raise solr.MultipleObjectsReturned(msg)
+        return ret_value
+
+    async def aget_index_version(self, max_age=0):
+        return await aget_index_version(self._conn, max_age)
+
+    async def aget_cursor_page(self, cursor_mark='*', rows=None):
+        """
+        Coroutine version of `get_cursor_page`.
+        """
+        clone = self._clone()
+        clone._search_params.pop('start', None)
+        clone._search_params['sort'] = self.get_cursor_sort(
+            await aget_unique_key(self._conn)
+        )
+        clone._search_params['cursorMark'] = cursor_mark
+        rows = self.page_by if rows is None else rows
+        response = await clone._asearch(rows=rows)
+        self._full_response = response
+        self._hits = response.hits
+        return [solr.Result(i) for i in response], response.nextCursorMark
@@ -25,17 +25,28 @@ you'd run the full ItemsToSolr export process, then right before you're
 ready to move that to production you would run this function to copy
 the inventory data from your existing production index to your new one.
 
-Use `generate_shelflistitem_manifests` if/when you need to regenerate
-the shelflist item manifests in Redis. E.g., if you change how the
-manifests are stored or what information they contain, if your Redis
-data gets corrupted or lost, etc.
+All three stream items from Solr with cursors, send only the fields
+that change as atomic updates, work on several locations at once, and
+commit once at the end; see `update_locations`.
+
+Use `generate_shelflistitem_manifests` if/when you need to verify or
+regenerate the shelflist item manifests in Redis. E.g., if you change
+how the manifests are stored or what information they contain, if your
+Redis data gets corrupted or lost, etc. It also fills in the global
+shelf-browse manifest for items that were placed before it existed.
+(Exports keep manifests up to date incrementally, so this isn't needed
+otherwise.)
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+import threading
+import time
+
 import pytz
 
-from shelflist import exporters, search_indexes
-from utils import redisobjs, solr
+from shelflist import manifests, search_indexes
+from utils import solr
 
 
 FLAG_CODES = {
@@ -50,6 +61,8 @@ FLAG_CODES = {
 }
 SYSTEMLOG_STATUS = '@SYSTEMLOG-STATUS'
 SYSTEMLOG_FLAG = '@SYSTEMLOG-FLAG'
+INVENTORY_FIELDS = ('shelf_status', 'inventory_notes', 'inventory_date',
+                    'flags')
 
 
 # Here are some private functions used for auto-generating inventory
@@ -104,73 +117,260 @@ def rows_to_data(rows):
     return {row['id']: row for row in rows}
 
 
+def _get_item_update(doc, values, unique_key, auto_notes=True):
+    # Return the (doc, changes) atomic update needed to give `doc` the
+    # given `values`, or None if it already has them. Auto-generated
+    # notes are appended to the existing notes rather than replacing
+    # them, so the existing notes never have to be sent back to Solr.
+    changes = {}
+    to_set = {field: value for field, value in values.items()
+              if field not in (unique_key, '_version_')
+              and doc.get(field) != value}
+    if to_set:
+        changes['set'] = to_set
+    if auto_notes and 'inventory_notes' not in values:
+        notes = []
+        if 'shelf_status' in values:
+            notes.extend(_make_ss_notes(doc, values['shelf_status']))
+        if 'flags' in values:
+            notes.extend(_make_fl_notes(doc, values['flags']))
+        if notes:
+            changes['add'] = {'inventory_notes': notes}
+    return (doc, changes) if changes else None
+
+
+def _get_copy_update(old_item, new_item):
+    # Return the atomic update that copies inventory data from
+    # `old_item` to `new_item`, or None if there's nothing to copy.
+    if new_item is None:
+        return None
+    to_set = {f: old_item.get(f) for f in INVENTORY_FIELDS
+              if old_item.get(f) != new_item.get(f)}
+    return (new_item, {'set': to_set}) if to_set else None
+
+
+class Progress(object):
+    """
+    Tracks and reports the progress of a bulk update that runs on
+    several locations at once (see `update_locations`). Counts may be
+    added from multiple threads.
+    """
+
+    def __init__(self, num_locations, verbose=True):
+        self.num_locations = num_locations
+        self.verbose = verbose
+        self.locations_done = 0
+        self.seen = 0
+        self.updated = 0
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def get_elapsed(self):
+        return time.perf_counter() - self.started
+
+    def get_rate(self):
+        elapsed = self.get_elapsed()
+        return self.seen / elapsed if elapsed else 0.0
+
+    def add(self, seen, updated):
+        with self.lock:
+            self.seen += seen
+            self.updated += updated
+
+    def location_done(self, location, seen, updated):
+        with self.lock:
+            self.locations_done += 1
+            if self.verbose:
+                print(f'[{self.locations_done}/{self.num_locations}] '
+                      f'Location ___{location}___: {seen} item(s), '
+                      f'{updated} updated. Overall: {self.seen} item(s), '
+                      f'{self.updated} updated, {self.get_rate():.1f} '
+                      f'items/sec.')
+
+    def summary(self):
+        """
+        Return a dict summarizing the progress so far.
+        """
+        with self.lock:
+            return {
+                'locations': self.locations_done,
+                'seen': self.seen,
+                'updated': self.updated,
+                'seconds': round(self.get_elapsed(), 3),
+                'items_per_second': round(self.get_rate(), 1)
+            }
+
+
+def iter_docs(queryset, batch_size=1000):
+    """
+    Iterate through every doc `queryset` matches, fetching them from
+    Solr `batch_size` at a time using a cursor. Unlike paging with
+    `start` offsets, each fetch costs the same no matter how deep into
+    the results it is.
+    """
+    for page in queryset.iter_cursor_pages(rows=batch_size):
+        for doc in page:
+            yield doc
+
+
+def merge_join(left, right, left_key='id', right_key='id'):
+    """
+    Match up the items from two iterables that are both sorted on a
+    join key, in one pass, like a database sort-merge join.
+
+    Yields a (left item, right item) tuple for each item in `left`,
+    where the right item is the item in `right` with the same key, or
+    None if there isn't one. Items in `right` without a match are
+    skipped. Keys should be unique on each side. Only one item from
+    each side is held at a time, so memory use doesn't depend on how
+    many items there are.
+
+    Items are compared using Python comparisons on their keys, which
+    for strings matches the order Solr uses to sort string fields.
+    """
+    right = iter(right)
+    right_item = next(right, None)
+    for left_item in left:
+        key = left_item[left_key]
+        while right_item is not None and right_item[right_key] < key:
+            right_item = next(right, None)
+        if right_item is not None and right_item[right_key] == key:
+            yield left_item, right_item
+            right_item = next(right, None)
+        else:
+            yield left_item, None
+
+
+def update_locations(locations, iter_updates, using='haystack|update',
+                     batch_size=1000, workers=4, verbose=True):
+    """
+    Run a bulk update on the items at each of the given `locations`.
+
+    This is the engine the other bulk functions in this module use.
+    `iter_updates` is a function that takes a location code and yields
+    one value for each item it looks at in that location: either a
+    (Result, changes) tuple, as for `utils.solr.bulk_update_fields`,
+    or None if the item needs no changes. Updates are sent to Solr as
+    atomic updates, up to `batch_size` items per request, so only the
+    fields that change are sent.
+
+    Up to `workers` locations are processed at once, each in its own
+    thread. Nothing is committed until all locations are finished;
+    then there is one commit. If a location fails, locations that
+    haven't started yet are cancelled, and ones in progress stop before
+    sending their next batch. The updates already sent are still
+    committed, and then the error is raised.
+
+    If `verbose` is True, progress and overall throughput are printed
+    as each location finishes. Returns a dict summarizing the update:
+    `locations`, `seen`, `updated`, `seconds`, and `items_per_second`.
+    """
+    progress = Progress(len(locations), verbose)
+    failed = threading.Event()
+
+    def update_location(location):
+        seen, updated, batch = 0, 0, []
+        for update in iter_updates(location):
+            seen += 1
+            if update is not None:
+                batch.append(update)
+            if len(batch) == batch_size:
+                if failed.is_set():
+                    return
+                solr.bulk_update_fields(batch, using=using, commit=False)
+                progress.add(0, len(batch))
+                updated, batch = updated + len(batch), []
+        if failed.is_set():
+            return
+        if batch:
+            solr.bulk_update_fields(batch, using=using, commit=False)
+        progress.add(seen, len(batch))
+        progress.location_done(location, seen, updated + len(batch))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(update_location, loc) for loc in locations]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                failed.set()
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+    finally:
+        if verbose:
+            print('Committing to Solr.')
+        solr.commit(solr.connect(using=using), using)
+    summary = progress.summary()
+    if verbose:
+        print(f"Done: {summary['seen']} item(s), {summary['updated']} "
+              f"updated, in {summary['seconds']} sec "
+              f"({summary['items_per_second']} items/sec).")
+    return summary
+
+
 def set_item_fields(locations, data={}, default={}, batch_size=1000,
-                    using='haystack|update', verbose=True, auto_notes=True):
+                    using='haystack|update', verbose=True, auto_notes=True,
+                    workers=4):
     """
     Set fields on a batch of shelflist items in Solr and reload them.
 
+    Items are streamed from Solr with a cursor, and only items whose
+    values actually change are updated, via atomic updates that send
+    just the changed fields. Locations are processed in parallel, and
+    there is one commit at the end. See `update_locations`.
+
     Args:
         - locations: A list of location code (strings) to operate on.
         - data: (Optional) A dict mapping Solr IDs to item data dicts.
           If provided, each matching item is updated with whatever is
-          in the data dict. The item in Solr is overwritten completely.
+          in the data dict. Fields not provided are left alone.
         - default: (Optional) A dict containing default values to use
-          for items NOT in `data`. Fields not provided are carried over
-          from the item in Solr. Use {'field': None} to clear a field.
+          for items NOT in `data`. Fields not provided are left alone.
+          Use {'field': None} to clear a field.
         - batch_size: (Default 1000) An int for how many records to
-          include with each call to update Solr.
-        - using: (Default 'haystack') The Solr core on which to run the
-          update.
-        - verbose: (Default True) If True, prints messages to stdout
-          for each location and each batch to indicate progress. If
-          False, no output is printed.
+          fetch from Solr at a time and to include with each call to
+          update Solr.
+        - using: (Default 'haystack|update') The Solr core on which to
+          run the update.
+        - verbose: (Default True) If True, prints a progress message to
+          stdout as each location finishes and a summary at the end.
+          If False, no output is printed.
         - auto_notes: (Default True) If True, AND if the values to be
           set do not include 'inventory_notes' (i.e., you're not
           providing your own notes), AND if the values to be set DO
           include 'shelf_status' or 'flags' -- add appropriate system
           notes to simulate setting/clearing the status and/or flags,
           as needed.
+        - workers: (Default 4) How many locations to process at once.
+
+    Returns a summary dict; see `update_locations`.
     """
-    for location in locations:
-        qs = solr.Queryset(using=using)
-        qs = qs.filter(location_code=location).order_by('id')
-        num_items = qs.count()
-        if verbose:
-            print('Location ___{}___ ({} items)'.format(location, num_items))
-        
-        for start in range(0, num_items, batch_size):
-            end = start + batch_size
-            batch = []
-            for doc in qs[start:end]:
-                values_to_set = data.get(doc['id']) or default.copy()
-                if values_to_set:
-                    if auto_notes:
-                        set_ss = 'shelf_status' in values_to_set
-                        set_fl = 'flags' in values_to_set
-                        set_in = 'inventory_notes' in values_to_set
-                        if (set_ss or set_fl) and not set_in:
-                            notes = doc.get('inventory_notes') or []
-                            if set_ss:
-                                new_ss = values_to_set['shelf_status']
-                                notes.extend(_make_ss_notes(doc, new_ss))
-                            if set_fl:
-                                new_fl = values_to_set['flags']
-                                notes.extend(_make_fl_notes(doc, new_fl))
-                            values_to_set['inventory_notes'] = notes or None
-                    doc.update(values_to_set)
-                    batch.append(doc)
-                    
-            if verbose:
-                real_end = num_items if num_items <= end else end
-                print('Adding items {} to {} ...'.format(start + 1, real_end))
-            qs._conn.add(batch, commit=False)
+    unique_key = solr.get_unique_key(solr.connect(using=using))
+    fields = set(default)
+    for values in data.values():
+        fields |= set(values)
+    if auto_notes:
+        fields |= {'shelf_status', 'flags'}
+    fields = sorted(fields | {'id', unique_key})
+
+    def iter_updates(location):
+        qs = solr.Queryset(using=using).filter(location_code=location)
+        qs = qs.order_by('id').only(*fields)
+        for doc in iter_docs(qs, batch_size):
+            values = data.get(doc['id']) or default
+            if values:
+                yield _get_item_update(doc, values, unique_key, auto_notes)
+            else:
+                yield None
 
-        # A final hard commit after each location
-        solr.commit(qs._conn, using)
+    return update_locations(locations, iter_updates, using=using,
+                            batch_size=batch_size, workers=workers,
+                            verbose=verbose)
 
 
 def clear_inventory_locations(locations, batch_size=1000, using='haystack',
-                              verbose=True):
+                              verbose=True, workers=4):
     """
     Clear all inventory-specific fields for a batch of shelflist items.
 
@@ -184,28 +384,25 @@ def clear_inventory_locations(locations, batch_size=1000, using='haystack',
         - batch_size (Default 1000)
         - using (Default 'haystack')
         - verbose (Default True)
+        - workers (Default 4)
     """
-    default = {
-        'shelf_status': None,
-        'inventory_notes': None,
-        'inventory_date': None,
-        'flags': None
-    }
-    set_item_fields(locations, default=default, batch_size=batch_size,
-                    using=using, verbose=verbose)
+    default = {field: None for field in INVENTORY_FIELDS}
+    return set_item_fields(locations, default=default,
+                           batch_size=batch_size, using=using,
+                           verbose=verbose, workers=workers)
 
 
 def copy_inventory_data_from_other_index(
     locations, from_url='http://localhost:8983/solr/haystack',
     to_using='haystack|update', batch_size=1000, verbose=True,
-    from_key='haystack_id', to_key='haystack_id'    
+    from_key='id', to_key='id', workers=4, update_batch_size=5000
 ):
     """
     Copy inventory-specific data from one index to another.
 
     We use this when we need to migrate to new Solr servers and we want
     to copy all inventory-specific data from the old one to the new
-    one. The overall workflow is:    
+    one. The overall workflow is:
         - On the new server, reindex all item data from Sierra into the
           haystack index. When finished, inventory-specific data will
           not yet be present.
@@ -216,6 +413,16 @@ def copy_inventory_data_from_other_index(
           either from a shell or a script. Provide the list of location
           codes you wish to copy over.
 
+    For each location, this does a sort-merge join (see `merge_join`):
+    items are streamed from both indexes with cursors, both sorted on
+    the join key (`id`, by default), and matched up as they go. So it
+    takes one pass over each index, memory use stays bounded, and the
+    work grows linearly with the number of items. Only items whose
+    inventory data differs are updated, via atomic updates sent in
+    batches of `update_batch_size`. Locations are processed in
+    parallel, and there is one commit at the end. See
+    `update_locations`.
+
     Args:
         - locations, a list of locations to act on.
         - from_url, the Solr server external to the current stack
@@ -223,104 +430,64 @@ def copy_inventory_data_from_other_index(
           'http://localhost:8983/solr/haystack'.
         - to_using, the haystack connection string you want to use to
           load data into. Default is 'haystack|update'.
-        - batch_size, default is 1000
+        - batch_size, how many items to fetch from each index at a
+          time. Default is 1000.
         - verbose, default is True
         - from_key, the field in the "from" Solr data you wish to use
-          as a match key. Default is 'haystack_id'.
+          as a match key. Default is 'id'.
         - to_key, the field in the "to" Solr data you wish to use as a
-          match key. Default is 'haystack_id'. Note that the values in
+          match key. Default is 'id'. Note that the values in
           your 'from_key' field must match the values in your 'to_key'
           field.
-    """
-    inv_fields = ['shelf_status', 'inventory_notes', 'inventory_date', 'flags']
-    for location in locations:
-        old_qs = solr.Queryset(url=from_url, page_by=batch_size)
-        old_qs = old_qs.filter(location_code=location).order_by(from_key)
-        new_qs = solr.Queryset(using=to_using, page_by=batch_size)
-        new_qs = new_qs.filter(location_code=location).order_by(to_key)
-        nqs_iter = iter(new_qs)
-        num_items = old_qs.count()
-        batch = []
-        num_updated = 0
-        num_skipped = 0
-        done_flag = False
-
-        if verbose:
-            print()
-            print(f'Location ___{location}___ ({num_items} items)')
-
-        new_item = next(nqs_iter, None)
-        for old_item in old_qs:
-            total_seen = num_updated + num_skipped
-            if verbose and total_seen % batch_size == 0:
-                pc = round((total_seen / num_items) * 100, 2)
-                print(f'Updated {num_updated}, skipped {num_skipped} ({pc}%)')
-
-            if len(batch) == batch_size:
-                new_qs._conn.add(batch, commit=False)
-                batch = []
-                if verbose:
-                    print(f'===Adding {batch_size} docs to Solr===')
-
-            updated_flag = False
-            while True:
-                if new_item is None:
-                    done_flag = True
-                    break
-                if old_item[from_key] < new_item[to_key]:
-                    break
-                if old_item[from_key] == new_item[to_key]:
-                    for field in inv_fields:
-                        if old_item.get(field) != new_item.get(field):
-                            new_item[field] = old_item.get(field)
-                            updated_flag = True
-                    if updated_flag:
-                        del(new_item['_version_'])
-                        batch.append(new_item)
-                    new_item = next(nqs_iter, None)
-                    break
-                new_item = next(nqs_iter, None)
-
-            if updated_flag:
-                num_updated += 1
-            else:
-                num_skipped += 1
-
-            if done_flag:
-                num_left = num_items - (num_updated + num_skipped)
-                num_skipped += num_left
-                break
+        - workers, how many locations to process at once. Default is 4.
+        - update_batch_size, how many items to send to Solr with each
+          update request. Default is 5000.
 
-        if batch:
-            new_qs._conn.add(batch, commit=False)
-            if verbose:
-                print(f'===Adding {len(batch)} docs to Solr===')
+    Returns a summary dict; see `update_locations`.
+    """
+    to_key_fields = {to_key, solr.get_unique_key(solr.connect(using=to_using))}
+    to_fields = sorted(to_key_fields | set(INVENTORY_FIELDS))
 
-        if verbose:
-            print(f'Done. Updated {num_updated}, skipped {num_skipped}.')
-            print()
+    def iter_updates(location):
+        old_qs = solr.Queryset(url=from_url).filter(location_code=location)
+        old_qs = old_qs.order_by(from_key).only(from_key, *INVENTORY_FIELDS)
+        new_qs = solr.Queryset(using=to_using).filter(location_code=location)
+        new_qs = new_qs.order_by(to_key).only(*to_fields)
+        pairs = merge_join(iter_docs(old_qs, batch_size),
+                           iter_docs(new_qs, batch_size), from_key, to_key)
+        for old_item, new_item in pairs:
+            yield _get_copy_update(old_item, new_item)
 
-        # A final hard commit after each location
-        solr.commit(new_qs._conn, to_using)
+    return update_locations(locations, iter_updates, using=to_using,
+                            batch_size=update_batch_size, workers=workers,
+                            verbose=verbose)
 
 
 def generate_shelflistitem_manifests(locations, using='haystack|search',
-                                     verbose=True):
+                                     verify_only=False, verbose=True):
     """
     (Re)generate shelflistitem manifests for the given locations.
+
+    Each manifest is compared against Solr, and only items that are
+    missing or out of place are repositioned. Use `verify_only=True`
+    to report how many items are out of place without changing
+    anything. Returns a dict mapping each location code to that count.
     """
     index = search_indexes.ShelflistItemIndex(using=using)
-    redis_shelflist_prefix = exporters.ItemsToSolr.redis_shelflist_prefix
+    changed = {}
     for location in locations:
         if verbose:
             print()
             print(f'Location ___{location}___')
             print('Getting items from Solr.')
-        manifest = index.get_location_manifest(location)
-        if manifest:
+        docs = index.get_location_manifest_docs(location)
+        manifest = manifests.ShelflistManifest(location)
+        if verify_only:
+            changed[location] = len(manifest.get_changes(docs))
+        else:
             if verbose:
                 print('Saving to Redis.')
-            r = redisobjs.RedisObject(redis_shelflist_prefix, location)
-            r.set(manifest)
-        elif verbose:
-            print('Location is empty or does not exist. Skipping.')
+            changed[location] = manifest.rebuild(docs)
+        if verbose:
+            print(f'{changed[location]} item(s) missing or out of place.')
+    return changed
@@ -0,0 +1,187 @@
+"""
+Contains a process-wide cache for small lookup tables.
+
+API serializers translate codes into labels--location codes into
+location names, item status codes into status labels, etc. Building
+those lookup tables requires a Solr query, but the underlying data only
+changes when a metadata export runs. `LOOKUP_CACHE` lets every
+serializer in a process share one copy of each table, which expires
+after `settings.LOOKUP_CACHE_TTL` seconds or when it is explicitly
+invalidated.
+
+Invalidation has to reach every web server process, not just the one
+that runs the export, so `LookupCache.invalidate` increments a version
+number for each table in a Redis hash. Each process compares its own
+table versions against Redis (at most once every `sync_interval`
+seconds) when `LookupCache.sync` is called and drops any tables that
+have changed. Those versions (and the time of each invalidation) also
+tell API views when data built from the tables last changed; see
+`LookupCache.get_versions`.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from utils.redisobjs import REDIS_CONNECTION
+
+# set up logger, for debugging
+logger = logging.getLogger('sierra.custom')
+
+
+class LookupCache(object):
+    """
+    Cache of named lookup tables (usually dicts) with a TTL and
+    Redis-coordinated invalidation.
+
+    Instances behave like a read/write mapping of table names to
+    tables: `cache['status'] = {...}` stores a table, and
+    `cache.get('status')` returns it (or the default, if it is not
+    cached or has expired). Call `sync` periodically (e.g., once per
+    request) to pick up invalidations made in other processes, and call
+    `invalidate` when the source data for one or more tables changes.
+
+    Tables are returned as-is, not copied, so anything that modifies a
+    cached table in place modifies it for every consumer.
+
+    Caches used for different purposes should use different Redis keys
+    (`redis_key`) to track their versions. The time each table was
+    last invalidated is kept in another hash, at `times_key`.
+    """
+    redis_key = 'lookup_cache:versions'
+    all_tables = '__all__'
+
+    def __init__(self, ttl=3600, sync_interval=5, conn=REDIS_CONNECTION,
+                 clock=time.monotonic, redis_key=None):
+        if redis_key is not None:
+            self.redis_key = redis_key
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.conn = conn
+        self.clock = clock
+        self._tables = {}
+        self._versions = None
+        self._last_sync = None
+
+    def __getitem__(self, name):
+        table = self.get(name)
+        if table is None:
+            raise KeyError(name)
+        return table
+
+    def __setitem__(self, name, table):
+        self.set(name, table)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def get(self, name, default=None):
+        try:
+            expires, table = self._tables[name]
+        except KeyError:
+            return default
+        if self.clock() >= expires:
+            self._tables.pop(name, None)
+            return default
+        return table
+
+    def set(self, name, table):
+        self._tables[name] = (self.clock() + self.ttl, table)
+
+    def sync(self, force=False):
+        """
+        Drop any tables that have been invalidated in another process
+        since the last sync. Unless `force` is True, this only checks
+        Redis if `sync_interval` seconds have passed since the last
+        check. If Redis is unavailable, this logs a warning and keeps
+        the local tables, which still expire via the TTL.
+        """
+        now = self.clock()
+        if not force and self._last_sync is not None:
+            if now - self._last_sync < self.sync_interval:
+                return
+        self._last_sync = now
+        try:
+            versions = self.conn.hgetall(self.redis_key)
+        except redis.RedisError as e:
+            logger.warning('Could not sync the lookup cache: {}'.format(e))
+            return
+        if self._versions is None:
+            # This is the first sync, so there's nothing to compare.
+            self._versions = versions
+            return
+        for name, version in versions.items():
+            if self._versions.get(name) != version:
+                if name == self.all_tables:
+                    self._tables.clear()
+                else:
+                    self._tables.pop(name, None)
+        self._versions = versions
+
+    @property
+    def times_key(self):
+        return '{}:times'.format(self.redis_key)
+
+    def get_versions(self, names):
+        """
+        Get the current state of the named tables, as shared via Redis,
+        for validating (e.g., with an HTTP ETag) data built from them.
+        Returns a (version, last_modified) tuple: `version` is a string
+        that changes whenever any of the tables is invalidated, and
+        `last_modified` is the Unix time of the latest invalidation, or
+        0 if none has been recorded. Returns None if Redis is
+        unavailable.
+        """
+        names = list(names) + [self.all_tables]
+        try:
+            pipe = self.conn.pipeline()
+            pipe.hmget(self.redis_key, names)
+            pipe.hmget(self.times_key, names)
+            versions, times = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('Could not get lookup cache versions: '
+                           '{}'.format(e))
+            return None
+        version = ','.join('{}={}'.format(name, v or 0)
+                           for name, v in zip(names, versions))
+        return version, max(float(t or 0) for t in times)
+
+    def invalidate(self, *names):
+        """
+        Drop the named tables, or all tables if no names are provided,
+        here and (via Redis) in every other process using a
+        LookupCache.
+        """
+        names = names or (self.all_tables,)
+        try:
+            now = time.time()
+            pipe = self.conn.pipeline()
+            for name in names:
+                pipe.hincrby(self.redis_key, name, 1)
+                pipe.hset(self.times_key, name, now)
+            versions = pipe.execute()[0::2]
+            if self._versions is not None:
+                for name, version in zip(names, versions):
+                    self._versions[name] = str(version)
+        except redis.RedisError as e:
+            logger.warning('Could not invalidate the lookup cache in other '
+                           'processes: {}'.format(e))
+        if self.all_tables in names:
+            self._tables.clear()
+        for name in names:
+            self._tables.pop(name, None)
+
+    def clear(self):
+        """
+        Drop all tables in this process only.
+        """
+        self._tables.clear()
+        self._versions = None
+        self._last_sync = None
+
+
+LOOKUP_CACHE = LookupCache(ttl=settings.LOOKUP_CACHE_TTL)
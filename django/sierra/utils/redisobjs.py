@@ -1,8 +1,16 @@
 from __future__ import absolute_import
 
+import array
+import asyncio
+import itertools
+import sys
 import ujson
+import weakref
+import zlib
+from base64 import b85decode, b85encode
 
 import redis
+import redis.asyncio
 from django.conf import settings
 from six import iteritems
 
@@ -10,11 +18,33 @@ from six import iteritems
 REDIS_CONNECTION = redis.StrictRedis(
     decode_responses=True, **settings.REDIS_CONNECTION
 )
+_ASYNC_CONNECTIONS = weakref.WeakKeyDictionary()
 NONE_KEY = '~~~|_DOESNOTEXIST_|~~~'
 STR_OBJ_PREFIX = '~~~|_STR_OBJ_|~~~'
+CODEC_PREFIX = '~~~|_CODEC_|'
 LISTLIKE_TYPES = [list, tuple]
 
 
+def get_async_connection():
+    """
+    Get a redis.asyncio connection for the running event loop.
+
+    This is the asyncio equivalent of REDIS_CONNECTION, for coroutines
+    that need to talk to Redis without blocking the event loop (e.g.,
+    to use with 'Pipeline.aexecute' or 'RedisObject.aget'). Async
+    connections can only be used on the event loop they were created
+    on, so this creates one per loop.
+    """
+    loop = asyncio.get_running_loop()
+    conn = _ASYNC_CONNECTIONS.get(loop)
+    if conn is None:
+        conn = redis.asyncio.StrictRedis(
+            decode_responses=True, **settings.REDIS_CONNECTION
+        )
+        _ASYNC_CONNECTIONS[loop] = conn
+    return conn
+
+
 class Accumulator(object):
     """
     Class for making accumulators to use with Pipeline.add.
@@ -139,6 +169,11 @@ class Pipeline(object):
 
     The final 'results' value would contain:
     [[1, 3, 5], ['b', 'd'], 'foobarbaz']
+
+    To use a Pipeline from asyncio code, make it with an asyncio
+    connection (e.g. 'Pipeline(get_async_connection())'), add commands
+    the same way, and then 'await pl.aexecute()' instead of calling
+    'execute'.
     """
 
     def __init__(self, conn=REDIS_CONNECTION):
@@ -193,6 +228,25 @@ class Pipeline(object):
         multiple 'add's, if desired.
         """
         getattr(self.pipe, cmd)(key, *args, **kwargs)
+        return self._add_entry(callback, accumulator)
+
+    def add_script(self, script, keys, args=[], callback=None,
+                   accumulator=None):
+        """
+        Queues up a Lua script to run as the next pipeline command.
+
+        Provide the 'script' (a redis.commands.core.Script, such as
+        from 'register_script'), plus the 'keys' and 'args' to pass to
+        it. The 'callback' and 'accumulator' work the same way they do
+        for 'add'. The script is loaded into Redis if it isn't there
+        already when the pipeline executes.
+
+        Returns the Pipeline instance.
+        """
+        script(keys=keys, args=args, client=self.pipe)
+        return self._add_entry(callback, accumulator)
+
+    def _add_entry(self, callback, accumulator):
         self.entries.append((callback, accumulator, False))
         if accumulator is not None and accumulator not in self.accumulators:
             self.accumulators.append(accumulator)
@@ -224,8 +278,23 @@ class Pipeline(object):
 
         The command queue is cleared when executed.
         """
+        return self._compile_results(self.pipe.execute())
+
+    async def aexecute(self):
+        """
+        Executes the current command queue and returns the results.
+
+        This is the coroutine version of 'execute', for Pipelines made
+        with an asyncio connection.
+        """
+        return self._compile_results(await self.pipe.execute())
+
+    def _compile_results(self, raw):
+        """
+        Applies callbacks and accumulators to the raw results from
+        Redis and resets this Pipeline's state.
+        """
         results = []
-        raw = self.pipe.execute()
         for result, entry in zip(raw, self.entries):
             callback, accumulator, acc_pop = entry
             if callback is not None:
@@ -262,6 +331,159 @@ def make_single_or_list_callback(decode_list=None):
     return callback
 
 
+class JSONCodec(object):
+    """
+    Codec that encodes data members as JSON strings.
+
+    A codec converts one Python value (one list/zset/set member, one
+    hash value, or one whole 'encoded_obj') to the string that's stored
+    in Redis, and back. This is the default codec, and JSON-encoded
+    members are stored without a codec tag, so it reads and writes the
+    same data RedisObjects always have.
+
+    Other codecs subclass this. Members they encode differently are
+    stored with a tag -- CODEC_PREFIX, the codec 'name', and a '|' --
+    so that 'decode_member' can decode any member, whatever codec the
+    RedisObject that reads it is using; members they don't encode
+    differently are plain JSON. Register each subclass with
+    'register_codec' so it can be found by name. Encoding must be
+    deterministic, since lookups by value compare encoded members.
+
+    Because the Redis connection decodes responses to str, binary
+    payloads are stored base85-encoded.
+    """
+    name = 'json'
+
+    def encode(self, data):
+        return ujson.dumps(data)
+
+    def decode(self, raw):
+        return ujson.loads(raw)
+
+    def tag(self, payload):
+        return ''.join([CODEC_PREFIX, self.name, '|', payload])
+
+    def decode_payload(self, payload):
+        """
+        Decode the 'payload' portion of a member tagged by this codec.
+        """
+        return self.decode(payload)
+
+
+class ZlibCodec(JSONCodec):
+    """
+    Codec that zlib-compresses the JSON for large data members.
+
+    Members whose JSON is at least 'threshold' characters long are
+    compressed; smaller members are stored as plain JSON, since
+    compression wouldn't save anything.
+    """
+    name = 'zlib'
+
+    def __init__(self, threshold=1024, level=6):
+        self.threshold = threshold
+        self.level = level
+
+    def encode(self, data):
+        encoded = super().encode(data)
+        if len(encoded) < self.threshold:
+            return encoded
+        packed = zlib.compress(encoded.encode('utf-8'), self.level)
+        return self.tag(b85encode(packed).decode('ascii'))
+
+    def decode_payload(self, payload):
+        raw = zlib.decompress(b85decode(payload)).decode('utf-8')
+        return super().decode(raw)
+
+
+class IntArrayCodec(JSONCodec):
+    """
+    Codec that packs lists of integers, such as lists of IDs, into
+    compact binary arrays.
+
+    Each list is delta-encoded (so sorted IDs become small numbers),
+    packed into the smallest array type that fits, and compressed. The
+    array type is stored with the payload. Members that aren't
+    non-empty lists of ints are stored as plain JSON. Packed lists
+    decode to lists.
+    """
+    name = 'intarray'
+    typecodes = ('b', 'h', 'i', 'q')
+
+    def encode(self, data):
+        if not (isinstance(data, (list, tuple)) and data
+                and all(type(v) is int for v in data)):
+            return super().encode(data)
+        deltas = [data[0]] + [b - a for a, b in zip(data, data[1:])]
+        for typecode in self.typecodes:
+            try:
+                packed = array.array(typecode, deltas)
+            except OverflowError:
+                continue
+            if sys.byteorder == 'big':
+                packed.byteswap()
+            payload = b85encode(zlib.compress(packed.tobytes()))
+            return self.tag(typecode + payload.decode('ascii'))
+        return super().encode(data)
+
+    def decode_payload(self, payload):
+        deltas = array.array(payload[0])
+        deltas.frombytes(zlib.decompress(b85decode(payload[1:])))
+        if sys.byteorder == 'big':
+            deltas.byteswap()
+        return list(itertools.accumulate(deltas))
+
+
+CODECS = {}
+ENTITY_CODECS = {}
+DEFAULT_CODEC = JSONCodec()
+
+
+def register_codec(codec):
+    """
+    Register a codec instance by its 'name', so that members it tags
+    can be decoded. Returns the codec.
+    """
+    CODECS[codec.name] = codec
+    return codec
+
+
+def set_entity_codec(entity, codec):
+    """
+    Set the codec that RedisObjects for the given 'entity' use by
+    default to encode data. (Existing data stays readable; it's
+    re-encoded with the new codec the next time it's saved.) Use None
+    to go back to the default, JSON.
+    """
+    if codec is None:
+        ENTITY_CODECS.pop(entity, None)
+    else:
+        ENTITY_CODECS[entity] = register_codec(codec)
+
+
+def encode_member(data, codec=None):
+    """
+    Encode one data member using 'codec' (default JSON).
+    """
+    return (codec or DEFAULT_CODEC).encode(data)
+
+
+def decode_member(raw):
+    """
+    Decode one data member, using whatever codec tagged it, if any.
+    """
+    if raw is None:
+        return None
+    if raw.startswith(CODEC_PREFIX):
+        name, payload = raw[len(CODEC_PREFIX):].split('|', 1)
+        return CODECS[name].decode_payload(payload)
+    return DEFAULT_CODEC.decode(raw)
+
+
+for _codec in (DEFAULT_CODEC, ZlibCodec(), IntArrayCodec()):
+    register_codec(_codec)
+
+
 class _Lookup(object):
     """
     Internal base class for storing info about Redis object lookups.
@@ -569,8 +791,9 @@ class _RedisTypeMetadata(object):
 
     'encode_member' and 'decode_member' are for encoding/decoding the
     individual data members for collective types (list/zset elements,
-    hash elements, set elements) -- here we encode to JSON, but you
-    could subclass this to use something different.
+    hash elements, set elements) -- here we encode using a Codec
+    (JSON, by default; see 'encode_member'), but you could subclass
+    this to use something different.
 
     'label' -- a string for identifying and addressing the rtype
     easily. Using the type string that Redis returns from a 'TYPE'
@@ -611,7 +834,8 @@ class _RedisTypeMetadata(object):
     'attributes' -- a set of string attributes or tags that apply to
     this rtype. If a tag is included, it applies; if not, it does not.
     """
-    encode_member = ujson.dumps
+    encode_member = staticmethod(encode_member)
+    decode_member = staticmethod(decode_member)
 
     def __init__(self, label, compatible_ptypes=[], incompatible_ptypes=[],
                  compatibility_label=None, all_lookup_type=None,
@@ -662,10 +886,6 @@ class _RedisTypeMetadata(object):
         )
         self.attributes = set(attributes or [])
 
-    @staticmethod
-    def decode_member(raw):
-        return None if raw is None else ujson.loads(raw)
-
     @property
     def compatibility_label(self):
         """
@@ -849,13 +1069,14 @@ class _BatchMixin(object):
     Abstract base "mixin" class for _RedisType that adds batch methods.
     """
 
-    def make_batches_to_send(self, data, batch_size):
+    def make_batches_to_send(self, data, batch_size, codec=None):
         """
         Returns an iterator that iterates over batches of 'data'.
 
         Use this for dividing user-provided data into batches of the
         given size ('batch_size'), for sending data to Redis in batch.
-        Subclasses must implement this.
+        Members are encoded using 'codec', where applicable. Subclasses
+        must implement this.
         """
         pass
 
@@ -872,7 +1093,7 @@ class _BatchMixin(object):
         cached_bypass = obj.bypass_encoding
         obj.bypass_encoding = True
         try:
-            batches = self.make_batches_to_send(data, bsize)
+            batches = self.make_batches_to_send(data, bsize, obj.codec)
             batch = next(batches)
             self.save(obj, batch, update, index, prev_rtype, tsize == 1)
             for i, batch in enumerate(batches):
@@ -935,12 +1156,13 @@ class _SequenceBatchMixin(_BatchMixin):
     Implements batch methods for sequences (lists, sets, etc.).
     """
 
-    def _make_batch_data_iterator(self, data):
-        return (self.encode_member(item) for item in data)
+    def _make_batch_data_iterator(self, data, codec=None):
+        return (self.encode_member(item, codec) for item in data)
 
-    def make_batches_to_send(self, data, batch_size):
+    def make_batches_to_send(self, data, batch_size, codec=None):
         batch = []
-        for i, item in enumerate(self._make_batch_data_iterator(data)):
+        data_iter = self._make_batch_data_iterator(data, codec)
+        for i, item in enumerate(data_iter):
             batch.append(item)
             if (i + 1) % batch_size == 0:
                 yield self.info.to_ptype(batch)
@@ -964,7 +1186,282 @@ class _SequenceBatchMixin(_BatchMixin):
         return Accumulator(list, self.accumulate_flattened_results)
 
 
-class _RedisZset(_SequenceBatchMixin, _RedisType):
+# Lua scripts for atomic list/zset operations. Each one modifies KEYS[1]
+# in one round trip, so concurrent clients can't interleave their own
+# reads and writes with it. They all take the same ARGV: [the start
+# index (or '' for the end of the object), the encoded None value (for
+# padding lists), then each encoded data value]. See
+# _AtomicSequenceMixin for how they're used.
+_LUA_HELPERS = '''
+local function start_pos(index, len)
+  if index == '' then
+    return len
+  end
+  local pos = tonumber(index)
+  if pos < 0 then
+    return math.max(len + pos, 0)
+  end
+  return pos
+end
+local function zset_len(key)
+  local last = redis.call('ZRANGE', key, -1, -1, 'WITHSCORES')
+  if last[2] then
+    return tonumber(last[2]) + 1
+  end
+  return 0
+end
+local function call_chunked(cmd, key, items)
+  for i = 1, #items, 1000 do
+    redis.call(cmd, key, unpack(items, i, math.min(i + 999, #items)))
+  end
+end
+'''
+
+# LIST_UPDATE overwrites list members starting at the index position,
+# padding with None if the index is past the end and appending members
+# that run past the end. Returns the new list length.
+LIST_UPDATE = REDIS_CONNECTION.register_script(_LUA_HELPERS + '''
+local len = redis.call('LLEN', KEYS[1])
+local pos = start_pos(ARGV[1], len)
+local tail = {}
+for i = len, pos - 1 do
+  tail[#tail + 1] = ARGV[2]
+end
+for i = 3, #ARGV do
+  if pos < len then
+    redis.call('LSET', KEYS[1], pos, ARGV[i])
+  else
+    tail[#tail + 1] = ARGV[i]
+  end
+  pos = pos + 1
+end
+call_chunked('RPUSH', KEYS[1], tail)
+return math.max(len, pos)
+''')
+
+# LIST_INSERT inserts members before the index position, like
+# list.insert, shifting later members back. Returns the new length.
+LIST_INSERT = REDIS_CONNECTION.register_script(_LUA_HELPERS + '''
+local len = redis.call('LLEN', KEYS[1])
+local pos = math.min(start_pos(ARGV[1], len), len)
+local tail = {}
+if pos < len then
+  tail = redis.call('LRANGE', KEYS[1], pos, -1)
+  if pos == 0 then
+    redis.call('DEL', KEYS[1])
+  else
+    redis.call('LTRIM', KEYS[1], 0, pos - 1)
+  end
+end
+local new = {}
+for i = 3, #ARGV do
+  new[#new + 1] = ARGV[i]
+end
+call_chunked('RPUSH', KEYS[1], new)
+call_chunked('RPUSH', KEYS[1], tail)
+return len + #ARGV - 2
+''')
+
+# LIST_REMOVE removes every occurrence of each member. Returns the
+# number of list members removed.
+LIST_REMOVE = REDIS_CONNECTION.register_script('''
+local removed = 0
+for i = 3, #ARGV do
+  removed = removed + redis.call('LREM', KEYS[1], 0, ARGV[i])
+end
+return removed
+''')
+
+# LIST_APPEND appends each member that isn't already in the list (or
+# earlier in ARGV). Returns the number of members appended.
+LIST_APPEND = REDIS_CONNECTION.register_script(_LUA_HELPERS + '''
+local seen = {}
+for _, member in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+  seen[member] = true
+end
+local new = {}
+for i = 3, #ARGV do
+  if not seen[ARGV[i]] then
+    seen[ARGV[i]] = true
+    new[#new + 1] = ARGV[i]
+  end
+end
+call_chunked('RPUSH', KEYS[1], new)
+return #new
+''')
+
+# ZSET_UPDATE replaces whatever members have scores in the range the
+# new members will occupy, starting at the index position, the same
+# way _RedisZset.update does. Returns the new zset length (the last
+# score + 1).
+ZSET_UPDATE = REDIS_CONNECTION.register_script(_LUA_HELPERS + '''
+local len = zset_len(KEYS[1])
+local pos = start_pos(ARGV[1], len)
+local n = #ARGV - 2
+if n == 0 then
+  return len
+end
+if pos < len then
+  redis.call('ZREMRANGEBYSCORE', KEYS[1], pos, pos + n - 1)
+end
+local new = {}
+for i = 3, #ARGV do
+  new[#new + 1] = pos + i - 3
+  new[#new + 1] = ARGV[i]
+end
+call_chunked('ZADD', KEYS[1], new)
+return math.max(len, pos + n)
+''')
+
+# ZSET_INSERT inserts members before the index position, shifting the
+# scores of later members up to make room. Returns the new length.
+ZSET_INSERT = REDIS_CONNECTION.register_script(_LUA_HELPERS + '''
+local len = zset_len(KEYS[1])
+local pos = math.min(start_pos(ARGV[1], len), len)
+local n = #ARGV - 2
+if n == 0 then
+  return len
+end
+local members = {}
+if pos < len then
+  local tail = redis.call('ZRANGEBYSCORE', KEYS[1], pos, '+inf',
+                          'WITHSCORES')
+  for i = 1, #tail, 2 do
+    members[#members + 1] = tonumber(tail[i + 1]) + n
+    members[#members + 1] = tail[i]
+  end
+end
+for i = 3, #ARGV do
+  members[#members + 1] = pos + i - 3
+  members[#members + 1] = ARGV[i]
+end
+call_chunked('ZADD', KEYS[1], members)
+return zset_len(KEYS[1])
+''')
+
+# ZSET_REMOVE removes each member and shifts the scores of later
+# members down to close the gaps, so positions stay in step with what
+# a list would do. Returns the number of members removed.
+ZSET_REMOVE = REDIS_CONNECTION.register_script(_LUA_HELPERS + '''
+local removed = {}
+for i = 3, #ARGV do
+  local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+  if score then
+    removed[#removed + 1] = tonumber(score)
+    redis.call('ZREM', KEYS[1], ARGV[i])
+  end
+end
+if #removed == 0 then
+  return 0
+end
+table.sort(removed)
+local tail = redis.call('ZRANGEBYSCORE', KEYS[1], '(' .. removed[1],
+                        '+inf', 'WITHSCORES')
+local shifted, j = {}, 1
+for i = 1, #tail, 2 do
+  local score = tonumber(tail[i + 1])
+  while j <= #removed and removed[j] < score do
+    j = j + 1
+  end
+  shifted[#shifted + 1] = score - (j - 1)
+  shifted[#shifted + 1] = tail[i]
+end
+call_chunked('ZADD', KEYS[1], shifted)
+return #removed
+''')
+
+# ZSET_APPEND appends each member that isn't already in the zset (or
+# earlier in ARGV). Returns the number of members appended.
+ZSET_APPEND = REDIS_CONNECTION.register_script(_LUA_HELPERS + '''
+local len = zset_len(KEYS[1])
+local pos, new, seen = len, {}, {}
+for i = 3, #ARGV do
+  if not seen[ARGV[i]] and not redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+    seen[ARGV[i]] = true
+    new[#new + 1] = pos
+    new[#new + 1] = ARGV[i]
+    pos = pos + 1
+  end
+end
+call_chunked('ZADD', KEYS[1], new)
+return pos - len
+''')
+
+
+class _AtomicSequenceMixin(object):
+    """
+    Abstract base "mixin" class for listlike _RedisTypes that adds
+    atomic operations.
+
+    Each operation ('update', 'insert', 'remove', or 'append') runs as
+    one Lua script, so it takes one round trip and can't race with
+    other clients that are changing the same object. Contrast with
+    'update' via 'save', which reads the object length and then sends
+    a series of commands. Subclasses must map each operation to its
+    script in 'atomic_scripts'.
+
+    See RedisObject.update_values, insert_values, remove_values, and
+    append_values.
+    """
+    atomic_scripts = {}
+    counting_ops = ('remove', 'append')
+
+    def atomic(self, obj, op, data, index=None):
+        """
+        Queues up the script for the 'op' operation on obj.pipe.
+
+        The script result is the new object length for 'update' and
+        'insert', or the number of members removed or appended for
+        'remove' and 'append'. Returns the Pipeline.
+        """
+        if obj.bypass_encoding:
+            values = list(data)
+        else:
+            values = [self.encode_member(v, obj.codec) for v in data]
+        args = ['' if index is None else index,
+                self.encode_member(None, obj.codec)] + values
+        obj.pipe.pending_cache.get(obj.key, {}).pop('len', None)
+        return obj.pipe.add_script(self.atomic_scripts[op], [obj.key], args)
+
+    def combine_atomic_results(self, op, results):
+        """
+        Combines the script results from several batches into one.
+        """
+        if op in self.counting_ops:
+            return sum(results)
+        return results[-1] if results else None
+
+    def batch_atomic(self, obj, op, data, index, bsize, tsize):
+        """
+        Runs the 'op' operation for 'data' in batches of 'bsize'.
+
+        Each batch is one atomic script call; 'tsize' works the same
+        way as for 'batch_save'. A negative 'index' is converted using
+        the current object length first, so that each batch can start
+        where the last one left off.
+        """
+        if index is not None and index < 0:
+            index = LOOKUP_TYPES.get('index').normalize_index_lookup(
+                index, obj.len, None, 0, index
+            )
+        results = []
+        try:
+            for i, start in enumerate(range(0, len(data), bsize)):
+                offset = index if index is None else index + start
+                self.atomic(obj, op, data[start:start + bsize], offset)
+                if tsize and (i + 1) % tsize == 0:
+                    results.extend(obj.pipe.execute())
+            if tsize == 0:
+                return obj.pipe
+            if len(obj.pipe):
+                results.extend(obj.pipe.execute())
+        except Exception:
+            obj.pipe.reset()
+            raise
+        return self.combine_atomic_results(op, results)
+
+
+class _RedisZset(_AtomicSequenceMixin, _SequenceBatchMixin, _RedisType):
     """
     Class that implements features for Redis zsets (sorted sets).
     """
@@ -975,12 +1472,15 @@ class _RedisZset(_SequenceBatchMixin, _RedisType):
         other_valid_lookup_types=[LOOKUP_TYPES.get('value')],
         attributes=['indexable', 'unique', 'listlike', 'def-listlike']
     )
+    atomic_scripts = {'update': ZSET_UPDATE, 'insert': ZSET_INSERT,
+                      'remove': ZSET_REMOVE, 'append': ZSET_APPEND}
 
-    def encode(self, data, bypass_encoding=False):
+    def encode(self, data, bypass_encoding=False, codec=None):
         if bypass_encoding:
             return data
         # 'data' should be a list of (item, score) tuples
-        return ((self.encode_member(item), score) for item, score in data)
+        return ((self.encode_member(item, codec), score)
+                for item, score in data)
 
     def decode(self, raw):
         return [self.decode_member(v) for v in raw] if raw else None
@@ -994,7 +1494,7 @@ class _RedisZset(_SequenceBatchMixin, _RedisType):
         obj.pipe.add(
             'zadd', obj.key, args=[dict(self.encode(
                 ((v, offset + i) for i, v in enumerate(data)),
-                obj.bypass_encoding
+                obj.bypass_encoding, obj.codec
             ))], accumulator=accumulator
         )
         obj.len = new_zlen
@@ -1035,7 +1535,7 @@ class _RedisZset(_SequenceBatchMixin, _RedisType):
 
     def get_by_value(self, obj, lval, multi):
         if multi:
-            encoded_vals = [self.encode_member(v) for v in lval]
+            encoded_vals = [self.encode_member(v, obj.codec) for v in lval]
             return obj.pipe.add(
                 'zmscore', obj.key, args=[encoded_vals],
                 callback=lambda scores: [
@@ -1043,12 +1543,12 @@ class _RedisZset(_SequenceBatchMixin, _RedisType):
                 ] if scores else None
             )
         return obj.pipe.add(
-            'zscore', obj.key, args=[self.encode_member(lval)],
+            'zscore', obj.key, args=[self.encode_member(lval, obj.codec)],
             callback=lambda score: score if score is None else int(score)
         )
 
 
-class _RedisList(_SequenceBatchMixin, _RedisType):
+class _RedisList(_AtomicSequenceMixin, _SequenceBatchMixin, _RedisType):
     """
     Class that implements features for Redis lists.
     """
@@ -1059,11 +1559,13 @@ class _RedisList(_SequenceBatchMixin, _RedisType):
         other_valid_lookup_types=[LOOKUP_TYPES.get('value')],
         attributes=['indexable', 'not-unique', 'listlike']
     )
+    atomic_scripts = {'update': LIST_UPDATE, 'insert': LIST_INSERT,
+                      'remove': LIST_REMOVE, 'append': LIST_APPEND}
 
-    def encode(self, data, bypass_encoding=False):
+    def encode(self, data, bypass_encoding=False, codec=None):
         if bypass_encoding:
             return data
-        return (self.encode_member(item) for item in data)
+        return (self.encode_member(item, codec) for item in data)
 
     def decode(self, raw):
         return [self.decode_member(v) for v in raw] if raw else None
@@ -1073,14 +1575,16 @@ class _RedisList(_SequenceBatchMixin, _RedisType):
         return obj.conn.llen(obj.key)
 
     def _pad_list_data_with_none(self, obj, data, how_many):
-        none = self.encode_member(None) if obj.bypass_encoding else None
+        none = None
+        if obj.bypass_encoding:
+            none = self.encode_member(None, obj.codec)
         return [none] * how_many + list(data)
 
     def _set_from_offset(self, obj, data, accumulator, offset, new_llen):
         if data:
             obj.pipe.add(
                 'rpush', obj.key,
-                args=self.encode(data, obj.bypass_encoding),
+                args=self.encode(data, obj.bypass_encoding, obj.codec),
                 accumulator=accumulator
             )
         obj.len = new_llen
@@ -1106,7 +1610,8 @@ class _RedisList(_SequenceBatchMixin, _RedisType):
             for i, value in enumerate(data[:prev_llen - offset]):
                 args = [
                     i + offset,
-                    value if obj.bypass_encoding else self.encode_member(value)
+                    value if obj.bypass_encoding
+                    else self.encode_member(value, obj.codec)
                 ]
                 obj.pipe.add(
                     'lset', obj.key, args=args, accumulator=acc
@@ -1130,7 +1635,7 @@ class _RedisList(_SequenceBatchMixin, _RedisType):
         kwargs = {'count': 0}
         if multi:
             acc = Accumulator.from_ptype(list)
-            for value in self.encode(lval):
+            for value in self.encode(lval, codec=obj.codec):
                 obj.pipe.add(
                     'lpos', obj.key, args=[value], kwargs=kwargs,
                     callback=callback, accumulator=acc
@@ -1138,7 +1643,8 @@ class _RedisList(_SequenceBatchMixin, _RedisType):
             obj.pipe.mark_accumulator_pop()
             return obj.pipe
         return obj.pipe.add(
-            'lpos', obj.key, args=[self.encode_member(lval)], kwargs=kwargs,
+            'lpos', obj.key, args=[self.encode_member(lval, obj.codec)],
+            kwargs=kwargs,
             callback=callback
         )
 
@@ -1189,7 +1695,7 @@ class _RedisString(_BatchMixin, _RedisType):
             'getrange', obj.key, args=lval, callback=lambda raw: raw or None
         )
 
-    def make_batches_to_send(self, data, batch_size):
+    def make_batches_to_send(self, data, batch_size, codec=None):
         total_size = len(data)
         index = 0
         while index < total_size:
@@ -1227,10 +1733,10 @@ class _RedisHash(_SequenceBatchMixin, _RedisType):
             return obj.conn.hkeys(obj.key)
         return super().get_all_lookup_value(obj, for_batch)
 
-    def encode(self, data, bypass_encoding=False):
+    def encode(self, data, bypass_encoding=False, codec=None):
         if bypass_encoding:
             return data
-        return ((k, self.encode_member(v)) for k, v in iteritems(data))
+        return ((k, self.encode_member(v, codec)) for k, v in iteritems(data))
 
     def decode(self, raw):
         return {
@@ -1244,7 +1750,8 @@ class _RedisHash(_SequenceBatchMixin, _RedisType):
     def set(self, obj, data, accumulator):
         return obj.pipe.add(
             'hset', obj.key,
-            kwargs={'mapping': dict(self.encode(data, obj.bypass_encoding))},
+            kwargs={'mapping': dict(self.encode(data, obj.bypass_encoding,
+                                                obj.codec))},
             accumulator=accumulator
         )
 
@@ -1263,8 +1770,8 @@ class _RedisHash(_SequenceBatchMixin, _RedisType):
             'hget', obj.key, args=[lval], callback=self.decode_member
         )
 
-    def _make_batch_data_iterator(self, data):
-        return self.encode(data)
+    def _make_batch_data_iterator(self, data, codec=None):
+        return self.encode(data, codec=codec)
 
     @staticmethod
     def accumulate_dict_results(collected, new_vals):
@@ -1296,10 +1803,10 @@ class _RedisSet(_SequenceBatchMixin, _RedisType):
         'set', [set], default_lookup_type=LOOKUP_TYPES.get('value_exists')
     )
 
-    def encode(self, data, bypass_encoding=False):
+    def encode(self, data, bypass_encoding=False, codec=None):
         if bypass_encoding:
             return data
-        return (self.encode_member(item) for item in data)
+        return (self.encode_member(item, codec) for item in data)
 
     def decode(self, raw):
         return set([self.decode_member(v) for v in raw]) if raw else None
@@ -1310,7 +1817,8 @@ class _RedisSet(_SequenceBatchMixin, _RedisType):
 
     def set(self, obj, data, accumulator):
         return obj.pipe.add(
-            'sadd', obj.key, args=self.encode(data, obj.bypass_encoding),
+            'sadd', obj.key,
+            args=self.encode(data, obj.bypass_encoding, obj.codec),
             accumulator=accumulator
         )
 
@@ -1322,13 +1830,13 @@ class _RedisSet(_SequenceBatchMixin, _RedisType):
 
     def get_by_value_exists(self, obj, lval, multi):
         if multi:
-            encoded_vals = list(self.encode(lval))
+            encoded_vals = list(self.encode(lval, codec=obj.codec))
             return obj.pipe.add(
                 'smismember', obj.key, args=[encoded_vals],
                 callback=lambda raw: [bool(v) for v in raw]
             )
         return obj.pipe.add(
-            'sismember', obj.key, args=[self.encode_member(lval)],
+            'sismember', obj.key, args=[self.encode_member(lval, obj.codec)],
             callback=bool
         )
 
@@ -1364,13 +1872,13 @@ class _EncodedObj(_RedisType):
         end_of_prefix = len(STR_OBJ_PREFIX) - 1
         return obj.conn.getrange(obj.key, 0, end_of_prefix) == STR_OBJ_PREFIX
 
-    def encode(self, data, bypass_encoding=False):
+    def encode(self, data, bypass_encoding=False, codec=None):
         if bypass_encoding:
             return data
-        return ''.join([STR_OBJ_PREFIX, self.encode_member(data)])
+        return ''.join([STR_OBJ_PREFIX, self.encode_member(data, codec)])
 
     def decode(self, raw):
-        return self.decode_member(raw.lstrip(STR_OBJ_PREFIX))
+        return self.decode_member(raw[len(STR_OBJ_PREFIX):])
 
     @staticmethod
     def get_obj_length(obj):
@@ -1378,7 +1886,8 @@ class _EncodedObj(_RedisType):
 
     def set(self, obj, data, accumulator):
         return obj.pipe.add(
-            'set', obj.key, args=[self.encode(data, obj.bypass_encoding)],
+            'set', obj.key,
+            args=[self.encode(data, obj.bypass_encoding, obj.codec)],
             accumulator=accumulator
         )
 
@@ -1508,6 +2017,37 @@ class _RedisTypeCollection(object):
 REDIS_TYPES = _RedisTypeCollection()
 
 
+# GET_OBJ_INFO is a Lua script that returns what RedisObject.aget needs
+# to know about KEYS[1] before it can get data from it, in one round
+# trip: [the Redis type, the object length (as 'get_obj_length' would
+# calculate it for the corresponding rtype), 1 if the object is a
+# string that starts with ARGV[1] (STR_OBJ_PREFIX) or 0 if not].
+GET_OBJ_INFO = '''
+local rtype = redis.call('TYPE', KEYS[1])['ok']
+local length = 0
+local is_encoded = 0
+if rtype == 'string' then
+    length = redis.call('STRLEN', KEYS[1])
+    local prefix = redis.call('GETRANGE', KEYS[1], 0, #ARGV[1] - 1)
+    if prefix == ARGV[1] then
+        is_encoded = 1
+    end
+elseif rtype == 'list' then
+    length = redis.call('LLEN', KEYS[1])
+elseif rtype == 'hash' then
+    length = redis.call('HLEN', KEYS[1])
+elseif rtype == 'set' then
+    length = redis.call('SCARD', KEYS[1])
+elseif rtype == 'zset' then
+    local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+    if last[2] then
+        length = tonumber(last[2]) + 1
+    end
+end
+return {rtype, length, is_encoded}
+'''
+
+
 class RedisObject(object):
     """
     Models a Redis key / object to simplify Redis interaction.
@@ -1553,7 +2093,7 @@ class RedisObject(object):
     conn = REDIS_CONNECTION
 
     def __init__(self, entity, id_, pipe=None, defer=False, batch_size=None,
-                 transaction_size=None):
+                 transaction_size=None, codec=None):
         """
         Initializes a RedisObject instance.
 
@@ -1615,6 +2155,13 @@ class RedisObject(object):
           transaction, each of which blocks further Redis execution
           until it completes. Having more transactions is perhaps safer
           (and clears memory more frequently) but is also slower.
+
+        Optionally, provide a 'codec' (e.g. a ZlibCodec or
+        IntArrayCodec instance) to control how data members are
+        encoded when they're saved. If not provided, the codec set for
+        this 'entity' via 'set_entity_codec' is used, or JSON if there
+        isn't one. Data is always decoded using the codec that encoded
+        it, so changing codecs doesn't affect reading existing data.
         """
         self.entity = entity
         self.id = id_
@@ -1625,6 +2172,7 @@ class RedisObject(object):
         self.transaction_size = transaction_size
         self._rtype = None
         self.bypass_encoding = False
+        self.codec = codec or ENTITY_CODECS.get(entity)
 
     def __len__(self):
         return self.len
@@ -1762,6 +2310,12 @@ class RedisObject(object):
         update one in place, you must account for how index values are
         mapped to scores.
 
+        Updating a list or zset this way reads the object's length and
+        then sends several commands, so concurrent updates to the same
+        key can interfere with each other. The 'update_values',
+        'insert_values', 'remove_values', and 'append_values' methods
+        each run as one atomic Lua script instead.
+
         Other types, labeled 'encoded_obj', cannot be updated -- data
         is reset whether 'update' is True or False.
 
@@ -1824,6 +2378,110 @@ class RedisObject(object):
             return rval[0]
         return rval
 
+    def update_values(self, index, *values, force_unique=None):
+        """
+        Atomically sets list/zset values starting at the given index.
+
+        This does the same thing as 'set_value' -- my_list[index:] =
+        values, where 'index' None means the end of the list -- except
+        that it runs as one Lua script in Redis. It takes one round
+        trip, it doesn't need to know the object's length beforehand,
+        and no other client can change the object partway through.
+        Lists are padded with None if 'index' is past the end, and
+        zsets use the same index-to-score mapping that 'set' describes.
+
+        If the key doesn't exist, it's created as a zset or list, per
+        'force_unique' (see 'set'). Raises a TypeError if the key
+        exists and isn't a list or zset.
+
+        Returns the new length of the object (or self.pipe, if
+        self.defer is True). Batch mode is supported; see
+        '_run_atomic'.
+        """
+        return self._run_atomic('update', values, index, force_unique)
+
+    def insert_values(self, index, *values, force_unique=None):
+        """
+        Atomically inserts list/zset values before the given index.
+
+        This is the equivalent of my_list[index:index] = values, as one
+        Lua script. For a zset, the members after 'index' have their
+        scores shifted to make room. An 'index' of None or past the end
+        appends the values. Otherwise it works like 'update_values'.
+        """
+        return self._run_atomic('insert', values, index, force_unique)
+
+    def remove_values(self, *values):
+        """
+        Atomically removes values from a list/zset.
+
+        Every occurrence of each value is removed, as one Lua script.
+        For a zset, the scores of later members are shifted down so
+        that there are no gaps where the removed values were, the same
+        as with a list. Values that aren't in the object are ignored.
+
+        Returns the number of members removed (or self.pipe, if
+        self.defer is True). Batch mode is supported.
+        """
+        return self._run_atomic('remove', values, None, None)
+
+    def append_values(self, *values, force_unique=None):
+        """
+        Atomically appends values that aren't already in a list/zset.
+
+        This skips any value that's already in the object or that
+        appears earlier in 'values' and appends the rest to the end,
+        as one Lua script. (Appending to a zset with 'set' instead
+        moves an existing value to the end.) Otherwise it works like
+        'update_values'.
+
+        Returns the number of members appended (or self.pipe, if
+        self.defer is True).
+        """
+        return self._run_atomic('append', values, None, force_unique)
+
+    def _run_atomic(self, op, values, index, force_unique):
+        """
+        Runs one of the atomic list/zset operations with 'values'.
+
+        If self.defer is False, it executes the operation immediately
+        and returns the script result. If self.defer is True, it queues
+        the script on self.pipe and returns that.
+
+        When batch mode is active, 'values' are divided into batches,
+        and each batch is its own atomic script call. The self.defer
+        and self.transaction_size settings are honored the same way as
+        for 'set', and the results from all batches are combined.
+        """
+        values = list(values)
+        rtype = self.rtype
+        if rtype.info.label == 'none':
+            if op == 'remove':
+                values = []
+            else:
+                rtype = REDIS_TYPES.get_from_data(values, force_unique)
+        elif not isinstance(rtype, _AtomicSequenceMixin):
+            raise TypeError(
+                f"cannot {op} values for key '{self.key}', which is a Redis "
+                f"{rtype.info.label}; it must be a list or zset"
+            )
+        if not values:
+            self.pipe.noop()
+        else:
+            self.rtype = rtype
+            if self.batch_size:
+                tsize = 0 if self.defer else self.transaction_size
+                return rtype.batch_atomic(
+                    self, op, values, index, self.batch_size, tsize
+                )
+            rtype.atomic(self, op, values, index)
+        if self.defer:
+            return self.pipe
+        result = self.pipe.execute()[-1]
+        if result is None and op in _AtomicSequenceMixin.counting_ops:
+            return 0
+        return result
+
     def get(self, lookup=None, lookup_type=None):
         """
         Fetches and returns the data from Redis using the current key.
@@ -1882,6 +2540,36 @@ class RedisObject(object):
             )
         return self.rtype.get(self, lookup_inst, not self.defer)
 
+    async def aget(self, lookup=None, lookup_type=None, conn=None):
+        """
+        Fetches and returns data from Redis, for asyncio code.
+
+        This is the coroutine version of 'get': it takes the same
+        lookup arguments and returns the same value, but it talks to
+        Redis over an asyncio connection ('conn', or the one from
+        'get_async_connection'), so it doesn't block the event loop.
+        It makes two round trips: one to get the object's type and
+        length (see GET_OBJ_INFO), which 'get' may need in order to
+        configure the lookup, and one to get the data. It ignores
+        'defer', and it does not support batch mode.
+        """
+        conn = conn or get_async_connection()
+        script = conn.register_script(GET_OBJ_INFO)
+        rt_label, length, is_encoded = await script(
+            keys=[self.key], args=[STR_OBJ_PREFIX]
+        )
+        if rt_label == 'string' and is_encoded:
+            rt_label = 'encoded_obj'
+        obj = type(self)(self.entity, self.id, pipe=Pipeline(conn),
+                         defer=True)
+        obj.bypass_encoding = self.bypass_encoding
+        obj.codec = self.codec
+        obj.rtype = REDIS_TYPES.get(rt_label)
+        obj.len = length
+        lookup_inst = obj.rtype.configure_lookup(obj, lookup, lookup_type)
+        obj.rtype.get(obj, lookup_inst)
+        return (await obj.pipe.aexecute())[-1]
+
     def get_field(self, *fields):
         """
         Fetches the value(s) for the given hash field(s).
@@ -1906,6 +2594,50 @@ class RedisObject(object):
             return self.get(values[0], 'value')
         return self.get(values, 'values')
 
+    @classmethod
+    def get_indexes(cls, lookups, pipe=None):
+        """
+        Fetches list/zset index positions for values in many objects.
+
+        'lookups' is a list of (RedisObject, value) pairs, such as for
+        finding several values that are each in a different list. It
+        returns a list containing the index position for each pair, in
+        the same order; a position is None if the value isn't in that
+        object or if the object isn't a list or zset.
+
+        This is the multi-object equivalent of 'get_index'. Lookups for
+        the same object are combined, and all of them are queued on one
+        pipeline ('pipe', or a new Pipeline) and executed together, so
+        they take one round trip to Redis regardless of how many
+        objects there are. (If the rtype for any of the objects isn't
+        already known, those are fetched first, with one more round
+        trip.) Batch mode and 'defer' are ignored.
+        """
+        pipe = pipe or Pipeline(cls.conn)
+        by_key = {}
+        for obj, value in lookups:
+            by_key.setdefault(obj.key, (obj, []))[1].append(value)
+        unknown = [obj for obj, _ in by_key.values() if obj._rtype is None]
+        for obj in unknown:
+            pipe.add('type', obj.key)
+        if unknown:
+            for obj, rt_label in zip(unknown, pipe.execute()):
+                obj.rtype = REDIS_TYPES.get(rt_label)
+        value_lookup = LOOKUP_TYPES.get('value')
+        queued = []
+        for obj, values in by_key.values():
+            if value_lookup in obj.rtype.info.valid_lookup_types:
+                proxy = cls(obj.entity, obj.id, pipe=pipe, defer=True)
+                proxy.rtype = obj.rtype
+                proxy.bypass_encoding = obj.bypass_encoding
+                proxy.codec = obj.codec
+                proxy.get(values, 'values')
+                queued.append(obj.key)
+        positions = {key: iter(result or [])
+                     for key, result in zip(queued, pipe.execute())}
+        return [next(positions.get(obj.key, iter([])), None)
+                for obj, _ in lookups]
+
     def get_value(self, start, end=None):
         """
         Fetches the values for a range of list/zset index positions.
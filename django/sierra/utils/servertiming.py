@@ -0,0 +1,300 @@
+"""
+Contains tools for timing the phases of API requests.
+
+`SimpleView` starts a `RequestTimings` collector at the beginning of
+each request (see `start_request`). While it's active, code anywhere in
+the request cycle can add to it using the module-level `record` and
+`timing` functions without needing a reference to the view or the
+request--e.g., `utils.solr` records the wall time of each Solr round
+trip plus Solr's own `QTime`, and serializers record lookup-table
+refreshes. When no collector is active (management commands, exports,
+tests that call serializers directly), `record` and `timing` do
+nothing, so instrumented code costs next to nothing outside of a
+request. The active collector is kept in a context variable, so each
+thread (under WSGI) or asyncio task (under ASGI) has its own, and code
+that `AsyncSimpleView` runs in a thread via `sync_to_async` records to
+the collector of the request that's waiting on it.
+
+At the end of a request, the collected timings are sent to the client
+in a `Server-Timing` header and added to `LATENCY_HISTOGRAMS`, which
+aggregates per-view latency histograms across every web server process
+via Redis.
+"""
+
+from __future__ import absolute_import
+
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+from utils.redisobjs import REDIS_CONNECTION
+
+# set up logger, for debugging
+logger = logging.getLogger('sierra.custom')
+
+_current = contextvars.ContextVar('server_timing', default=None)
+
+
+class RequestTimings(object):
+    """
+    Collects named durations (in seconds) for one request.
+
+    Durations recorded under the same name more than once (e.g., a
+    request that makes several Solr round trips) are summed. Metrics
+    may overlap--e.g., the `filter` phase includes the Solr query that
+    validates the filtered queryset--so they aren't meant to add up to
+    the total.
+    """
+    descriptions = {
+        'filter': 'Filter parsing',
+        'solr': 'Solr round trips',
+        'solr-qtime': 'Solr QTime',
+        'lookups': 'Lookup refresh',
+        'serialize': 'Serialization',
+        'render': 'Rendering',
+        'total': 'Total',
+    }
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.start_time = clock()
+        self.metrics = OrderedDict()
+
+    def add(self, name, secs):
+        self.metrics[name] = self.metrics.get(name, 0) + secs
+
+    @contextmanager
+    def timing(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, self.clock() - start)
+
+    def elapsed(self):
+        return self.clock() - self.start_time
+
+    def get_header_value(self, total=None):
+        """
+        Format the collected timings as a `Server-Timing` header value.
+        If `total` (in seconds) is provided, it's included as a `total`
+        metric.
+        """
+        metrics = list(self.metrics.items())
+        if total is not None:
+            metrics.append(('total', total))
+        parts = []
+        for name, secs in metrics:
+            desc = self.descriptions.get(name)
+            desc = ';desc="{}"'.format(desc) if desc else ''
+            parts.append('{}{};dur={:.1f}'.format(name, desc, secs * 1000))
+        return ', '.join(parts)
+
+
+def start_request(clock=time.perf_counter):
+    """
+    Start collecting timings for a new request in the current context
+    (thread or asyncio task), and return the new RequestTimings object.
+    """
+    timings = RequestTimings(clock)
+    _current.set(timings)
+    return timings
+
+
+def end_request():
+    """
+    Stop collecting timings in the current context.
+    """
+    _current.set(None)
+
+
+def get_current():
+    """
+    Get the active RequestTimings object for the current context, or
+    None if there isn't one.
+    """
+    return _current.get()
+
+
+def record(name, secs):
+    """
+    Add `secs` to the named metric for the active request, if any.
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, secs)
+
+
+@contextmanager
+def timing(name):
+    """
+    Context manager that times the enclosed block and records it as
+    the named metric for the active request, if any.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+    else:
+        with timings.timing(name):
+            yield
+
+
+class LatencyHistograms(object):
+    """
+    Per-view latency histograms, aggregated across processes in Redis.
+
+    Call `observe` with a view name and a dict of metrics (name =>
+    seconds) at the end of each request. Observations are tallied in
+    memory and written to Redis in one pipeline at most once every
+    `flush_interval` seconds, so the cost per request is a few dict
+    updates. Each view gets a Redis hash that stores, for each metric,
+    a count of observations per bucket (where `buckets` are upper
+    bounds in milliseconds), the total count, and the sum.
+
+    `get_histograms` reads the histograms for all views back out of
+    Redis, and `reset` deletes them.
+    """
+    redis_key = 'server_timing'
+    buckets = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self, flush_interval=10, conn=REDIS_CONNECTION,
+                 clock=time.monotonic):
+        self.flush_interval = flush_interval
+        self.conn = conn
+        self.clock = clock
+        self._pending = {}
+        self._last_flush = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def bucket_labels(self):
+        return [str(b) for b in self.buckets] + ['+Inf']
+
+    def get_view_key(self, view_name):
+        return '{}:{}'.format(self.redis_key, view_name)
+
+    def observe(self, view_name, metrics):
+        """
+        Add one request's metrics (a dict of name => seconds) to the
+        histograms for `view_name`.
+        """
+        with self._lock:
+            view = self._pending.setdefault(view_name, {})
+            for name, secs in metrics.items():
+                msecs = secs * 1000
+                hist = view.get(name)
+                if hist is None:
+                    hist = view[name] = [0] * (len(self.buckets) + 2)
+                hist[bisect.bisect_left(self.buckets, msecs)] += 1
+                hist[-1] += msecs
+        if self.clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write pending observations to Redis. If Redis is unavailable,
+        this logs a warning and keeps the observations for the next
+        flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = self.clock()
+        if not pending:
+            return
+        labels = self.bucket_labels
+        try:
+            pipe = self.conn.pipeline(transaction=False)
+            pipe.sadd(self.redis_key, *pending.keys())
+            for view_name, view in pending.items():
+                key = self.get_view_key(view_name)
+                for name, hist in view.items():
+                    for label, count in zip(labels, hist):
+                        if count:
+                            pipe.hincrby(key, '{}|{}'.format(name, label),
+                                         count)
+                    pipe.hincrby(key, '{}|count'.format(name), sum(hist[:-1]))
+                    pipe.hincrbyfloat(key, '{}|sum'.format(name), hist[-1])
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('Could not save latency histograms: {}'.format(e))
+            with self._lock:
+                for view_name, view in pending.items():
+                    merged = self._pending.setdefault(view_name, {})
+                    for name, hist in view.items():
+                        if name in merged:
+                            hist = [a + b for a, b in zip(hist, merged[name])]
+                        merged[name] = hist
+
+    def estimate_quantile(self, buckets, count, quantile):
+        """
+        Estimate the given quantile from a histogram's bucket counts
+        (a list of (label, count) tuples), as the upper bound of the
+        bucket containing it. Returns None if it falls in the last,
+        unbounded bucket or there are no observations.
+        """
+        target, running = count * quantile, 0
+        for (label, num), bound in zip(buckets, self.buckets):
+            running += num
+            if running >= target and count:
+                return bound
+        return None
+
+    def get_histograms(self):
+        """
+        Get the histograms for all views, as a dict: view name =>
+        metric name => dict with `count`, `sumMs`, `meanMs`, the
+        estimated quantiles (e.g., `p95Ms`), and `buckets` (bucket
+        upper bound => number of observations in that bucket). Pending
+        observations in this process are flushed first.
+        """
+        self.flush()
+        labels = self.bucket_labels
+        histograms = OrderedDict()
+        view_names = sorted(self.conn.smembers(self.redis_key))
+        pipe = self.conn.pipeline(transaction=False)
+        for view_name in view_names:
+            pipe.hgetall(self.get_view_key(view_name))
+        for view_name, raw in zip(view_names, pipe.execute()):
+            metrics = OrderedDict()
+            names = sorted(set(f.split('|')[0] for f in raw.keys()))
+            for name in names:
+                count = int(raw.get('{}|count'.format(name), 0))
+                total = float(raw.get('{}|sum'.format(name), 0))
+                buckets = [(label, int(raw.get('{}|{}'.format(name, label),
+                                               0)))
+                           for label in labels]
+                hist = OrderedDict([
+                    ('count', count),
+                    ('sumMs', round(total, 3)),
+                    ('meanMs', round(total / count, 3) if count else None),
+                ])
+                for q in self.quantiles:
+                    key = 'p{}Ms'.format(int(q * 100))
+                    hist[key] = self.estimate_quantile(buckets, count, q)
+                hist['buckets'] = OrderedDict(buckets)
+                metrics[name] = hist
+            histograms[view_name] = metrics
+        return histograms
+
+    def reset(self):
+        """
+        Delete all histograms, in Redis and pending in this process.
+        """
+        with self._lock:
+            self._pending = {}
+        view_names = self.conn.smembers(self.redis_key)
+        keys = [self.get_view_key(v) for v in view_names]
+        self.conn.delete(self.redis_key, *keys)
+
+
+LATENCY_HISTOGRAMS = LatencyHistograms(
+    flush_interval=settings.SERVER_TIMING_FLUSH_INTERVAL
+)
@@ -0,0 +1,234 @@
+"""
+Contains tools for coalescing identical concurrent operations.
+
+When many callers ask for the same thing at the same time--e.g., many
+API requests running the same Solr query at once--it's wasteful for
+each of them to do the work. With "single-flight" coalescing, the first
+caller for a given key (the leader) does the work, and callers that
+arrive while it's in flight (followers) wait for and share its result.
+Nothing is cached: once the leader finishes, the next caller for that
+key starts a new flight.
+
+`SingleFlight` coalesces calls between threads in one process, and
+`AsyncSingleFlight` coalesces calls between asyncio tasks on one event
+loop. `RedisSingleFlight` coalesces calls across processes, using a short
+Redis lock to elect a leader and a short-lived Redis key to hand the
+result off to followers.
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+import redis
+
+from utils.redisobjs import REDIS_CONNECTION
+
+# set up logger, for debugging
+logger = logging.getLogger('sierra.custom')
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls between threads in one
+    process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        Call `func` and return a tuple: (result, shared). If a call for
+        the same `key` is already in flight in another thread, this
+        waits for it and returns its result (or raises its exception)
+        instead of calling `func`; in that case `shared` is True, and
+        the result is the same object the other thread got.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight(object):
+    """
+    Coalesces identical concurrent calls between asyncio tasks running
+    on the same event loop.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func):
+        """
+        Await `func()` (`func` should return an awaitable) and return a
+        tuple: (result, shared), like `SingleFlight.do`. If a call for
+        the same `key` is already in flight in another task, this waits
+        for it instead. If the task making the first call is cancelled,
+        tasks waiting on it make the call themselves.
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        future = self._calls.get(call_key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                return await func(), False
+        future = self._calls[call_key] = loop.create_future()
+        try:
+            result = await func()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, so asyncio doesn't log
+            # it if no other task was waiting for it.
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[call_key]
+        return result, False
+
+
+# RELEASE is a Lua script that a RedisSingleFlight leader runs when it
+# finishes. If the lock at KEYS[1] still belongs to the leader (i.e.
+# holds its token, ARGV[1]), it releases the lock. If ARGV[2] is not
+# empty, it is the serialized result, which is stored at KEYS[2] for
+# ARGV[3] milliseconds so that followers can pick it up.
+RELEASE = REDIS_CONNECTION.register_script('''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+end
+return 1
+''')
+
+
+class RedisSingleFlight(object):
+    """
+    Coalesces identical concurrent calls across processes via Redis.
+
+    The first caller for a key takes a lock that expires after
+    `timeout` seconds and calls the function. Callers that find the
+    lock taken poll Redis (starting every `poll_interval` seconds and
+    backing off) for the leader's serialized result, which the leader
+    stores under a key unique to its flight. Followers fall back to
+    calling the function themselves if the leader fails, if the result
+    is too big to hand off (over `max_bytes`), or if `timeout` runs
+    out. If Redis is unavailable, every caller calls the function.
+    """
+    redis_key = 'single_flight'
+
+    def __init__(self, timeout=2, max_bytes=1048576, poll_interval=0.005,
+                 conn=REDIS_CONNECTION, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.conn = conn
+        self.clock = clock
+        self.sleep = sleep
+
+    def get_lock_key(self, key):
+        return '{}:lock:{}'.format(self.redis_key, key)
+
+    def get_result_key(self, key, token):
+        return '{}:result:{}:{}'.format(self.redis_key, key, token)
+
+    def do(self, key, func, dumps, loads):
+        """
+        Call `func` and return a tuple: (result, shared), like
+        `SingleFlight.do`, except that `key` should be a string
+        suitable for use in a Redis key, and the result is shared
+        between processes. `dumps` should serialize a result to a
+        string and `loads` should deserialize one; followers get the
+        deserialized copy.
+        """
+        lock_key = self.get_lock_key(key)
+        token = uuid.uuid4().hex
+        timeout_ms = int(self.timeout * 1000)
+        try:
+            acquired = self.conn.set(lock_key, token, nx=True, px=timeout_ms)
+            leader_token = token if acquired else self.conn.get(lock_key)
+        except redis.RedisError as e:
+            logger.warning('Could not coalesce via Redis: {}'.format(e))
+            return func(), False
+        if leader_token is None:
+            # The leader finished between our SET and GET.
+            return func(), False
+        if acquired:
+            return self._lead(key, token, func, dumps, timeout_ms), False
+        return self._follow(key, leader_token, func, loads)
+
+    def _lead(self, key, token, func, dumps, timeout_ms):
+        data = ''
+        try:
+            result = func()
+            data = dumps(result)
+            if len(data) > self.max_bytes:
+                data = ''
+            return result
+        finally:
+            try:
+                RELEASE(keys=[self.get_lock_key(key),
+                              self.get_result_key(key, token)],
+                        args=[token, data, timeout_ms])
+            except redis.RedisError as e:
+                logger.warning('Could not release single-flight lock: '
+                               '{}'.format(e))
+
+    def _follow(self, key, token, func, loads):
+        lock_key = self.get_lock_key(key)
+        result_key = self.get_result_key(key, token)
+        deadline = self.clock() + self.timeout
+        interval = self.poll_interval
+        while True:
+            try:
+                data, current_token = self.conn.mget(result_key, lock_key)
+            except redis.RedisError as e:
+                logger.warning('Could not coalesce via Redis: {}'.format(e))
+                break
+            if data is not None:
+                return loads(data), True
+            if current_token != token or self.clock() >= deadline:
+                break
+            self.sleep(interval)
+            interval = min(interval * 2, 0.05)
+        return func(), False
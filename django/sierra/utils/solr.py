@@ -6,8 +6,10 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import copy
+import hashlib
 import logging
 import re
+import time
 from datetime import datetime
 
 import pysolr
@@ -16,19 +18,26 @@ from django.core.exceptions import ImproperlyConfigured
 from six import iteritems, text_type
 import ujson
 
+from utils import servertiming
+from utils.singleflight import RedisSingleFlight, SingleFlight
+
 
 # set up logger, for debugging
 logger = logging.getLogger('sierra.custom')
 
 
-def connect(url=None, using='default', **kwargs):
+def connect(url=None, using='default', solr_class=pysolr.Solr, **kwargs):
+    """
+    Get a `solr_class` (pysolr.Solr, by default) object for the given
+    `url`, or for the Haystack connection named by `using`.
+    """
     if not url:
         try:
             url = settings.HAYSTACK_CONNECTIONS[using]['URL']
         except KeyError:
             raise ImproperlyConfigured('Haystack connection {} does not '
                                        'exist.'.format(using))
-    return pysolr.Solr(url, always_commit=True, **kwargs)
+    return solr_class(url, always_commit=True, **kwargs)
 
 
 def commit(leader_conn, using, specify_leader_url=False):
@@ -61,6 +70,139 @@ def commit(leader_conn, using, specify_leader_url=False):
                     raise ImproperlyConfigured(f"{err_msg} {resp['message']}")
 
 
+_UNIQUE_KEYS = {}
+
+
+def get_unique_key(conn):
+    """
+    Get the name of the uniqueKey field for the core at `conn`.
+
+    The value comes from the Solr Schema API and is cached for each
+    core URL, so Solr is only asked once per process. (E.g., cores
+    managed by Haystack use `haystack_id`, but others use `id`.)
+    """
+    if conn.url not in _UNIQUE_KEYS:
+        resp = ujson.loads(conn._send_request('GET', 'schema/uniquekey'))
+        _UNIQUE_KEYS[conn.url] = resp['uniqueKey']
+    return _UNIQUE_KEYS[conn.url]
+
+
+_INDEX_VERSIONS = {}
+
+
+def get_index_version(conn, max_age=0):
+    """
+    Get the current version of the index for the core at `conn`.
+
+    Returns a tuple: (indexversion, generation), from the Solr
+    replication handler. The `indexversion` is the timestamp (in
+    milliseconds) of the latest commit and the `generation` increments
+    with each commit, so the tuple changes whenever what a search
+    returns might change. Values are cached for each core URL for
+    `max_age` seconds, so busy processes don't have to ask Solr on
+    every request; pass 0 to always get a fresh value.
+    """
+    now = time.monotonic()
+    cached = _INDEX_VERSIONS.get(conn.url)
+    if cached is not None and now - cached[0] < max_age:
+        return cached[1]
+    req_path = 'replication?command=indexversion&wt=json'
+    resp = ujson.loads(conn._send_request('GET', req_path))
+    version = (resp['indexversion'], resp['generation'])
+    _INDEX_VERSIONS[conn.url] = (now, version)
+    return version
+
+
+REALTIME_GET_BATCH_SIZE = 100
+
+
+def realtime_get(conn, ids, **kwargs):
+    """
+    Get the documents with the given uniqueKey values (`ids`--see
+    `get_unique_key`) as they are right now, using the real-time get
+    handler (/get) for the core at `conn`.
+
+    Unlike a search, a real-time get reads from Solr's update log, so
+    it sees updates that haven't been committed yet, e.g., ones sent
+    with `commit=False` or a `commit_within` that hasn't passed. Use
+    it to read a `_version_` to check an update against (see
+    `bulk_update_fields`). Other kwargs, such as `fq` and `fl`, are
+    passed to Solr as for a search; documents that don't match an `fq`
+    are left out, as are IDs that don't exist. Returns a list of
+    Results, in the order of `ids`.
+    """
+    docs = []
+    for i in range(0, len(ids), REALTIME_GET_BATCH_SIZE):
+        # Solr splits the `ids` param on commas, so escape them.
+        chunk = [re.sub(r'([\\,])', r'\\\1', text_type(id_))
+                 for id_ in ids[i:i + REALTIME_GET_BATCH_SIZE]]
+        params = dict(kwargs, ids=','.join(chunk), wt='json')
+        path = 'get?{}'.format(pysolr.safe_urlencode(params, doseq=True))
+        resp = ujson.loads(conn._send_request('get', path))
+        docs.extend(Result(doc) for doc in resp['response']['docs'])
+    return docs
+
+
+LOCAL_SEARCH_FLIGHTS = SingleFlight()
+REDIS_SEARCH_FLIGHTS = RedisSingleFlight(
+    timeout=settings.SOLR_SINGLE_FLIGHT_TIMEOUT,
+    max_bytes=settings.SOLR_SINGLE_FLIGHT_MAX_BYTES
+)
+
+
+def get_search_key(conn, args, kwargs):
+    """
+    Get a key that identifies a Solr search: a hash of the core URL
+    and all of the search parameters.
+    """
+    params = repr((conn.url, args, sorted(kwargs.items())))
+    return hashlib.sha1(params.encode('utf-8')).hexdigest()
+
+
+def copy_results(results):
+    """
+    Make an independent copy of a pysolr Results object, so that
+    results shared between callers can't be changed by one of them.
+    """
+    return type(results)(ujson.loads(ujson.dumps(results.raw_response)))
+
+
+def coalesced_search(conn, *args, **kwargs):
+    """
+    Run a search on `conn` (a pysolr.Solr object) and return the
+    results, sharing one Solr round trip among identical concurrent
+    searches.
+
+    If settings.SOLR_SINGLE_FLIGHT_LOCAL is True, identical searches
+    running at the same time in different threads of the same process
+    are coalesced. If settings.SOLR_SINGLE_FLIGHT_REDIS is also True,
+    identical searches in different processes are coalesced via Redis
+    (see utils.singleflight.RedisSingleFlight). Every caller gets its
+    own copy of the results. Searches are never cached: a search that
+    starts after an identical one has finished goes to Solr.
+
+    A search that joins one already in flight may not see changes
+    committed after that one started, so only use this for reads that
+    can tolerate that. Querysets only use it if they're made with
+    `coalesce=True` (see `Queryset.coalesced`).
+    """
+    if not settings.SOLR_SINGLE_FLIGHT_LOCAL:
+        return conn.search(*args, **kwargs)
+    key = get_search_key(conn, args, kwargs)
+
+    def search():
+        if settings.SOLR_SINGLE_FLIGHT_REDIS:
+            return REDIS_SEARCH_FLIGHTS.do(
+                key, lambda: conn.search(*args, **kwargs),
+                dumps=lambda results: ujson.dumps(results.raw_response),
+                loads=lambda data: pysolr.Results(ujson.loads(data))
+            )[0]
+        return conn.search(*args, **kwargs)
+
+    results, shared = LOCAL_SEARCH_FLIGHTS.do(key, search)
+    return copy_results(results) if shared else results
+
+
 def format_datetime_for_solr(dt_obj):
     """
     Format a Python datetime object (UTC) in Solr datetime format.
@@ -71,6 +213,203 @@ def format_datetime_for_solr(dt_obj):
     return '{}T{}Z'.format(date_str, time_str)
 
 
+def _atomic_update_value(value):
+    if isinstance(value, (list, tuple)):
+        return [_atomic_update_value(v) for v in value]
+    if isinstance(value, datetime):
+        return format_datetime_for_solr(value)
+    return value
+
+
+def atomic_update(conn, docs, using='default', commit_now=True,
+                  commit_within=None):
+    """
+    Apply Solr atomic updates to many documents in one request.
+
+    Each doc in `docs` is a dict containing the core's uniqueKey field
+    (see `get_unique_key`) and, for each field to change, a dict that
+    maps an atomic-update modifier ('set', 'add', 'remove', 'inc',
+    etc.) to the value to apply, e.g.:
+
+        {'haystack_id': 'base.itemrecord.1', 'shelf_status': {'set': 'ok'}}
+
+    Only the given fields change; Solr rebuilds each document from its
+    stored fields, so, unlike `Result.save`, nothing has to be fetched
+    first. A 'set' value of None removes the field. (A doc without any
+    modifiers would replace the whole document, so that raises a
+    ValueError.) A doc may also include the `_version_` it expects the
+    document in Solr to have, for optimistic concurrency: if any
+    document's version doesn't match, this raises a VersionConflict.
+    (Docs before the conflicting one in the request are still updated,
+    and they're committed the same way they would have been without
+    the conflict.)
+
+    By default the updates are committed (and replicated, if `using`
+    is configured for manual replication--see `commit`) right away.
+    Pass `commit_within` (in milliseconds) to have Solr commit them
+    within that time instead, so that frequent small batches don't
+    each trigger a commit. (In that case followers only pick up the
+    changes when they next poll the leader.) Pass `commit_now=False` to
+    leave committing to the caller.
+
+    Returns a dict mapping the uniqueKey value of each doc to its new
+    `_version_`.
+    """
+    if not all(any(isinstance(v, dict) for v in doc.values())
+               for doc in docs):
+        raise ValueError('Each atomic-update doc must change a field.')
+    docs = [{field: ({mod: _atomic_update_value(v) for mod, v in val.items()}
+                     if isinstance(val, dict) else val)
+             for field, val in doc.items()} for doc in docs]
+    path = 'update/?versions=true'
+    if commit_within is not None:
+        path = '{}&commitWithin={}'.format(path, int(commit_within))
+    headers = {'Content-type': 'application/json; charset=utf-8'}
+    try:
+        resp = conn._send_request('post', path,
+                                  ujson.dumps(docs).encode('utf-8'), headers)
+    except pysolr.SolrError as e:
+        if '(HTTP 409)' in str(e):
+            if commit_now and commit_within is None:
+                commit(conn, using)
+            raise VersionConflict(str(e))
+        raise
+    if commit_now and commit_within is None:
+        commit(conn, using)
+    adds = ujson.loads(resp).get('adds') or []
+    return dict(zip(adds[0::2], adds[1::2]))
+
+
+def bulk_update_fields(updates, url=None, using='default',
+                       check_version=False, commit=True, commit_within=None,
+                       skip_conflicts=False):
+    """
+    Change fields on many Solr documents in one request, using atomic
+    updates. This is the bulk version of `Result.update_fields`.
+
+    `updates` is a list of (result, changes) tuples, where `result` is
+    a Result and `changes` is a dict of `Result.update_fields` kwargs,
+    e.g. (result, {'set': {'shelf_status': None}}). Each Result only
+    needs to contain the core's uniqueKey field (and `_version_`, if
+    `check_version` is True), so you can make one from an ID instead
+    of fetching the document. See `Result.update_fields` for the other
+    args. Each Result is changed and gets its new `_version_`, as in
+    `update_fields`. Results with no changes are skipped.
+
+    With `check_version`, one stale document normally makes the whole
+    call raise a VersionConflict, even though the documents before it
+    were updated. Pass `skip_conflicts=True` to save every document
+    that isn't stale instead: after a conflict, the documents that
+    were still pending are checked against Solr with a real-time get,
+    the stale ones are dropped, and the rest are sent again. (Read the
+    Results' versions with `realtime_get` or `Queryset.get_current`,
+    too, so that updates that aren't committed yet don't make them
+    look stale.) The updates are committed
+    (per `commit` and `commit_within`) even if something fails
+    partway. Returns a list of the Results that weren't updated
+    because of a conflict (always empty without `skip_conflicts`).
+    """
+    updates = [(result, changes) for result, changes in updates
+               if any(changes.values())]
+    if not updates:
+        return []
+    conn = connect(url, using)
+    unique_key = get_unique_key(conn)
+    if not (skip_conflicts and check_version):
+        _send_updates(conn, unique_key, updates, using, check_version,
+                      commit, commit_within)
+        return []
+    return _send_updates_skipping_conflicts(conn, unique_key, updates, using,
+                                            commit, commit_within)
+
+
+def _send_updates(conn, unique_key, updates, using, check_version,
+                  commit_now, commit_within):
+    """
+    Send the (result, changes) `updates` to Solr in one atomic-update
+    request, and update each Result to match. See `bulk_update_fields`.
+    """
+    docs = [result.get_atomic_update(unique_key, check_version=check_version,
+                                     **changes)
+            for result, changes in updates]
+    versions = atomic_update(conn, docs, using, commit_now=commit_now,
+                             commit_within=commit_within)
+    for result, changes in updates:
+        result.apply_update_locally(**changes)
+        if result.get(unique_key) in versions:
+            result['_version_'] = versions[result[unique_key]]
+
+
+def _send_updates_skipping_conflicts(conn, unique_key, updates, using,
+                                     commit_now, commit_within):
+    """
+    Send the version-checked (result, changes) `updates` to Solr,
+    dropping stale documents and resending the rest after each
+    conflict, then commit. Returns the stale Results. See
+    `bulk_update_fields`.
+    """
+    conflicts = []
+    try:
+        while updates:
+            try:
+                _send_updates(conn, unique_key, updates, using, True, False,
+                              commit_within)
+                updates = []
+            except VersionConflict:
+                pending, stale = _sort_out_conflict(conn, unique_key, updates)
+                if len(pending) == len(updates):
+                    raise
+                updates = pending
+                conflicts.extend(stale)
+    finally:
+        if commit_now and commit_within is None:
+            commit(conn, using)
+    return conflicts
+
+
+def _sort_out_conflict(conn, unique_key, updates):
+    """
+    After a version-checked request with the (result, changes)
+    `updates` failed partway, find out what happened to each one, with
+    a real-time get (see `realtime_get`)--a search wouldn't see the
+    uncommitted updates the failed request did make, or ones from
+    earlier requests that haven't been committed yet. A document that
+    still has the expected `_version_`
+    wasn't reached yet, so it's still pending. One that has a new
+    version and the values the changes would give it was updated by
+    the failed request; its Result is updated to match. Any other
+    document (including one that no longer exists) is stale.
+
+    Returns a tuple: (pending updates, stale Results).
+    """
+    ids = [result[unique_key] for result, _ in updates]
+    current = {doc[unique_key]: doc for doc in realtime_get(conn, ids)}
+    pending, stale = [], []
+    for result, changes in updates:
+        doc = current.get(result[unique_key])
+        if doc is not None and doc['_version_'] == result['_version_']:
+            pending.append((result, changes))
+            continue
+        expected = Result(result)
+        expected.apply_update_locally(**changes)
+        fields = [f for c in changes.values() for f in (c or {})]
+        if doc is None or any(doc.get(f) != expected.get(f) for f in fields):
+            stale.append(result)
+        else:
+            result.apply_update_locally(**changes)
+            result['_version_'] = doc['_version_']
+    return pending, stale
+
+
+class VersionConflict(pysolr.SolrError):
+    """
+    Raised when an update expects a document to have a `_version_` it
+    no longer has, i.e., it was changed by someone else since it was
+    read.
+    """
+    pass
+
+
 class MultipleObjectsReturned(Exception):
     pass
 
@@ -98,10 +437,89 @@ class Result(dict):
         if wants_commit:
             commit(conn, using)
 
+    def get_atomic_update(self, unique_key, set=None, add=None, remove=None,
+                          inc=None, check_version=False):
+        """
+        Get the atomic-update doc (see `atomic_update`) that makes the
+        changes described by the other args to this document, which
+        is identified by its `unique_key` field. See `update_fields`.
+        """
+        doc = {unique_key: self[unique_key]}
+        if check_version:
+            doc['_version_'] = self['_version_']
+        for mod, changes in (('set', set), ('add', add), ('remove', remove),
+                             ('inc', inc)):
+            for field, value in (changes or {}).items():
+                if field in doc:
+                    msg = ('Field {} can only be changed once per '
+                           'update.'.format(field))
+                    raise ValueError(msg)
+                doc[field] = {mod: value}
+        return doc
+
+    def apply_update_locally(self, set=None, add=None, remove=None,
+                             inc=None):
+        """
+        Change this Result the way `update_fields` changes the document
+        in Solr, without sending anything to Solr.
+        """
+        for field, value in (set or {}).items():
+            if value is None:
+                self.pop(field, None)
+            else:
+                self[field] = value
+        for field, value in (add or {}).items():
+            old = self.get(field)
+            old = [] if old is None else old
+            old = old if isinstance(old, list) else [old]
+            self[field] = old + (value if isinstance(value, list)
+                                 else [value])
+        for field, value in (remove or {}).items():
+            values = value if isinstance(value, list) else [value]
+            remaining = [v for v in self.get(field) or [] if v not in values]
+            if remaining:
+                self[field] = remaining
+            else:
+                self.pop(field, None)
+        for field, value in (inc or {}).items():
+            self[field] = (self.get(field) or 0) + value
+
+    def update_fields(self, set=None, add=None, remove=None, inc=None,
+                      url=None, using='default', check_version=False,
+                      commit=True, commit_within=None):
+        """
+        Change fields on this document in Solr using an atomic update.
+
+        Unlike `save`, this only sends the changes, not the whole
+        document, and Solr applies them to what's stored; e.g., adding
+        a value to a multi-valued field with 10,000 values sends one
+        value. So this Result only needs to contain the core's
+        uniqueKey field--you can make one from an ID, without fetching
+        the document first. Each arg maps field names to values:
+
+            - set: Replace the field's value; None removes the field.
+            - add: Add a value (or a list of values) to a multi-valued
+              field.
+            - remove: Remove all occurrences of a value (or a list of
+              values) from a multi-valued field.
+            - inc: Add a number to a numeric field.
+
+        If `check_version` is True, the update only succeeds if the
+        document in Solr still has the `_version_` in this Result;
+        otherwise a VersionConflict is raised and nothing changes.
+        The same changes are made to this Result, and it gets the new
+        `_version_`, so a Result fetched from Solr stays in sync and
+        can be updated again. Pass `commit=False` to skip committing,
+        like `save`, or see `atomic_update` for `commit_within`.
+        """
+        bulk_update_fields([(self, {'set': set, 'add': add, 'remove': remove,
+                                    'inc': inc})],
+                           url, using, check_version, commit, commit_within)
+
 
 class Queryset(object):
     def __init__(self, url=None, using='default', page_by=100, conn=None,
-                 **kwargs):
+                 coalesce=False, **kwargs):
         self._conn = conn or connect(url=url, using=using, **kwargs)
         self._result_set = []
         self._result_offset = 0
@@ -109,8 +527,10 @@ class Queryset(object):
         self._search_params = {'q': '*:*', 'fq': []}
         self._full_response = None
         self.page_by = page_by
+        self.coalesce = coalesce
         kwargs['conn'] = self._conn
         kwargs['page_by'] = page_by
+        kwargs['coalesce'] = coalesce
         self._kwargs = kwargs
 
     def __getitem__(self, key):
@@ -146,7 +566,14 @@ class Queryset(object):
     def _search(self, *args, **kwargs):
         kwargs = kwargs or {}
         kwargs.update(self._search_params)
-        response = self._conn.search(*args, **kwargs)
+        start = time.perf_counter()
+        if self.coalesce:
+            response = coalesced_search(self._conn, *args, **kwargs)
+        else:
+            response = self._conn.search(*args, **kwargs)
+        servertiming.record('solr', time.perf_counter() - start)
+        if getattr(response, 'qtime', None) is not None:
+            servertiming.record('solr-qtime', response.qtime / 1000.0)
         self._full_response = response
         self._hits = response.hits
         return response
@@ -159,7 +586,7 @@ class Queryset(object):
             self._result_set = []
 
     def _clone(self):
-        clone = Queryset(**self._kwargs)
+        clone = type(self)(**self._kwargs)
         clone._search_params = copy.deepcopy(self._search_params)
         clone._set_cache(None)
         clone._full_response = None
@@ -174,6 +601,91 @@ class Queryset(object):
             len(self)
         return self._full_response
 
+    def get_index_version(self, max_age=0):
+        """
+        Get the (indexversion, generation) tuple for the index this
+        queryset searches. See the `get_index_version` function.
+        """
+        return get_index_version(self._conn, max_age)
+
+    def get_current(self, results):
+        """
+        Get the current state of the given Results (e.g., from this
+        queryset) with a real-time get (see the `realtime_get`
+        function), so that they reflect updates Solr hasn't committed
+        yet. The queryset's filters and field list still apply (but
+        not a query set with `search`), so results that no longer
+        match are left out, as are ones that have been deleted.
+        """
+        unique_key = get_unique_key(self._conn)
+        params = {'fq': self._search_params['fq']}
+        if self._search_params.get('fl'):
+            params['fl'] = self._search_params['fl']
+        ids = [result[unique_key] for result in results]
+        return realtime_get(self._conn, ids, **params)
+
+    def get_cursor_sort(self, unique_key=None):
+        """
+        Get the sort parameter to use for cursor-based paging.
+
+        Solr's `cursorMark` requires that the sort include the core's
+        uniqueKey field as a tiebreaker. This returns the current sort
+        with the uniqueKey added to the end, if it isn't already there.
+        If you already know the name of the `unique_key` field, pass
+        it; otherwise it's looked up (see `get_unique_key`).
+        """
+        unique_key = unique_key or get_unique_key(self._conn)
+        sort = self._search_params.get('sort')
+        if not sort:
+            return '{} asc'.format(unique_key)
+        sort_fields = [crit.split()[0] for crit in sort.split(',')]
+        if unique_key in sort_fields:
+            return sort
+        return '{}, {} asc'.format(sort, unique_key)
+
+    def get_cursor_page(self, cursor_mark='*', rows=None):
+        """
+        Fetch one page of results using a Solr cursor (`cursorMark`).
+
+        Unlike slicing, which uses the `start` parameter, the cost of
+        fetching a page via a cursor stays the same no matter how deep
+        into the result set you are. Pass '*' as the `cursor_mark` to
+        get the first page; `rows` defaults to `page_by`. Returns a
+        tuple: (list of Result objects, next cursor mark). When the
+        next cursor mark is the same as the one you passed, you've
+        reached the end of the result set. Like other searches, this
+        sets the `full_response` and the count of total results.
+        """
+        clone = self._clone()
+        clone._search_params.pop('start', None)
+        clone._search_params['sort'] = self.get_cursor_sort()
+        clone._search_params['cursorMark'] = cursor_mark
+        rows = self.page_by if rows is None else rows
+        response = clone._search(rows=rows)
+        self._full_response = response
+        self._hits = response.hits
+        return [Result(i) for i in response], response.nextCursorMark
+
+    def iter_cursor_pages(self, rows=None):
+        """
+        Iterate through all results using a Solr cursor.
+
+        This is a generator that yields one page (a list of Result
+        objects) at a time, `rows` results per page (defaulting to
+        `page_by`), fetching each page from Solr as it's needed. Use
+        this to work through large result sets without using deep
+        `start` offsets or holding everything in memory.
+        """
+        rows = self.page_by if rows is None else rows
+        cursor_mark = '*'
+        while True:
+            results, next_cursor_mark = self.get_cursor_page(cursor_mark, rows)
+            if results:
+                yield results
+            if next_cursor_mark in (None, cursor_mark) or len(results) < rows:
+                break
+            cursor_mark = next_cursor_mark
+
     def _add_contains_parameter(self, field, val):
         val = self._conn._from_python(val)
         return u'{}:*{}*'.format(field, val)
@@ -343,3 +855,20 @@ class Queryset(object):
         clone = self._clone()
         clone._search_params['fl'] = fields
         return clone
+
+    def coalesced(self, coalesce=True):
+        """
+        Get a copy of this queryset whose searches are coalesced with
+        identical searches running at the same time (see
+        `coalesced_search`), or not, if `coalesce` is False.
+
+        By default, searches aren't coalesced, because a search that
+        joins one already in flight can miss changes committed after
+        the other one started. Use this for read-only requests that
+        can live with that, like API GETs, not for code that reads
+        back what it has just written.
+        """
+        clone = self._clone()
+        clone.coalesce = coalesce
+        clone._kwargs['coalesce'] = coalesce
+        return clone
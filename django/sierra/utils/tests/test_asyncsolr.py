@@ -0,0 +1,165 @@
+"""
+Contains tests for utils.asyncsolr.
+"""
+
+import asyncio
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pysolr
+import pytest
+import ujson
+
+from utils import asyncsolr, solr
+
+
+# FIXTURES AND TEST DATA
+
+class StandInSolr(object):
+    """
+    Answers Solr requests made via an httpx.MockTransport, recording
+    the parameters of each request. Each search returns `num_found`
+    and the docs in `docs`; `delay` makes each search take that many
+    seconds, so tests can make searches overlap.
+    """
+
+    def __init__(self, docs=None, num_found=None, delay=0, status=200):
+        self.docs = docs or []
+        self.num_found = len(self.docs) if num_found is None else num_found
+        self.delay = delay
+        self.status = status
+        self.requests = []
+
+    async def __call__(self, request):
+        url = urlsplit(str(request.url))
+        if request.method == 'POST':
+            params = parse_qs(request.content.decode('utf-8'))
+        else:
+            params = parse_qs(url.query)
+        self.requests.append((url.path, params))
+        if url.path.endswith('schema/uniquekey'):
+            return httpx.Response(200, json={'uniqueKey': 'id'})
+        await asyncio.sleep(self.delay)
+        if self.status != 200:
+            return httpx.Response(self.status, json={
+                'error': {'msg': 'bad request'}
+            })
+        rows = int(params.get('rows', ['10'])[0])
+        body = {
+            'responseHeader': {'QTime': 3},
+            'response': {'numFound': self.num_found,
+                         'docs': self.docs[:rows]},
+        }
+        if 'cursorMark' in params:
+            body['nextCursorMark'] = 'NEXT'
+        return httpx.Response(200, text=ujson.dumps(body))
+
+
+@pytest.fixture
+def make_queryset():
+    def _make_queryset(stand_in):
+        conn = asyncsolr.AsyncSolr('http://solr.example.com/solr/core')
+        transport = httpx.MockTransport(stand_in)
+        conn.client = httpx.AsyncClient(transport=transport)
+        return asyncsolr.AsyncQueryset(conn=conn)
+    return _make_queryset
+
+
+# TESTS
+
+def test_asyncqueryset_aslice_sends_queryset_params(make_queryset):
+    """
+    AsyncQueryset.aslice should make one Solr request, with the params
+    built by `filter`, `order_by`, and `only`, and return Result
+    objects.
+    """
+    stand_in = StandInSolr(docs=[{'id': 'b1'}, {'id': 'b2'}], num_found=50)
+    qs = make_queryset(stand_in).filter(type='bib').order_by('-id')
+    qs = qs.only('id')
+    results = asyncio.run(qs.aslice(10, 12))
+    count = asyncio.run(qs.acount())
+
+    assert results == [{'id': 'b1'}, {'id': 'b2'}]
+    assert all(isinstance(r, solr.Result) for r in results)
+    assert count == 50
+    assert len(stand_in.requests) == 1
+    path, params = stand_in.requests[0]
+    assert path.endswith('/select/')
+    assert params['fq'] == ['type:"bib"']
+    assert params['sort'] == ['id desc']
+    assert params['fl'] == ['id']
+    assert (params['start'], params['rows']) == (['10'], ['2'])
+
+
+def test_asyncqueryset_aget_item_and_aget_one(make_queryset):
+    """
+    AsyncQueryset.aget_item should raise an IndexError for an index
+    past the end of the results, and aget_one should return None if
+    nothing matches.
+    """
+    found = make_queryset(StandInSolr(docs=[{'id': 'b1'}]))
+    not_found = make_queryset(StandInSolr())
+
+    assert asyncio.run(found.aget_item(0)) == {'id': 'b1'}
+    assert asyncio.run(found.aget_one(id='b1')) == {'id': 'b1'}
+    assert asyncio.run(not_found.aget_one(id='b2')) is None
+    with pytest.raises(IndexError):
+        asyncio.run(not_found.aget_item(0))
+
+
+def test_asyncqueryset_aget_cursor_page(make_queryset):
+    """
+    AsyncQueryset.aget_cursor_page should sort on the unique key as a
+    tiebreaker and return the page and the next cursor mark.
+    """
+    stand_in = StandInSolr(docs=[{'id': 'b1'}, {'id': 'b2'}])
+    qs = make_queryset(stand_in).order_by('title')
+    page, next_cursor = asyncio.run(qs.aget_cursor_page('*', rows=2))
+    _, params = stand_in.requests[-1]
+
+    assert page == [{'id': 'b1'}, {'id': 'b2'}]
+    assert next_cursor == 'NEXT'
+    assert params['sort'] == ['title asc, id asc']
+    assert params['cursorMark'] == ['*']
+    assert 'start' not in params
+
+
+def test_asyncqueryset_raises_solrerror(make_queryset):
+    """
+    An error response from Solr should raise a pysolr.SolrError, like
+    the blocking Queryset methods do.
+    """
+    qs = make_queryset(StandInSolr(status=400))
+    with pytest.raises(pysolr.SolrError):
+        asyncio.run(qs.aslice(0, 10))
+
+
+@pytest.mark.parametrize('local, coalesce, exp_requests', [
+    (True, True, 1),
+    (False, True, 4),
+    (True, False, 4),
+])
+def test_asyncqueryset_coalesces_identical_searches(local, coalesce,
+                                                    exp_requests,
+                                                    make_queryset, settings):
+    """
+    Identical searches awaited concurrently on one event loop should
+    share one Solr request if the querysets are coalesced and
+    SOLR_SINGLE_FLIGHT_LOCAL is True, but each should get its own copy
+    of the results.
+    """
+    settings.SOLR_SINGLE_FLIGHT_LOCAL = local
+    stand_in = StandInSolr(docs=[{'id': 'b1', 'x': [1]}], delay=0.05)
+
+    async def search_all():
+        qsets = [make_queryset(stand_in).coalesced(coalesce)
+                 for _ in range(4)]
+        return await asyncio.gather(*[
+            qs.filter(id='b1').aslice(0, 10) for qs in qsets
+        ])
+
+    outcomes = asyncio.run(search_all())
+    outcomes[0][0]['x'].append(2)
+
+    assert len(stand_in.requests) == exp_requests
+    assert outcomes[1:] == [[{'id': 'b1', 'x': [1]}]] * 3
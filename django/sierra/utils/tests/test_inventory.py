@@ -0,0 +1,79 @@
+"""
+Contains tests for utils.inventory.
+"""
+
+import pytest
+
+from utils import inventory, solr
+
+
+# TESTS
+
+@pytest.mark.parametrize('left, right, exp', [
+    ([], ['a'], []),
+    (['a', 'b'], [], [('a', None), ('b', None)]),
+    (['a', 'b', 'c'], ['a', 'b', 'c'], [('a', 'a'), ('b', 'b'), ('c', 'c')]),
+    (['b', 'd', 'f'], ['a', 'b', 'c', 'f', 'g'],
+     [('b', 'b'), ('d', None), ('f', 'f')]),
+    (['a', 'c'], ['b'], [('a', None), ('c', None)]),
+    (['i10', 'i2'], ['i10', 'i100', 'i2'], [('i10', 'i10'), ('i2', 'i2')]),
+])
+def test_merge_join(left, right, exp):
+    """
+    `merge_join` should pair each left item with the right item that
+    has the same key, or None, in one pass over two sorted iterables.
+    """
+    left = ({'id': v} for v in left)
+    right = ({'key': v} for v in right)
+    pairs = inventory.merge_join(left, right, 'id', 'key')
+    assert [(l['id'], r and r['key']) for l, r in pairs] == exp
+
+
+def test_update_locations_batches_updates_and_commits_once(monkeypatch):
+    """
+    `update_locations` should send only the updates `iter_updates`
+    yields for each location, in batches of `batch_size`, and commit
+    once at the end. It should return a summary of what it did.
+    """
+    sent, commits = [], []
+    monkeypatch.setattr(solr, 'bulk_update_fields',
+                        lambda batch, **kwargs: sent.append(len(batch)))
+    monkeypatch.setattr(solr, 'commit', lambda *args: commits.append(args))
+    monkeypatch.setattr(solr, 'connect', lambda **kwargs: None)
+
+    def iter_updates(location):
+        for i in range(5):
+            doc = solr.Result({'id': f'{location}{i}'})
+            yield None if i % 2 else (doc, {'set': {'shelf_status': 'x'}})
+
+    summary = inventory.update_locations(['a', 'b'], iter_updates,
+                                         batch_size=2, workers=2,
+                                         verbose=False)
+    assert sorted(sent) == [1, 1, 2, 2]
+    assert len(commits) == 1
+    assert (summary['locations'], summary['seen'], summary['updated']) == \
+        (2, 10, 6)
+
+
+def test_update_locations_stops_and_commits_after_a_failure(monkeypatch):
+    """
+    When a location fails, `update_locations` should not start the
+    locations still waiting for a worker. It should commit what was
+    already sent and then raise the error.
+    """
+    started, commits = [], []
+    monkeypatch.setattr(solr, 'bulk_update_fields', lambda batch, **kw: None)
+    monkeypatch.setattr(solr, 'commit', lambda *args: commits.append(args))
+    monkeypatch.setattr(solr, 'connect', lambda **kwargs: None)
+
+    def iter_updates(location):
+        started.append(location)
+        if location == 'a':
+            raise ValueError('bad location')
+        yield (solr.Result({'id': f'{location}1'}), {'set': {'flags': 'x'}})
+
+    with pytest.raises(ValueError):
+        inventory.update_locations(['a', 'b', 'c'], iter_updates,
+                                   workers=1, verbose=False)
+    assert started == ['a']
+    assert len(commits) == 1
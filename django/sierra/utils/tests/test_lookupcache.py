@@ -0,0 +1,134 @@
+"""
+Contains tests for utils.lookupcache.
+"""
+
+import pytest
+
+from utils import lookupcache
+
+
+# FIXTURES AND TEST DATA
+
+@pytest.fixture
+def fake_clock():
+    class FakeClock(object):
+        def __init__(self):
+            self.now = 0
+
+        def __call__(self):
+            return self.now
+
+    return FakeClock()
+
+
+@pytest.fixture
+def make_cache(fake_clock):
+    def _make_cache(ttl=60, sync_interval=5):
+        return lookupcache.LookupCache(ttl=ttl, sync_interval=sync_interval,
+                                       clock=fake_clock)
+    return _make_cache
+
+
+# TESTS
+
+def test_lookupcache_get_and_set(make_cache):
+    """
+    LookupCache objects should store and return tables by name, via
+    `get`/`set` or via the mapping interface.
+    """
+    cache = make_cache()
+    cache.set('status', {'a': 'AVAILABLE'})
+    cache['location'] = {'w3': 'Willis Library, 3rd Floor'}
+    assert cache.get('status') == {'a': 'AVAILABLE'}
+    assert cache['location'] == {'w3': 'Willis Library, 3rd Floor'}
+    assert 'status' in cache
+    assert 'item_type' not in cache
+    assert cache.get('item_type', {}) == {}
+    with pytest.raises(KeyError):
+        cache['item_type']
+
+
+def test_lookupcache_tables_expire_after_ttl(make_cache, fake_clock):
+    """
+    Each table in a LookupCache should expire `ttl` seconds after it
+    was set.
+    """
+    cache = make_cache(ttl=60)
+    cache['status'] = {'a': 'AVAILABLE'}
+    fake_clock.now = 30
+    cache['location'] = {'w3': 'Willis Library, 3rd Floor'}
+    fake_clock.now = 59
+    assert 'status' in cache
+    fake_clock.now = 60
+    assert 'status' not in cache
+    assert 'location' in cache
+    fake_clock.now = 90
+    assert 'location' not in cache
+
+
+@pytest.mark.parametrize('names, exp_remaining', [
+    (('status',), ['location', 'item_type']),
+    (('status', 'item_type'), ['location']),
+    ((), []),
+])
+def test_lookupcache_invalidate_reaches_other_processes(names, exp_remaining,
+                                                        make_cache,
+                                                        fake_clock):
+    """
+    Invalidating tables in one LookupCache should drop them from that
+    cache immediately and from other LookupCaches (e.g., in other
+    processes) the next time they sync. Invalidating with no names
+    should drop everything.
+    """
+    all_names = ['location', 'status', 'item_type']
+    this_proc, other_proc = make_cache(), make_cache()
+    for cache in (this_proc, other_proc):
+        cache.sync()
+        for name in all_names:
+            cache[name] = {}
+    this_proc.invalidate(*names)
+    assert [n for n in all_names if n in this_proc] == exp_remaining
+    assert [n for n in all_names if n in other_proc] == all_names
+    fake_clock.now = 5
+    other_proc.sync()
+    assert [n for n in all_names if n in other_proc] == exp_remaining
+
+
+def test_lookupcache_sync_checks_redis_once_per_interval(make_cache,
+                                                         fake_clock, mocker):
+    """
+    LookupCache.sync should only check Redis if at least
+    `sync_interval` seconds have passed since the last check, unless
+    `force` is True.
+    """
+    cache = make_cache(sync_interval=5)
+    mocker.patch.object(cache, 'conn', wraps=cache.conn)
+    cache.sync()
+    fake_clock.now = 4
+    cache.sync()
+    assert cache.conn.hgetall.call_count == 1
+    cache.sync(force=True)
+    assert cache.conn.hgetall.call_count == 2
+    fake_clock.now = 9
+    cache.sync()
+    assert cache.conn.hgetall.call_count == 3
+
+
+def test_lookupcache_get_versions_changes_on_invalidate(make_cache, mocker):
+    """
+    LookupCache.get_versions should return a version string that
+    changes whenever one of the named tables (or all tables) is
+    invalidated, along with the time of the latest invalidation.
+    """
+    mocker.patch('utils.lookupcache.time.time', return_value=1000.5)
+    cache = make_cache()
+    initial = cache.get_versions(['status'])
+    cache.invalidate('location')
+    assert cache.get_versions(['status']) == initial
+    assert initial[1] == 0
+    cache.invalidate('status')
+    after_status = cache.get_versions(['status'])
+    assert after_status[0] != initial[0]
+    assert after_status[1] == 1000.5
+    cache.invalidate()
+    assert cache.get_versions(['status'])[0] != after_status[0]
@@ -2,6 +2,8 @@
 Contains tests for utils.redisobjs.
 """
 
+import asyncio
+
 import pytest
 
 from utils import redisobjs
@@ -597,6 +599,85 @@ def test_redisobject_inner_sets_fail(value):
         r_set.set(value)
 
 
+BIG_STR = 'abcdefghij' * 200
+IDS = list(range(1000000, 1003000, 3))
+
+
+@pytest.mark.parametrize('codec', [
+    redisobjs.JSONCodec(),
+    redisobjs.ZlibCodec(threshold=100),
+    redisobjs.IntArrayCodec(),
+])
+@pytest.mark.parametrize('value, force_unique, lookup, lookup_type, exp', [
+    ([IDS, [1, 2], BIG_STR, None], False, IDS, 'value', 0),
+    ([[1, 2], IDS, {'a': BIG_STR}], True, IDS, 'value', 1),
+    ({'a': IDS, 'b': BIG_STR, 'c': [-5, 300, 2 ** 40]}, None, 'c', 'field',
+     [-5, 300, 2 ** 40]),
+    ({BIG_STR, 'a'}, None, BIG_STR, 'value_exists', True),
+    (IDS[0:5], True, IDS[3], 'value', 3),
+])
+def test_redisobject_codecs_roundtrip(codec, value, force_unique, lookup,
+                                      lookup_type, exp):
+    """
+    Data saved with any codec should come back the same way it went in,
+    lookups by value should find encoded members, and objects using
+    any other codec should be able to read it.
+    """
+    r = redisobjs.RedisObject('test', 'codecs', codec=codec)
+    r.set(value, force_unique=force_unique)
+    other = redisobjs.RedisObject('test', 'codecs')
+    assert r.get() == value
+    assert other.get() == value
+    assert r.get(lookup, lookup_type) == exp
+
+
+@pytest.mark.parametrize('codec, value, exp_tag', [
+    (redisobjs.ZlibCodec(threshold=100), 'short', None),
+    (redisobjs.ZlibCodec(threshold=100), BIG_STR, 'zlib'),
+    (redisobjs.IntArrayCodec(), IDS, 'intarray'),
+    (redisobjs.IntArrayCodec(), [1, 'a'], None),
+    (redisobjs.IntArrayCodec(), [], None),
+])
+def test_codecs_tag_only_what_they_compact(codec, value, exp_tag):
+    """
+    Codecs should tag and shrink the members they're meant for, and
+    store anything else as plain JSON.
+    """
+    encoded = redisobjs.encode_member(value, codec)
+    plain = redisobjs.encode_member(value)
+    if exp_tag is None:
+        assert encoded == plain
+    else:
+        assert encoded.startswith(f'{redisobjs.CODEC_PREFIX}{exp_tag}|')
+        assert len(encoded) < len(plain) / 4
+    assert redisobjs.decode_member(encoded) == value
+
+
+def test_set_entity_codec_sets_default_codec():
+    """
+    RedisObjects should use the codec set for their entity, unless
+    they're given one. Data saved under an earlier codec should still
+    be readable.
+    """
+    legacy = redisobjs.RedisObject('test', 'entity_codec')
+    legacy.set({'old': BIG_STR})
+    redisobjs.set_entity_codec('test', redisobjs.ZlibCodec(threshold=100))
+    try:
+        r = redisobjs.RedisObject('test', 'entity_codec')
+        assert isinstance(r.codec, redisobjs.ZlibCodec)
+        assert r.get() == {'old': BIG_STR}
+        r.set({'new': BIG_STR}, update=True)
+        raw = r.conn.hget(r.key, 'new')
+        assert raw.startswith(f'{redisobjs.CODEC_PREFIX}zlib|')
+        assert r.get() == {'old': BIG_STR, 'new': BIG_STR}
+        json_codec = redisobjs.JSONCodec()
+        assert redisobjs.RedisObject('test', 'x', codec=json_codec).codec \
+            is json_codec
+    finally:
+        redisobjs.set_entity_codec('test', None)
+    assert redisobjs.RedisObject('test', 'entity_codec').codec is None
+
+
 def test_redisobject_set_and_get_different_keys():
     """
     Setting different values using different keys should return the
@@ -839,6 +920,107 @@ def test_redisobject_setvalue_multiple_values(mocker):
     r.set.assert_called_with(('a', 'b'), update=True, index=1)
 
 
+@pytest.mark.parametrize('method, init, f_unq, args, exp_return, expected', [
+    # update_values
+    ('update_values', ['a', 'b', 'c'], False, (1, 'x', 'y', 'z'), 4,
+     ['a', 'x', 'y', 'z']),
+    ('update_values', ['a', 'b', 'c'], True, (1, 'x', 'y', 'z'), 4,
+     ['a', 'x', 'y', 'z']),
+    ('update_values', ['a', 'b', 'c'], False, (-2, 'x'), 3,
+     ['a', 'x', 'c']),
+    ('update_values', ['a', 'b', 'c'], True, (-2, 'x'), 3,
+     ['a', 'x', 'c']),
+    ('update_values', ['a', 'b', 'c'], False, (None, 'x', 'y'), 5,
+     ['a', 'b', 'c', 'x', 'y']),
+    ('update_values', ['a'], False, (3, 'x'), 4, ['a', None, None, 'x']),
+    ('update_values', None, False, (0, 'x', 'y'), 2, ['x', 'y']),
+
+    # insert_values
+    ('insert_values', ['a', 'b', 'c'], False, (1, 'x', 'y'), 5,
+     ['a', 'x', 'y', 'b', 'c']),
+    ('insert_values', ['a', 'b', 'c'], True, (1, 'x', 'y'), 5,
+     ['a', 'x', 'y', 'b', 'c']),
+    ('insert_values', ['a', 'b', 'c'], False, (0, 'x'), 4,
+     ['x', 'a', 'b', 'c']),
+    ('insert_values', ['a', 'b', 'c'], True, (-1, 'x'), 4,
+     ['a', 'b', 'x', 'c']),
+    ('insert_values', ['a', 'b', 'c'], True, (10, 'x'), 4,
+     ['a', 'b', 'c', 'x']),
+
+    # remove_values
+    ('remove_values', ['a', 'b', 'c', 'b', 'd'], False, ('b', 'd', 'q'), 3,
+     ['a', 'c']),
+    ('remove_values', ['a', 'b', 'c', 'd', 'e'], True, ('b', 'd', 'q'), 2,
+     ['a', 'c', 'e']),
+    ('remove_values', None, False, ('a',), 0, None),
+
+    # append_values
+    ('append_values', ['a', 'b'], False, ('b', 'c', 'c', 'a', 'd'), 2,
+     ['a', 'b', 'c', 'd']),
+    ('append_values', ['a', 'b'], True, ('b', 'c', 'c', 'a', 'd'), 2,
+     ['a', 'b', 'c', 'd']),
+    ('append_values', None, True, ('a', 'a', 'b'), 2, ['a', 'b']),
+])
+@pytest.mark.parametrize('bsize', [None, 1, 2])
+def test_redisobject_atomic_operations(method, init, f_unq, args, exp_return,
+                                       expected, bsize):
+    """
+    The RedisObject update_values, insert_values, remove_values, and
+    append_values methods should change a list or zset the same way
+    the equivalent Python list operations would, in or out of batch
+    mode, and return the new length or the number of values removed
+    or appended.
+    """
+    r = redisobjs.RedisObject('test', 'atomic')
+    if init is not None:
+        r.set(init, force_unique=f_unq)
+    ratomic = redisobjs.RedisObject('test', 'atomic', batch_size=bsize)
+    kwargs = {} if method == 'remove_values' else {'force_unique': f_unq}
+    assert getattr(ratomic, method)(*args, **kwargs) == exp_return
+    r = redisobjs.RedisObject('test', 'atomic')
+    assert r.get() == expected
+    if expected is not None and f_unq:
+        assert [r.get_index(v) for v in expected] == list(range(len(expected)))
+
+
+def test_redisobject_atomic_operations_take_one_round_trip(mocker):
+    """
+    Each atomic RedisObject list/zset operation should take one
+    pipeline execution, without reading the object's length first.
+    Deferred operations should queue up on the pipeline and all run
+    when it's executed.
+    """
+    r = redisobjs.RedisObject('test', 'atomic')
+    r.set(['a', 'b', 'c'], force_unique=True)
+    execute = mocker.spy(redisobjs.Pipeline, 'execute')
+    get_len = mocker.spy(redisobjs._RedisZset, 'get_obj_length')
+    r.insert_values(0, 'x')
+    r.remove_values('b')
+    r.update_values(-1, 'y')
+    r.append_values('x', 'z')
+    assert execute.call_count == 4
+    assert get_len.call_count == 0
+    assert r.get() == ['x', 'a', 'y', 'z']
+
+    rdefer = redisobjs.RedisObject('test', 'atomic', defer=True)
+    rdefer.remove_values('x', 'a')
+    rdefer.insert_values(1, 'b', 'c')
+    assert rdefer.pipe.execute() == [2, 4]
+    assert r.get() == ['y', 'b', 'c', 'z']
+
+
+def test_redisobject_atomic_operations_type_error():
+    """
+    The atomic RedisObject list/zset operations should raise a
+    TypeError if the key exists but isn't a list or zset.
+    """
+    r = redisobjs.RedisObject('test', 'atomic')
+    r.set({'a': 'z'})
+    with pytest.raises(TypeError) as excinfo:
+        r.append_values('a')
+    assert 'must be a list or zset' in str(excinfo.value)
+
+
 def test_redisobject_get_nonexistent_key_returns_none():
     """
     For ease of use, trying to get a key that doesn't exist returns
@@ -1005,6 +1187,33 @@ def test_redisobject_get_with_lookups(init, f_unq, lookup_type, lookup,
     assert result == expected
 
 
+@pytest.mark.parametrize('init, f_unq, lookup_type, lookup', [
+    (['a', 'b', 'c'], True, 'index', (1, 2)),
+    (['a', 'b', 'c', 'b', 'e'], True, 'values', ('a', 'b', 'c', 'e')),
+    (['a', 'b', 'c'], True, 'index', -1),
+    (['a', 'c', 'b', 'c'], False, 'value', 'c'),
+    (['a', 'b', 'c'], False, 'index', (-2, -1)),
+    ('abcdefg', None, 'index', (-4, -1)),
+    ({'a': [1, 2, 3], 'b': 'y', 'c': 'x'}, None, 'fields', ('a', 'd')),
+    ({'a', 'b', 'c'}, None, 'values_exist', ['d', 'c']),
+    ({'a': 'hash'}, None, 'index', 0),
+    ({'a': 'hash', 'b': {'c': 'd'}}, None, None, None),
+    (None, None, None, None),
+])
+def test_redisobject_aget_matches_get(init, f_unq, lookup_type, lookup):
+    """
+    The RedisObject.aget coroutine should return the same results as
+    the RedisObject.get method for the same lookup.
+    """
+    if init is not None:
+        redisobjs.RedisObject('test', 'aget').set(init, force_unique=f_unq)
+    expected = redisobjs.RedisObject('test', 'aget').get(lookup, lookup_type)
+    result = asyncio.run(
+        redisobjs.RedisObject('test', 'aget').aget(lookup, lookup_type)
+    )
+    assert result == expected
+
+
 def test_redisobject_get_with_defer():
     """
     When a RedisObject instance has defer set to True, a 'get'
@@ -1062,6 +1271,34 @@ def test_redisobject_getindex_multiple_values(mocker):
     r.get.assert_called_with(('myval1', 'myval2'), 'values')
 
 
+def test_redisobject_getindexes_multiple_objects(mocker):
+    """
+    The RedisObject.get_indexes method should return the same index
+    positions that 'get_index' returns for each (object, value) pair,
+    in order, with None for objects that aren't lists or zsets. Once
+    the objects' rtypes are known, all lookups should take one
+    pipeline execution.
+    """
+    colors = redisobjs.RedisObject('test', 'colors')
+    colors.set(['red', 'green', 'blue'], force_unique=True)
+    tastes = redisobjs.RedisObject('test', 'tastes')
+    tastes.set(['bitter', 'sour', 'sweet', 'sour'])
+    things = redisobjs.RedisObject('test', 'things')
+    things.set({'a': 'z'})
+    missing = redisobjs.RedisObject('test', 'missing')
+    lookups = [(colors, 'blue'), (tastes, 'sweet'), (colors, 'red'),
+               (things, 'a'), (missing, 'red'), (colors, 'purple'),
+               (tastes, 'umami')]
+    expected = [obj.get_index(value) for obj, value in lookups]
+
+    assert expected == [2, 2, 0, None, None, None, None]
+    assert redisobjs.RedisObject.get_indexes(lookups) == expected
+    execute = mocker.spy(redisobjs.Pipeline, 'execute')
+    assert redisobjs.RedisObject.get_indexes(lookups) == expected
+    assert execute.call_count == 1
+    assert redisobjs.RedisObject.get_indexes([]) == []
+
+
 def test_redisobject_getvalue_single_index(mocker):
     """
     The RedisObject.get_value method is just a convenience method that
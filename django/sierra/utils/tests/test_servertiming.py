@@ -0,0 +1,156 @@
+"""
+Contains tests for utils.servertiming.
+"""
+
+import asyncio
+
+import pytest
+
+from utils import servertiming
+
+
+# FIXTURES AND TEST DATA
+
+@pytest.fixture
+def fake_clock():
+    class FakeClock(object):
+        def __init__(self):
+            self.now = 0
+
+        def __call__(self):
+            return self.now
+
+    return FakeClock()
+
+
+@pytest.fixture
+def make_histograms(fake_clock):
+    made = []
+
+    def _make_histograms(flush_interval=10):
+        hists = servertiming.LatencyHistograms(flush_interval=flush_interval,
+                                               clock=fake_clock)
+        hists.redis_key = 'test_server_timing'
+        made.append(hists)
+        return hists
+
+    yield _make_histograms
+    for hists in made:
+        hists.reset()
+
+
+# TESTS
+
+def test_requesttimings_header_value(fake_clock):
+    """
+    RequestTimings should sum repeated metrics and format them, plus
+    the total, as a Server-Timing header value, in milliseconds.
+    """
+    timings = servertiming.RequestTimings(clock=fake_clock)
+    timings.add('solr', 0.010)
+    with timings.timing('solr'):
+        fake_clock.now = 0.0025
+    timings.add('custom', 0.5)
+    assert timings.get_header_value(total=1.25) == (
+        'solr;desc="Solr round trips";dur=12.5, custom;dur=500.0, '
+        'total;desc="Total";dur=1250.0'
+    )
+
+
+def test_record_and_timing_only_apply_to_active_request(fake_clock):
+    """
+    The module-level `record` and `timing` functions should add to the
+    active request's timings, if there is one, and otherwise do
+    nothing.
+    """
+    servertiming.record('solr', 1)
+    with servertiming.timing('render'):
+        pass
+    timings = servertiming.start_request(clock=fake_clock)
+    try:
+        servertiming.record('solr', 1)
+        with servertiming.timing('render'):
+            fake_clock.now = 2
+        assert servertiming.get_current() is timings
+    finally:
+        servertiming.end_request()
+    servertiming.record('solr', 1)
+    assert servertiming.get_current() is None
+    assert timings.metrics == {'solr': 1, 'render': 2}
+
+
+def test_concurrent_tasks_have_separate_timings(fake_clock):
+    """
+    Each asyncio task (e.g. each request served by an async view)
+    should record to its own request's timings, even when tasks
+    interleave on one event loop.
+    """
+    async def handle_request(seconds):
+        timings = servertiming.start_request(clock=fake_clock)
+        try:
+            await asyncio.sleep(0.01)
+            servertiming.record('solr', seconds)
+            await asyncio.sleep(0.01)
+            return timings.metrics
+        finally:
+            servertiming.end_request()
+
+    async def run_all():
+        return await asyncio.gather(handle_request(1), handle_request(2))
+
+    assert asyncio.run(run_all()) == [{'solr': 1}, {'solr': 2}]
+    assert servertiming.get_current() is None
+
+
+def test_latencyhistograms_aggregate_observations(make_histograms):
+    """
+    LatencyHistograms should count observations per view, metric, and
+    latency bucket, and should combine observations from every
+    instance (i.e., every process) sharing the same Redis data.
+    """
+    hists_a, hists_b = make_histograms(), make_histograms()
+    hists_a.observe('api.views.ItemList', {'total': 0.004, 'solr': 0.002})
+    hists_a.observe('api.views.ItemList', {'total': 0.020})
+    hists_b.observe('api.views.ItemList', {'total': 20})
+    hists_b.observe('api.views.BibList', {'total': 0.3})
+    hists_b.flush()
+    result = hists_a.get_histograms()
+
+    assert list(result.keys()) == ['api.views.BibList', 'api.views.ItemList']
+    total = result['api.views.ItemList']['total']
+    assert total['count'] == 3
+    assert total['sumMs'] == 20024.0
+    assert total['meanMs'] == pytest.approx(6674.667)
+    assert total['p50Ms'] == 25
+    assert total['p99Ms'] is None
+    assert list(total['buckets'].keys()) == hists_a.bucket_labels
+    assert total['buckets']['5'] == 1
+    assert total['buckets']['25'] == 1
+    assert total['buckets']['+Inf'] == 1
+    assert result['api.views.ItemList']['solr']['count'] == 1
+    assert result['api.views.BibList']['total']['buckets']['500'] == 1
+
+
+def test_latencyhistograms_flush_interval(make_histograms, fake_clock):
+    """
+    LatencyHistograms should write observations to Redis only once
+    `flush_interval` seconds have passed since the last flush.
+    """
+    hists, reader = make_histograms(flush_interval=10), make_histograms()
+    hists.observe('view', {'total': 0.01})
+    assert reader.get_histograms() == {}
+    fake_clock.now = 10
+    hists.observe('view', {'total': 0.01})
+    assert reader.get_histograms()['view']['total']['count'] == 2
+
+
+def test_latencyhistograms_reset(make_histograms):
+    """
+    LatencyHistograms.reset should delete all histogram data.
+    """
+    hists = make_histograms()
+    hists.observe('view', {'total': 0.01})
+    hists.flush()
+    hists.observe('view', {'total': 0.01})
+    hists.reset()
+    assert hists.get_histograms() == {}
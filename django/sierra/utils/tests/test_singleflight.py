@@ -0,0 +1,286 @@
+"""
+Contains tests for utils.singleflight and coalesced Solr searches.
+"""
+
+import asyncio
+import threading
+import time
+
+import pysolr
+import pytest
+import ujson
+
+from utils import singleflight, solr
+
+
+# FIXTURES AND TEST DATA
+
+class GatedFunction(object):
+    """
+    Callable that counts calls and blocks each call until `release` is
+    called, so tests can make calls overlap.
+    """
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def release(self, settle=0.2):
+        """
+        Let calls finish, after giving other threads `settle` seconds
+        to start waiting on the first call.
+        """
+        time.sleep(settle)
+        self.gate.set()
+
+
+def run_in_threads(num, func):
+    """
+    Start `num` threads that each call `func`. Returns a tuple: (list
+    of threads, list of outcomes). Once the threads are done, each
+    outcome is a (result, error) tuple.
+    """
+    outcomes = [None] * num
+
+    def run(i):
+        try:
+            outcomes[i] = (func(), None)
+        except Exception as e:
+            outcomes[i] = (None, e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(num)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+class FakeSolr(pysolr.Solr):
+    def __init__(self, func):
+        super().__init__('http://solr.example.com/solr/core')
+        self.func = func
+
+    def search(self, q, **kwargs):
+        return pysolr.Results(self.func())
+
+
+@pytest.fixture
+def redis_flights():
+    flights = singleflight.RedisSingleFlight(timeout=2)
+    flights.redis_key = 'test_single_flight'
+    return flights
+
+
+# TESTS
+
+def test_singleflight_coalesces_concurrent_calls():
+    """
+    SingleFlight.do should call the function once for concurrent calls
+    with the same key, sharing the result, and should call it again
+    for a call that starts after the first finished.
+    """
+    flights = singleflight.SingleFlight()
+    func = GatedFunction(result=['result'])
+    threads, outcomes = run_in_threads(
+        5, lambda: flights.do('key', func)
+    )
+    func.started.wait(5)
+    other_key = flights.do('other', lambda: 'other result')
+    func.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert func.calls == 1
+    assert other_key == ('other result', False)
+    assert sorted(shared for (result, shared), _ in outcomes) == [
+        False, True, True, True, True
+    ]
+    assert all(result is func.result for (result, _), _ in outcomes)
+    assert flights.do('key', func) == (['result'], False)
+    assert func.calls == 2
+
+
+def test_singleflight_shares_errors():
+    """
+    When the leader's call raises an exception, SingleFlight.do should
+    raise it for every caller that was waiting on it.
+    """
+    flights = singleflight.SingleFlight()
+    func = GatedFunction(error=ValueError('bad'))
+    threads, outcomes = run_in_threads(3, lambda: flights.do('key', func))
+    func.started.wait(5)
+    func.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert func.calls == 1
+    assert all(isinstance(error, ValueError) for _, error in outcomes)
+
+
+def test_redissingleflight_hands_off_result(redis_flights):
+    """
+    RedisSingleFlight.do should let a follower pick up the leader's
+    result from Redis instead of calling the function itself.
+    """
+    func = GatedFunction(result={'a': [1, 2]})
+    threads, outcomes = run_in_threads(
+        1, lambda: redis_flights.do('key', func, ujson.dumps, ujson.loads)
+    )
+    func.started.wait(5)
+    follower_func = GatedFunction(result='follower')
+    follower_func.release(settle=0)
+    follower = threading.Thread(target=lambda: outcomes.append(
+        redis_flights.do('key', follower_func, ujson.dumps, ujson.loads)
+    ))
+    follower.start()
+    func.release()
+    threads[0].join(5)
+    follower.join(5)
+
+    assert outcomes[0] == (({'a': [1, 2]}, False), None)
+    assert outcomes[1] == ({'a': [1, 2]}, True)
+    assert follower_func.calls == 0
+    assert redis_flights.conn.get(redis_flights.get_lock_key('key')) is None
+
+
+def test_redissingleflight_follower_falls_back_on_error(redis_flights):
+    """
+    If the leader's call fails, RedisSingleFlight followers should
+    call the function themselves.
+    """
+    func = GatedFunction(error=ValueError('bad'))
+    threads, outcomes = run_in_threads(
+        1, lambda: redis_flights.do('key', func, ujson.dumps, ujson.loads)
+    )
+    func.started.wait(5)
+    results = []
+    follower = threading.Thread(target=lambda: results.append(
+        redis_flights.do('key', lambda: 'mine', ujson.dumps, ujson.loads)
+    ))
+    follower.start()
+    func.release()
+    threads[0].join(5)
+    follower.join(5)
+
+    assert isinstance(outcomes[0][1], ValueError)
+    assert results == [('mine', False)]
+
+
+@pytest.mark.parametrize('use_redis', [False, True])
+def test_queryset_coalesces_identical_searches(use_redis, settings):
+    """
+    Identical Solr searches run concurrently via coalesced Queryset
+    objects should share one Solr round trip, but each Queryset should
+    get its own copy of the results.
+    """
+    settings.SOLR_SINGLE_FLIGHT_LOCAL = True
+    settings.SOLR_SINGLE_FLIGHT_REDIS = use_redis
+    func = GatedFunction(result={
+        'response': {'numFound': 1, 'docs': [{'id': 'b1', 'x': [1]}]}
+    })
+    conn = FakeSolr(func)
+
+    def search():
+        return solr.Queryset(conn=conn).coalesced().filter(id='b1')[0:10]
+
+    threads, outcomes = run_in_threads(4, search)
+    func.started.wait(5)
+    func.release()
+    for thread in threads:
+        thread.join(5)
+    first = outcomes[0][0]
+    first[0]['x'].append(2)
+
+    assert func.calls == 1
+    assert [r for r, _ in outcomes[1:]] == [[{'id': 'b1', 'x': [1]}]] * 3
+
+
+def test_queryset_does_not_coalesce_by_default(settings):
+    """
+    Queryset searches should each go to Solr unless the Queryset was
+    made with `coalesce=True`, even if SOLR_SINGLE_FLIGHT_LOCAL is
+    True, so that code reading back its own writes never gets results
+    from a search that started before them.
+    """
+    settings.SOLR_SINGLE_FLIGHT_LOCAL = True
+    func = GatedFunction(result={'response': {'numFound': 0, 'docs': []}})
+    conn = FakeSolr(func)
+
+    def search():
+        return solr.Queryset(conn=conn).filter(id='b1')[0:10]
+
+    threads, outcomes = run_in_threads(4, search)
+    func.started.wait(5)
+    func.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert func.calls == 4
+    assert not solr.Queryset(conn=conn).filter(id='b1').coalesce
+    assert solr.Queryset(conn=conn).coalesced().filter(id='b1').coalesce
+
+
+def test_asyncsingleflight_coalesces_concurrent_calls():
+    """
+    AsyncSingleFlight.do should await the function once for concurrent
+    calls with the same key on one event loop, sharing the result or
+    the exception.
+    """
+    flights = singleflight.AsyncSingleFlight()
+    calls = []
+
+    async def func(result=None, error=None):
+        calls.append(result)
+        await asyncio.sleep(0.05)
+        if error is not None:
+            raise error
+        return result
+
+    async def run_all():
+        return await asyncio.gather(
+            *[flights.do('key', lambda: func(['result'])) for _ in range(4)],
+            *[flights.do('bad', lambda: func(error=ValueError('bad')))
+              for _ in range(2)],
+            return_exceptions=True
+        )
+
+    outcomes = asyncio.run(run_all())
+
+    assert len(calls) == 2
+    assert [shared for _, shared in outcomes[:4]] == [False, True, True, True]
+    assert all(result is outcomes[0][0] for result, _ in outcomes[:4])
+    assert all(isinstance(error, ValueError) for error in outcomes[4:])
+    assert flights._calls == {}
+
+
+def test_asyncsingleflight_followers_survive_leader_cancellation():
+    """
+    If the task making the first call is cancelled, AsyncSingleFlight
+    followers should call the function themselves instead of being
+    cancelled too.
+    """
+    flights = singleflight.AsyncSingleFlight()
+
+    async def func():
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def run_all():
+        leader = asyncio.ensure_future(flights.do('key', func))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do('key', func))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(run_all()) == (('result', False), True)
@@ -106,3 +106,141 @@ def test_commit_error_if_no_leader_url(solr_conn, settings):
     leader_conn.add(test_records, commit=False)
     with pytest.raises(ImproperlyConfigured):
         solr.commit(leader_conn, leader, specify_leader_url=False)
+
+
+def test_result_update_fields(solr_conn):
+    """
+    Result.update_fields should change only the given fields in Solr,
+    using atomic updates, without needing the rest of the document.
+    The Result should be changed to match, including its `_version_`.
+    """
+    using = 'haystack|update'
+    conn = solr_conn(using)
+    conn.add([{'haystack_id': 'i1', 'id': 'i1', 'shelf_status': 'onShelf',
+               'inventory_notes': ['a', 'b', 'c'], 'copy_number': 1}])
+    result = solr.Result(haystack_id='i1')
+    result.update_fields(set={'shelf_status': None}, add={'flags': 'x'},
+                         remove={'inventory_notes': ['a', 'c']},
+                         inc={'copy_number': 2}, using=using)
+    doc = list(conn.search(q='haystack_id:i1'))[0]
+
+    assert doc['id'] == 'i1'
+    assert 'shelf_status' not in doc
+    assert doc['flags'] == ['x']
+    assert doc['inventory_notes'] == ['b']
+    assert doc['copy_number'] == 3
+    assert result == {'haystack_id': 'i1', 'flags': ['x'], 'copy_number': 2,
+                      '_version_': doc['_version_']}
+
+
+def test_bulk_update_fields_checks_versions(solr_conn):
+    """
+    When `check_version` is True, bulk_update_fields should raise a
+    VersionConflict if a document changed after it was read, and an
+    update using the new version should succeed.
+    """
+    using = 'haystack|update'
+    conn = solr_conn(using)
+    conn.add([{'haystack_id': 'i1', 'id': 'i1'},
+              {'haystack_id': 'i2', 'id': 'i2'}])
+    results = solr.Queryset(using=using).order_by('haystack_id')[0:2]
+    solr.bulk_update_fields([(results[1], {'set': {'flags': ['x']}})],
+                            using=using, check_version=True)
+    stale = solr.Result(results[1], _version_=1)
+
+    with pytest.raises(solr.VersionConflict):
+        solr.bulk_update_fields([(stale, {'set': {'flags': None}})],
+                                using=using, check_version=True)
+    solr.bulk_update_fields([
+        (results[0], {'set': {'shelf_status': 'missing'}}),
+        (results[1], {'add': {'flags': 'y'}}),
+    ], using=using, check_version=True)
+    docs = list(conn.search(q='*:*', sort='haystack_id asc'))
+
+    assert docs[0]['shelf_status'] == 'missing'
+    assert docs[1]['flags'] == ['x', 'y']
+    assert [r['_version_'] for r in results] == [
+        d['_version_'] for d in docs
+    ]
+
+
+def test_bulk_update_fields_skips_conflicts(solr_conn, mocker):
+    """
+    When `skip_conflicts` is True, bulk_update_fields should save every
+    document whose version still matches, even ones after a stale
+    document in the request, commit once, and return the stale
+    Results instead of raising a VersionConflict.
+    """
+    using = 'haystack|update'
+    conn = solr_conn(using)
+    conn.add([{'haystack_id': f'i{n}', 'id': f'i{n}'} for n in range(1, 4)])
+    results = solr.Queryset(using=using).order_by('haystack_id')[0:3]
+    solr.bulk_update_fields([(solr.Result(results[1]),
+                              {'set': {'flags': ['x']}})],
+                            using=using, check_version=True)
+    commit = mocker.patch('utils.solr.commit', wraps=solr.commit)
+    conflicts = solr.bulk_update_fields(
+        [(r, {'set': {'shelf_status': 'missing'}}) for r in results],
+        using=using, check_version=True, skip_conflicts=True
+    )
+    docs = list(conn.search(q='*:*', sort='haystack_id asc'))
+
+    assert conflicts == [results[1]]
+    assert commit.call_count == 1
+    assert [d.get('shelf_status') for d in docs] == ['missing', None,
+                                                     'missing']
+    assert docs[1]['flags'] == ['x']
+    assert [results[0]['_version_'], results[2]['_version_']] == [
+        docs[0]['_version_'], docs[2]['_version_']
+    ]
+
+
+def test_bulk_update_fields_skips_conflicts_with_uncommitted_updates(
+        solr_conn):
+    """
+    When `skip_conflicts` is True, bulk_update_fields should tell
+    stale documents from ones updated by an earlier request that
+    hasn't been committed yet (e.g., within its `commit_within`), as
+    long as the Results were read with `Queryset.get_current`.
+    """
+    using = 'haystack|update'
+    conn = solr_conn(using)
+    conn.add([{'haystack_id': f'i{n}', 'id': f'i{n}'} for n in range(1, 4)])
+    qs = solr.Queryset(using=using).order_by('haystack_id')
+    solr.bulk_update_fields(
+        [(r, {'set': {'flags': ['x']}}) for r in qs[0:2]],
+        using=using, check_version=True, commit=False
+    )
+    results = qs.get_current(qs[0:3])
+    stale = solr.Result(results[2])
+    stale.update_fields(set={'flags': ['y']}, using=using, commit=False)
+    conflicts = solr.bulk_update_fields(
+        [(r, {'set': {'shelf_status': 'missing'}}) for r in results],
+        using=using, check_version=True, commit=False, skip_conflicts=True
+    )
+    docs = solr.realtime_get(conn, ['i1', 'i2', 'i3'])
+
+    assert conflicts == [results[2]]
+    assert [d.get('shelf_status') for d in docs] == ['missing', 'missing',
+                                                     None]
+    assert [d.get('flags') for d in docs] == [['x'], ['x'], ['y']]
+
+
+def test_realtime_get_params(mocker):
+    """
+    realtime_get should ask Solr's /get handler for the given IDs, in
+    batches of REALTIME_GET_BATCH_SIZE, escaping commas in IDs and
+    passing other kwargs as params.
+    """
+    conn = mocker.Mock()
+    conn._send_request.side_effect = lambda method, path: (
+        '{"response": {"numFound": 1, "docs": [{"id": "x"}]}}'
+    )
+    mocker.patch.object(solr, 'REALTIME_GET_BATCH_SIZE', 2)
+    docs = solr.realtime_get(conn, ['a', 'b,c', 'd'], fq=['type:Item'])
+    paths = [call.args[1] for call in conn._send_request.call_args_list]
+
+    assert docs == [{'id': 'x'}, {'id': 'x'}]
+    assert isinstance(docs[0], solr.Result)
+    assert paths == ['get?fq=type%3AItem&ids=a%2Cb%5C%2Cc&wt=json',
+                     'get?fq=type%3AItem&ids=d&wt=json']
@@ -2,6 +2,11 @@
 This contains code for helping test timings of Django REST framework
 views.
 
+Note that views based on api.simpleviews.SimpleView already time each
+phase of every request and report the results in a `Server-Timing`
+header and in per-view latency histograms (see utils.servertiming), so
+you only need what follows for other views or for custom timings.
+
 TO USE
 
 First, go into your view code and create a dispatch method on your base